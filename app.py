@@ -1,78 +1,630 @@
 import os
+import json
+import math
+import time
+import gc
+import uuid
 import logging
 import sys
-from flask import Flask, render_template, request, redirect, session, url_for
-from dotenv import load_dotenv
+import click
+from itertools import chain
+from flask import Flask, Response, abort, g, jsonify, render_template, send_file, stream_template, stream_with_context, request, redirect, session, url_for
+from services.config import load_env, preloading
 from services.auth import AuthService
 from services.mercado_livre import MercadoLivreService
+from services.http_client import preload as preload_http
+from services.normalizer import json_default
+from services.cache import build_search_cache, build_page_cache
+from services.single_flight import SingleFlight
+from services.token_manager import TokenManager, build_token_store
+from services.product_index import ProductIndex
+from services.exporter import CatalogExporter, ExportError, FORMATS, encode_delta, read_queries
+from services.catalog_sync import CatalogSync, SQLiteCatalogStore, SyncError, build_catalog_store
+from services.session_store import build_session_interface
+from services.warmup import build_warmup
+from services.images import build_image_validator, build_thumbnail_cache
+from services.batch_search import BatchSearchError, build_batch_search
+from services.suggestions import build_suggestion_index
+from services.hedging import build_hedger
+from services.deadline import start_deadline
+from services.price_history import PriceAlerts, build_price_history
+from services.scheduler import build_scheduler
+from services.resilience import UpstreamUnavailable
+from services.metrics import REGISTRY, install_log_trace_ids, new_trace_id, current_trace_id
 
-# Configuração de Logging
+# Configuração de Logging (cada linha leva o trace id da requisição)
+install_log_trace_ids()
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
+    format='%(asctime)s [%(levelname)s] [%(trace_id)s] %(name)s: %(message)s',
     stream=sys.stdout
 )
 logger = logging.getLogger("ML_PROD")
 
-load_dotenv()
+# Já carregado pelo import dos serviços: não relê o .env
+load_env()
 
 app = Flask(__name__)
+# jsonify serializa os produtos compactos (normalizer.Product) como dicts
+app.json.default = json_default
 # Busca a chave do .env. Se não existir, gera um erro claro.
 app.secret_key = os.getenv("FLASK_SECRET_KEY")
 if not app.secret_key:
     logger.critical("ERRO: FLASK_SECRET_KEY não definida no arquivo .env!")
+# Sessão guardada no servidor: o cookie leva só um id opaco (ML_SESSION_BACKEND=sqlite|memory)
+app.session_interface = build_session_interface()
 
 auth_service = AuthService()
+# Cache de resultados normalizados compartilhado entre requisições (TTL + LRU)
+search_cache = build_search_cache()
+# Páginas já renderizadas, com ETag forte (respostas 304 sem template nem upstream)
+page_cache = build_page_cache()
+# Uma única chamada ao upstream por busca idêntica em andamento
+search_flight = SingleFlight()
+# Renovação proativa dos tokens (sessões OAuth e modo .env) em segundo plano
+# Em preload a thread de renovação só nasce no worker (start_background_tasks)
+# Os tokens ficam no SQLite das sessões, compartilhados entre os workers: uma renovação por chave
+token_manager = TokenManager(auth_service, autostart=not preloading(), store=build_token_store())
+if os.getenv("ML_ACCESS_TOKEN", "").strip():
+    # Modo .env: sem expires_in conhecido, a primeira renovação ainda é reativa (401).
+    # Depois de um reinício vale o par já renovado no store, não o do .env
+    token_manager.register(TokenManager.ENV_KEY, {
+        'access_token': os.getenv("ML_ACCESS_TOKEN").strip(),
+        'refresh_token': os.getenv("ML_REFRESH_TOKEN", "").strip() or None,
+        'expires_in': os.getenv("ML_TOKEN_EXPIRES_IN"),
+    }, seed=True)
+
+# Thumbnails conferidas por HEAD em segundo plano; a busca só lê o cache (ML_IMAGE_VALIDATION=0 desliga)
+image_validator = build_image_validator()
+# Proxy opcional das thumbnails com cache em disco (ML_THUMBNAIL_PROXY=1)
+thumbnail_cache = build_thumbnail_cache()
+
+# Cópia atrasada das buscas lentas ao ML, limitada a uma fração das chamadas (ML_HEDGE_ENABLED=1)
+hedger = build_hedger()
+# Orçamento de latência por rota (segundos): vale para a renovação do token e para as buscas ao ML
+REQUEST_BUDGETS = {"index": float(os.getenv("ML_REQUEST_BUDGET", 5))}
+
+# Busca em lote (JSON/NDJSON): várias (site, busca) por requisição, num pool limitado do worker
+batch_search = build_batch_search(MercadoLivreService.SITE_IDS, MercadoLivreService.DEFAULT_SITE_ID)
+
+# Produtos já vistos neste worker: filtros e facetas sem nova chamada ao ML
+product_index = ProductIndex()
+# Buscas, títulos e marcas já vistos: sugestões enquanto o usuário digita, sem chamada ao ML
+suggestion_index = build_suggestion_index()
+# Série temporal de preços/status dos produtos vistos, em segmentos compactos no disco (ML_PRICE_HISTORY=0 desliga)
+price_history = build_price_history()
+# Máximo de resultados carregados do ML para filtrar uma busca ainda não indexada
+MAX_FILTER_WINDOW = 1000
+
+
+def _record_prices(products):
+    if price_history is not None:
+        price_history.record(products)
+
+
+def _env_service():
+    return MercadoLivreService(token_manager.get(TokenManager.ENV_KEY).access_token)
+
+
+def _refresh_env_token():
+    token_manager.record_unauthorized(TokenManager.ENV_KEY)
+    return token_manager.refresh(TokenManager.ENV_KEY) is not None
+
+
+# Sincronização incremental (modo .env): só o que mudou chega ao índice e aos caches
+catalog_sync = CatalogSync(_env_service, store=build_catalog_store(), per_query=MAX_FILTER_WINDOW,
+                           page_size=MercadoLivreService.PAGE_SIZE, on_unauthorized=_refresh_env_token)
+
+
+@catalog_sync.subscribe
+def _apply_catalog_delta(delta):
+    product_index.add(delta.upserts, delta.query)
+    suggestion_index.add_products(delta.upserts)
+    _record_prices(delta.upserts)
+    product_index.remove(delta.removed, delta.query)
+    # Páginas e buscas guardadas dessa query deixaram de valer
+    search_cache.invalidate_query(delta.query)
+    page_cache.invalidate_query(delta.query)
+
+# Busca padrão e itens por página da rota / (o aquecimento pré-busca essas chaves de cache)
+DEFAULT_QUERY = "notebook"
+DEFAULT_PER_PAGE = 10
+
+
+def _warmup_service():
+    # Sem token do modo .env não há com o que pré-buscar (os tokens OAuth são de cada usuário)
+    token = token_manager.get(TokenManager.ENV_KEY)
+    if token is None:
+        return None
+    return MercadoLivreService(token.access_token, cache=search_cache, single_flight=search_flight,
+                               image_validator=image_validator)
+
+
+# Buscas populares pré-carregadas no cache ao subir o worker e periodicamente, em segundo plano
+warmup = build_warmup(_warmup_service, DEFAULT_QUERY, DEFAULT_PER_PAGE)
+WARMUP_ENABLED = os.getenv("ML_WARMUP_ENABLED", "1") == "1"
+
+# Fila de tarefas de segundo plano (refresh do catálogo, alertas de preço), persistida em SQLite
+# e dividida entre os workers (ML_JOBS_ENABLED=0 desliga)
+scheduler = build_scheduler()
+JOBS_ENABLED = os.getenv("ML_JOBS_ENABLED", "1") == "1"
+# Quedas de preço já alertadas, ao lado do histórico: compartilhadas entre os workers e entre reinícios
+price_alerts = PriceAlerts(os.path.join(price_history.directory, "alerts.sqlite3")) if price_history else None
+
+
+def _refresh_query_job(query):
+    # Sem token do modo .env a tarefa falha e segue o backoff até ele aparecer
+    if token_manager.get(TokenManager.ENV_KEY) is None:
+        raise SyncError("Sem token do modo .env para o refresh")
+    catalog_sync.refresh(query)
+
+
+def _price_alerts_job(days, min_drop):
+    """Registra (log e, com ML_PRICE_ALERTS_PATH, uma linha JSON) as quedas de preço ainda não alertadas."""
+    if price_history is None:
+        return
+    window = days * 86400
+    alerts = price_alerts.claim(price_history.price_drops(window, min_drop, limit=MAX_PRICE_DROPS), window)
+    for drop in alerts:
+        logger.warning(f"Queda de preço: {drop['id']} de {drop['max']} para {drop['last']} "
+                       f"({drop['drop']:.0%} em {days:g} dias)")
+    path = os.getenv("ML_PRICE_ALERTS_PATH")
+    if alerts and path:
+        with open(path, "a", encoding="utf-8") as f:
+            for drop in alerts:
+                f.write(json.dumps(dict(drop, alerted_at=int(time.time())), ensure_ascii=False) + "\n")
+
+
+scheduler.register("refresh_query", _refresh_query_job, max_attempts=int(os.getenv("ML_JOBS_MAX_ATTEMPTS", 5)),
+                   rate=float(os.getenv("ML_JOBS_REFRESH_RATE", 0.5)))
+scheduler.register("price_alerts", _price_alerts_job, max_attempts=3)
+if os.getenv("ML_ACCESS_TOKEN", "").strip():
+    # Buscas acompanhadas (ML_REFRESH_QUERIES=notebook,celular): refresh incremental a cada intervalo
+    for _query in filter(None, (q.strip() for q in os.getenv("ML_REFRESH_QUERIES", "").split(","))):
+        scheduler.every("refresh_query", float(os.getenv("ML_REFRESH_INTERVAL", 900)), _query)
+if price_history is not None and os.getenv("ML_PRICE_ALERTS", "0") == "1":
+    scheduler.every("price_alerts", float(os.getenv("ML_PRICE_ALERTS_INTERVAL", 3600)),
+                    float(os.getenv("ML_PRICE_ALERTS_DAYS", 7)), float(os.getenv("ML_PRICE_ALERTS_MIN_DROP", 0.1)),
+                    priority=3)
+
+
+def start_background_tasks():
+    """Threads de segundo plano do processo (renovação de tokens, aquecimento do cache e fila de tarefas)."""
+    token_manager.start()
+    if WARMUP_ENABLED:
+        warmup.start()
+    if JOBS_ENABLED:
+        scheduler.start()
+
+
+# Threads não sobrevivem ao fork: em preload, o gunicorn chama start_background_tasks em cada worker (post_fork)
+if not preloading():
+    start_background_tasks()
+
+# Métricas do worker (GET /metrics): histogramas no caminho quente, stats lidos só na exposição
+REQUEST_LATENCY = REGISTRY.histogram(
+    "ml_request_seconds",
+    "Duração das requisições por rota, método e status (streaming: até o primeiro byte)",
+    ("route", "method", "status"),
+)
+RENDER_LATENCY = REGISTRY.histogram("ml_render_seconds", "Tempo de renderização de templates", ("template",))
+REGISTRY.register_stats("ml_search_cache", search_cache.stats, "Cache de buscas",
+                        counters=("hits", "misses", "stale_hits", "stale_if_error", "evictions"))
+REGISTRY.register_stats("ml_page_cache", page_cache.stats, "Cache de páginas renderizadas",
+                        counters=("hits", "misses", "reused", "evictions"))
+REGISTRY.register_stats("ml_search_single_flight", search_flight.stats, "Coalescência de buscas",
+                        counters=("calls", "coalesced"))
+REGISTRY.register_stats("ml_auth_tokens", token_manager.stats, "Tokens OAuth",
+                        counters=("refreshes", "failures", "unauthorized", "adopted"))
+REGISTRY.register_stats("ml_sessions", app.session_interface.stats, "Sessões no servidor",
+                        counters=("swept", "lookups", "cache_hits"))
+REGISTRY.register_stats("ml_warmup", warmup.stats, "Aquecimento do cache de buscas",
+                        counters=("runs",) + warmup.OUTCOMES)
+if image_validator is not None:
+    REGISTRY.register_stats("ml_image_validation", image_validator.stats, "Validação das thumbnails",
+                            counters=("checked", "cache_hits", "broken", "unknown", "dropped"))
+if thumbnail_cache is not None:
+    REGISTRY.register_stats("ml_thumbnail_cache", thumbnail_cache.stats, "Proxy de thumbnails",
+                            counters=("hits", "misses", "evictions", "failures"))
+if hedger is not None:
+    REGISTRY.register_stats("ml_hedging", hedger.stats, "Hedging das buscas ao ML",
+                            counters=("calls", "hedged", "hedge_wins", "skipped"))
+REGISTRY.register_stats("ml_suggestions", suggestion_index.stats, "Índice de sugestões de busca",
+                        counters=("merges",))
+if price_history is not None:
+    REGISTRY.register_stats("ml_price_history", price_history.stats, "Histórico de preços",
+                            counters=("recorded", "skipped", "flushes", "merges", "points_written", "bytes_written"))
+REGISTRY.register_stats("ml_jobs", scheduler.stats, "Fila de tarefas de segundo plano",
+                        counters=scheduler.OUTCOMES)
+REGISTRY.register_stats("ml_product_index", lambda: {"products": len(product_index)}, "Índice local de produtos")
+
+# Limite de produtos por página da interface (acima de PAGE_SIZE a busca faz fan-out)
+MAX_PER_PAGE = 200
+
+@app.before_request
+def _start_request():
+    g.request_start = time.perf_counter()
+    new_trace_id(request.headers.get('X-Request-ID'))
+    # Sempre redefinido: a thread do worker atende outras requisições com o mesmo contexto
+    start_deadline(REQUEST_BUDGETS.get(request.endpoint))
+    if WARMUP_ENABLED:
+        warmup.start()  # já rodando: só confere o pid (app carregado antes do fork)
+
+@app.after_request
+def _finish_request(response):
+    response.headers['X-Request-ID'] = current_trace_id()
+    start = g.get('request_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_LATENCY.observe(time.perf_counter() - start, route, request.method, str(response.status_code))
+    return response
+
+def _render(template, **context):
+    with RENDER_LATENCY.time(template):
+        return render_template(template, **context)
+
+def _pagination_args():
+    """Lê page/per_page da query string com valores seguros."""
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+    except ValueError:
+        page = 1
+    try:
+        per_page = min(MAX_PER_PAGE, max(1, int(request.args.get('per_page', DEFAULT_PER_PAGE))))
+    except ValueError:
+        per_page = DEFAULT_PER_PAGE
+    return page, per_page
+
+# Facetas do índice local: (campo do produto, parâmetro da URL, rótulo)
+FACETS = (
+    ('brand', 'brand', 'Marca'),
+    ('color', 'color', 'Cor'),
+    ('additional_attr', 'attr', 'Capacidade/Modelo'),
+    ('status', 'status', 'Status'),
+)
+
+def _index_filters():
+    """Lê os filtros locais (facetas e faixa de preço) da query string."""
+    filters = {}
+    for field, param, _ in FACETS:
+        value = request.args.get(param, '').strip()
+        if value:
+            filters[field] = value
+    prices = []
+    for name in ('min_price', 'max_price'):
+        try:
+            prices.append(float(request.args[name]) if request.args.get(name) else None)
+        except ValueError:
+            prices.append(None)
+    return filters, prices[0], prices[1]
+
+def _filter_args(filters, min_price, max_price):
+    """Filtros ativos como parâmetros de URL (para links de paginação e facetas)."""
+    args = {param: filters[field] for field, param, _ in FACETS if field in filters}
+    if min_price is not None:
+        args['min_price'] = min_price
+    if max_price is not None:
+        args['max_price'] = max_price
+    return args
+
+def _indexed_pages(pages, query):
+    """Indexa cada página do fan-out conforme ela chega ao navegador."""
+    for page_products in pages:
+        product_index.add(page_products, query)
+        suggestion_index.add_products(page_products)
+        _record_prices(page_products)
+        yield page_products
+
+def _page_response(etag, body, logged_in):
+    """Resposta HTML com ETag; If-None-Match correspondente vira 304 sem corpo."""
+    response = Response(body, mimetype="text/html")
+    response.set_etag(etag)
+    # A variante logada nunca vai para caches compartilhados; o navegador sempre revalida
+    response.headers['Cache-Control'] = "private, no-cache" if logged_in else "public, no-cache"
+    response.vary.add('Cookie')
+    return response.make_conditional(request)
+
+def _store_session_tokens(token, replace=False):
+    # Só um par que vence depois do guardado: a cópia antiga de um worker não desfaz a renovação de outro
+    if not replace and session.get('access_token') and \
+            (token.expires_at or 0) <= (session.get('token_expires_at') or 0):
+        return
+    session['access_token'] = token.access_token
+    if token.refresh_token:
+        session['refresh_token'] = token.refresh_token
+    session['token_expires_at'] = token.expires_at
+
+def _current_tokens():
+    """
+    Devolve (token_key, access_token, refresh_token) da requisição atual.
+    Os tokens vêm do TokenManager (store compartilhado entre os workers), que
+    pode tê-los renovado em segundo plano; nesse caso a sessão é atualizada.
+    """
+    if not session.get('access_token'):
+        token = token_manager.get(TokenManager.ENV_KEY)
+        if token is None:
+            return None, "", ""
+        return TokenManager.ENV_KEY, token.access_token, token.refresh_token or ""
+
+    key = session.get('token_key')
+    token = token_manager.get(key) if key else None
+    if token is None:
+        # Sessão sem tokens no store (anterior a ele ou varrida): adota os da sessão
+        key = key or uuid.uuid4().hex
+        session['token_key'] = key
+        token = token_manager.register(key, {
+            'access_token': session['access_token'].strip(),
+            'refresh_token': (session.get('refresh_token') or "").strip() or None,
+            'expires_at': session.get('token_expires_at'),
+        })
+    if token.access_token != session.get('access_token'):
+        _store_session_tokens(token)
+    return key, token.access_token, token.refresh_token or ""
 
 @app.route("/")
 def index():
-    # Recupera tokens
-    # Recupera tokens e limpa possíveis espaços em branco
-    access_token = session.get('access_token') or os.getenv("ML_ACCESS_TOKEN", "")
-    if access_token: access_token = access_token.strip()
-    
-    refresh_token = session.get('refresh_token') or os.getenv("ML_REFRESH_TOKEN", "")
-    if refresh_token: refresh_token = refresh_token.strip()
-    
-    query = request.args.get('q', 'notebook')
+    # Recupera tokens (já renovados em segundo plano quando possível)
+    token_key, access_token, refresh_token = _current_tokens()
+    logged_in = bool(access_token)
+
+    if logged_in and request.args.get('page', '1') == '1':
+        # Popularidade para o aquecimento: a chave de cache da primeira chamada ao ML desta página
+        warmup.popularity.record(request.args.get('q', DEFAULT_QUERY),
+                                 min(_pagination_args()[1], MercadoLivreService.PAGE_SIZE))
+
+    # Página idêntica renderizada há pouco: responde sem template nem chamada ao ML
+    page_key = page_cache.make_key(logged_in, request.args.items(multi=True))
+    cached = page_cache.get(page_key)
+    if cached is not None:
+        return _page_response(*cached, logged_in)
+
+    query = request.args.get('q', DEFAULT_QUERY)
+    page, per_page = _pagination_args()
+    offset = (page - 1) * per_page
     
     products = []
     error_message = None
+    has_next = False
+    pages = None
 
-    if access_token:
-        ml_service = MercadoLivreService(access_token)
-        results = ml_service.search_products(query=query)
+    filters, min_price, max_price = _index_filters()
+    filtering = bool(filters) or min_price is not None or max_price is not None
+
+    if access_token and filtering and product_index.has_query(query):
+        # Busca já indexada: filtra localmente, sem chamada ao ML
+        matched = product_index.search(query, filters, min_price, max_price)
+        products = matched[offset:offset + per_page]
+        has_next = len(matched) > offset + per_page
+    elif access_token:
+        # Com filtros, a busca ainda não indexada é carregada desde o início para paginar o resultado filtrado
+        fetch_offset, fetch_total = (0, min(offset + per_page, MAX_FILTER_WINDOW)) if filtering else (offset, per_page)
+        # Todas as páginas da janela são disparadas em paralelo; aguardamos só a primeira
+        ml_service = MercadoLivreService(access_token, cache=search_cache, single_flight=search_flight,
+                                         image_validator=image_validator, hedger=hedger)
+        pages = ml_service.iter_pages(query, offset=fetch_offset, total=fetch_total)
+        results = next(pages, [])
         
         # Lógica de Diferencial: Renovação Automática
         if isinstance(results, dict) and results.get('error') == 'auth_expired' and refresh_token:
             logger.info("Access token expirado. Tentando renovação automática...")
-            new_tokens = auth_service.refresh_access_token(refresh_token)
+            token_manager.record_unauthorized(token_key)
+            new_token = token_manager.refresh(token_key)
             
-            if 'access_token' in new_tokens:
-                access_token = new_tokens['access_token']
-                session['access_token'] = access_token
-                if 'refresh_token' in new_tokens:
-                    session['refresh_token'] = new_tokens['refresh_token']
+            if new_token is not None:
+                access_token = new_token.access_token
+                if token_key != TokenManager.ENV_KEY:
+                    _store_session_tokens(new_token)
                 
                 # Tenta a busca novamente com o novo token
-                ml_service = MercadoLivreService(access_token)
-                results = ml_service.search_products(query=query)
+                pages.close()
+                ml_service = MercadoLivreService(access_token, cache=search_cache, single_flight=search_flight,
+                                         image_validator=image_validator, hedger=hedger)
+                pages = ml_service.iter_pages(query, offset=fetch_offset, total=fetch_total)
+                results = next(pages, [])
             else:
                 error_message = "Sua sessão expirou. Por favor, conecte sua conta novamente."
                 access_token = None # Força re-login
 
         if isinstance(results, list):
             products = results
+            # Primeira página cheia: provavelmente há mais resultados
+            has_next = len(results) == min(per_page, MercadoLivreService.PAGE_SIZE)
+            product_index.add(results, query)
+            suggestion_index.add_products(results)
+            _record_prices(results)
+            if results and page == 1:
+                suggestion_index.add_query(query)
+            if filtering:
+                # Primeira vez desta busca com filtros: o restante da janela entra no índice antes de filtrar
+                for page_products in pages:
+                    product_index.add(page_products, query)
+                    _record_prices(page_products)
+                matched = product_index.search(query, filters, min_price, max_price)
+                products = matched[offset:offset + per_page]
+                has_next = len(matched) > offset + per_page
         elif isinstance(results, dict) and 'error' in results:
             error_message = results.get('message', "Ocorreu um erro ao buscar produtos.")
     else:
         error_message = "Conecte sua conta do Mercado Livre para realizar buscas no catálogo."
 
-    return render_template("index.html", 
-                         products=products, 
-                         error_message=error_message,
-                         is_logged_in=bool(access_token),
-                         user_id=session.get('ml_user_id') or os.getenv("ML_USER_ID"))
+    context = dict(error_message=error_message,
+                   is_logged_in=bool(access_token),
+                   user_id=session.get('ml_user_id') or os.getenv("ML_USER_ID"),
+                   query=query,
+                   page=page,
+                   per_page=per_page,
+                   has_next=has_next,
+                   filter_args=_filter_args(filters, min_price, max_price),
+                   facets=[])
+
+    if access_token and product_index.has_query(query):
+        counts = product_index.facets(query, filters, min_price, max_price)
+        context['facets'] = [(param, label, counts[field]) for field, param, label in FACETS if counts[field]]
+
+    if products and pages is not None and not filtering and per_page > MercadoLivreService.PAGE_SIZE:
+        # Streaming: a primeira página vai para o navegador enquanto as demais chegam
+        return stream_template("index.html", products=chain(products, chain.from_iterable(_indexed_pages(pages, query))),
+                               **context)
+
+    if pages is not None:
+        pages.close()
+    if logged_in and error_message:
+        # Erros do upstream (ou sessão expirada) não vão para o cache
+        return _render("index.html", products=products, **context)
+
+    fingerprint = page_cache.fingerprint(products, sorted(context.items()))
+    etag, body = page_cache.render(page_key, fingerprint,
+                                   lambda: _render("index.html", products=products, **context))
+    return _page_response(etag, body, logged_in)
+
+# Limite de itens por chamada à busca em streaming
+MAX_STREAM_LIMIT = 1000
+
+@app.route("/api/search/stream")
+def search_stream():
+    """Produtos normalizados em NDJSON, um por linha, enviados conforme chegam do ML."""
+    _, access_token, _ = _current_tokens()
+    if not access_token:
+        return jsonify({"error": "auth_required"}), 401
+
+    query = request.args.get('q', DEFAULT_QUERY)
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = min(MAX_STREAM_LIMIT, max(1, int(request.args.get('limit', 50))))
+    except ValueError:
+        return jsonify({"error": "invalid_params"}), 400
+
+    products = MercadoLivreService(access_token).stream_products(query, offset=offset, limit=limit)
+    first = next(products, None)
+    if isinstance(first, dict) and 'error' in first:
+        if first['error'] == 'upstream_unavailable':
+            # Circuito aberto/limite de requisições: falha na hora, com a espera sugerida
+            response = jsonify(first)
+            response.status_code = 503
+            if first.get('retry_after'):
+                response.headers['Retry-After'] = str(math.ceil(first['retry_after']))
+            return response
+        status = 401 if first['error'] == 'auth_expired' else 502
+        return jsonify(first), status
+
+    def generate():
+        if first is None:
+            return
+        for product in chain([first], products):
+            yield json.dumps(product, ensure_ascii=False, default=json_default) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+@app.route("/api/search/batch", methods=["POST"])
+def search_batch():
+    """
+    Várias buscas por requisição: {"queries": [{"q", "site_id", "offset", "limit"}, ...], "deadline": s}.
+    Resposta em JSON (resultados na ordem do lote) ou, com ?stream=1 ou Accept: application/x-ndjson,
+    em NDJSON, uma linha por busca assim que ela termina.
+    """
+    _, access_token, _ = _current_tokens()
+    if not access_token:
+        return jsonify({"error": "auth_required"}), 401
+    try:
+        queries, deadline = batch_search.parse(request.get_json(silent=True))
+    except BatchSearchError as e:
+        return jsonify({"error": "invalid_batch", "message": str(e)}), 400
+
+    ml_service = MercadoLivreService(access_token, cache=search_cache, single_flight=search_flight,
+                                     image_validator=image_validator, hedger=hedger)
+    results = batch_search.run(ml_service, queries, deadline)
+
+    if request.args.get('stream') == '1' or 'application/x-ndjson' in request.headers.get('Accept', ''):
+        def generate():
+            for result in results:
+                yield json.dumps(result, ensure_ascii=False, default=json_default) + "\n"
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+    ordered = sorted(results, key=lambda result: result['index'])
+    return jsonify({"results": ordered, "partial": any(result['status'] != 'ok' for result in ordered)})
+
+# Máximo de sugestões por resposta
+MAX_SUGGESTIONS = 10
+
+@app.route("/api/suggest")
+def suggest():
+    """Sugestões para o texto digitado, do índice local (buscas, títulos e marcas já vistos)."""
+    prefix = request.args.get('q', '')
+    try:
+        limit = min(MAX_SUGGESTIONS, max(1, int(request.args.get('limit', 8))))
+    except ValueError:
+        return jsonify({"error": "invalid_params"}), 400
+    return jsonify({"q": prefix, "suggestions": suggestion_index.suggest(prefix, limit)})
+
+# Janela padrão e máxima (dias) das consultas ao histórico de preços
+DEFAULT_PRICE_WINDOW_DAYS = 30
+MAX_PRICE_DROPS = 200
+
+def _price_window():
+    """Janela em segundos a partir de ?days= (ValueError se inválida)."""
+    days = float(request.args.get('days', DEFAULT_PRICE_WINDOW_DAYS))
+    if not 0 < days <= 3650:
+        raise ValueError(days)
+    return days * 86400
+
+@app.route("/api/prices/drops")
+def price_drops():
+    """Produtos cujo último preço caiu ao menos min_drop (fração) em relação ao maior preço da janela."""
+    if price_history is None:
+        abort(404)
+    try:
+        window = _price_window()
+        min_drop = float(request.args.get('min_drop', 0.1))
+        limit = min(MAX_PRICE_DROPS, max(1, int(request.args.get('limit', 50))))
+    except ValueError:
+        return jsonify({"error": "invalid_params"}), 400
+    return jsonify({"days": window / 86400, "min_drop": min_drop,
+                    "drops": price_history.price_drops(window, min_drop, limit)})
+
+@app.route("/api/prices/<product_id>")
+def price_series(product_id):
+    """Pontos (instante, preço, status) do produto na janela, com menor, maior e último preço."""
+    if price_history is None:
+        abort(404)
+    try:
+        window = _price_window()
+    except ValueError:
+        return jsonify({"error": "invalid_params"}), 400
+    since = int(time.time() - window)
+    points = [{"at": ts, "price": price, "status": status}
+              for ts, price, status in price_history.history(product_id, since=since)]
+    return jsonify({"id": product_id, "days": window / 86400, "points": points,
+                    "window": price_history.window(product_id, window)})
+
+@app.route("/api/jobs/status")
+def jobs_status():
+    """Fila de tarefas: profundidade, atraso da tarefa vencida mais antiga, vazão e execuções por tarefa."""
+    return jsonify(dict(scheduler.status(), enabled=JOBS_ENABLED))
+
+@app.template_filter("thumbnail_src")
+def _thumbnail_src(url):
+    """Com o proxy ligado, thumbnails do CDN do ML passam pela rota /thumbnails."""
+    if thumbnail_cache is not None and thumbnail_cache.allowed(url):
+        return url_for('thumbnail', url=url)
+    return url
+
+@app.route("/thumbnails")
+def thumbnail():
+    """Thumbnail servida do cache em disco; indisponível, redireciona para o placeholder local."""
+    if thumbnail_cache is None:
+        abort(404)
+    url = request.args.get('url', '')
+    if not thumbnail_cache.allowed(url):
+        abort(400)
+    path = thumbnail_cache.fetch(url)
+    if path is None:
+        return redirect(url_for('static', filename='placeholder.svg'))
+    return send_file(path, mimetype=thumbnail_cache.mimetype(path), max_age=7 * 24 * 3600)
+
+@app.route("/metrics")
+def metrics():
+    """Métricas deste worker no formato de exposição do Prometheus."""
+    return Response(REGISTRY.expose(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.route("/login")
 def login():
@@ -99,10 +651,10 @@ def callback():
     token_data = auth_service.exchange_code_for_token(code)
     
     if 'access_token' in token_data:
-        # Sucesso! Armazenamos os tokens na sessão
-        session['access_token'] = token_data['access_token']
-        if 'refresh_token' in token_data:
-            session['refresh_token'] = token_data['refresh_token']
+        # Sucesso! Armazenamos os tokens na sessão (com id novo) e agendamos a renovação proativa
+        session.rotate()
+        session['token_key'] = uuid.uuid4().hex
+        _store_session_tokens(token_manager.register(session['token_key'], token_data), replace=True)
         
         # Opcional: armazenar o user_id retornado pelo ML
         session['ml_user_id'] = token_data.get('user_id')
@@ -117,10 +669,100 @@ def callback():
 
 @app.route("/logout")
 def logout():
+    if session.get('token_key'):
+        token_manager.discard(session['token_key'])
     session.clear()
     logger.info("Sessão encerrada pelo usuário.")
     return redirect(url_for('index'))
 
+def create_app():
+    """
+    Factory para o gunicorn com preload_app (gunicorn.conf.py usa "app:create_app()").
+    Roda uma vez, no master: importa o que só seria importado na primeira chamada ao
+    ML, compila o template e congela os objetos já criados no GC, para que os workers
+    herdem tudo pelo fork (copy-on-write) em vez de repetir o trabalho a cada reciclagem.
+    """
+    preload_http()
+    app.jinja_env.get_template("index.html")
+    if preloading():
+        # Coletas do GC no worker não tocam (e não copiam) as páginas herdadas do master
+        gc.freeze()
+    return app
+
+@app.cli.command("export")
+@click.argument("queries_file", type=click.File("r", encoding="utf-8"))
+@click.option("-o", "--output", required=True, type=click.Path(dir_okay=False), help="arquivo de saída")
+@click.option("-f", "--format", "fmt", type=click.Choice(FORMATS), default="jsonl", show_default=True)
+@click.option("--per-query", type=click.IntRange(1), default=1000, show_default=True, help="máximo de produtos por busca")
+@click.option("--page-size", type=click.IntRange(1), default=MercadoLivreService.PAGE_SIZE, show_default=True,
+              help="itens por chamada ao /products/search")
+@click.option("--workers", type=click.IntRange(1), default=4, show_default=True, help="páginas buscadas em paralelo")
+@click.option("--checkpoint", type=click.Path(dir_okay=False), help="padrão: <saída>.checkpoint.json")
+@click.option("--restart", is_flag=True, help="ignora o checkpoint e recomeça do zero")
+def export_catalog(queries_file, output, fmt, per_query, page_size, workers, checkpoint, restart):
+    """Exporta os produtos normalizados das buscas de QUERIES_FILE (uma por linha).
+
+    Usa o token do modo .env (ML_ACCESS_TOKEN/ML_REFRESH_TOKEN). Um job
+    interrompido continua de onde parou ao rodar o mesmo comando de novo.
+    """
+    if token_manager.get(TokenManager.ENV_KEY) is None:
+        raise click.ClickException("Defina ML_ACCESS_TOKEN (e ML_REFRESH_TOKEN) no .env para exportar.")
+    queries = read_queries(queries_file)
+    if not queries:
+        raise click.ClickException("Nenhuma busca no arquivo.")
+
+    exporter = CatalogExporter(
+        _env_service, output, fmt=fmt, checkpoint_path=checkpoint, per_query=per_query, page_size=page_size,
+        workers=workers, on_unauthorized=_refresh_env_token,
+        progress=lambda items, rate: click.echo(f"{items} produtos | {rate:.0f} itens/s", err=True),
+    )
+    try:
+        stats = exporter.run(queries, restart=restart)
+    except ExportError as e:
+        raise click.ClickException(f"{e} (checkpoint salvo; rode de novo para retomar)")
+    click.echo(f"{stats['items']} produtos de {stats['queries']} buscas em {output} "
+               f"({stats['bytes'] / 2 ** 20:.1f} MB) | {stats['items_this_run']} nesta execução, "
+               f"{stats['items_per_sec']:.0f} itens/s" + (" | retomado do checkpoint" if stats['resumed'] else ""))
+
+@app.cli.command("sync")
+@click.argument("queries_file", type=click.File("r", encoding="utf-8"))
+@click.option("-o", "--output", type=click.Path(dir_okay=False), help="acrescenta os deltas (JSONL) a este arquivo")
+@click.option("--store", type=click.Path(dir_okay=False),
+              help="SQLite com o estado da última sincronização (padrão: ML_CATALOG_STORE/ML_CATALOG_STORE_PATH)")
+@click.option("--per-query", type=click.IntRange(1), default=MAX_FILTER_WINDOW, show_default=True,
+              help="máximo de produtos por busca")
+@click.option("--workers", type=click.IntRange(1), default=4, show_default=True, help="páginas buscadas em paralelo")
+def sync_catalog(queries_file, output, store, per_query, workers):
+    """Sincroniza as buscas de QUERIES_FILE e grava só o que mudou desde a última execução.
+
+    Cada produto novo, alterado ou removido vira uma linha JSONL com "op".
+    Sem um store SQLite, o estado vive só neste processo e tudo sai como novo.
+    """
+    if token_manager.get(TokenManager.ENV_KEY) is None:
+        raise click.ClickException("Defina ML_ACCESS_TOKEN (e ML_REFRESH_TOKEN) no .env para sincronizar.")
+    queries = read_queries(queries_file)
+    if not queries:
+        raise click.ClickException("Nenhuma busca no arquivo.")
+    sync = CatalogSync(_env_service, store=SQLiteCatalogStore(store) if store else catalog_sync.store,
+                       per_query=per_query, page_size=MercadoLivreService.PAGE_SIZE, workers=workers,
+                       on_unauthorized=_refresh_env_token)
+    sync.subscribe(_apply_catalog_delta)
+
+    failed = 0
+    with open(output, "ab") if output else open(os.devnull, "wb") as deltas:
+        for query in queries:
+            try:
+                delta = sync.refresh(query)
+            except (SyncError, UpstreamUnavailable) as e:
+                failed += 1
+                click.echo(str(e), err=True)
+                continue
+            deltas.write(encode_delta(delta))
+            click.echo(f"{query}: {len(delta.added)} novos, {len(delta.changed)} alterados, "
+                       f"{len(delta.removed)} removidos, {delta.unchanged} iguais")
+    if failed:
+        raise click.ClickException(f"{failed} de {len(queries)} buscas falharam (nada aplicado para elas)")
+
 if __name__ == "__main__":
     # Garante que temos uma secret_key configurada para as sessões funcionarem
     if not os.getenv("FLASK_SECRET_KEY"):
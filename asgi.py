@@ -0,0 +1,196 @@
+import os
+import time
+import logging
+import sys
+from quart import Quart, Response, g, render_template, request, redirect, session, url_for
+from services.config import load_env
+from services.auth import AsyncAuthService
+from services.mercado_livre import AsyncMercadoLivreService
+from services.http_client import AsyncHttpClient
+from services.cache import build_search_cache
+from services.single_flight import AsyncSingleFlight
+from services.metrics import REGISTRY, install_log_trace_ids, new_trace_id, current_trace_id
+
+# Modo assíncrono (ASGI): mesmas rotas e templates do app.py, mas as chamadas
+# ao Mercado Livre não bloqueiam o worker enquanto aguardam a API.
+#   gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+install_log_trace_ids()
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] [%(trace_id)s] %(name)s: %(message)s',
+    stream=sys.stdout
+)
+logger = logging.getLogger("ML_PROD")
+
+load_env()
+
+app = Quart(__name__)
+# Sessão no cookie assinado padrão do Quart: não usa as sessões no servidor nem o store de
+# tokens do app.py, então um login feito num modo não vale no outro
+app.secret_key = os.getenv("FLASK_SECRET_KEY")
+if not app.secret_key:
+    logger.critical("ERRO: FLASK_SECRET_KEY não definida no arquivo .env!")
+
+search_cache = build_search_cache()
+search_flight = AsyncSingleFlight()
+# O cliente httpx pertence ao event loop do worker: criado em before_serving
+http_client = None
+auth_service = None
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    "ml_request_seconds",
+    "Duração das requisições por rota, método e status (streaming: até o primeiro byte)",
+    ("route", "method", "status"),
+)
+REGISTRY.register_stats("ml_search_cache", search_cache.stats, "Cache de buscas",
+                        counters=("hits", "misses", "stale_hits", "stale_if_error", "evictions"))
+REGISTRY.register_stats("ml_search_single_flight", search_flight.stats, "Coalescência de buscas",
+                        counters=("calls", "coalesced"))
+
+# Limite de produtos por página da interface (acima de PAGE_SIZE a busca faz fan-out)
+MAX_PER_PAGE = 200
+
+def _pagination_args():
+    """Lê page/per_page da query string com valores seguros."""
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+    except ValueError:
+        page = 1
+    try:
+        per_page = min(MAX_PER_PAGE, max(1, int(request.args.get('per_page', 10))))
+    except ValueError:
+        per_page = 10
+    return page, per_page
+
+@app.before_serving
+async def startup():
+    global http_client, auth_service
+    http_client = AsyncHttpClient()
+    auth_service = AsyncAuthService(http_client)
+
+@app.after_serving
+async def shutdown():
+    await http_client.aclose()
+
+@app.before_request
+async def _start_request():
+    g.request_start = time.perf_counter()
+    new_trace_id(request.headers.get('X-Request-ID'))
+
+@app.after_request
+async def _finish_request(response):
+    response.headers['X-Request-ID'] = current_trace_id()
+    start = g.get('request_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_LATENCY.observe(time.perf_counter() - start, route, request.method, str(response.status_code))
+    return response
+
+@app.route("/")
+async def index():
+    # Recupera tokens e limpa possíveis espaços em branco
+    access_token = session.get('access_token') or os.getenv("ML_ACCESS_TOKEN", "")
+    if access_token: access_token = access_token.strip()
+
+    refresh_token = session.get('refresh_token') or os.getenv("ML_REFRESH_TOKEN", "")
+    if refresh_token: refresh_token = refresh_token.strip()
+
+    query = request.args.get('q', 'notebook')
+    page, per_page = _pagination_args()
+    offset = (page - 1) * per_page
+
+    products = []
+    error_message = None
+    has_next = False
+
+    if access_token:
+        ml_service = AsyncMercadoLivreService(access_token, http_client=http_client, cache=search_cache, single_flight=search_flight)
+        results = await ml_service.search_all(query, offset=offset, total=per_page)
+
+        # Renovação Automática
+        if isinstance(results, dict) and results.get('error') == 'auth_expired' and refresh_token:
+            logger.info("Access token expirado. Tentando renovação automática...")
+            new_tokens = await auth_service.refresh_access_token(refresh_token)
+
+            if 'access_token' in new_tokens:
+                access_token = new_tokens['access_token']
+                session['access_token'] = access_token
+                if 'refresh_token' in new_tokens:
+                    session['refresh_token'] = new_tokens['refresh_token']
+
+                ml_service = AsyncMercadoLivreService(access_token, http_client=http_client, cache=search_cache, single_flight=search_flight)
+                results = await ml_service.search_all(query, offset=offset, total=per_page)
+            else:
+                error_message = "Sua sessão expirou. Por favor, conecte sua conta novamente."
+                access_token = None # Força re-login
+
+        if isinstance(results, list):
+            products = results
+            has_next = len(results) == per_page
+        elif isinstance(results, dict) and 'error' in results:
+            error_message = results.get('message', "Ocorreu um erro ao buscar produtos.")
+    else:
+        error_message = "Conecte sua conta do Mercado Livre para realizar buscas no catálogo."
+
+    return await render_template("index.html",
+                                 products=products,
+                                 error_message=error_message,
+                                 is_logged_in=bool(access_token),
+                                 user_id=session.get('ml_user_id') or os.getenv("ML_USER_ID"),
+                                 query=query,
+                                 page=page,
+                                 per_page=per_page,
+                                 has_next=has_next,
+                                 filter_args={})
+
+@app.template_filter("thumbnail_src")
+def _thumbnail_src(url):
+    # O proxy de thumbnails só existe no modo WSGI (app.py)
+    return url
+
+@app.route("/metrics")
+async def metrics():
+    """Métricas deste worker no formato de exposição do Prometheus."""
+    return Response(REGISTRY.expose(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route("/login")
+async def login():
+    url = auth_service.get_auth_url()
+    if not url:
+        logger.error("Não foi possível gerar a URL de login. Verifique as credenciais no .env")
+        return redirect(url_for('index', error="config_error"))
+    return redirect(url)
+
+@app.route("/callback")
+async def callback():
+    code = request.args.get('code')
+    error = request.args.get('error')
+
+    if error:
+        logger.error(f"Erro retornado pelo Mercado Livre no callback: {error}")
+        return redirect(url_for('index', auth_error="access_denied"))
+
+    if not code:
+        logger.warning("Callback acessado sem código de autorização.")
+        return redirect(url_for('index'))
+
+    token_data = await auth_service.exchange_code_for_token(code)
+
+    if 'access_token' in token_data:
+        session['access_token'] = token_data['access_token']
+        if 'refresh_token' in token_data:
+            session['refresh_token'] = token_data['refresh_token']
+        session['ml_user_id'] = token_data.get('user_id')
+
+        logger.info(f"Autenticação bem-sucedida para o usuário {session['ml_user_id']}")
+        return redirect(url_for('index'))
+    else:
+        error_msg = token_data.get('error_description', token_data.get('message', 'Erro desconhecido'))
+        logger.error(f"Falha na troca do token: {error_msg}")
+        return redirect(url_for('index', auth_error=error_msg))
+
+@app.route("/logout")
+async def logout():
+    session.clear()
+    logger.info("Sessão encerrada pelo usuário.")
+    return redirect(url_for('index'))
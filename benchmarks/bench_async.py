@@ -0,0 +1,120 @@
+"""
+Benchmark de carga: modo síncrono (gunicorn sync) vs assíncrono (uvicorn worker)
+contra um upstream local lento.
+
+    python benchmarks/bench_async.py --latency 0.5 --concurrency 50 --requests 300
+
+Cada requisição usa uma busca diferente para que cache e single-flight
+não escondam a espera pelo upstream.
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+import statistics
+
+import httpx
+
+from fake_ml_api import FakeMLApi
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    "sync": ["gunicorn", "app:app"],
+    "async": ["gunicorn", "-k", "uvicorn.workers.UvicornWorker", "asgi:app"],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, upstream_url, workers):
+    port = free_port()
+    env = dict(os.environ,
+               ML_API_BASE_URL=upstream_url,
+               ML_ACCESS_TOKEN="bench-token",
+               FLASK_SECRET_KEY="bench-secret",
+               ML_CACHE_TTL="0",
+               ML_CACHE_STALE_TTL="0")
+    cmd = [sys.executable, "-m"] + MODES[mode][:1] + ["-w", str(workers), "-b", f"127.0.0.1:{port}",
+                                                      "--log-level", "warning"] + MODES[mode][1:]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return proc, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"Servidor {mode} não subiu")
+
+
+async def run_load(base_url, total, concurrency, timeout):
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async with httpx.AsyncClient(timeout=timeout, limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                i = queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    response = await client.get(f"{base_url}/", params={"q": f"bench-{i}"})
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.5, help="latência do upstream em segundos")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--modes", default="sync,async")
+    args = parser.parse_args()
+
+    upstream = FakeMLApi(latency=args.latency).start()
+    print(f"upstream={upstream.url} latência={args.latency}s concorrência={args.concurrency} workers={args.workers}")
+    try:
+        for mode in args.modes.split(","):
+            proc, base_url = start_server(mode, upstream.url, args.workers)
+            try:
+                result = asyncio.run(run_load(base_url, args.requests, args.concurrency, timeout=120))
+            finally:
+                proc.terminate()
+                proc.wait()
+            print(f"{mode:>5}: {result['rps']:8.1f} req/s  p50={result['p50_ms']:8.1f} ms  "
+                  f"p99={result['p99_ms']:8.1f} ms  erros={result['errors']}")
+    finally:
+        upstream.stop()
+
+
+if __name__ == "__main__":
+    main()
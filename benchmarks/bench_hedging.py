@@ -0,0 +1,103 @@
+"""
+Cauda de latência da busca com prazo por requisição e hedging, contra um
+upstream local em que uma fração das buscas é muito mais lenta.
+
+    python benchmarks/bench_hedging.py --tail-rate 0.05 --tail-latency 2 --requests 400
+
+Cada cenário faz as mesmas buscas (sem cache, uma busca diferente por chamada)
+com `--concurrency` threads: sem nada (timeout fixo de 10 s), só com prazo
+(`--budget`), só com hedging e com os dois. Mostra p50/p95/p99/máx, buscas que
+estouraram o prazo e quantas chamadas extras o hedging fez ao upstream.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_ml_api import spawn
+from services.deadline import start_deadline
+from services.hedging import Hedger
+from services.http_client import HttpClient
+from services.mercado_livre import MercadoLivreService
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def upstream_searches(url):
+    with urllib.request.urlopen(f"{url}/__stats") as response:
+        return json.load(response)["search"]
+
+
+def run(url, requests, concurrency, budget, hedger):
+    http = HttpClient(pool_maxsize=concurrency * 2, retries=0)
+    service = MercadoLivreService("fake-access", http_client=http, hedger=hedger)
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def search(i):
+        start_deadline(budget)
+        start = time.perf_counter()
+        results = service.search_products(f"notebook {i}", limit=10)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not isinstance(results, list):
+                errors.append(results.get("reason") or results.get("error"))
+
+    before = upstream_searches(url)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(search, range(requests)))
+    calls = upstream_searches(url) - before
+    http.close()
+    return latencies, errors, calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.02, help="latência base do upstream (s)")
+    parser.add_argument("--tail-rate", type=float, default=0.05, help="fração das buscas lentas")
+    parser.add_argument("--tail-latency", type=float, default=2.0, help="latência extra das buscas lentas (s)")
+    parser.add_argument("--budget", type=float, default=1.0, help="prazo por requisição (s)")
+    parser.add_argument("--percentile", type=float, default=0.9, help="percentil que dispara a cópia")
+    parser.add_argument("--max-ratio", type=float, default=0.1, help="fração máxima de cópias")
+    args = parser.parse_args()
+
+    upstream, url = spawn(latency=args.latency, tail_rate=args.tail_rate, tail_latency=args.tail_latency)
+    MercadoLivreService.API_BASE_URL = url
+    scenarios = (
+        ("timeout fixo", None, False),
+        ("prazo", args.budget, False),
+        ("hedging", None, True),
+        ("prazo + hedging", args.budget, True),
+    )
+    try:
+        print(f"{args.requests} buscas, {args.concurrency} simultâneas; upstream {args.latency * 1000:.0f} ms, "
+              f"{args.tail_rate:.0%} com +{args.tail_latency:.1f} s")
+        for name, budget, hedged in scenarios:
+            hedger = Hedger(percentile=args.percentile, max_ratio=args.max_ratio) if hedged else None
+            # Aquecimento: conexões do pool abertas e amostras de latência para o percentil do hedger
+            run(url, 50, args.concurrency, None, hedger)
+            latencies, errors, calls = run(url, args.requests, args.concurrency, budget, hedger)
+            extra = calls - args.requests
+            print(f"  {name:<16} p50 {percentile(latencies, 0.5) * 1000:7.1f} ms | "
+                  f"p95 {percentile(latencies, 0.95) * 1000:7.1f} ms | p99 {percentile(latencies, 0.99) * 1000:7.1f} ms | "
+                  f"máx {max(latencies) * 1000:7.1f} ms | prazo estourado {errors.count('deadline'):3d} | "
+                  f"chamadas extras {extra} ({extra / args.requests:.1%})")
+    finally:
+        upstream.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Micro-benchmark do normalizador colunar (normalize_batch) contra o loop por item original.
+
+    python benchmarks/bench_normalizer.py --sizes 10000,100000
+
+Antes de medir, confere que as duas implementações produzem exatamente a mesma saída.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.normalizer import normalize_batch
+from fake_ml_api import make_product
+
+
+def legacy_normalize(results):
+    """Loop por item original de MercadoLivreService._normalize_results (referência)."""
+    normalized = []
+    for item in results:
+        # Captura atributos (exige pelo menos 3)
+        raw_attributes = item.get('attributes', [])
+        attrs_dict = {attr.get('id'): attr.get('value_name') for attr in raw_attributes if attr.get('value_name')}
+
+        # Atributos específicos solicitados no desafio ou relevantes
+        display_attrs = []
+
+        # Tenta pegar Marca, Cor e um terceiro (Capacidade ou Modelo)
+        brand = attrs_dict.get('BRAND', attrs_dict.get('MARCA', 'Não informado'))
+        color = attrs_dict.get('COLOR', attrs_dict.get('COR', 'Não informado'))
+
+        # Terceiro atributo dinâmico (Capacidade, Modelo ou o primeiro disponível que não seja marca/cor)
+        model = attrs_dict.get('MODEL', attrs_dict.get('MODELO'))
+        capacity = attrs_dict.get('CAPACITY', attrs_dict.get('CAPACIDADE'))
+        third_attr = capacity or model or "Não informado"
+
+        # Se ainda faltar, pega qualquer outro disponível
+        if third_attr == "Não informado":
+            for k, v in attrs_dict.items():
+                if k not in ['BRAND', 'MARCA', 'COLOR', 'COR'] and v:
+                    third_attr = v
+                    break
+
+        # Imagem e Placeholder
+        thumbnail = item.get('thumbnail', '')
+
+        # Se não tiver thumbnail, tenta pegar da lista 'pictures'
+        if not thumbnail and 'pictures' in item and len(item['pictures']) > 0:
+            thumbnail = item['pictures'][0].get('url', '')
+
+        # Força HTTPS para evitar Mixed Content Block
+        if thumbnail and thumbnail.startswith('http://'):
+            thumbnail = thumbnail.replace('http://', 'https://')
+
+        has_image = bool(thumbnail and "placeholder" not in thumbnail.lower())
+
+        # Melhorar qualidade da imagem se possível
+        if has_image and thumbnail.endswith('-I.jpg'):
+            thumbnail = thumbnail.replace('-I.jpg', '-V.jpg')
+        elif has_image and '-I.png' in thumbnail: # Suporte a PNG
+            thumbnail = thumbnail.replace('-I.png', '-V.png')
+
+        # Tratamento de Preço (API de Catálogo é diferente)
+        price = item.get('price')
+        if not price:
+            # Tenta pegar do buy_box_winner ou price_range que é comum no catalogo
+            buy_box = item.get('buy_box_winner', {})
+            price = buy_box.get('price')
+
+        if not price:
+             # Fallback para range de preço se não tiver preço fixo
+             price_range = item.get('price_range', {})
+             price = price_range.get('min_price', 0)
+
+        # Tratamento de Link (Permalink)
+        permalink = item.get('permalink')
+        if not permalink:
+            # Constrói o link manualmente se não vier
+            permalink = f"https://www.mercadolivre.com.br/p/{item.get('id')}"
+
+        normalized.append({
+            'id': item.get('id'),
+            'title': item.get('name', item.get('title', 'Sem título')), 
+            'status': 'Ativo' if item.get('status') == 'active' else item.get('status', 'Inativo'),
+            'price': price or 0,
+            'thumbnail': thumbnail if has_image else None,
+            'has_image': has_image,
+            'permalink': permalink,
+            'brand': brand,
+            'color': color,
+            'additional_attr': third_attr,
+            'attributes': [
+                {'label': 'Marca', 'value': brand},
+                {'label': 'Cor', 'value': color},
+                {'label': 'Capacidade/Modelo', 'value': third_attr}
+            ]
+        })
+    return normalized
+
+
+def synthetic_payload(size, seed=42):
+    """Itens no formato do /products/search com variações de atributos, imagens e preço."""
+    rng = random.Random(seed)
+    items = []
+    for i in range(size):
+        item = make_product(i)
+        roll = rng.random()
+        if roll < 0.1:
+            item["attributes"] = [{"id": "MARCA", "value_name": "Positivo"}, {"id": "VOLTAGE", "value_name": "Bivolt"}]
+        elif roll < 0.2:
+            item["attributes"] = []
+        if rng.random() < 0.1:
+            item.pop("price")
+            item["buy_box_winner"] = {"price": 99.9}
+        if rng.random() < 0.05:
+            item["thumbnail"] = ""
+            item["pictures"] = [{"url": f"http://http2.mlstatic.com/P_{i}-I.png"}]
+        items.append(item)
+    return items
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for size in (int(s) for s in args.sizes.split(",")):
+        payload = synthetic_payload(size)
+        assert normalize_batch(payload).to_dicts() == legacy_normalize(payload), "saídas divergentes"
+
+        legacy = best_of(lambda: legacy_normalize(payload), args.repeat)
+        columns = best_of(lambda: normalize_batch(payload), args.repeat)
+        dicts = best_of(lambda: normalize_batch(payload).to_dicts(), args.repeat)
+        print(f"{size:>7} itens: loop original {legacy * 1000:8.1f} ms | "
+              f"colunar {columns * 1000:8.1f} ms ({legacy / columns:4.2f}x) | "
+              f"colunar + dicts {dicts * 1000:8.1f} ms ({legacy / dicts:4.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Micro-benchmark do cache de páginas renderizadas (RenderedPageCache) na rota /.
+
+    python benchmarks/bench_page_cache.py --per-page 50 --requests 500
+
+Compara, pelo test client do Flask e sem rede (busca já em memória):
+renderização completa, entrada expirada com o mesmo contexto (corpo reaproveitado),
+página servida do cache (200) e requisição condicional (304). Páginas acima de
+ML_SEARCH_PAGE_SIZE são enviadas em streaming e não passam pelo cache.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("FLASK_SECRET_KEY", "bench")
+
+from services.normalizer import normalize_batch
+from services.mercado_livre import MercadoLivreService
+from bench_normalizer import synthetic_payload
+import app as app_module
+
+
+def measure(client, url, requests, headers=None, before=None):
+    timings = []
+    for _ in range(requests):
+        if before:
+            before()
+        start = time.perf_counter()
+        response = client.get(url, headers=headers or {})
+        response.get_data()
+        timings.append(time.perf_counter() - start)
+    return response, timings
+
+
+def report(label, timings, baseline=None):
+    median = statistics.median(timings)
+    speedup = f" ({baseline / median:5.1f}x)" if baseline else ""
+    print(f"  {label:<26} mediana {median * 1e6:8.0f} µs | p95 {sorted(timings)[int(len(timings) * 0.95)] * 1e6:8.0f} µs{speedup}")
+    return median
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--per-page", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+    if args.per_page > MercadoLivreService.PAGE_SIZE:
+        parser.error(f"--per-page acima de {MercadoLivreService.PAGE_SIZE} usa streaming (sem cache de página)")
+
+    products = normalize_batch(synthetic_payload(args.per_page)).to_dicts()
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess['access_token'] = 'bench-token'
+    url = f"/?q=notebook&per_page={args.per_page}"
+
+    with patch.object(MercadoLivreService, "search_products", lambda self, query, offset=0, limit=10: products):
+        print(f"{args.per_page} produtos por página, {args.requests} requisições:")
+        _, full = measure(client, url, args.requests, before=app_module.page_cache.clear)
+        baseline = report("renderização completa", full)
+
+        app_module.page_cache.ttl, ttl = 0, app_module.page_cache.ttl
+        _, reused = measure(client, url, args.requests)
+        app_module.page_cache.ttl = ttl
+        report("expirada, mesmo contexto", reused, baseline)
+
+        response, hits = measure(client, url, args.requests)
+        report("cache (200)", hits, baseline)
+
+        etag = response.headers["ETag"]
+        response, conditional = measure(client, url, args.requests, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        report("condicional (304)", conditional, baseline)
+        print(f"  corpo: {len(client.get(url).data)} bytes | {app_module.page_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Ingestão e consultas do histórico de preços (PriceHistory).
+
+    python benchmarks/bench_price_history.py --points 3000000 --products 100000 --days 7
+
+Grava os pontos em páginas de 50 produtos, como chegam das buscas (cada
+produto num passeio aleatório de preço, instantes espalhados por `--days`
+dias), e mede: pontos/s na ingestão (com os flushes e compactações em
+segundo plano), bytes por ponto no disco, amplificação de escrita (bytes
+gravados / bytes finais) e a latência das consultas: série de um produto,
+mín/máx na janela e quedas de preço no último dia (com os segmentos já
+decodificados e a frio).
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.price_history import PriceHistory
+
+DAY = 86400
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def ingest(history, points, products, days, seed=42):
+    rng = random.Random(seed)
+    prices = [rng.uniform(50, 5000) for _ in range(products)]
+    ids = [f"MLB{i:010d}" for i in range(products)]
+    start_ts = int(time.time()) - days * DAY
+    step = days * DAY / points
+    page = []
+    start = time.perf_counter()
+    for n in range(points):
+        i = rng.randrange(products)
+        prices[i] = max(1.0, prices[i] * rng.uniform(0.97, 1.03))
+        page.append({"id": ids[i], "price": round(prices[i], 2), "status": "active"})
+        if len(page) == 50:
+            history.record(page, now=start_ts + int(n * step))
+            page = []
+    history.record(page, now=start_ts + int(points * step))
+    history.close()
+    return time.perf_counter() - start, ids
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=3000000)
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="bench_price_history_")
+    try:
+        # min_interval=0: todo ponto é gravado (pior caso; em produção repetições são descartadas)
+        history = PriceHistory(directory, min_interval=0, flush_interval=10 ** 9, max_tracked=args.products)
+        elapsed, ids = ingest(history, args.points, args.products, args.days)
+        stats = history.stats()
+        print(f"ingestão: {args.points} pontos em {elapsed:.1f} s ({args.points / elapsed:,.0f} pontos/s, "
+              f"{args.points / elapsed * DAY / 1e6:,.0f} M/dia)")
+        print(f"disco: {stats['segments']} segmentos, {stats['bytes'] / 2 ** 20:.1f} MiB "
+              f"({stats['bytes'] / stats['points']:.2f} B/ponto) | {stats['flushes']} flushes, {stats['merges']} fusões | "
+              f"amplificação de escrita {stats['bytes_written'] / stats['bytes']:.2f}x "
+              f"({stats['points_written'] / stats['points']:.2f} gravações por ponto)")
+
+        rng = random.Random(7)
+        now = int(time.time())
+        cold = time.perf_counter()
+        history.history(ids[0])
+        cold = time.perf_counter() - cold
+        series = timed(lambda: history.history(rng.choice(ids)), args.repeat)
+        window = timed(lambda: history.window(rng.choice(ids), DAY, now=now), args.repeat)
+        print(f"série de um produto: a frio {cold * 1000:.0f} ms (decodifica os segmentos) | "
+              f"p50 {percentile(series, 0.5) * 1e6:.0f} µs | p99 {percentile(series, 0.99) * 1e6:.0f} µs")
+        print(f"mín/máx em 1 dia:    p50 {percentile(window, 0.5) * 1e6:.0f} µs | "
+              f"p99 {percentile(window, 0.99) * 1e6:.0f} µs")
+        drops = timed(lambda: history.price_drops(DAY, 0.05, now=now), 5)
+        print(f"quedas >= 5% em 1 dia ({len(history.price_drops(DAY, 0.05, limit=10 ** 9, now=now))} produtos): "
+              f"{min(drops) * 1000:.0f} ms")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
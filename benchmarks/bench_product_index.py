@@ -0,0 +1,92 @@
+"""
+Micro-benchmark do índice local de produtos (ProductIndex) contra a varredura linear.
+
+    python benchmarks/bench_product_index.py --size 100000
+
+Mede a inserção incremental (páginas de 50 itens), filtros por faceta, faixa de
+preço e contagem de facetas. Cada consulta é conferida contra a varredura antes de medir.
+"""
+import os
+import sys
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.normalizer import normalize_batch
+from services.product_index import ProductIndex
+from bench_normalizer import synthetic_payload, best_of
+
+
+def linear_search(products, filters=None, min_price=None, max_price=None):
+    """Referência: percorre todos os produtos a cada consulta."""
+    filters = {k: str(v).casefold() for k, v in (filters or {}).items()}
+    found = []
+    for product in products:
+        if any(str(product.get(k)).casefold() != v for k, v in filters.items()):
+            continue
+        price = product.get('price') or 0
+        if min_price is not None and price < min_price:
+            continue
+        if max_price is not None and price > max_price:
+            continue
+        found.append(product)
+    return found
+
+
+def linear_facets(products):
+    counts = {facet: {} for facet in ProductIndex.FACETS}
+    for product in products:
+        for facet in ProductIndex.FACETS:
+            value = product.get(facet)
+            counts[facet][value] = counts[facet].get(value, 0) + 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    products = normalize_batch(synthetic_payload(args.size)).to_dicts()
+    pages = [products[i:i + args.page_size] for i in range(0, len(products), args.page_size)]
+
+    def build():
+        index = ProductIndex(max_products=args.size)
+        for page in pages:
+            index.add(page, query="notebook")
+        return index
+
+    insert = best_of(build, args.repeat)
+    # Memória medida numa construção à parte (tracemalloc distorce os tempos)
+    tracemalloc.start()
+    index = build()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{args.size} produtos: inserção {insert * 1000:.1f} ms "
+          f"({insert / len(pages) * 1e6:.0f} µs/página), índice {memory / 1e6:.1f} MB")
+
+    cases = [
+        ("marca", dict(filters={'brand': 'Dell'})),
+        ("marca + cor", dict(filters={'brand': 'Dell', 'color': 'Prata'})),
+        ("faixa de preço estreita", dict(min_price=1500, max_price=1550)),
+        ("marca + cor + preço", dict(filters={'brand': 'Lenovo', 'color': 'Preto'}, max_price=2000)),
+    ]
+    for label, kwargs in cases:
+        expected = [p['id'] for p in linear_search(products, **kwargs)]
+        assert [p['id'] for p in index.search("notebook", **kwargs)] == expected, f"divergência em {label}"
+        scan = best_of(lambda: linear_search(products, **kwargs), args.repeat)
+        indexed = best_of(lambda: index.search("notebook", **kwargs), args.repeat)
+        print(f"  {label:<26} {len(expected):>7} itens | varredura {scan * 1000:7.1f} ms | "
+              f"índice {indexed * 1000:7.1f} ms ({scan / indexed:5.1f}x)")
+
+    scan = best_of(lambda: linear_facets(products), args.repeat)
+    indexed = best_of(lambda: index.facets("notebook", {'color': 'Prata'}), args.repeat)
+    print(f"  {'facetas':<26} {'':>7}       | varredura {scan * 1000:7.1f} ms | "
+          f"índice {indexed * 1000:7.1f} ms ({scan / indexed:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Memória dos produtos guardados no cache: registros compactos (Product) contra dicts.
+
+    python benchmarks/bench_product_memory.py --size 100000
+
+Simula o cache de buscas de um worker: páginas de 50 itens chegam como JSON
+(cada página decodificada à parte, como na resposta do ML), são normalizadas
+e ficam retidas. Mede com tracemalloc a memória que sobra depois de descartar
+o JSON, para três layouts: o dict por produto com `attributes` próprio (loop
+original), os dicts de to_dicts (attributes compartilhado) e os Product de to_records.
+"""
+import os
+import gc
+import sys
+import json
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.normalizer import normalize_batch, shared_attributes
+from bench_normalizer import synthetic_payload, legacy_normalize
+
+
+LAYOUTS = [
+    ("dicts (loop original)", legacy_normalize),
+    ("dicts (to_dicts)", lambda items: normalize_batch(items).to_dicts()),
+    ("Product (to_records)", lambda items: normalize_batch(items).to_records()),
+]
+
+
+def retained(pages, layout):
+    """Bytes retidos depois de normalizar e guardar todas as páginas."""
+    shared_attributes.cache_clear()
+    gc.collect()
+    tracemalloc.start()
+    cached = [layout(json.loads(raw)) for raw in pages]
+    gc.collect()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert sum(len(page) for page in cached) == sum(len(json.loads(raw)) for raw in pages)
+    return memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--page-size", type=int, default=50)
+    args = parser.parse_args()
+
+    items = synthetic_payload(args.size)
+    pages = [json.dumps(items[i:i + args.page_size]).encode() for i in range(0, len(items), args.page_size)]
+    del items
+
+    # As três representações precisam descrever os mesmos produtos
+    sample = json.loads(pages[0])
+    assert normalize_batch(sample).to_records() == legacy_normalize(sample), "saídas divergentes"
+
+    print(f"{args.size} produtos em cache ({len(pages)} páginas de {args.page_size}):")
+    baseline = None
+    for label, layout in LAYOUTS:
+        memory = retained(pages, layout)
+        baseline = baseline or memory
+        print(f"  {label:<24} {memory / 1e6:7.1f} MB | {memory / args.size:6.0f} B/produto | "
+              f"{baseline / memory:4.1f}x")
+
+
+if __name__ == "__main__":
+    main()
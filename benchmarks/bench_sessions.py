@@ -0,0 +1,89 @@
+"""
+Micro-benchmark do custo de sessão por requisição: cookie assinado do Flask
+contra sessões no servidor (memória e SQLite, com e sem cache de leitura).
+
+    python benchmarks/bench_sessions.py --requests 5000
+
+Mede open_session + save_session do SessionInterface numa requisição com a
+sessão de um usuário logado (tokens OAuth, token_key, user id): leitura pura
+(o caso comum) e leitura com renovação de token (a sessão é regravada), além
+do tamanho do cookie enviado em cada requisição.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, Response
+from flask.sessions import SecureCookieSessionInterface
+from services.session_store import MemorySessionBackend, SQLiteSessionBackend, ServerSideSessionInterface
+
+SESSION = {
+    "access_token": "APP_USR-1234567890123456-101712-0123456789abcdef0123456789abcdef-123456789",
+    "refresh_token": "TG-0123456789abcdef01234567-123456789",
+    "token_expires_at": 1792243200.123,
+    "token_key": "0123456789abcdef0123456789abcdef",
+    "ml_user_id": 123456789,
+}
+
+
+def measure(app, requests, cookie, modify):
+    interface = app.session_interface
+    timings = []
+    with app.test_request_context("/", headers={"Cookie": f"session={cookie}"}) as ctx:
+        for i in range(requests):
+            # Cookies já parseados pelo werkzeug: mede só o trabalho da sessão
+            start = time.perf_counter()
+            session = interface.open_session(app, ctx.request)
+            session.get("access_token")
+            if modify:
+                session["access_token"] = f"APP_USR-renovado-{i}"
+            interface.save_session(app, session, Response())
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def login_cookie(app):
+    with app.test_request_context("/") as ctx:
+        session = app.session_interface.open_session(app, ctx.request)
+        session.update(SESSION)
+        response = Response()
+        app.session_interface.save_session(app, session, response)
+    return response.headers["Set-Cookie"].split(";", 1)[0].split("=", 1)[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="bench-sessions-")
+    variants = [
+        ("cookie assinado", SecureCookieSessionInterface()),
+        ("memória", ServerSideSessionInterface(MemorySessionBackend())),
+        ("sqlite sem cache", ServerSideSessionInterface(
+            SQLiteSessionBackend(os.path.join(directory, "a.sqlite3"), cache_ttl=0))),
+        ("sqlite + cache 1 s", ServerSideSessionInterface(
+            SQLiteSessionBackend(os.path.join(directory, "b.sqlite3"), cache_ttl=1))),
+    ]
+    print(f"{args.requests} requisições por variante (open_session + save_session):")
+    print(f"  {'':<20} {'leitura':>14} {'com escrita':>14} {'cookie':>10}")
+    baseline = None
+    for label, interface in variants:
+        app = Flask(__name__)
+        app.secret_key = "bench"
+        app.session_interface = interface
+        cookie = login_cookie(app)
+        read = statistics.median(measure(app, args.requests, cookie, modify=False))
+        write = statistics.median(measure(app, args.requests, cookie, modify=True))
+        baseline = baseline or read
+        print(f"  {label:<20} {read * 1e6:11.1f} µs {write * 1e6:11.1f} µs {len(cookie):7d} B"
+              f"  ({baseline / read:4.1f}x na leitura)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Custo de subir um worker: tempo de import do app e tempo até a primeira resposta.
+
+    python benchmarks/bench_startup.py --workers 4
+
+Compara um worker frio (processo novo que importa o app, como no gunicorn sem
+preload a cada reciclagem) com workers criados por fork de um master que já
+carregou o app com create_app() (gunicorn.conf.py). A primeira resposta é um
+GET / sem login (template renderizado, sem chamada ao ML). Também lista os
+módulos mais caros do import, pelo -X importtime do Python.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENV = dict(os.environ, FLASK_SECRET_KEY="bench", ML_WARMUP_ENABLED="0", ML_ACCESS_TOKEN="", ML_REFRESH_TOKEN="")
+
+COLD = """
+import json, time
+start = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+app.test_client().get('/')
+first = time.perf_counter()
+app.test_client().get('/')
+print(json.dumps({"import": imported - start, "first": first - imported, "second": time.perf_counter() - first}))
+"""
+
+PRELOADED = """
+import os, json, time
+start = time.perf_counter()
+from app import create_app
+app = create_app()
+loaded = time.perf_counter() - start
+results = []
+for _ in range(%d):
+    read, write = os.pipe()
+    if os.fork() == 0:
+        os.close(read)
+        forked = time.perf_counter()
+        from app import start_background_tasks
+        start_background_tasks()
+        app.test_client().get('/')
+        first = time.perf_counter()
+        app.test_client().get('/')
+        os.write(write, json.dumps({"first": first - forked, "second": time.perf_counter() - first}).encode())
+        os._exit(0)
+    os.close(write)
+    data = b""
+    while chunk := os.read(read, 4096):
+        data += chunk
+    os.wait()
+    results.append(json.loads(data))
+print(json.dumps({"load": loaded, "workers": results}))
+"""
+
+
+def run(code, env):
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def heaviest_imports(top):
+    """Módulos com maior tempo próprio no import do app (python -X importtime)."""
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT, env=ENV,
+                            capture_output=True, text=True, check=True)
+    rows = []
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        rows.append((int(self_us), int(cumulative_us), name.strip()))
+    total = next((cumulative for _, cumulative, name in rows if name == "app"), 0)
+    return total, sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    total, rows = heaviest_imports(args.top)
+    print(f"import app: {total / 1000:.1f} ms (cumulativo). Módulos mais caros (tempo próprio):")
+    for self_us, cumulative_us, name in rows:
+        print(f"  {name:<40} {self_us / 1000:7.1f} ms | cumulativo {cumulative_us / 1000:7.1f} ms")
+
+    cold = min((run(COLD, ENV) for _ in range(args.repeat)), key=lambda r: r["import"] + r["first"])
+    print(f"worker frio:       import {cold['import'] * 1000:7.1f} ms | 1ª resposta {cold['first'] * 1000:6.1f} ms | "
+          f"2ª {cold['second'] * 1000:5.1f} ms | pronto em {(cold['import'] + cold['first']) * 1000:7.1f} ms")
+
+    preloaded = run(PRELOADED % args.workers, dict(ENV, ML_PRELOAD="1"))
+    print(f"master (preload):  create_app {preloaded['load'] * 1000:7.1f} ms, uma vez")
+    for i, worker in enumerate(preloaded["workers"], 1):
+        print(f"  worker {i} (fork): 1ª resposta {worker['first'] * 1000:6.1f} ms | 2ª {worker['second'] * 1000:5.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark do modo streaming (stream_products) contra o parse da página inteira
+(response.json() + normalização) em uma página grande de /products/search.
+
+    python benchmarks/bench_streaming.py --items 50000 --bandwidth 20000000
+
+Cada modo roda em um processo separado para que o pico de RSS seja independente.
+Mede: tempo até o primeiro produto, tempo total, pico de RSS e pico de alocação Python.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+from fake_ml_api import spawn
+
+
+def run_mode(mode, url, items):
+    from services.http_client import HttpClient
+    from services.mercado_livre import MercadoLivreService
+    from services.normalizer import normalize_batch
+
+    MercadoLivreService.API_BASE_URL = url
+    service = MercadoLivreService("bench-token", http_client=HttpClient())
+    first = None
+    count = 0
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    if mode == "full":
+        url_, params, _ = service._build_search("notebook", 0, items)
+        response = service.http.get(url_, params=params, headers=service.headers)
+        batch = normalize_batch(response.json().get("results", []))
+        for product in batch.to_dicts():
+            if first is None:
+                first = time.perf_counter() - start
+            count += 1
+    else:
+        for product in service.stream_products("notebook", limit=items):
+            if first is None:
+                first = time.perf_counter() - start
+            count += 1
+
+    total = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    print(json.dumps({
+        "mode": mode,
+        "items": count,
+        "first_ms": round(first * 1000, 1),
+        "total_ms": round(total * 1000, 1),
+        "peak_alloc_mb": round(peak / 2 ** 20, 1),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--bandwidth", type=int, default=20_000_000, help="bytes/s do upstream local")
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        return run_mode(args.mode, args.url, args.items)
+
+    upstream, url = spawn(bandwidth=args.bandwidth)
+    try:
+        for mode in ("full", "stream"):
+            output = subprocess.check_output([sys.executable, __file__, "--mode", mode, "--url", url,
+                                              "--items", str(args.items)])
+            result = json.loads(output.decode().strip().splitlines()[-1])
+            print(f"{mode:>6}: primeiro produto {result['first_ms']:8.1f} ms | total {result['total_ms']:8.1f} ms | "
+                  f"pico RSS {result['max_rss_mb']:6.1f} MB | pico alocação {result['peak_alloc_mb']:6.1f} MB")
+    finally:
+        upstream.terminate()
+        upstream.wait()
+
+
+if __name__ == "__main__":
+    main()
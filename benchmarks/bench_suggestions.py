@@ -0,0 +1,87 @@
+"""
+Latência do índice de sugestões (SuggestionIndex) com 1 milhão de termos.
+
+    python benchmarks/bench_suggestions.py --terms 1000000
+
+Monta o índice como em produção (páginas de 50 produtos com título e marca,
+mais buscas repetidas), confere algumas consultas contra a varredura linear e
+mede a latência de prefixos curtos (intervalos enormes), médios e longos.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.suggestions import SuggestionIndex, suggestion_key
+
+WORDS = ["notebook", "celular", "cadeira", "mochila", "monitor", "mouse", "teclado", "fone", "tablet",
+         "smartwatch", "geladeira", "fogão", "lavadora", "gamer", "pro", "max", "ultra", "preto", "prata",
+         "azul", "128gb", "256gb", "16gb", "8gb", "i5", "i7", "ryzen", "bivolt", "sem fio", "ergonômica"]
+BRANDS = ["Dell", "Samsung", "Apple", "Lenovo", "Motorola", "Xiaomi", "Positivo", "Acer", "LG", "Brastemp"]
+PREFIXES = ["n", "no", "note", "notebook g", "cel", "s", "ge", "mo", "ergo", "notebook dell pr", "xyz"]
+
+
+def build(terms, seed=42):
+    rng = random.Random(seed)
+    index = SuggestionIndex(max_terms=terms)
+    page = []
+    start = time.perf_counter()
+    for i in range(terms):
+        title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))) + f" {i}"
+        page.append({"title": title, "brand": rng.choice(BRANDS)})
+        if len(page) == 50:
+            index.add_products(page)
+            page = []
+            for _ in range(rng.randint(0, 2)):
+                index.add_query(" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 2))))
+    index.add_products(page)
+    return index, time.perf_counter() - start
+
+
+def linear_suggest(index, prefix, limit):
+    """Referência: varre todos os termos a cada consulta."""
+    key = suggestion_key(prefix)
+    scores = index._scores
+    matches = sorted((term for term in scores if term.startswith(key)), key=lambda term: (-scores[term], term))
+    return [index._display[term] for term in matches[:limit]]
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--terms", type=int, default=1000000)
+    parser.add_argument("--limit", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+
+    index, elapsed = build(args.terms)
+    stats = index.stats()
+    print(f"{stats['terms']} termos em {stats['segments']} segmentos: montagem {elapsed:.1f} s "
+          f"({elapsed / args.terms * 1e6:.1f} µs/termo)")
+
+    for prefix in PREFIXES[:4]:
+        expected = linear_suggest(index, prefix, args.limit)
+        assert [s["text"] for s in index.suggest(prefix, args.limit)] == expected, f"divergência em '{prefix}'"
+
+    for prefix in PREFIXES:
+        samples = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            index.suggest(prefix, args.limit)
+            samples.append(time.perf_counter() - start)
+        scan = time.perf_counter()
+        linear_suggest(index, prefix, args.limit)
+        scan = time.perf_counter() - scan
+        print(f"  '{prefix}':{'':<{18 - len(prefix)}} p50 {percentile(samples, 0.5) * 1e6:7.1f} µs | "
+              f"p99 {percentile(samples, 0.99) * 1e6:7.1f} µs | varredura {scan * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Stand-in local da API do Mercado Livre para benchmarks.
+
+    python benchmarks/fake_ml_api.py --port 8900 --latency 0.2 --bandwidth 5000000
+    python benchmarks/fake_ml_api.py --shape recorded --error-rate 0.02 --token-ttl 30
+    python benchmarks/fake_ml_api.py --latency 0.05 --tail-rate 0.05 --tail-latency 2
+
+Serve /products/search e /oauth/token com latência, banda, taxa de erros 5xx,
+expiração de tokens (401) e tamanho de payload configuráveis. Com --tail-rate,
+essa fração das buscas leva --tail-latency a mais (réplica lenta, cauda longa). No formato
+"recorded", cada item segue o exemplo gravado em fixtures/products_search_item.json.
+GET /__stats devolve os contadores do servidor.
+"""
+import os
+import sys
+import copy
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "products_search_item.json")
+BRANDS = ("Dell", "Lenovo", "Samsung", "Apple")
+COLORS = ("Preto", "Prata", "Branco")
+
+_fixture = None
+
+
+def make_product(index, query="notebook"):
+    """Produto no formato de /products/search."""
+    return {
+        "id": f"MLB{index:08d}",
+        "name": f"{query.title()} Modelo {index}",
+        "status": "active",
+        "price": 1000 + (index % 500) * 7.5,
+        "thumbnail": f"http://http2.mlstatic.com/D_{index}-I.jpg" if index % 4 else "",
+        "permalink": f"https://www.mercadolivre.com.br/p/MLB{index:08d}",
+        "attributes": [
+            {"id": "BRAND", "value_name": BRANDS[index % 4]},
+            {"id": "COLOR", "value_name": COLORS[index % 3]},
+            {"id": "MODEL", "value_name": f"X{index % 50}"},
+        ],
+    }
+
+
+def make_recorded_product(index, query="notebook", extra_attributes=0):
+    """
+    Produto com o formato gravado do /products/search: sem price/thumbnail no
+    nível superior (preço no buy_box_winner, quando há, e imagens em pictures).
+    extra_attributes acrescenta atributos para aumentar o payload.
+    """
+    global _fixture
+    if _fixture is None:
+        with open(FIXTURE_PATH, encoding="utf-8") as fixture:
+            _fixture = json.load(fixture)
+    item = copy.deepcopy(_fixture)
+    item_id = f"MLB{index:08d}"
+    brand, color = BRANDS[index % 4], COLORS[index % 3]
+    item["id"] = item["catalog_product_id"] = item_id
+    item["name"] = f"{query.title()} {brand} Modelo {index}"
+    item["keywords"] = f"{query} {brand.lower()}"
+    for attribute in item["attributes"]:
+        if attribute["id"] == "BRAND":
+            attribute["value_name"] = attribute["values"][0]["name"] = brand
+        elif attribute["id"] == "COLOR":
+            attribute["value_name"] = attribute["values"][0]["name"] = color
+        elif attribute["id"] == "MODEL":
+            attribute["value_name"] = attribute["values"][0]["name"] = f"X{index % 50}"
+    if index % 3:
+        item["buy_box_winner"] = {"item_id": f"MLB{index + 10 ** 9}", "price": 1000 + (index % 500) * 7.5,
+                                  "currency_id": "BRL", "shipping": {"free_shipping": True}}
+    if index % 7 == 0:
+        item["pictures"] = []
+    for n in range(extra_attributes):
+        value = f"Valor {n} do produto {index}"
+        item["attributes"].append({"id": f"EXTRA_{n}", "name": f"Atributo extra {n}", "value_id": None,
+                                   "value_name": value, "values": [{"id": None, "name": value, "meta": None}],
+                                   "meta": None, "value_type": "string"})
+    return item
+
+
+class FakeMLApi(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, bandwidth=0, error_rate=0.0, token_ttl=0, shape="simple",
+                 extra_attributes=0, total=1000000, seed=0, tail_rate=0.0, tail_latency=0.0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency = latency
+        self.bandwidth = bandwidth  # bytes/s; 0 = sem limite
+        self.error_rate = error_rate  # fração das buscas respondidas com 503
+        self.tail_rate = tail_rate  # fração das buscas que levam tail_latency a mais
+        self.tail_latency = tail_latency
+        self.token_ttl = token_ttl  # segundos de validade dos tokens; 0 = aceita qualquer token
+        self.shape = shape
+        self.extra_attributes = extra_attributes
+        self.total = total
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.stats = {"search": 0, "errors": 0, "unauthorized": 0, "tokens": 0, "tail": 0}
+        # Tokens válidos -> vencimento; o token inicial dos benchmarks é "fake-access"
+        self.tokens = {"fake-access": time.time() + token_ttl}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def product(self, index, query):
+        if self.shape == "recorded":
+            return make_recorded_product(index, query, self.extra_attributes)
+        return make_product(index, query)
+
+    def authorized(self, header):
+        if not self.token_ttl:
+            return True
+        token = (header or "").replace("Bearer ", "", 1).strip()
+        with self.lock:
+            return self.tokens.get(token, 0) > time.time()
+
+    def issue_token(self):
+        with self.lock:
+            self.stats["tokens"] += 1
+            number = self.stats["tokens"]
+            access = f"fake-access-{number}"
+            self.tokens[access] = time.time() + (self.token_ttl or 21600)
+        return {"access_token": access, "refresh_token": f"fake-refresh-{number}",
+                "expires_in": self.token_ttl or 21600, "user_id": 1, "token_type": "Bearer"}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if not self.server.bandwidth:
+            self.wfile.write(data)
+            return
+        # Envia em blocos para simular um link lento (o cliente recebe o corpo aos poucos)
+        block = 64 * 1024
+        for start in range(0, len(data), block):
+            self.wfile.write(data[start:start + block])
+            self.wfile.flush()
+            time.sleep(block / self.server.bandwidth)
+
+    def do_GET(self):
+        server = self.server
+        parsed = urlparse(self.path)
+        if parsed.path == "/__stats":
+            return self._send(200, dict(server.stats, requests=server.requests))
+
+        with server.lock:
+            server.requests += 1
+        time.sleep(server.latency)
+        if parsed.path != "/products/search":
+            return self._send(404, {"error": "not_found"})
+
+        with server.lock:
+            server.stats["search"] += 1
+            failed = server.error_rate and server.random.random() < server.error_rate
+            if failed:
+                server.stats["errors"] += 1
+            slow = server.tail_rate and server.random.random() < server.tail_rate
+            if slow:
+                server.stats["tail"] += 1
+        if slow:
+            time.sleep(server.tail_latency)
+        if failed:
+            return self._send(503, {"message": "Service unavailable", "error": "service_unavailable", "status": 503})
+        if not server.authorized(self.headers.get("Authorization")):
+            with server.lock:
+                server.stats["unauthorized"] += 1
+            return self._send(401, {"message": "invalid access token", "error": "unauthorized",
+                                    "status": 401, "cause": []})
+
+        params = parse_qs(parsed.query)
+        query = params.get("q", ["notebook"])[0]
+        limit = int(params.get("limit", ["10"])[0])
+        offset = int(params.get("offset", ["0"])[0])
+        end = min(offset + limit, server.total)
+        self._send(200, {
+            "keywords": query,
+            "paging": {"total": server.total, "offset": offset, "limit": limit},
+            "results": [server.product(i, query) for i in range(offset, end)],
+        })
+
+    def do_POST(self):
+        with self.server.lock:
+            self.server.requests += 1
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        time.sleep(self.server.latency)
+        if urlparse(self.path).path != "/oauth/token":
+            return self._send(404, {"error": "not_found"})
+        self._send(200, self.server.issue_token())
+
+    def log_message(self, *args):
+        pass
+
+
+def spawn(**options):
+    """
+    Sobe o stand-in em outro processo (sem disputar o GIL com o código medido)
+    e espera aceitar conexões. Devolve (processo, url).
+    """
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    command = [sys.executable, os.path.abspath(__file__), "--port", str(port)]
+    for name, value in options.items():
+        command += [f"--{name.replace('_', '-')}", str(value)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    for _ in range(200):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    else:
+        process.terminate()
+        raise RuntimeError("fake_ml_api não subiu a tempo")
+    return process, f"http://127.0.0.1:{port}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--bandwidth", type=int, default=0, help="bytes/s (0 = sem limite)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração das buscas respondidas com 503")
+    parser.add_argument("--token-ttl", type=float, default=0, help="validade dos tokens em segundos (0 = sem 401)")
+    parser.add_argument("--shape", choices=("simple", "recorded"), default="simple")
+    parser.add_argument("--extra-attributes", type=int, default=0, help="atributos extras por item (formato recorded)")
+    parser.add_argument("--total", type=int, default=1000000, help="total de resultados da busca")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="fração das buscas com latência extra")
+    parser.add_argument("--tail-latency", type=float, default=0.0, help="latência extra dessas buscas (s)")
+    args = parser.parse_args()
+    server = FakeMLApi(args.port, args.latency, args.bandwidth, args.error_rate, args.token_ttl, args.shape,
+                       args.extra_attributes, args.total, args.seed, args.tail_rate, args.tail_latency)
+    print(f"Fake ML API em {server.url} (latência {args.latency}s)")
+    server.serve_forever()
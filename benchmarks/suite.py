@@ -0,0 +1,313 @@
+"""
+Suíte de benchmarks offline contra o stand-in local da API (fake_ml_api.py).
+
+    python benchmarks/suite.py --output baseline.json
+    python benchmarks/suite.py --compare baseline.json --threshold 0.2
+    python benchmarks/suite.py --scenarios service_search,app_index_cold --quick
+
+Cada cenário roda em um processo próprio, com o seu upstream, e mede vazão,
+latência (p50/p95/p99), alocações Python (tracemalloc, numa passada separada)
+e RSS. O resultado é um JSON (stdout ou --output). Com --compare, compara com um
+resultado anterior e sai com código 1 se alguma métrica piorar além do limite.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import subprocess
+import tracemalloc
+import urllib.request
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+from fake_ml_api import spawn, make_recorded_product
+
+# Opções do upstream e variáveis de ambiente de cada cenário
+SCENARIOS = {
+    "normalize_batch": dict(
+        description="normalize_batch + to_dicts em 500 itens no formato gravado (sem rede)",
+        upstream=None),
+    "service_search": dict(
+        description="MercadoLivreService.search_products, 50 itens, sem cache",
+        upstream=dict(shape="recorded")),
+    "service_fanout": dict(
+        description="search_all com 200 itens (4 páginas em paralelo), upstream com 10 ms de latência",
+        upstream=dict(shape="recorded", latency=0.01)),
+    "service_stream": dict(
+        description="stream_products com 200 itens e 20 atributos extras por item",
+        upstream=dict(shape="recorded", extra_attributes=20)),
+    "service_errors": dict(
+        description="search_products com 5% de respostas 503 (retry com backoff curto)",
+        upstream=dict(shape="recorded", error_rate=0.05)),
+    "app_index_cold": dict(
+        description="GET / de ponta a ponta (50 por página), caches limpos a cada requisição",
+        upstream=dict(shape="recorded")),
+    "app_index_warm": dict(
+        description="GET / de ponta a ponta (50 por página) com caches de busca e de página",
+        upstream=dict(shape="recorded")),
+    "app_index_token_expiry": dict(
+        description="GET / com tokens de 0,5 s: 401 e renovação via /oauth/token durante a medição",
+        upstream=dict(shape="recorded", token_ttl=0.5),
+        env={"ML_TOKEN_REFRESH_MARGIN": "0", "ML_TOKEN_REFRESH_JITTER": "0"}),
+}
+
+# Métricas comparadas com --compare: (caminho, maior_é_melhor)
+COMPARED = (
+    (("throughput_ops",), True),
+    (("latency_ms", "p50"), False),
+    (("latency_ms", "p95"), False),
+    (("alloc_kb", "peak"), False),
+)
+
+
+def _service(url, **kwargs):
+    from services.http_client import HttpClient
+    from services.mercado_livre import MercadoLivreService
+
+    MercadoLivreService.API_BASE_URL = url
+    return MercadoLivreService("fake-access", http_client=HttpClient(backoff_factor=0.01), **kwargs)
+
+
+def _app_client(url):
+    os.environ.setdefault("FLASK_SECRET_KEY", "bench")
+    import logging
+    import app as app_module
+    from services.auth import AuthService
+    from services.mercado_livre import MercadoLivreService
+
+    logging.getLogger().setLevel(logging.WARNING)
+    MercadoLivreService.API_BASE_URL = url
+    AuthService.API_BASE_URL = url
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess['access_token'] = 'fake-access'
+        sess['refresh_token'] = 'fake-refresh'
+    return app_module, client
+
+
+def _get(client, path):
+    response = client.get(path)
+    response.get_data()
+    if response.status_code not in (200, 304):
+        raise RuntimeError(f"GET {path} -> {response.status_code}")
+
+
+def setup(name, url):
+    """Devolve (operação, antes_de_cada_operação) do cenário."""
+    if name == "normalize_batch":
+        from services.normalizer import normalize_batch
+        payload = [make_recorded_product(i) for i in range(500)]
+        return (lambda: normalize_batch(payload).to_dicts()), None
+
+    if name in ("service_search", "service_errors"):
+        service = _service(url)
+        return (lambda: service.search_products("notebook", limit=50)), None
+
+    if name == "service_fanout":
+        service = _service(url)
+        return (lambda: service.search_all("notebook", total=200)), None
+
+    if name == "service_stream":
+        service = _service(url)
+        return (lambda: sum(1 for _ in service.stream_products("notebook", limit=200))), None
+
+    app_module, client = _app_client(url)
+    path = "/?q=notebook&per_page=50"
+    if name == "app_index_warm":
+        return (lambda: _get(client, path)), None
+
+    def clear():
+        app_module.search_cache.clear()
+        app_module.page_cache.clear()
+    return (lambda: _get(client, path)), clear
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _current_rss_mb():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+
+def run_scenario(name, url, iterations, warmup, alloc_iterations):
+    op, before = setup(name, url)
+    for _ in range(warmup):
+        if before:
+            before()
+        op()
+
+    timings = []
+    for _ in range(iterations):
+        if before:
+            before()
+        start = time.perf_counter()
+        op()
+        timings.append(time.perf_counter() - start)
+    elapsed = sum(timings)
+
+    # Alocações numa passada à parte: o tracemalloc distorce os tempos
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    for _ in range(alloc_iterations):
+        if before:
+            before()
+        op()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    ordered = sorted(timings)
+    result = {
+        "iterations": iterations,
+        "throughput_ops": round(iterations / elapsed, 2),
+        "latency_ms": {
+            "mean": round(elapsed / iterations * 1000, 3),
+            "p50": round(_percentile(ordered, 0.50) * 1000, 3),
+            "p95": round(_percentile(ordered, 0.95) * 1000, 3),
+            "p99": round(_percentile(ordered, 0.99) * 1000, 3),
+            "max": round(ordered[-1] * 1000, 3),
+        },
+        "alloc_kb": {
+            "peak": round((peak - baseline) / 1024, 1),
+            "retained": round((current - baseline) / 1024, 1),
+        },
+        "rss_mb": {
+            "max": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "current": round(_current_rss_mb() or 0, 1),
+        },
+    }
+    if url:
+        with urllib.request.urlopen(f"{url}/__stats") as response:
+            result["upstream"] = json.load(response)
+    return result
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _metric(result, path):
+    for part in path:
+        result = result[part]
+    return result
+
+
+def compare(current, baseline, threshold):
+    """Imprime a comparação e devolve a lista de regressões."""
+    regressions = []
+    for name, result in current["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        for path, higher_is_better in COMPARED:
+            now, before = _metric(result, path), _metric(previous, path)
+            if not before:
+                continue
+            change = (now - before) / before
+            worse = -change if higher_is_better else change
+            flag = "REGRESSÃO" if worse > threshold else ""
+            label = ".".join(path)
+            print(f"{name:<24} {label:<16} {before:>12.3f} -> {now:>12.3f} ({change:+7.1%}) {flag}", file=sys.stderr)
+            if flag:
+                regressions.append({"scenario": name, "metric": label, "before": before, "after": now,
+                                    "change": round(change, 4)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="cenários separados por vírgula")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--alloc-iterations", type=int, default=20)
+    parser.add_argument("--quick", action="store_true", help="poucas iterações (verificação rápida)")
+    parser.add_argument("--output", help="grava o JSON neste arquivo (padrão: stdout)")
+    parser.add_argument("--compare", help="JSON de uma execução anterior")
+    parser.add_argument("--threshold", type=float, default=0.2, help="piora relativa tolerada no --compare")
+    parser.add_argument("--list", action="store_true", help="lista os cenários e sai")
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.quick:
+        args.iterations, args.warmup, args.alloc_iterations = 20, 3, 3
+
+    if args.list:
+        for name, scenario in SCENARIOS.items():
+            print(f"{name:<24} {scenario['description']}")
+        return 0
+
+    if args.run:
+        print(json.dumps(run_scenario(args.run, args.url, args.iterations, args.warmup, args.alloc_iterations)))
+        return 0
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"cenários desconhecidos: {', '.join(unknown)}")
+
+    results = {}
+    for name in names:
+        scenario = SCENARIOS[name]
+        upstream, url = spawn(**scenario["upstream"]) if scenario["upstream"] is not None else (None, "")
+        try:
+            command = [sys.executable, os.path.abspath(__file__), "--run", name, "--url", url,
+                       "--iterations", str(args.iterations), "--warmup", str(args.warmup),
+                       "--alloc-iterations", str(args.alloc_iterations)]
+            output = subprocess.check_output(command, env=dict(os.environ, **scenario.get("env", {})), cwd=ROOT)
+            results[name] = dict(json.loads(output.decode().strip().splitlines()[-1]),
+                                 description=scenario["description"], upstream_options=scenario["upstream"])
+        finally:
+            if upstream is not None:
+                upstream.terminate()
+                upstream.wait()
+        latency = results[name]["latency_ms"]
+        print(f"{name:<24} {results[name]['throughput_ops']:>10.1f} ops/s | p50 {latency['p50']:8.2f} ms | "
+              f"p95 {latency['p95']:8.2f} ms | p99 {latency['p99']:8.2f} ms | "
+              f"pico alocação {results[name]['alloc_kb']['peak']:9.1f} KB | RSS {results[name]['rss_mb']['max']:6.1f} MB",
+              file=sys.stderr)
+
+    report = {
+        "meta": {
+            "revision": _git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "iterations": args.iterations,
+        },
+        "scenarios": results,
+    }
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as previous:
+            report["regressions"] = compare(report, json.load(previous), args.threshold)
+        exit_code = 1 if report["regressions"] else 0
+
+    data = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            output.write(data + "\n")
+    else:
+        print(data)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
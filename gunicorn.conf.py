@@ -0,0 +1,21 @@
+"""
+Configuração do gunicorn com preload: o app é carregado uma vez no master
+(create_app) e os workers herdam módulos, templates e estado pelo fork.
+
+    gunicorn -c gunicorn.conf.py
+"""
+import os
+
+# Lido por services.config.preloading(): nada de threads no import do app
+os.environ.setdefault("ML_PRELOAD", "1")
+
+wsgi_app = "app:create_app()"
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Threads de segundo plano não passam pelo fork: cada worker inicia as suas
+    from app import start_background_tasks
+    start_background_tasks()
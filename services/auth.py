@@ -1,25 +1,36 @@
-import requests
 import os
 import logging
 from urllib.parse import urlencode
-from dotenv import load_dotenv
+from services import deadline
+from services.config import load_env
+from services.http_client import get_http_client
+from services.single_flight import SingleFlight, AsyncSingleFlight
 
-load_dotenv()
+load_env()
 logger = logging.getLogger(__name__)
 
 class AuthService:
     """
     Serviço oficial para fluxo Authorization Code do Mercado Livre.
     """
-    API_BASE_URL = "https://api.mercadolibre.com"
+    API_BASE_URL = os.getenv("ML_API_BASE_URL", "https://api.mercadolibre.com")
     # Usando o domínio global para maior compatibilidade
     AUTH_URL = "https://auth.mercadolivre.com.br/authorization"
     
-    def __init__(self):
+    def __init__(self, http_client=None, single_flight=None):
         # Sanitização: remove espaços e quebras de linha acidentais
         self.client_id = str(os.getenv("ML_CLIENT_ID", "")).strip()
         self.client_secret = str(os.getenv("ML_CLIENT_SECRET", "")).strip()
         self.redirect_uri = str(os.getenv("ML_REDIRECT_URI", "")).strip()
+        # Pool HTTP resolvido no primeiro uso: construir o serviço não cria sessão nem importa requests
+        self._http = http_client
+        # O refresh_token é de uso único: renovações simultâneas do mesmo token
+        # precisam virar uma única chamada, senão todas menos uma falham.
+        self.single_flight = single_flight or SingleFlight()
+
+    @property
+    def http(self):
+        return self._http or get_http_client()
 
     def get_auth_url(self):
         """Gera URL de autorização com encoding correto."""
@@ -37,6 +48,23 @@ class AuthService:
 
     def exchange_code_for_token(self, code):
         """Troca o 'code' pelo token real."""
+        url, payload, headers = self._exchange_request(code)
+
+        try:
+            logger.info(f"Iniciando troca de token para o código: {code[:10]}...")
+            response = self.http.post(url, data=payload, headers=headers, read_timeout=15)
+            
+            if response.status_code != 200:
+                logger.error(f"Erro na API ML ({response.status_code}): {response.text}")
+                return response.json()
+                
+            return response.json()
+        except Exception as e:
+            logger.error(f"Erro de conexão com Mercado Livre: {str(e)}")
+            return {"error": "connection_error", "message": str(e)}
+
+    def _exchange_request(self, code):
+        """Monta URL, payload e headers da troca do 'code' pelo token."""
         url = f"{self.API_BASE_URL}/oauth/token"
         
         # O ML exige que o redirect_uri seja idêntico ao usado no get_auth_url
@@ -53,39 +81,79 @@ class AuthService:
             'content-type': 'application/x-www-form-urlencoded',
             'User-Agent': 'ML-Explorer/1.0.0 (Python Flask App)'
         }
-        
+        return url, payload, headers
+
+    def refresh_access_token(self, refresh_token):
+        """Usa o refresh_token para obter um novo access_token."""
+        refresh_token = refresh_token.strip()
+        return self.single_flight.do(f"refresh:{refresh_token}", lambda: self._request_refresh(refresh_token))
+
+    def _request_refresh(self, refresh_token):
+        url, payload, headers = self._refresh_request(refresh_token)
+
         try:
-            logger.info(f"Iniciando troca de token para o código: {code[:10]}...")
-            response = requests.post(url, data=payload, headers=headers, timeout=15)
-            
-            if response.status_code != 200:
-                logger.error(f"Erro na API ML ({response.status_code}): {response.text}")
-                return response.json()
-                
+            logger.info("Tentando renovar o token de acesso...")
+            # Fora do prazo da requisição: cortar a chamada depois que o ML já
+            # trocou o par (refresh_token de uso único) perderia o par novo
+            with deadline.suspended():
+                response = self.http.post(url, data=payload, headers=headers, read_timeout=15)
             return response.json()
         except Exception as e:
-            logger.error(f"Erro de conexão com Mercado Livre: {str(e)}")
+            logger.error(f"Erro ao renovar token: {str(e)}")
             return {"error": "connection_error", "message": str(e)}
 
-    def refresh_access_token(self, refresh_token):
-        """Usa o refresh_token para obter um novo access_token."""
+    def _refresh_request(self, refresh_token):
+        """Monta URL, payload e headers da renovação do token."""
         url = f"{self.API_BASE_URL}/oauth/token"
         
         payload = {
             'grant_type': 'refresh_token',
             'client_id': self.client_id,
             'client_secret': self.client_secret,
-            'refresh_token': refresh_token.strip()
+            'refresh_token': refresh_token
         }
         
         headers = {
             'accept': 'application/json',
             'content-type': 'application/x-www-form-urlencoded'
         }
-        
+        return url, payload, headers
+
+
+class AsyncAuthService(AuthService):
+    """
+    Variante assíncrona (httpx) do fluxo OAuth, usada pelo modo ASGI.
+    Espera um AsyncHttpClient em http_client.
+    """
+
+    def __init__(self, http_client, single_flight=None):
+        super().__init__(http_client=http_client, single_flight=single_flight or AsyncSingleFlight())
+
+    async def exchange_code_for_token(self, code):
+        url, payload, headers = self._exchange_request(code)
+
+        try:
+            logger.info(f"Iniciando troca de token para o código: {code[:10]}...")
+            response = await self.http.post(url, data=payload, headers=headers, read_timeout=15)
+
+            if response.status_code != 200:
+                logger.error(f"Erro na API ML ({response.status_code}): {response.text}")
+
+            return response.json()
+        except Exception as e:
+            logger.error(f"Erro de conexão com Mercado Livre: {str(e)}")
+            return {"error": "connection_error", "message": str(e)}
+
+    async def refresh_access_token(self, refresh_token):
+        refresh_token = refresh_token.strip()
+        return await self.single_flight.do(f"refresh:{refresh_token}", lambda: self._request_refresh_async(refresh_token))
+
+    async def _request_refresh_async(self, refresh_token):
+        url, payload, headers = self._refresh_request(refresh_token)
+
         try:
             logger.info("Tentando renovar o token de acesso...")
-            response = requests.post(url, data=payload, headers=headers, timeout=15)
+            response = await self.http.post(url, data=payload, headers=headers, read_timeout=15)
             return response.json()
         except Exception as e:
             logger.error(f"Erro ao renovar token: {str(e)}")
@@ -0,0 +1,178 @@
+"""
+Busca em lote: várias (site, busca) numa única requisição JSON.
+
+BatchSearch valida o lote e dispara cada busca por MercadoLivreService.search_products
+num pool limitado compartilhado pelo worker, com o mesmo cache e single-flight da
+página inicial. Os resultados são entregues na ordem em que terminam, um por
+busca (produtos ou erro); ao fim do prazo do lote, as que ainda não terminaram
+saem como "timeout" e o lote volta parcial. O prazo do lote também vale para
+as chamadas ao ML de cada busca (services.deadline), que desistem nele em vez
+de prender o pool até o timeout de leitura.
+"""
+import os
+import time
+import logging
+import threading
+import contextvars
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeout
+from services import deadline as request_deadline
+from services.metrics import REGISTRY
+from services.resilience import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+BATCH_QUERIES = REGISTRY.counter(
+    "ml_batch_queries",
+    "Buscas executadas pela busca em lote, por resultado (ok, error, timeout)",
+    ("status",),
+)
+
+BatchQuery = namedtuple("BatchQuery", "index site_id query offset limit")
+
+
+class BatchSearchError(ValueError):
+    """Lote inválido (corpo da requisição); a mensagem vai para o cliente."""
+
+
+class BatchSearch:
+    """
+    Executor das buscas em lote. O pool é do worker (criado na primeira busca,
+    depois do fork): `max_workers` limita as chamadas simultâneas ao ML somando
+    todos os lotes em andamento.
+    """
+
+    def __init__(self, max_workers=8, max_queries=20, max_limit=50, default_deadline=5.0, max_deadline=15.0,
+                 site_ids=None, default_site_id="MLB"):
+        self.max_workers = max_workers
+        self.max_queries = max_queries
+        self.max_limit = max_limit
+        self.default_deadline = default_deadline
+        self.max_deadline = max_deadline
+        self.site_ids = frozenset(site_ids) if site_ids else None
+        self.default_site_id = default_site_id
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def parse(self, payload):
+        """
+        (buscas, prazo em segundos) de um corpo {"queries": [...], "deadline": s}.
+        Cada busca é {"q", "site_id", "offset", "limit"} ou só o texto da busca.
+        """
+        if not isinstance(payload, dict) or not isinstance(payload.get("queries"), list):
+            raise BatchSearchError("O corpo deve ser um objeto JSON com a lista 'queries'.")
+        entries = payload["queries"]
+        if not entries:
+            raise BatchSearchError("'queries' está vazia.")
+        if len(entries) > self.max_queries:
+            raise BatchSearchError(f"No máximo {self.max_queries} buscas por lote.")
+
+        queries = [self._parse_query(index, entry) for index, entry in enumerate(entries)]
+        deadline = payload.get("deadline", self.default_deadline)
+        if isinstance(deadline, bool) or not isinstance(deadline, (int, float)) or deadline <= 0:
+            raise BatchSearchError("'deadline' deve ser um número de segundos maior que zero.")
+        return queries, min(float(deadline), self.max_deadline)
+
+    def _parse_query(self, index, entry):
+        if isinstance(entry, str):
+            entry = {"q": entry}
+        if not isinstance(entry, dict):
+            raise BatchSearchError(f"Busca {index}: esperado um objeto ou texto.")
+        query = " ".join(str(entry.get("q") or "").split())
+        if not query:
+            raise BatchSearchError(f"Busca {index}: 'q' é obrigatório.")
+        site_id = str(entry.get("site_id") or self.default_site_id).upper()
+        if self.site_ids is not None and site_id not in self.site_ids:
+            raise BatchSearchError(f"Busca {index}: site_id '{site_id}' desconhecido.")
+        try:
+            offset = int(entry.get("offset", 0))
+            limit = int(entry.get("limit", 10))
+        except (TypeError, ValueError):
+            raise BatchSearchError(f"Busca {index}: 'offset' e 'limit' devem ser inteiros.")
+        if offset < 0 or not 1 <= limit <= self.max_limit:
+            raise BatchSearchError(f"Busca {index}: 'offset' >= 0 e 'limit' entre 1 e {self.max_limit}.")
+        return BatchQuery(index, site_id, query, offset, limit)
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ml-batch")
+                self._pid = os.getpid()
+            return self._executor
+
+    def run(self, service, queries, deadline):
+        """
+        Gera um dict por busca, na ordem em que terminam: status "ok" (com
+        products), "error" (com error/message do serviço) ou "timeout".
+        Encerrar o gerador cancela as buscas que ainda não começaram.
+        """
+        expires_at = time.monotonic() + deadline
+        pool = self._pool()
+        # Cada busca roda numa cópia do contexto atual (trace id da requisição nos logs)
+        futures = {pool.submit(contextvars.copy_context().run, self._search, service, query, expires_at): query
+                   for query in queries}
+        pending = set(futures)
+        try:
+            for future in as_completed(futures, timeout=max(0.0, expires_at - time.monotonic())):
+                pending.discard(future)
+                yield self._result(futures[future], future)
+        except FutureTimeout:
+            logger.warning(f"Busca em lote: {len(pending)} de {len(futures)} buscas não terminaram no prazo.")
+            for future in sorted(pending, key=lambda f: futures[f].index):
+                BATCH_QUERIES.inc("timeout")
+                yield self._entry(futures[future], "timeout")
+            pending = set()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    @staticmethod
+    def _search(service, query, expires_at):
+        # O prazo do lote (ou o da requisição, se acabar antes) vale para as chamadas ao ML: o
+        # HttpClient encurta o timeout e desiste no fim, liberando a thread do pool para outros lotes
+        left = expires_at - time.monotonic()
+        request_left = request_deadline.remaining()
+        if request_left is not None:
+            left = min(left, request_left)
+        if left <= 0:
+            raise DeadlineExceeded(f"Prazo do lote esgotado antes da busca '{query.query}' começar")
+        request_deadline.start_deadline(left)
+        return service.search_products(query.query, query.offset, query.limit, query.site_id)
+
+    def _result(self, query, future):
+        try:
+            results = future.result()
+        except Exception as e:
+            logger.error(f"Busca em lote '{query.query}' falhou: {e}")
+            results = {"error": "exception", "message": str(e)}
+        if isinstance(results, list):
+            BATCH_QUERIES.inc("ok")
+            entry = self._entry(query, "ok")
+            entry["products"] = results
+            return entry
+        BATCH_QUERIES.inc("error")
+        entry = self._entry(query, "error")
+        entry["error"] = results.get("error")
+        entry["message"] = results.get("message")
+        if results.get("retry_after"):
+            entry["retry_after"] = results["retry_after"]
+        return entry
+
+    @staticmethod
+    def _entry(query, status):
+        return {"index": query.index, "site_id": query.site_id, "q": query.query,
+                "offset": query.offset, "limit": query.limit, "status": status}
+
+
+def build_batch_search(site_ids=None, default_site_id="MLB"):
+    """BatchSearch a partir das variáveis de ambiente."""
+    return BatchSearch(
+        max_workers=int(os.getenv("ML_BATCH_WORKERS", 8)),
+        max_queries=int(os.getenv("ML_BATCH_MAX_QUERIES", 20)),
+        max_limit=int(os.getenv("ML_BATCH_MAX_LIMIT", 50)),
+        default_deadline=float(os.getenv("ML_BATCH_DEADLINE", 5)),
+        max_deadline=float(os.getenv("ML_BATCH_MAX_DEADLINE", 15)),
+        site_ids=site_ids,
+        default_site_id=default_site_id,
+    )
@@ -0,0 +1,475 @@
+import os
+import json
+import hashlib
+import asyncio
+import time
+import sqlite3
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode
+from services.normalizer import Product, json_default
+from services.deadline import clear_deadline
+
+logger = logging.getLogger(__name__)
+
+class MemoryCacheBackend:
+    """
+    Backend LRU em memória (por worker), limitado por número de entradas
+    e por tamanho aproximado em bytes.
+    """
+
+    def __init__(self, max_entries=512, max_bytes=16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._data = OrderedDict()  # key -> (value, size, stored_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            self._data.move_to_end(key)
+            return entry[0], entry[2]
+
+    def set(self, key, value, size, stored_at):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, size, stored_at)
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_size, _) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def keys(self):
+        with self._lock:
+            return list(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def total_bytes(self):
+        return self._bytes
+
+
+def _encode_value(value):
+    # Products guardados como a tupla dos campos, para voltarem como Product (igual ao backend em memória)
+    if isinstance(value, Product):
+        return {"__product__": value.__getstate__()}
+    return json_default(value)
+
+
+def _decode_object(obj):
+    state = obj.get("__product__")
+    if state is not None and len(obj) == 1:
+        return Product(*state)
+    return obj
+
+
+class SQLiteCacheBackend:
+    """
+    Backend LRU compartilhado entre workers do gunicorn via arquivo SQLite (WAL).
+    A ordem LRU é mantida pela coluna accessed_at. As leituras não escrevem no
+    arquivo: os acessos ficam em memória e vão num único UPDATE no próximo set()
+    (antes da evicção) ou ao acumular touch_batch chaves.
+    """
+
+    def __init__(self, path, max_entries=512, max_bytes=16 * 1024 * 1024, touch_batch=256):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.touch_batch = touch_batch
+        self.evictions = 0
+        self._touched = {}  # chave -> último acesso ainda não gravado
+        self._touch_lock = threading.Lock()
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+                " stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_lru ON search_cache (accessed_at)")
+
+    def _conn(self):
+        # Uma conexão por thread (e por processo, já que é criada sob demanda após o fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute("SELECT value, stored_at FROM search_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        with self._touch_lock:
+            self._touched[key] = time.time()
+            flush = len(self._touched) >= self.touch_batch
+        if flush:
+            self._flush_touched(self._conn())
+        return json.loads(row[0], object_hook=_decode_object), row[1]
+
+    def _flush_touched(self, conn):
+        with self._touch_lock:
+            touched, self._touched = self._touched, {}
+        if touched:
+            conn.executemany("UPDATE search_cache SET accessed_at = MAX(accessed_at, ?) WHERE key = ?",
+                             [(accessed_at, key) for key, accessed_at in touched.items()])
+
+    def set(self, key, value, size, stored_at):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._flush_touched(conn)
+            conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, value, size, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(value, default=_encode_value), size, stored_at, time.time()),
+            )
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM search_cache").fetchone()
+            while count > self.max_entries or total > self.max_bytes:
+                row = conn.execute("SELECT key, size FROM search_cache ORDER BY accessed_at LIMIT 1").fetchone()
+                if row is None:
+                    break
+                conn.execute("DELETE FROM search_cache WHERE key = ?", (row[0],))
+                count -= 1
+                total -= row[1]
+                self.evictions += 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM search_cache WHERE key = ?", (key,))
+
+    def clear(self):
+        self._conn().execute("DELETE FROM search_cache")
+
+    def keys(self):
+        return [row[0] for row in self._conn().execute("SELECT key FROM search_cache")]
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+
+    @property
+    def total_bytes(self):
+        return self._conn().execute("SELECT COALESCE(SUM(size), 0) FROM search_cache").fetchone()[0]
+
+
+def _size_default(value):
+    # Estimativa de tamanho: Products contam como o dict equivalente, o resto como texto
+    return value.to_dict() if isinstance(value, Product) else str(value)
+
+
+class SearchCache:
+    """
+    Cache TTL + LRU dos resultados já normalizados de /products/search.
+
+    Entradas expiradas ainda dentro da janela de stale são servidas
+    imediatamente enquanto uma thread em segundo plano revalida a chave
+    (stale-while-revalidate), para que uma busca popular nunca bloqueie
+    no upstream ao expirar. Se o upstream estiver indisponível (circuit breaker
+    aberto ou limite de requisições), qualquer valor ainda guardado para a chave
+    é servido no lugar do erro, mesmo fora da janela de stale.
+    """
+
+    def __init__(self, backend=None, ttl=300, stale_ttl=600):
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.stale_if_error = 0
+        self._refreshing = set()
+        self._tasks = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(site_id, query, limit, status, offset=0):
+        # Normaliza a busca: "  Notebook   Dell " e "notebook dell" são a mesma chave
+        normalized_query = " ".join(str(query or "").lower().split())
+        key = f"{site_id}|{normalized_query}|{limit}|{status}"
+        return f"{key}|{offset}" if offset else key
+
+    def get(self, key):
+        """Retorna o valor se ainda estiver fresco (sem revalidação)."""
+        entry = self.backend.get(key)
+        if entry is not None and time.time() - entry[1] <= self.ttl:
+            return entry[0]
+        return None
+
+    def age(self, key):
+        """Segundos desde que a chave foi guardada (None se não estiver no cache)."""
+        entry = self.backend.get(key)
+        return None if entry is None else time.time() - entry[1]
+
+    def set(self, key, value):
+        size = len(json.dumps(value, default=_size_default))
+        self.backend.set(key, value, size, time.time())
+
+    def _lookup(self, key):
+        """Devolve (valor, expirado) ou (None, False) em caso de miss."""
+        entry = self.backend.get(key)
+        if entry is not None:
+            value, stored_at = entry
+            age = time.time() - stored_at
+            if age <= self.ttl:
+                self.hits += 1
+                return value, False
+            if age <= self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                return value, True
+        self.misses += 1
+        return None, False
+
+    def get_or_load(self, key, loader):
+        """
+        Busca a chave no cache; em caso de miss chama loader().
+        Apenas listas não vazias são armazenadas: erros e a lista vazia
+        devolvida em falhas de conexão nunca ficam presos no cache.
+        """
+        value, stale = self._lookup(key)
+        if value is not None:
+            if stale:
+                self._revalidate(key, loader)
+            return value
+
+        value = loader()
+        if self._cacheable(value):
+            self.set(key, value)
+            return value
+        return self._fallback(key, value)
+
+    async def get_or_load_async(self, key, loader):
+        """Mesmo que get_or_load, para loaders assíncronos (modo ASGI)."""
+        value, stale = self._lookup(key)
+        if value is not None:
+            if stale:
+                self._revalidate_async(key, loader)
+            return value
+
+        value = await loader()
+        if self._cacheable(value):
+            self.set(key, value)
+            return value
+        return self._fallback(key, value)
+
+    @staticmethod
+    def _cacheable(value):
+        return isinstance(value, list) and len(value) > 0
+
+    def _fallback(self, key, error):
+        """Com o upstream indisponível (ou fora do ar), devolve o último valor guardado (se houver) no lugar do erro."""
+        if not (isinstance(error, dict) and error.get("error") in ("upstream_unavailable", "connection_error")):
+            return error
+        entry = self.backend.get(key)
+        if entry is None:
+            return error
+        self.stale_if_error += 1
+        logger.info(f"Upstream indisponível: servindo '{key}' guardado há {time.time() - entry[1]:.0f} s")
+        return entry[0]
+
+    def _claim_refresh(self, key):
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _release_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def _revalidate(self, key, loader):
+        if not self._claim_refresh(key):
+            return
+
+        def refresh():
+            # Segundo plano: o prazo da requisição que disparou a revalidação não vale aqui
+            clear_deadline()
+            try:
+                value = loader()
+                if self._cacheable(value):
+                    self.set(key, value)
+            except Exception as e:
+                logger.error(f"Falha ao revalidar cache para '{key}': {str(e)}")
+            finally:
+                self._release_refresh(key)
+
+        # Mantém o trace id da requisição que disparou a revalidação nos logs
+        threading.Thread(target=contextvars.copy_context().run, args=(refresh,),
+                         name="cache-revalidate", daemon=True).start()
+
+    def _revalidate_async(self, key, loader):
+        if not self._claim_refresh(key):
+            return
+
+        async def refresh():
+            try:
+                value = await loader()
+                if self._cacheable(value):
+                    self.set(key, value)
+            except Exception as e:
+                logger.error(f"Falha ao revalidar cache para '{key}': {str(e)}")
+            finally:
+                self._release_refresh(key)
+                self._tasks.discard(task)
+
+        # Mantém referência à task para que não seja coletada antes de terminar
+        task = asyncio.get_running_loop().create_task(refresh())
+        self._tasks.add(task)
+
+    def invalidate_query(self, query):
+        """Descarta todas as páginas guardadas de uma busca (ex.: o catálogo dela mudou)."""
+        normalized_query = " ".join(str(query or "").lower().split())
+        removed = 0
+        for key in self.backend.keys():
+            parts = key.split("|")
+            if len(parts) > 1 and parts[1] == normalized_query:
+                self.backend.delete(key)
+                removed += 1
+        return removed
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "stale_if_error": self.stale_if_error,
+            "evictions": self.backend.evictions,
+            "entries": len(self.backend),
+            "bytes": self.backend.total_bytes,
+        }
+
+    def clear(self):
+        self.backend.clear()
+
+
+class RenderedPageCache:
+    """
+    Cache de páginas HTML já renderizadas, por variante (logado/deslogado) e
+    parâmetros da requisição.
+
+    Cada entrada guarda a impressão digital do contexto usado na renderização,
+    o ETag forte (hash do corpo) e o corpo. Enquanto fresca, a página é servida
+    (ou respondida com 304) sem template nem upstream; depois de expirar, o corpo
+    ainda é reaproveitado se o novo contexto tiver a mesma impressão digital.
+    """
+
+    def __init__(self, backend=None, ttl=60):
+        self.backend = backend if backend is not None else MemoryCacheBackend(max_entries=256, max_bytes=32 * 1024 * 1024)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.reused = 0
+
+    @staticmethod
+    def make_key(logged_in, args):
+        """args: pares (nome, valor) da query string; a ordem não importa."""
+        variant = "auth" if logged_in else "anon"
+        # Codificado de novo: "a=1%26b%3D2" e "a=1&b=2" são buscas diferentes
+        return variant + "?" + urlencode(sorted(args))
+
+    @staticmethod
+    def fingerprint(*parts):
+        return hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key):
+        """(etag, corpo) se a página ainda estiver fresca."""
+        entry = self.backend.get(key)
+        if entry is not None and time.time() - entry[1] <= self.ttl:
+            self.hits += 1
+            _, etag, body = entry[0]
+            return etag, body
+        return None
+
+    def render(self, key, fingerprint, render):
+        """
+        Devolve (etag, corpo) para o contexto com essa impressão digital,
+        chamando render() só se o corpo guardado não corresponder a ela.
+        """
+        entry = self.backend.get(key)
+        if entry is not None and entry[0][0] == fingerprint:
+            self.reused += 1
+            _, etag, body = entry[0]
+        else:
+            self.misses += 1
+            body = render().encode("utf-8")
+            etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.backend.set(key, (fingerprint, etag, body), len(body), time.time())
+        return etag, body
+
+    def invalidate_query(self, query, default_query="notebook"):
+        """Descarta as páginas renderizadas de uma busca (parâmetro q; sem q, vale default_query)."""
+        normalized_query = " ".join(str(query or "").lower().split())
+        removed = 0
+        for key in self.backend.keys():
+            args = dict(parse_qsl(key.partition("?")[2], keep_blank_values=True))
+            if " ".join(args.get("q", default_query).lower().split()) == normalized_query:
+                self.backend.delete(key)
+                removed += 1
+        return removed
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reused": self.reused,
+            "evictions": self.backend.evictions,
+            "entries": len(self.backend),
+            "bytes": self.backend.total_bytes,
+        }
+
+    def clear(self):
+        self.backend.clear()
+
+
+def build_page_cache():
+    """Cria o cache de páginas renderizadas a partir das variáveis de ambiente (por worker)."""
+    return RenderedPageCache(
+        backend=MemoryCacheBackend(
+            max_entries=int(os.getenv("ML_PAGE_CACHE_MAX_ENTRIES", 256)),
+            max_bytes=int(os.getenv("ML_PAGE_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+        ),
+        ttl=float(os.getenv("ML_PAGE_CACHE_TTL", 60)),
+    )
+
+
+def build_search_cache():
+    """Cria o cache de busca a partir das variáveis de ambiente."""
+    max_entries = int(os.getenv("ML_CACHE_MAX_ENTRIES", 512))
+    max_bytes = int(os.getenv("ML_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+    if os.getenv("ML_CACHE_BACKEND", "memory").lower() == "sqlite":
+        path = os.getenv("ML_CACHE_PATH", "/tmp/ml_search_cache.sqlite3")
+        backend = SQLiteCacheBackend(path, max_entries=max_entries, max_bytes=max_bytes)
+    else:
+        backend = MemoryCacheBackend(max_entries=max_entries, max_bytes=max_bytes)
+    return SearchCache(
+        backend=backend,
+        ttl=float(os.getenv("ML_CACHE_TTL", 300)),
+        stale_ttl=float(os.getenv("ML_CACHE_STALE_TTL", 600)),
+    )
@@ -0,0 +1,320 @@
+"""
+Sincronização incremental do catálogo de uma busca.
+
+Cada refresh baixa as páginas da busca e compara com o que foi visto da última
+vez: o store guarda, por (busca, id), o hash do conteúdo normalizado e o
+produto, e por página o ETag devolvido pelo ML. Páginas com ETag são pedidas
+com If-None-Match; um 304 conta como "nada mudou" sem baixar nem normalizar o
+corpo. O resultado é um CatalogDelta (adicionados, alterados com os campos que
+mudaram, removidos) entregue aos consumidores inscritos, em vez do snapshot
+inteiro.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from services.metrics import REGISTRY
+from services.normalizer import json_default
+from services.resilience import CircuitOpenError, DeadlineExceeded, RateLimitedError, UpstreamUnavailable
+
+logger = logging.getLogger(__name__)
+
+# Campos que entram no hash (attributes é derivado de marca, cor e terceiro atributo)
+HASHED_FIELDS = ('title', 'status', 'price', 'thumbnail', 'has_image', 'permalink',
+                 'brand', 'color', 'additional_attr')
+# Colunas do NormalizedBatch na ordem de HASHED_FIELDS
+_BATCH_COLUMNS = ('titles', 'statuses', 'prices', 'thumbnails', 'has_image', 'permalinks',
+                  'brands', 'colors', 'third_attrs')
+
+SYNC_CHANGES = REGISTRY.counter(
+    "ml_catalog_sync_changes",
+    "Produtos adicionados, alterados e removidos pela sincronização incremental",
+    ("kind",),
+)
+# Recusas do HttpClient (error "upstream_unavailable" do serviço) de volta à exceção original, pelo reason
+_REFUSALS = {error.reason: error for error in (CircuitOpenError, RateLimitedError, DeadlineExceeded)}
+
+SYNC_PAGES = REGISTRY.counter(
+    "ml_catalog_sync_pages",
+    "Páginas buscadas na sincronização, por resultado (fetched, not_modified)",
+    ("result",),
+)
+
+
+class SyncError(Exception):
+    """Refresh interrompido; nada foi aplicado ao store."""
+
+
+class CatalogDelta(namedtuple("CatalogDelta", "query added changed removed unchanged")):
+    """
+    Diferença de uma busca entre dois refreshes: added (produtos), changed
+    ([(produto, campos alterados)]), removed (ids) e quantos não mudaram.
+    """
+    __slots__ = ()
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.removed)
+
+    @property
+    def upserts(self):
+        """Produtos novos e alterados, na forma que o índice recebe."""
+        return self.added + [product for product, _ in self.changed]
+
+
+def content_hash(values):
+    """Hash do conteúdo normalizado (valores na ordem de HASHED_FIELDS)."""
+    return hashlib.blake2b("\x1f".join(map(str, values)).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def product_hash(product):
+    return content_hash([product.get(field) for field in HASHED_FIELDS])
+
+
+def changed_fields(old, new):
+    return [field for field in HASHED_FIELDS if old.get(field) != new.get(field)]
+
+
+class MemoryCatalogStore:
+    """Store em memória (por processo); some ao reiniciar, então o primeiro refresh traz tudo como novo."""
+
+    def __init__(self):
+        self._queries = {}  # busca -> {"products": {id: (hash, produto)}, "pages": {offset: (etag, ids)}, "total": n}
+        self._lock = threading.Lock()
+
+    def _entry(self, query):
+        return self._queries.get(query) or {"products": {}, "pages": {}, "total": None}
+
+    def hashes(self, query):
+        with self._lock:
+            return {product_id: h for product_id, (h, _) in self._entry(query)["products"].items()}
+
+    def products(self, query, ids=None):
+        with self._lock:
+            products = self._entry(query)["products"]
+            ids = products if ids is None else ids
+            return {product_id: products[product_id][1] for product_id in ids if product_id in products}
+
+    def pages(self, query):
+        with self._lock:
+            return dict(self._entry(query)["pages"])
+
+    def total(self, query):
+        with self._lock:
+            return self._entry(query)["total"]
+
+    def apply(self, query, upserts, removed, pages, total):
+        """upserts: [(id, hash, produto)]; pages: {offset: (etag, ids)} substitui as páginas anteriores."""
+        with self._lock:
+            entry = self._queries.setdefault(query, {"products": {}, "pages": {}, "total": None})
+            products = entry["products"]
+            for product_id, h, product in upserts:
+                products[product_id] = (h, product)
+            for product_id in removed:
+                products.pop(product_id, None)
+            entry["pages"] = dict(pages)
+            entry["total"] = total
+
+
+class SQLiteCatalogStore:
+    """Store em SQLite (WAL): sobrevive a reinícios e é compartilhado entre workers e o CLI."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS catalog_products ("
+                " query TEXT NOT NULL, id TEXT NOT NULL, hash TEXT NOT NULL, data TEXT NOT NULL,"
+                " updated_at REAL NOT NULL, PRIMARY KEY (query, id))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS catalog_pages ("
+                " query TEXT NOT NULL, offset INTEGER NOT NULL, etag TEXT, ids TEXT NOT NULL,"
+                " PRIMARY KEY (query, offset))"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS catalog_queries (query TEXT PRIMARY KEY, total INTEGER)")
+
+    def _conn(self):
+        # Uma conexão por thread (e por processo, já que é criada sob demanda após o fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def hashes(self, query):
+        rows = self._conn().execute("SELECT id, hash FROM catalog_products WHERE query = ?", (query,))
+        return dict(rows.fetchall())
+
+    def products(self, query, ids=None):
+        conn = self._conn()
+        if ids is None:
+            rows = conn.execute("SELECT id, data FROM catalog_products WHERE query = ?", (query,)).fetchall()
+        else:
+            rows = [row for product_id in ids for row in conn.execute(
+                "SELECT id, data FROM catalog_products WHERE query = ? AND id = ?", (query, product_id))]
+        return {product_id: json.loads(data) for product_id, data in rows}
+
+    def pages(self, query):
+        rows = self._conn().execute("SELECT offset, etag, ids FROM catalog_pages WHERE query = ?", (query,))
+        return {offset: (etag, json.loads(ids)) for offset, etag, ids in rows.fetchall()}
+
+    def total(self, query):
+        row = self._conn().execute("SELECT total FROM catalog_queries WHERE query = ?", (query,)).fetchone()
+        return row[0] if row else None
+
+    def apply(self, query, upserts, removed, pages, total):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO catalog_products (query, id, hash, data, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(query, product_id, h, json.dumps(product, ensure_ascii=False, default=json_default), now)
+                 for product_id, h, product in upserts],
+            )
+            conn.executemany("DELETE FROM catalog_products WHERE query = ? AND id = ?",
+                             [(query, product_id) for product_id in removed])
+            conn.execute("DELETE FROM catalog_pages WHERE query = ?", (query,))
+            conn.executemany("INSERT INTO catalog_pages (query, offset, etag, ids) VALUES (?, ?, ?, ?)",
+                             [(query, offset, etag, json.dumps(ids)) for offset, (etag, ids) in pages.items()])
+            conn.execute("INSERT OR REPLACE INTO catalog_queries (query, total) VALUES (?, ?)", (query, total))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+class CatalogSync:
+    """
+    Refresh incremental de buscas sobre MercadoLivreService.fetch_batch.
+
+    A primeira página define o total; as demais (até per_query) são buscadas em
+    paralelo. Só depois de todas as páginas chegarem o delta é calculado e
+    aplicado ao store: uma página com erro interrompe o refresh com SyncError,
+    para um resultado parcial nunca virar uma remoção em massa. Uma página
+    recusada pelo circuit breaker, pelo limitador ou pelo prazo interrompe com
+    UpstreamUnavailable (com retry_after), que a fila de tarefas trata como
+    adiamento e não como falha.
+    """
+
+    def __init__(self, service_factory, store=None, per_query=1000, page_size=50, workers=4, on_unauthorized=None):
+        self.service_factory = service_factory
+        self.on_unauthorized = on_unauthorized
+        self.store = store if store is not None else MemoryCatalogStore()
+        self.per_query = per_query
+        self.page_size = page_size
+        self.workers = max(1, workers)
+        self._listeners = []
+
+    @staticmethod
+    def normalize_query(query):
+        return " ".join(str(query or "").lower().split())
+
+    def subscribe(self, listener):
+        """listener(delta) é chamado a cada refresh que mudou algo."""
+        self._listeners.append(listener)
+        return listener
+
+    def _fetch(self, service, query, offset, etag):
+        limit = min(self.page_size, self.per_query - offset)
+        page = service.fetch_batch(query, offset=offset, limit=limit, etag=etag)
+        if isinstance(page, dict) and page.get("error") == "auth_expired" and self.on_unauthorized \
+                and self.on_unauthorized():
+            # Token renovado: uma nova tentativa com um serviço novo (o token vem da fábrica)
+            page = self.service_factory().fetch_batch(query, offset=offset, limit=limit, etag=etag)
+        if isinstance(page, dict) and page.get("error") == "upstream_unavailable":
+            raise _REFUSALS.get(page.get("reason"), UpstreamUnavailable)(
+                f"Busca '{query}' (offset {offset}) recusada: {page.get('message')}", retry_after=page.get("retry_after"))
+        if not isinstance(page, tuple):
+            raise SyncError(f"Busca '{query}' (offset {offset}) falhou: {page.get('message') or page.get('error')}")
+        SYNC_PAGES.inc("not_modified" if page.batch is None else "fetched")
+        return page
+
+    def refresh(self, query):
+        """Busca a query de novo, atualiza o store e devolve (e publica) o CatalogDelta."""
+        query = self.normalize_query(query)
+        known_pages = self.store.pages(query)
+        service = self.service_factory()
+
+        def fetch(offset):
+            return self._fetch(service, query, offset, (known_pages.get(offset) or (None,))[0])
+
+        first = fetch(0)
+        total = first.total if first.batch is not None else self.store.total(query)
+        end = min(self.per_query, total if total is not None else self.per_query)
+        offsets = list(range(self.page_size, end, self.page_size))
+        pages = [first]
+        if offsets:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(offsets)),
+                                    thread_name_prefix="ml-sync") as executor:
+                pages += list(executor.map(fetch, offsets))
+
+        old_hashes = self.store.hashes(query)
+        seen = {}        # id -> hash dos produtos presentes agora
+        fresh = {}       # id -> (hash, índice na página, batch) dos produtos baixados
+        page_state = {}
+        for offset, page in zip([0] + offsets, pages):
+            if page.batch is None:
+                # 304: a página é a mesma do último refresh
+                etag, ids = known_pages[offset]
+                for product_id in ids:
+                    seen.setdefault(product_id, old_hashes.get(product_id))
+                page_state[offset] = (etag, ids)
+                continue
+            batch = page.batch
+            for i, values in enumerate(zip(*(getattr(batch, column) for column in _BATCH_COLUMNS))):
+                product_id = batch.ids[i]
+                if product_id not in seen:
+                    seen[product_id] = h = content_hash(values)
+                    fresh[product_id] = (h, i, batch)
+            page_state[offset] = (page.etag, list(batch.ids))
+            if len(batch) < min(self.page_size, self.per_query - offset):
+                break
+
+        added, changed, upserts = [], [], []
+        changed_ids = [product_id for product_id, (h, _, _) in fresh.items()
+                       if product_id in old_hashes and old_hashes[product_id] != h]
+        previous = self.store.products(query, changed_ids) if changed_ids else {}
+        for product_id, (h, i, batch) in fresh.items():
+            old = old_hashes.get(product_id)
+            if old == h:
+                continue
+            product = batch.product(i)
+            upserts.append((product_id, h, product))
+            if old is None:
+                added.append(product)
+            else:
+                changed.append((product, changed_fields(previous.get(product_id, {}), product)))
+        removed = [product_id for product_id in old_hashes if product_id not in seen]
+        unchanged = len(seen) - len(upserts)
+
+        self.store.apply(query, upserts, removed, page_state, total)
+        delta = CatalogDelta(query, added, changed, removed, unchanged)
+        for kind, count in (("added", len(added)), ("changed", len(changed)), ("removed", len(removed))):
+            if count:
+                SYNC_CHANGES.inc(kind, amount=count)
+        logger.info(f"Sync '{query}': {len(added)} novos, {len(changed)} alterados, "
+                    f"{len(removed)} removidos, {unchanged} iguais")
+        if delta:
+            for listener in self._listeners:
+                try:
+                    listener(delta)
+                except Exception:
+                    logger.exception(f"Consumidor de delta falhou para '{query}'")
+        return delta
+
+
+def build_catalog_store():
+    """Cria o store da sincronização a partir das variáveis de ambiente."""
+    if os.getenv("ML_CATALOG_STORE", "memory").lower() == "sqlite":
+        return SQLiteCatalogStore(os.getenv("ML_CATALOG_STORE_PATH", "/tmp/ml_catalog.sqlite3"))
+    return MemoryCatalogStore()
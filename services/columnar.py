@@ -0,0 +1,150 @@
+"""
+Formato colunar binário e compacto para exportação de produtos normalizados.
+
+Arquivo = MAGIC seguido de grupos de linhas (um por página exportada). Cada grupo
+começa com o número de linhas e traz uma coluna por vez, na ordem de COLUMNS; cada
+coluna é um bloco comprimido com zlib:
+
+    <I linhas> então, por coluna: <B codificação> <I bytes comprimidos> <dados>
+
+Codificações: texto (offsets <I + UTF-8 concatenado), dicionário (valores distintos
+como texto + índices <H/<I por linha, para colunas repetitivas como marca e cor),
+float64 e bool (um byte por linha). Como o arquivo só cresce por grupos inteiros,
+truncá-lo no fim de um grupo sempre deixa um arquivo válido (base do resume).
+"""
+import sys
+import zlib
+import struct
+from array import array
+
+MAGIC = b"MLCOL1\n"
+
+TEXT, DICTIONARY, FLOAT64, BOOL = 1, 2, 3, 4
+
+# (nome, codificação, atributo do NormalizedBatch; None = valor por grupo)
+COLUMNS = (
+    ("query", DICTIONARY, None),
+    ("id", TEXT, "ids"),
+    ("title", TEXT, "titles"),
+    ("status", DICTIONARY, "statuses"),
+    ("price", FLOAT64, "prices"),
+    ("thumbnail", TEXT, "thumbnails"),
+    ("has_image", BOOL, "has_image"),
+    ("permalink", TEXT, "permalinks"),
+    ("brand", DICTIONARY, "brands"),
+    ("color", DICTIONARY, "colors"),
+    ("additional_attr", DICTIONARY, "third_attrs"),
+)
+COLUMN_NAMES = tuple(name for name, _, _ in COLUMNS)
+# Colunas de texto em que o vazio volta como None na leitura (produto sem thumbnail)
+NULLABLE_COLUMNS = ("thumbnail",)
+
+_U32 = struct.Struct("<I")
+_CHUNK = struct.Struct("<BI")
+_SWAP = sys.byteorder == "big"
+
+
+def _little_endian(values):
+    # array usa a ordem nativa; o arquivo é sempre little-endian
+    if _SWAP:
+        values.byteswap()
+    return values
+
+
+def _encode_text(values):
+    encoded = [("" if v is None else str(v)).encode("utf-8") for v in values]
+    offsets = array("I", [0])
+    total = 0
+    for data in encoded:
+        total += len(data)
+        offsets.append(total)
+    return _little_endian(offsets).tobytes() + b"".join(encoded)
+
+
+def _decode_text(payload, rows):
+    offsets = array("I")
+    offsets.frombytes(payload[:4 * (rows + 1)])
+    _little_endian(offsets)
+    blob = payload[4 * (rows + 1):]
+    return [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(rows)]
+
+
+def _encode_dictionary(values):
+    positions = {}
+    indices = [positions.setdefault(v, len(positions)) for v in values]
+    distinct = list(positions)
+    codes = array("H" if len(distinct) <= 0xFFFF else "I", indices)
+    return _U32.pack(len(distinct)) + bytes([codes.itemsize]) + _encode_text(distinct) + _little_endian(codes).tobytes()
+
+
+def _decode_dictionary(payload, rows):
+    count = _U32.unpack_from(payload)[0]
+    itemsize = payload[4]
+    offsets = array("I")
+    offsets.frombytes(payload[5:5 + 4 * (count + 1)])
+    _little_endian(offsets)
+    text_end = 5 + 4 * (count + 1) + offsets[-1]
+    distinct = _decode_text(payload[5:text_end], count)
+    codes = array("H" if itemsize == 2 else "I")
+    codes.frombytes(payload[text_end:text_end + itemsize * rows])
+    _little_endian(codes)
+    return [distinct[i] for i in codes]
+
+
+def _encode_column(encoding, values):
+    if encoding == TEXT:
+        return _encode_text(values)
+    if encoding == DICTIONARY:
+        return _encode_dictionary(values)
+    if encoding == FLOAT64:
+        return _little_endian(array("d", (float(v or 0) for v in values))).tobytes()
+    return bytes(1 if v else 0 for v in values)
+
+
+def _decode_column(encoding, payload, rows):
+    if encoding == TEXT:
+        return _decode_text(payload, rows)
+    if encoding == DICTIONARY:
+        return _decode_dictionary(payload, rows)
+    if encoding == FLOAT64:
+        values = array("d")
+        values.frombytes(payload)
+        return _little_endian(values).tolist()
+    return [b == 1 for b in payload]
+
+
+def encode_row_group(query, batch, level=6):
+    """Bytes de um grupo de linhas com os produtos de um NormalizedBatch."""
+    rows = len(batch)
+    parts = [_U32.pack(rows)]
+    for _, encoding, attribute in COLUMNS:
+        values = [query] * rows if attribute is None else getattr(batch, attribute)
+        data = zlib.compress(_encode_column(encoding, values), level)
+        parts.append(_CHUNK.pack(encoding, len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+
+def iter_row_groups(path):
+    """Lê um arquivo colunar e gera um dict {coluna: lista de valores} por grupo de linhas."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} não é um arquivo colunar de produtos")
+        while True:
+            header = f.read(_U32.size)
+            if not header:
+                return
+            rows = _U32.unpack(header)[0]
+            group = {}
+            for name in COLUMN_NAMES:
+                encoding, size = _CHUNK.unpack(f.read(_CHUNK.size))
+                group[name] = _decode_column(encoding, zlib.decompress(f.read(size)), rows)
+            for name in NULLABLE_COLUMNS:
+                group[name] = [value or None for value in group[name]]
+            yield group
+
+
+def iter_rows(path):
+    """Produtos do arquivo colunar como dicts (uma linha por produto)."""
+    for group in iter_row_groups(path):
+        yield from (dict(zip(COLUMN_NAMES, row)) for row in zip(*(group[name] for name in COLUMN_NAMES)))
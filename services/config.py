@@ -0,0 +1,32 @@
+"""
+Configuração do processo.
+
+O .env é lido uma única vez por processo (load_env é idempotente), antes de os
+serviços lerem os.getenv. Com o gunicorn em preload (gunicorn.conf.py), o app é
+carregado no master, que define ML_PRELOAD=1: nesse modo nada abre threads no
+import, e cada worker as inicia depois do fork (app.start_background_tasks).
+"""
+import os
+import threading
+
+_loaded = False
+_lock = threading.Lock()
+
+
+def load_env(path=None):
+    """Carrega o .env no os.environ (variáveis já definidas prevalecem). True só na primeira chamada."""
+    global _loaded
+    if _loaded:
+        return False
+    with _lock:
+        if _loaded:
+            return False
+        from dotenv import load_dotenv
+        load_dotenv(path)
+        _loaded = True
+    return True
+
+
+def preloading():
+    """Se o app está sendo carregado no master do gunicorn, antes do fork dos workers."""
+    return os.getenv("ML_PRELOAD") == "1"
@@ -0,0 +1,64 @@
+"""
+Prazo (orçamento de latência) da requisição atual.
+
+A rota define o prazo com start_deadline no início da requisição; ele fica num
+contextvar, então acompanha as tarefas do fan-out e do hedging (que rodam numa
+cópia do contexto) até o HttpClient. Lá, o timeout de cada chamada ao ML
+é limitado ao tempo que resta, e uma chamada que não cabe mais no prazo é
+recusada sem sair do processo (DeadlineExceeded). Sem prazo definido, nada muda.
+
+Chamadas que não podem ser cortadas no meio rodam em suspended(): a renovação
+do token, por exemplo, gasta o refresh_token de uso único, e desistir depois
+que o ML já trocou o par perderia o par novo.
+"""
+import time
+import contextvars
+from contextlib import contextmanager
+from services.resilience import DeadlineExceeded
+
+# Instante (time.monotonic) em que o prazo acaba; None = sem prazo
+_expires_at = contextvars.ContextVar("deadline", default=None)
+
+
+def start_deadline(seconds):
+    """Define o prazo da requisição atual (None ou 0 = sem prazo) e devolve quando ele acaba."""
+    expires_at = time.monotonic() + seconds if seconds else None
+    _expires_at.set(expires_at)
+    return expires_at
+
+
+def clear_deadline():
+    _expires_at.set(None)
+
+
+@contextmanager
+def suspended():
+    """Executa o bloco sem o prazo da requisição (timeouts normais); o prazo volta ao sair."""
+    token = _expires_at.set(None)
+    try:
+        yield
+    finally:
+        _expires_at.reset(token)
+
+
+def remaining():
+    """Segundos que restam do prazo (pode ser negativo), ou None sem prazo."""
+    expires_at = _expires_at.get()
+    return None if expires_at is None else expires_at - time.monotonic()
+
+
+def check(what="a chamada"):
+    """Levanta DeadlineExceeded se o prazo já acabou; devolve o que resta (ou None)."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"Prazo da requisição esgotado antes de {what}")
+    return left
+
+
+def clamp_timeout(timeout, left):
+    """Timeout do requests (número ou (conexão, leitura)) limitado aos `left` segundos restantes."""
+    if left is None:
+        return timeout
+    if isinstance(timeout, tuple):
+        return tuple(left if value is None else min(value, left) for value in timeout)
+    return left if timeout is None else min(timeout, left)
@@ -0,0 +1,256 @@
+import io
+import os
+import csv
+import json
+import time
+import logging
+from itertools import chain, islice
+from concurrent.futures import ThreadPoolExecutor
+from services import columnar
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("jsonl", "csv", "columnar")
+FIELDS = columnar.COLUMN_NAMES
+# Atributos do NormalizedBatch na ordem de FIELDS (a busca entra como primeira coluna)
+_BATCH_COLUMNS = tuple(attribute for _, _, attribute in columnar.COLUMNS if attribute)
+
+
+class ExportError(Exception):
+    """Falha que interrompe a exportação (o checkpoint fica válido para retomar)."""
+
+
+def _rows(query, batch):
+    return zip([query] * len(batch), *(getattr(batch, attribute) for attribute in _BATCH_COLUMNS))
+
+
+def _encode_jsonl(query, batch):
+    return "".join(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False) + "\n"
+                   for row in _rows(query, batch)).encode("utf-8")
+
+
+def _encode_csv(query, batch):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(_rows(query, batch))
+    return buffer.getvalue().encode("utf-8")
+
+
+def _csv_header():
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerow(FIELDS)
+    return buffer.getvalue().encode("utf-8")
+
+
+# formato -> (cabeçalho do arquivo, codificação de uma página)
+ENCODERS = {
+    "jsonl": (b"", _encode_jsonl),
+    "csv": (_csv_header(), _encode_csv),
+    "columnar": (columnar.MAGIC, columnar.encode_row_group),
+}
+
+
+def encode_delta(delta):
+    """
+    Linhas JSONL de um CatalogDelta da sincronização incremental: "op" (added,
+    changed, removed) + as colunas de FIELDS; alterados trazem também "fields".
+    Removidos só levam busca e id.
+    """
+    lines = []
+    for op, product, fields in chain((("added", product, None) for product in delta.added),
+                                     (("changed", product, fields) for product, fields in delta.changed)):
+        row = {"op": op, "query": delta.query}
+        row.update((field, product.get(field)) for field in FIELDS[1:])
+        if fields is not None:
+            row["fields"] = fields
+        lines.append(json.dumps(row, ensure_ascii=False) + "\n")
+    lines.extend(json.dumps({"op": "removed", "query": delta.query, "id": product_id}, ensure_ascii=False) + "\n"
+                 for product_id in delta.removed)
+    return "".join(lines).encode("utf-8")
+
+
+def read_queries(lines):
+    """Buscas de um arquivo (uma por linha), sem linhas vazias, comentários (#) ou repetidas."""
+    seen = set()
+    queries = []
+    for line in lines:
+        query = " ".join(line.split())
+        if query and not query.startswith("#") and query.lower() not in seen:
+            seen.add(query.lower())
+            queries.append(query)
+    return queries
+
+
+class CatalogExporter:
+    """
+    Exportação em lote dos produtos normalizados de uma lista de buscas.
+
+    As páginas de todas as buscas são disparadas em ordem num pool limitado
+    (`workers`), mas gravadas sempre na ordem (busca, offset), então o arquivo
+    é determinístico. O limite de requisições e o circuit breaker do HttpClient
+    continuam valendo; páginas recusadas ou com erro são tentadas de novo com
+    espera. Depois de cada página gravada, o checkpoint (JSON) registra o tamanho
+    do arquivo e até onde cada busca chegou: ao retomar, o que foi escrito depois
+    do último checkpoint é truncado e a exportação continua da página seguinte.
+    """
+
+    def __init__(self, service_factory, output, fmt="jsonl", checkpoint_path=None, per_query=1000,
+                 page_size=50, workers=4, max_attempts=5, retry_delay=1.0, on_unauthorized=None,
+                 progress=None, progress_interval=2.0):
+        if fmt not in ENCODERS:
+            raise ValueError(f"Formato desconhecido: {fmt}")
+        self.service_factory = service_factory
+        self.output = output
+        self.fmt = fmt
+        self.checkpoint_path = checkpoint_path or f"{output}.checkpoint.json"
+        self.per_query = per_query
+        self.page_size = page_size
+        self.workers = max(1, workers)
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.on_unauthorized = on_unauthorized
+        self.progress = progress
+        self.progress_interval = progress_interval
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        expected = {"format": self.fmt, "page_size": self.page_size, "per_query": self.per_query}
+        if any(state.get(key) != value for key, value in expected.items()):
+            raise ExportError(f"Checkpoint {self.checkpoint_path} é de outra configuração "
+                              f"({state.get('format')}, página {state.get('page_size')}, "
+                              f"{state.get('per_query')} por busca); use --restart")
+        return state
+
+    def _save_checkpoint(self, state):
+        tmp = f"{self.checkpoint_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp, self.checkpoint_path)
+
+    def _open_output(self, state):
+        header, _ = ENCODERS[self.fmt]
+        if state["bytes"]:
+            size = os.path.getsize(self.output) if os.path.exists(self.output) else -1
+            if size < state["bytes"]:
+                raise ExportError(f"{self.output} é menor que o registrado no checkpoint; use --restart")
+            f = open(self.output, "r+b")
+            # Descarta o que foi escrito depois do último checkpoint (página incompleta)
+            f.truncate(state["bytes"])
+            f.seek(state["bytes"])
+            return f
+        f = open(self.output, "wb")
+        f.write(header)
+        f.flush()
+        state["bytes"] = f.tell()
+        return f
+
+    def _fetch(self, query, offset, limit):
+        """Uma página, com novas tentativas para 401 (após renovar o token), erros e recusas locais."""
+        last_error = None
+        for attempt in range(self.max_attempts):
+            result = self.service_factory().fetch_batch(query, offset=offset, limit=limit)
+            if isinstance(result, tuple):
+                return result
+            last_error = result
+            if result.get("error") == "auth_expired":
+                if not (self.on_unauthorized and self.on_unauthorized()):
+                    break
+                continue
+            delay = result.get("retry_after") or self.retry_delay * (2 ** attempt)
+            logger.warning(f"Página {offset} de '{query}' falhou ({result.get('error')}); nova tentativa em {delay:.1f} s")
+            time.sleep(min(delay, 60))
+        message = (last_error or {}).get("message") or (last_error or {}).get("error")
+        raise ExportError(f"Busca '{query}' (offset {offset}) falhou: {message}")
+
+    def run(self, queries, restart=False):
+        """Exporta (ou retoma) as buscas e devolve as estatísticas da execução."""
+        state = None if restart else self._load_checkpoint()
+        resumed = state is not None
+        if state is None:
+            state = {"format": self.fmt, "page_size": self.page_size, "per_query": self.per_query,
+                     "bytes": 0, "items": 0, "queries": {}}
+        for query in queries:
+            state["queries"].setdefault(query, {"next_offset": 0, "items": 0, "total": None, "done": False})
+        _, encode = ENCODERS[self.fmt]
+
+        started = time.perf_counter()
+        last_report = started
+        items = pages = 0
+        output = self._open_output(state)
+        self._save_checkpoint(state)
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ml-export")
+        futures = {}  # (busca, offset) -> página em andamento
+        scheduled = {query: state["queries"][query]["next_offset"] for query in queries}
+        window = self.workers * 2
+
+        def fill(position):
+            # Agenda páginas na ordem de gravação. Enquanto o total de uma busca não é
+            # conhecido, só a página seguinte dela é pedida (sem chamadas além do fim).
+            for query in islice(queries, position, None):
+                progress = state["queries"][query]
+                if progress["done"]:
+                    continue
+                end = self.per_query if progress["total"] is None else min(self.per_query, progress["total"])
+                while len(futures) < window and scheduled[query] < end:
+                    offset = scheduled[query]
+                    if progress["total"] is None and offset > progress["next_offset"]:
+                        break
+                    futures[(query, offset)] = executor.submit(
+                        self._fetch, query, offset, min(self.page_size, self.per_query - offset))
+                    scheduled[query] = offset + self.page_size
+                if len(futures) >= window:
+                    return
+
+        try:
+            for position, query in enumerate(queries):
+                progress = state["queries"][query]
+                while not progress["done"]:
+                    fill(position)
+                    offset = progress["next_offset"]
+                    limit = min(self.page_size, self.per_query - offset)
+                    page = futures.pop((query, offset)).result()
+                    batch, total = page.batch, page.total
+
+                    if len(batch):
+                        output.write(encode(query, batch))
+                        output.flush()
+                    progress["next_offset"] = offset + limit
+                    progress["items"] += len(batch)
+                    if total is not None:
+                        progress["total"] = total
+                    # Página incompleta ou fim do total informado: não há mais resultados
+                    progress["done"] = (len(batch) < limit or progress["next_offset"] >= self.per_query
+                                        or (total is not None and progress["next_offset"] >= total))
+                    state["bytes"] = output.tell()
+                    state["items"] += len(batch)
+                    self._save_checkpoint(state)
+                    items += len(batch)
+                    pages += 1
+
+                    now = time.perf_counter()
+                    if self.progress and now - last_report >= self.progress_interval:
+                        last_report = now
+                        self.progress(state["items"], items / (now - started))
+                # Páginas agendadas além do fim real da busca são descartadas
+                for key in [key for key in futures if key[0] == query]:
+                    futures.pop(key).cancel()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            output.close()
+
+        elapsed = time.perf_counter() - started
+        # Concluída: o próximo run com a mesma saída começa do zero
+        os.remove(self.checkpoint_path)
+        return {
+            "items": state["items"],
+            "items_this_run": items,
+            "pages": pages,
+            "queries": len(queries),
+            "bytes": state["bytes"],
+            "seconds": round(elapsed, 3),
+            "items_per_sec": round(items / elapsed, 1) if elapsed else 0.0,
+            "resumed": resumed,
+        }
@@ -0,0 +1,158 @@
+"""
+Requisições com cópia atrasada (hedging) para a busca no ML.
+
+Uma réplica lenta do ML define a cauda de latência mesmo quando quase todas
+as chamadas são rápidas. Com o Hedger, se a chamada não responde até o
+percentil configurado das latências recentes, uma cópia idêntica é disparada
+e vale a primeira resposta. Só chamadas idempotentes (GET /products/search)
+passam por aqui, e as cópias são limitadas a uma fração das chamadas para
+não gastar a cota do ML; cada cópia também passa pelo limitador e pelo
+circuit breaker do HttpClient.
+"""
+import os
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from services import deadline
+from services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+HEDGED_CALLS = REGISTRY.counter(
+    "ml_hedged_calls",
+    "Chamadas com hedging, por resultado (fast, hedged, hedge_won, no_budget, no_time)",
+    ("outcome",),
+)
+
+
+def _close(future):
+    """Descarta a resposta de quem perdeu a corrida (devolve a conexão ao pool)."""
+    if not future.cancelled() and future.exception() is None:
+        close = getattr(future.result(), "close", None)
+        if close is not None:
+            close()
+
+
+class Hedger:
+    """
+    Dispara uma cópia da chamada quando ela passa do percentil `percentile` das
+    latências recentes (entre min_delay e max_delay; max_delay enquanto houver
+    menos de min_samples amostras). Cada chamada rende `max_ratio` de crédito,
+    até `burst`, e cada cópia gasta um: no máximo ~max_ratio das chamadas têm cópia.
+    O pool é do worker (criado na primeira chamada, depois do fork).
+    """
+
+    def __init__(self, percentile=0.95, min_delay=0.05, max_delay=2.0, max_ratio=0.05, burst=5.0,
+                 window=512, min_samples=20, max_workers=32):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_ratio = max_ratio
+        self.burst = burst
+        self.min_samples = min_samples
+        self.max_workers = max_workers
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.skipped = 0
+        self._credits = 1.0
+        self._samples = deque(maxlen=window)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ml-hedge")
+                self._pid = os.getpid()
+            return self._executor
+
+    def delay(self):
+        """Espera antes da cópia: o percentil das latências recentes das chamadas originais."""
+        samples = list(self._samples)
+        if len(samples) < self.min_samples:
+            return self.max_delay
+        samples.sort()
+        value = samples[min(len(samples) - 1, int(len(samples) * self.percentile))]
+        return min(self.max_delay, max(self.min_delay, value))
+
+    def _observe(self, start, future):
+        if not future.cancelled() and future.exception() is None:
+            self._samples.append(time.perf_counter() - start)
+
+    def _earn(self):
+        with self._lock:
+            self.calls += 1
+            self._credits = min(self.burst, self._credits + self.max_ratio)
+
+    def _spend(self):
+        with self._lock:
+            if self._credits < 1:
+                return False
+            self._credits -= 1
+            return True
+
+    def call(self, fn):
+        """Resultado de fn() (ou da cópia, se ela responder antes); exceções só se as duas falharem."""
+        self._earn()
+        pool = self._pool()
+        start = time.perf_counter()
+        # Cada chamada roda numa cópia do contexto atual (trace id e prazo da requisição)
+        primary = pool.submit(contextvars.copy_context().run, fn)
+        primary.add_done_callback(lambda future: self._observe(start, future))
+        delay = self.delay()
+        done, _ = wait((primary,), timeout=delay)
+        if done:
+            HEDGED_CALLS.inc("fast")
+            return primary.result()
+
+        left = deadline.remaining()
+        outcome = "no_time" if left is not None and left <= 0 else None if self._spend() else "no_budget"
+        if outcome is not None:
+            self.skipped += 1
+            HEDGED_CALLS.inc(outcome)
+            return primary.result()
+
+        self.hedged += 1
+        HEDGED_CALLS.inc("hedged")
+        logger.info(f"Chamada sem resposta após {delay * 1000:.0f} ms: disparando cópia (hedge)")
+        hedge = pool.submit(contextvars.copy_context().run, fn)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self.hedge_wins += 1
+                        HEDGED_CALLS.inc("hedge_won")
+                    for loser in pending:
+                        loser.add_done_callback(_close)
+                    return future.result()
+        # As duas falharam: vale o erro da chamada original
+        return primary.result()
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "skipped": self.skipped,
+            "delay_seconds": round(self.delay(), 4),
+        }
+
+
+def build_hedger():
+    """Hedger a partir das variáveis de ambiente, ou None (ML_HEDGE_ENABLED=1 liga)."""
+    if os.getenv("ML_HEDGE_ENABLED", "0") != "1":
+        return None
+    return Hedger(
+        percentile=float(os.getenv("ML_HEDGE_PERCENTILE", 0.95)),
+        min_delay=float(os.getenv("ML_HEDGE_MIN_DELAY", 0.05)),
+        max_delay=float(os.getenv("ML_HEDGE_MAX_DELAY", 2.0)),
+        max_ratio=float(os.getenv("ML_HEDGE_MAX_RATIO", 0.05)),
+        max_workers=int(os.getenv("ML_HEDGE_WORKERS", 32)),
+    )
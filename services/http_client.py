@@ -0,0 +1,297 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from functools import lru_cache
+from services import deadline
+from services.metrics import REGISTRY
+from services.resilience import (UpstreamGuard, UpstreamUnavailable, RateLimitedError, DeadlineExceeded,
+                                 endpoint_of, retry_after_seconds)
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    "ml_upstream_request_seconds",
+    "Duração das chamadas à API do ML (inclui retries), por método, endpoint e status",
+    ("method", "endpoint", "status"),
+)
+
+def _observe_upstream(method, url, start, status, histogram=UPSTREAM_LATENCY):
+    # Só o path entra no label: a query string (busca do usuário) explodiria a cardinalidade
+    histogram.observe(time.perf_counter() - start, method, endpoint_of(url), status)
+
+@lru_cache(maxsize=None)
+def _server_error_retry():
+    # requests/urllib3 só são importados na primeira sessão: o import do app não paga esse custo
+    from urllib3.util.retry import Retry
+
+    class ServerErrorRetry(Retry):
+        # O urllib3 repete qualquer 429 com Retry-After; aqui quem cuida do 429 é o limitador do host
+        RETRY_AFTER_STATUS_CODES = frozenset({503})
+
+    return ServerErrorRetry
+
+def preload():
+    """Importa requests/urllib3 já (ex.: no master do gunicorn, para os workers herdarem os módulos)."""
+    import requests  # noqa: F401
+    _server_error_retry()
+
+class HttpClient:
+    """
+    Camada HTTP compartilhada pelo processo para chamadas à API do Mercado Livre.
+
+    Mantém um pool de conexões keep-alive por host (evita um novo handshake
+    TCP+TLS a cada requisição), timeouts separados de conexão/leitura e
+    retry com backoff exponencial para respostas 5xx. Toda chamada passa por um
+    circuit breaker do endpoint e pelo limitador do host (UpstreamGuard): com o
+    circuito aberto ou o limite estourado, levanta UpstreamUnavailable sem sair
+    do processo. Os 429 ajustam o limitador e são repetidos por ele. Com um
+    prazo na requisição (services.deadline), os timeouts ficam limitados ao que
+    resta dele e o esgotamento vira DeadlineExceeded. Um cliente para outro
+    upstream (ex.: o CDN das imagens) recebe o seu guard e o seu histograma
+    (`latency`, com os labels de UPSTREAM_LATENCY), sem misturar estado e métricas com o ML.
+    """
+
+    SERVER_ERROR_STATUSES = (500, 502, 503, 504)
+    RETRY_STATUSES = (429,) + SERVER_ERROR_STATUSES
+
+    def __init__(self, pool_connections=None, pool_maxsize=None, pool_block=None,
+                 connect_timeout=None, read_timeout=None, retries=None, backoff_factor=None, guard=None,
+                 latency=None):
+        # Configuração via .env, com valores padrão seguros para o gunicorn
+        self.pool_connections = pool_connections or int(os.getenv("ML_HTTP_POOL_CONNECTIONS", 4))
+        self.pool_maxsize = pool_maxsize or int(os.getenv("ML_HTTP_POOL_MAXSIZE", 10))
+        if pool_block is None:
+            pool_block = os.getenv("ML_HTTP_POOL_BLOCK", "false").lower() == "true"
+        self.pool_block = pool_block
+        self.connect_timeout = connect_timeout or float(os.getenv("ML_HTTP_CONNECT_TIMEOUT", 3.05))
+        self.read_timeout = read_timeout or float(os.getenv("ML_HTTP_READ_TIMEOUT", 10))
+        self.retries = retries if retries is not None else int(os.getenv("ML_HTTP_RETRIES", 2))
+        self.backoff_factor = backoff_factor if backoff_factor is not None else float(os.getenv("ML_HTTP_BACKOFF", 0.3))
+        self.guard = guard or UpstreamGuard()
+        self.latency = latency or UPSTREAM_LATENCY
+        self.session = self._build_session()
+
+    def _build_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        # POST (troca/renovação de token) só é repetido em falha de conexão:
+        # o refresh_token do ML é de uso único e não pode ser reenviado às cegas.
+        # 429 fica fora: quem espera o Retry-After é o limitador do host.
+        retry = _server_error_retry()(
+            total=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=self.SERVER_ERROR_STATUSES,
+            allowed_methods=frozenset({"GET", "HEAD"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _timeout(self, read_timeout=None):
+        return (self.connect_timeout, read_timeout or self.read_timeout)
+
+    def _send(self, method, send, url, read_timeout, kwargs):
+        kwargs.setdefault("timeout", self._timeout(read_timeout))
+        breaker, limiter = self.guard.breaker(url), self.guard.limiter(url)
+        start = time.perf_counter()
+        status = "error"
+        try:
+            try:
+                # Com prazo na requisição (services.deadline), o timeout é o que resta dele
+                left = deadline.check(f"{method} {endpoint_of(url)}")
+                kwargs["timeout"] = deadline.clamp_timeout(kwargs["timeout"], left)
+                delay = self.guard.admit(breaker, limiter)
+                if delay and left is not None and delay >= left:
+                    breaker.cancel()
+                    raise DeadlineExceeded(f"Espera do limitador ({delay:.2f} s) passa do prazo", retry_after=delay)
+            except UpstreamUnavailable as e:
+                status = e.reason
+                raise
+            if delay:
+                time.sleep(delay)
+            try:
+                response = self._attempts(method, send, url, limiter, kwargs)
+            except Exception as e:
+                left = deadline.remaining()
+                if left is not None and left <= 0:
+                    # Timeout cortado pelo prazo: a lentidão não conta como falha do endpoint
+                    breaker.cancel()
+                    status = DeadlineExceeded.reason
+                    raise DeadlineExceeded(f"Prazo da requisição esgotado durante {method} {endpoint_of(url)}") from e
+                breaker.record_failure()
+                raise
+            status = str(response.status_code)
+            self.guard.record(breaker, response.status_code)
+            return response
+        finally:
+            _observe_upstream(method, url, start, status, self.latency)
+
+    def _attempts(self, method, send, url, limiter, kwargs):
+        attempt = 0
+        while True:
+            response = send(url, **kwargs)
+            if response.status_code != 429:
+                return response
+            limiter.throttle(retry_after_seconds(response))
+            if method != "GET" or attempt >= self.retries:
+                return response
+            try:
+                delay = limiter.reserve()
+            except RateLimitedError:
+                # Retry-After longo demais para segurar o worker: devolve o 429
+                return response
+            left = deadline.remaining()
+            if left is not None and delay >= left:
+                return response
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url, read_timeout=None, **kwargs):
+        return self._send("GET", self.session.get, url, read_timeout, kwargs)
+
+    def post(self, url, read_timeout=None, **kwargs):
+        return self._send("POST", self.session.post, url, read_timeout, kwargs)
+
+    def head(self, url, read_timeout=None, **kwargs):
+        return self._send("HEAD", self.session.head, url, read_timeout, kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncHttpClient:
+    """
+    Equivalente assíncrono (httpx) do HttpClient, usado pelo modo ASGI.
+
+    Mesma política do cliente síncrono: pool keep-alive, timeouts separados
+    e retry com backoff em 429/5xx apenas para GET (POST só em falha de conexão),
+    com circuit breaker e limitador adaptativo (UpstreamGuard).
+    Deve ser criado dentro do event loop que vai usá-lo.
+    """
+
+    RETRY_STATUSES = HttpClient.RETRY_STATUSES
+
+    def __init__(self, max_connections=None, max_keepalive=None, connect_timeout=None,
+                 read_timeout=None, retries=None, backoff_factor=None, guard=None):
+        import httpx  # dependência exclusiva do modo assíncrono
+
+        self._httpx = httpx
+        self.max_connections = max_connections or int(os.getenv("ML_HTTP_ASYNC_MAX_CONNECTIONS", 100))
+        self.max_keepalive = max_keepalive or int(os.getenv("ML_HTTP_POOL_MAXSIZE", 10))
+        self.connect_timeout = connect_timeout or float(os.getenv("ML_HTTP_CONNECT_TIMEOUT", 3.05))
+        self.read_timeout = read_timeout or float(os.getenv("ML_HTTP_READ_TIMEOUT", 10))
+        self.retries = retries if retries is not None else int(os.getenv("ML_HTTP_RETRIES", 2))
+        self.backoff_factor = backoff_factor if backoff_factor is not None else float(os.getenv("ML_HTTP_BACKOFF", 0.3))
+        self.guard = guard or UpstreamGuard()
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_keepalive),
+        )
+
+    def _timeout(self, read_timeout=None):
+        return self._httpx.Timeout(read_timeout or self.read_timeout, connect=self.connect_timeout)
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff_factor * (2 ** attempt)
+
+    async def _request(self, method, url, read_timeout, retry_on_status, **kwargs):
+        kwargs.setdefault("timeout", self._timeout(read_timeout))
+        breaker, limiter = self.guard.breaker(url), self.guard.limiter(url)
+        start = time.perf_counter()
+        status = "error"
+        try:
+            try:
+                delay = self.guard.admit(breaker, limiter)
+            except UpstreamUnavailable as e:
+                status = e.reason
+                raise
+            if delay:
+                await asyncio.sleep(delay)
+            try:
+                response = await self._attempts(method, url, retry_on_status, limiter, kwargs)
+            except Exception:
+                breaker.record_failure()
+                raise
+            status = str(response.status_code)
+            self.guard.record(breaker, response.status_code)
+            return response
+        finally:
+            _observe_upstream(method, url, start, status)
+
+    async def _attempts(self, method, url, retry_on_status, limiter, kwargs):
+        attempt = 0
+        while True:
+            response = None
+            try:
+                response = await self.client.request(method, url, **kwargs)
+                if response.status_code == 429:
+                    limiter.throttle(retry_after_seconds(response))
+                if not retry_on_status or response.status_code not in self.RETRY_STATUSES or attempt >= self.retries:
+                    return response
+            except self._httpx.ConnectError:
+                if attempt >= self.retries:
+                    raise
+            if response is not None and response.status_code == 429:
+                try:
+                    delay = limiter.reserve()
+                except RateLimitedError:
+                    return response
+            else:
+                delay = self._backoff(attempt, response)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def get(self, url, read_timeout=None, **kwargs):
+        return await self._request("GET", url, read_timeout, True, **kwargs)
+
+    async def post(self, url, read_timeout=None, **kwargs):
+        return await self._request("POST", url, read_timeout, False, **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+def get_http_client():
+    """
+    Retorna o cliente HTTP do processo atual.
+
+    Cada worker do gunicorn cria o seu próprio pool após o fork, para que
+    sockets abertos no processo pai nunca sejam compartilhados.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = HttpClient()
+                _client_pid = pid
+                logger.info(f"Pool HTTP criado para o processo {pid}")
+    return _client
+
+def reset_http_client():
+    """Descarta o cliente atual (útil em testes ou após mudança de configuração)."""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _client_pid = None
@@ -0,0 +1,386 @@
+"""
+Pipeline das imagens dos produtos: validação das thumbnails e proxy com cache em disco.
+
+A normalização troca a thumbnail -I pela variante -V (maior) sem saber se ela
+existe. ImageValidator confere as URLs por HEAD em segundo plano, com resultado
+em cache por URL, e a busca só aplica o que já foi conferido: uma -V quebrada
+volta para a -I original e, sem nenhuma das duas, o produto fica sem thumbnail
+(o template mostra o placeholder local) e sai do grupo "com imagem" da
+ordenação. ThumbnailCache (opcional) serve as thumbnails do CDN do ML pelo
+próprio app, guardadas em disco com limite de bytes e de arquivos e descarte LRU.
+
+As chamadas ao CDN usam um HttpClient próprio (get_image_http_client): circuit
+breakers, limitador e histograma de latência separados dos da API do ML.
+"""
+import os
+import time
+import hashlib
+import logging
+import mimetypes
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from services.http_client import HttpClient
+from services.metrics import REGISTRY
+from services.resilience import UpstreamGuard
+
+logger = logging.getLogger(__name__)
+
+IMAGE_LATENCY = REGISTRY.histogram(
+    "ml_image_request_seconds",
+    "Duração das chamadas ao CDN das imagens (validação e proxy), por método, endpoint e status",
+    ("method", "endpoint", "status"),
+)
+
+# Variante grande -> original, na ordem em que são tentadas
+_VARIANTS = (('-V.jpg', '-I.jpg'), ('-V.png', '-I.png'))
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_image_http_client():
+    """
+    Cliente HTTP do processo para o CDN das imagens (criado após o fork, como o
+    da API). Sem retries (um HEAD sem resposta fica desconhecido e é tentado na
+    próxima busca) e sem o ML_RATE_LIMIT da API.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = HttpClient(retries=0, guard=UpstreamGuard(rate=0), latency=IMAGE_LATENCY)
+                _client_pid = pid
+    return _client
+
+
+def fallback_url(thumbnail):
+    """A thumbnail original (-I) de uma variante -V, ou None."""
+    for large, original in _VARIANTS:
+        if large in thumbnail:
+            return thumbnail.replace(large, original)
+    return None
+
+
+class ImageValidator:
+    """
+    Confere por HEAD, em segundo plano, se as thumbnails existem. Respostas 2xx
+    com Content-Type de imagem valem por `ttl`; 404/410 (ou outro tipo de
+    conteúdo) por `negative_ttl`. Erros de rede e 5xx ficam como desconhecidos
+    (o produto mantém a imagem) e não entram no cache.
+
+    A busca do usuário só lê os vereditos já guardados (apply, sem rede): as
+    URLs ainda não conferidas vão para o pool de max_workers threads do
+    processo, até max_pending por vez, e valem a partir das próximas buscas.
+    """
+
+    def __init__(self, http_client=None, ttl=6 * 3600, negative_ttl=600, max_workers=4, max_pending=1000,
+                 timeout=2.0, max_entries=50000):
+        self._http = http_client
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.checked = 0
+        self.cache_hits = 0
+        self.broken = 0
+        self.unknown = 0
+        self.dropped = 0
+        self._results = OrderedDict()  # url -> (existe, verificada_em)
+        self._pending = set()          # na fila ou sendo conferidas agora
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    @property
+    def http(self):
+        # Cliente do CDN resolvido no primeiro uso (depois do fork, com o app em preload)
+        return self._http or get_image_http_client()
+
+    def _cached(self, url, now):
+        entry = self._results.get(url)
+        if entry is None:
+            return None
+        ok, checked_at = entry
+        if now - checked_at > (self.ttl if ok else self.negative_ttl):
+            return None
+        return ok
+
+    def _remember(self, url, ok, now):
+        with self._lock:
+            self._results[url] = (ok, now)
+            self._results.move_to_end(url)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+    def _head(self, url):
+        try:
+            response = self.http.head(url, read_timeout=self.timeout, allow_redirects=True)
+        except Exception as e:
+            logger.debug(f"HEAD {url} falhou: {e}")
+            return None
+        status = response.status_code
+        if status in (404, 410):
+            return False
+        if not 200 <= status < 300:
+            return None
+        content_type = response.headers.get('Content-Type', '')
+        return not content_type or content_type.startswith('image/')
+
+    def check(self, url):
+        """Confere a URL agora (bloqueia) e guarda o resultado; uma -V quebrada já confere a -I também."""
+        ok = self._head(url)
+        if ok is None:
+            self.unknown += 1
+            return None
+        self.checked += 1
+        now = time.time()
+        self._remember(url, ok, now)
+        fallback = fallback_url(url) if ok is False else None
+        if fallback and self._cached(fallback, now) is None:
+            self.check(fallback)
+        return ok
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ml-images")
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, urls):
+        """Agenda a conferência das URLs em segundo plano (as já pendentes e as acima de max_pending ficam de fora)."""
+        with self._lock:
+            urls = [url for url in dict.fromkeys(urls) if url not in self._pending]
+            room = max(0, self.max_pending - len(self._pending))
+            self.dropped += max(0, len(urls) - room)
+            urls = urls[:room]
+            self._pending.update(urls)
+        if not urls:
+            return
+        pool = self._pool()
+        for url in urls:
+            pool.submit(self._run, url)
+
+    def _run(self, url):
+        try:
+            self.check(url)
+        except Exception:
+            logger.exception(f"Erro ao conferir a thumbnail {url}")
+        finally:
+            with self._lock:
+                self._pending.discard(url)
+
+    def apply(self, batch):
+        """
+        Aplica a um NormalizedBatch, no lugar, os vereditos já guardados: -V quebrada
+        vira a -I original; sem nenhuma válida, thumbnail None e has_image=False.
+        Não faz chamadas: as URLs sem veredito vão para a fila de segundo plano.
+        """
+        now = time.time()
+        thumbnails, has_image = batch.thumbnails, batch.has_image
+        unknown = []
+        for i in range(len(batch)):
+            if not has_image[i]:
+                continue
+            url = thumbnails[i]
+            ok = self._cached(url, now)
+            if ok is None:
+                unknown.append(url)
+                continue
+            self.cache_hits += 1
+            if ok:
+                continue
+            fallback = fallback_url(url)
+            fallback_ok = self._cached(fallback, now) if fallback else False
+            if fallback_ok is not False:
+                thumbnails[i] = fallback
+                if fallback_ok is None:
+                    unknown.append(fallback)
+            else:
+                thumbnails[i] = None
+                has_image[i] = False
+                self.broken += 1
+        if unknown:
+            self.submit(unknown)
+        return batch
+
+    def stats(self):
+        return {
+            "checked": self.checked,
+            "cache_hits": self.cache_hits,
+            "broken": self.broken,
+            "unknown": self.unknown,
+            "dropped": self.dropped,
+            "pending": len(self._pending),
+            "entries": len(self._results),
+        }
+
+
+class ThumbnailCache:
+    """
+    Proxy de thumbnails com cache em disco. Só busca URLs dos hosts permitidos
+    (o CDN do ML), guarda até max_file_bytes por arquivo e descarta os menos
+    usados quando passa de max_bytes ou max_files. O índice LRU fica em memória
+    e é reconstruído pelo mtime dos arquivos ao subir; cada acerto atualiza o mtime.
+    """
+
+    def __init__(self, directory, http_client=None, max_bytes=256 * 1024 * 1024, max_files=20000,
+                 max_file_bytes=2 * 1024 * 1024, allowed_hosts=("mlstatic.com",), timeout=5.0):
+        self.directory = directory
+        self._http = http_client
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.max_file_bytes = max_file_bytes
+        self.allowed_hosts = tuple(allowed_hosts)
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.failures = 0
+        self._index = OrderedDict()  # nome do arquivo -> bytes (LRU)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    @property
+    def http(self):
+        return self._http or get_image_http_client()
+
+    def _scan(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self._bytes += size
+
+    def allowed(self, url):
+        parts = urlsplit(url or "")
+        host = (parts.hostname or "").lower()
+        return parts.scheme in ("http", "https") and any(
+            host == allowed or host.endswith("." + allowed) for allowed in self.allowed_hosts)
+
+    @staticmethod
+    def filename(url):
+        extension = os.path.splitext(urlsplit(url).path)[1].lower()
+        if extension not in (".jpg", ".jpeg", ".png", ".webp", ".gif"):
+            extension = ".img"
+        return hashlib.blake2b(url.encode("utf-8"), digest_size=16).hexdigest() + extension
+
+    @staticmethod
+    def mimetype(path):
+        return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    def fetch(self, url):
+        """Caminho do arquivo em disco com a thumbnail (baixada se preciso), ou None."""
+        if not self.allowed(url):
+            return None
+        name = self.filename(url)
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            cached = name in self._index
+            if cached:
+                self._index.move_to_end(name)
+        if cached:
+            try:
+                os.utime(path)
+                self.hits += 1
+                return path
+            except FileNotFoundError:
+                # Descartada por outro worker que divide o diretório
+                self._forget(name)
+        self.misses += 1
+        return self._download(url, name, path)
+
+    def _download(self, url, name, path):
+        try:
+            response = self.http.get(url, read_timeout=self.timeout, stream=True)
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Thumbnail {url} indisponível: {e}")
+            return None
+        try:
+            if response.status_code != 200 or not response.headers.get('Content-Type', 'image/').startswith('image/'):
+                self.failures += 1
+                return None
+            chunks, size = [], 0
+            for chunk in response.iter_content(64 * 1024):
+                chunks.append(chunk)
+                size += len(chunk)
+                if size > self.max_file_bytes:
+                    self.failures += 1
+                    return None
+            data = b"".join(chunks)
+        finally:
+            response.close()
+
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            old = self._index.pop(name, None)
+            if old is not None:
+                self._bytes -= old
+            self._index[name] = len(data)
+            self._bytes += len(data)
+            evicted = []
+            while self._index and (len(self._index) > self.max_files or self._bytes > self.max_bytes):
+                victim, size = self._index.popitem(last=False)
+                self._bytes -= size
+                evicted.append(victim)
+        for victim in evicted:
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.directory, victim))
+            except FileNotFoundError:
+                pass
+        return path if name in self._index else None
+
+    def _forget(self, name):
+        with self._lock:
+            size = self._index.pop(name, None)
+            if size is not None:
+                self._bytes -= size
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "failures": self.failures,
+            "files": len(self._index),
+            "bytes": self._bytes,
+        }
+
+
+def build_image_validator():
+    """Validação das thumbnails a partir das variáveis de ambiente (None se desligada)."""
+    if os.getenv("ML_IMAGE_VALIDATION", "1") != "1":
+        return None
+    return ImageValidator(
+        ttl=float(os.getenv("ML_IMAGE_VALIDATION_TTL", 6 * 3600)),
+        max_workers=int(os.getenv("ML_IMAGE_VALIDATION_WORKERS", 4)),
+        max_pending=int(os.getenv("ML_IMAGE_VALIDATION_MAX_PENDING", 1000)),
+    )
+
+
+def build_thumbnail_cache():
+    """Proxy de thumbnails a partir das variáveis de ambiente (None se desligado)."""
+    if os.getenv("ML_THUMBNAIL_PROXY", "0") != "1":
+        return None
+    return ThumbnailCache(
+        os.getenv("ML_THUMBNAIL_DIR", "/tmp/ml_thumbnails"),
+        max_bytes=int(os.getenv("ML_THUMBNAIL_MAX_BYTES", 256 * 1024 * 1024)),
+        max_files=int(os.getenv("ML_THUMBNAIL_MAX_FILES", 20000)),
+        allowed_hosts=[host.strip() for host in os.getenv("ML_THUMBNAIL_HOSTS", "mlstatic.com").split(",") if host.strip()],
+    )
@@ -0,0 +1,117 @@
+import json
+import codecs
+
+_WHITESPACE = " \t\n\r"
+
+class JsonStreamError(ValueError):
+    """Corpo JSON inválido ou truncado."""
+
+
+def iter_json_array(chunks, key="results", meta=None):
+    """
+    Percorre incrementalmente um objeto JSON de nível superior e gera, um a um,
+    os elementos do array em `key` (ex.: "results" do /products/search).
+
+    `chunks` é um iterável de bytes (ex.: response.iter_content). Só o elemento
+    em construção e o restante do chunk atual ficam em memória. As demais chaves
+    de nível superior (ex.: "paging") são gravadas em `meta`, se informado.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer = ""
+    pos = 0
+    eof = False
+    state = "start"  # start -> key -> colon -> value | items -> (comma) -> key ... -> end
+
+    def more():
+        nonlocal buffer, pos, eof
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            eof = True
+            buffer = buffer[pos:] + utf8.decode(b"", final=True)
+            pos = 0
+            return
+        # Descarta o que já foi consumido para manter o buffer pequeno
+        buffer = buffer[pos:] + utf8.decode(chunk)
+        pos = 0
+
+    def skip_ws():
+        nonlocal pos
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+
+    def decode_value():
+        """Decodifica um valor completo em pos; None se ainda faltam dados."""
+        nonlocal pos
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise JsonStreamError(f"JSON inválido na posição {pos}")
+            return None, False
+        # Um número no fim do buffer pode continuar no próximo chunk
+        if end == len(buffer) and not eof:
+            return None, False
+        pos = end
+        return value, True
+
+    current_key = None
+    while state != "end":
+        skip_ws()
+        if pos >= len(buffer):
+            if eof:
+                raise JsonStreamError("JSON truncado")
+            more()
+            continue
+
+        char = buffer[pos]
+        if state == "start":
+            if char != "{":
+                raise JsonStreamError("Esperado objeto JSON no nível superior")
+            pos += 1
+            state = "key"
+        elif state == "key":
+            if char == "}":
+                pos += 1
+                state = "end"
+                continue
+            if char == ",":
+                pos += 1
+                continue
+            current_key, ok = decode_value()
+            if not ok:
+                more()
+                continue
+            state = "colon"
+        elif state == "colon":
+            if char != ":":
+                raise JsonStreamError(f"Esperado ':' na posição {pos}")
+            pos += 1
+            state = "value"
+        elif state == "value":
+            if current_key == key and char == "[":
+                pos += 1
+                state = "items"
+                continue
+            value, ok = decode_value()
+            if not ok:
+                more()
+                continue
+            if meta is not None:
+                meta[current_key] = value
+            state = "key"
+        elif state == "items":
+            if char == "]":
+                pos += 1
+                state = "key"
+                continue
+            if char == ",":
+                pos += 1
+                continue
+            item, ok = decode_value()
+            if not ok:
+                more()
+                continue
+            yield item
@@ -1,25 +1,75 @@
-import requests
+import os
+import math
+import time
+import asyncio
 import logging
 import random
+import contextvars
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from services.http_client import get_http_client
+from services.cache import SearchCache
+from services.normalizer import normalize_batch
+from services.json_stream import iter_json_array
+from services.metrics import REGISTRY
+from services.resilience import UpstreamUnavailable
 
 logger = logging.getLogger(__name__)
 
+PROCESSING_SECONDS = REGISTRY.histogram(
+    "ml_search_processing_seconds",
+    "Tempo de processamento de uma página de /products/search, por etapa (parse, normalize, images, sort, materialize)",
+    ("stage",),
+)
+SEARCH_ERRORS = REGISTRY.counter(
+    "ml_search_errors",
+    "Buscas que não devolveram produtos, por tipo de erro",
+    ("kind",),
+)
+
+# Página de fetch_batch: batch=None quando o ML respondeu 304 (não mudou desde o etag enviado)
+SearchPage = namedtuple("SearchPage", "batch total etag")
+
 class MercadoLivreService:
     """
     Serviço para busca e manipulação de produtos da API do Mercado Livre.
     """
     
-    API_BASE_URL = "https://api.mercadolibre.com"
+    # Sobrescrevível para apontar a um stand-in local (benchmarks)
+    API_BASE_URL = os.getenv("ML_API_BASE_URL", "https://api.mercadolibre.com")
+    # Máximo de itens por chamada ao /products/search na busca paginada
+    PAGE_SIZE = int(os.getenv("ML_SEARCH_PAGE_SIZE", 50))
+    # Páginas buscadas em paralelo por busca paginada
+    FANOUT_WORKERS = int(os.getenv("ML_SEARCH_FANOUT_WORKERS", 4))
+    # Tamanho dos blocos lidos do corpo da resposta no modo streaming
+    STREAM_CHUNK_SIZE = 16 * 1024
+    # Timeout de leitura das buscas (limitado pelo prazo da requisição, quando houver)
+    READ_TIMEOUT = 10
+    # Site padrão das buscas e sites aceitos em site_id (busca em lote)
+    DEFAULT_SITE_ID = os.getenv("ML_SITE_ID", "MLB")
+    SITE_IDS = ("MLA", "MLB", "MLC", "MLM", "MLU", "MLV", "MCO", "MPE", "MEC", "MBO", "MPY", "MCR", "MPA",
+                "MRD", "MGT", "MHN", "MNI", "MSV", "MCU")
 
-    def __init__(self, access_token=None):
+    def __init__(self, access_token=None, http_client=None, cache=None, single_flight=None, image_validator=None,
+                 hedger=None):
         self.access_token = access_token
+        # Pool de conexões compartilhado pelo processo (keep-alive entre requisições)
+        self.http = http_client or get_http_client()
+        # Cache opcional de resultados normalizados (SearchCache)
+        self.cache = cache
+        # Coalescência opcional de buscas idênticas simultâneas (SingleFlight)
+        self.single_flight = single_flight
+        # Validação opcional das thumbnails antes da ordenação imagem-primeiro (ImageValidator)
+        self.image_validator = image_validator
+        # Cópia atrasada opcional das chamadas lentas ao /products/search (Hedger)
+        self.hedger = hedger
         self.headers = {
             'Authorization': f'Bearer {self.access_token}',
             'Accept': 'application/json',
             'User-Agent': 'ML-Explorer/1.0.0'
         }
 
-    def search_products(self, query="notebook"):
+    def search_products(self, query="notebook", offset=0, limit=10, site_id=None):
         """
         Busca produtos ativos no catálogo usando o endpoint obrigatório do desafio.
         """
@@ -27,133 +77,315 @@ class MercadoLivreService:
             logger.warning("Tentativa de busca sem access_token.")
             return []
 
+        url, params, key = self._build_search(query, offset, limit, site_id)
+        loader = lambda: self._fetch_products(url, params)
+
+        if self.single_flight is not None:
+            recheck = (lambda: self.cache.get(key)) if self.cache is not None else None
+            fetch = loader
+            loader = lambda: self.single_flight.do(key, fetch, recheck=recheck)
+
+        if self.cache is None:
+            return loader()
+        return self.cache.get_or_load(key, loader)
+
+    def prefetch(self, query="notebook", offset=0, limit=10, min_ttl=0):
+        """
+        Aquece o cache com uma busca: só chama o ML se a entrada não existir ou
+        for expirar em menos de min_ttl segundos. Devolve "fresh", "loaded",
+        "empty" ou o dict de erro da busca.
+        """
+        url, params, key = self._build_search(query, offset, limit)
+        age = self.cache.age(key)
+        if age is not None and age + min_ttl <= self.cache.ttl:
+            return "fresh"
+        fetch = lambda: self._fetch_products(url, params)
+        results = self.single_flight.do(key, fetch) if self.single_flight is not None else fetch()
+        if isinstance(results, dict):
+            return results
+        if not results:
+            return "empty"
+        self.cache.set(key, results)
+        return "loaded"
+
+    def _build_search(self, query, offset=0, limit=10, site_id=None):
+        """Monta URL, parâmetros e chave de cache da busca (site padrão: DEFAULT_SITE_ID)."""
         # Endpoint específico solicitado no desafio
         url = f"{self.API_BASE_URL}/products/search"
-        
+
         # Parâmetros mínimos exigidos
         params = {
             'status': 'active',
-            'site_id': 'MLB',
+            'site_id': site_id or self.DEFAULT_SITE_ID,
             'q': query,
-            'limit': 10
+            'limit': limit
         }
+        if offset:
+            params['offset'] = offset
+
+        key = SearchCache.make_key(params['site_id'], query, params['limit'], params['status'], offset)
+        return url, params, key
+
+    def _page_plan(self, offset, total, page_size):
+        """Divide a janela [offset, offset + total) em chamadas de até page_size itens."""
+        return [(start, min(page_size, offset + total - start)) for start in range(offset, offset + total, page_size)]
+
+    def iter_pages(self, query="notebook", offset=0, total=10, page_size=None, max_workers=None):
+        """
+        Busca paginada com fan-out: todas as páginas da janela são disparadas em
+        paralelo (pool limitado) e entregues em ordem assim que chegam, já sem
+        produtos repetidos (por id). Cada página mantém a ordenação imagem-primeiro.
+
+        Um erro na primeira página é entregue como dict (ex.: auth_expired);
+        erros nas páginas seguintes encerram a iteração com resultado parcial.
+        """
+        page_size = page_size or self.PAGE_SIZE
+        plan = self._page_plan(offset, total, page_size)
+        workers = max(1, min(max_workers or self.FANOUT_WORKERS, len(plan)))
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ml-fanout")
+        # Cada tarefa roda numa cópia do contexto atual (trace id e prazo da requisição)
+        futures = [executor.submit(contextvars.copy_context().run, self.search_products, query, start, size)
+                   for start, size in plan]
+        seen = set()
+        try:
+            for index, future in enumerate(futures):
+                results = future.result()
+                if not isinstance(results, list):
+                    if index == 0:
+                        yield results
+                    else:
+                        logger.warning(f"Página {index + 1} de '{query}' falhou; resultado parcial.")
+                    return
+
+                page = []
+                for product in results:
+                    if product['id'] not in seen:
+                        seen.add(product['id'])
+                        page.append(product)
+                yield page
+        finally:
+            # Cliente desconectou ou erro: não espera as páginas restantes
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def search_all(self, query="notebook", offset=0, total=10, page_size=None):
+        """Versão não-streaming de iter_pages: lista única, imagem-primeiro no conjunto todo."""
+        merged = []
+        for page in self.iter_pages(query, offset, total, page_size):
+            if not isinstance(page, list):
+                return page
+            merged.extend(page)
+        # sort estável: dentro de cada grupo mantém a ordem de relevância do ML
+        merged.sort(key=lambda x: x['has_image'], reverse=True)
+        return merged
 
+    def _fetch_products(self, url, params):
+        """Executa a chamada ao upstream e devolve a lista normalizada (ou um dict de erro)."""
         try:
-            logger.info(f"Buscando no catálogo: {query}")
-            response = requests.get(url, params=params, headers=self.headers, timeout=10)
-            
-            if response.status_code == 401:
-                logger.error("Token expirado ou inválido (401)")
-                return {"error": "auth_expired"}
-                
-            response.raise_for_status()
-            data = response.json()
-            
-            # O endpoint /products/search pode retornar 'results' ou 'products' dependendo da versão
-            results = data.get('results', [])
-            
-            normalized = self._normalize_results(results)
-            
-            # Requisito 4: Ordenação (Produtos com imagem primeiro)
-            normalized.sort(key=lambda x: x['has_image'], reverse=True)
-            
-            return normalized
-            
-        except requests.exceptions.HTTPError as e:
-            logger.error(f"Erro HTTP na API ML: {e}")
+            logger.info(f"Buscando no catálogo: {params['q']}")
+            return self._parse_search_response(self._search_get(url, params))
+        except UpstreamUnavailable as e:
+            return self._unavailable_error(e)
+        except Exception as e:
+            logger.error(f"Erro inesperado na busca: {str(e)}")
+            SEARCH_ERRORS.inc("exception")
+            return {"error": "connection_error", "message": "Não foi possível falar com o Mercado Livre."}
+
+    def _search_get(self, url, params):
+        """GET do /products/search; com hedger, uma cópia é disparada se a resposta demorar."""
+        # READ_TIMEOUT é o teto: com prazo na requisição, o HttpClient usa o que resta dele
+        get = lambda: self.http.get(url, params=params, headers=self.headers, read_timeout=self.READ_TIMEOUT)
+        if self.hedger is None:
+            return get()
+        return self.hedger.call(get)
+
+    def _unavailable_error(self, error):
+        """Erro de busca para uma chamada recusada pelo circuit breaker ou pelo limitador."""
+        SEARCH_ERRORS.inc(error.reason)
+        if error.reason == "deadline":
+            message = "O Mercado Livre demorou demais para responder."
+        else:
+            message = "O Mercado Livre está instável no momento."
+        if error.retry_after:
+            message += f" Tente novamente em {math.ceil(error.retry_after)} s."
+        return {"error": "upstream_unavailable", "reason": error.reason, "retry_after": error.retry_after,
+                "message": message}
+
+    def stream_products(self, query="notebook", offset=0, limit=10, meta=None):
+        """
+        Modo streaming: lê o corpo de /products/search incrementalmente e gera os
+        produtos normalizados um a um, com memória limitada a um item (útil para
+        páginas grandes e jobs em lote). Mantém a ordem da API (sem imagem-primeiro)
+        e não passa pelo cache. Um erro HTTP é entregue como um único dict
+        (ex.: auth_expired); as demais chaves do corpo (ex.: paging) vão para `meta`.
+        """
+        if not self.access_token:
+            logger.warning("Tentativa de busca sem access_token.")
+            return
+
+        url, params, _ = self._build_search(query, offset, limit)
+        logger.info(f"Buscando no catálogo (streaming): {query}")
+        try:
+            response = self.http.get(url, params=params, headers=self.headers, read_timeout=self.READ_TIMEOUT,
+                                     stream=True)
+        except UpstreamUnavailable as e:
+            yield self._unavailable_error(e)
+            return
+        except Exception as e:
+            logger.error(f"Erro inesperado na busca: {str(e)}")
+            SEARCH_ERRORS.inc("exception")
+            return
+
+        with response:
+            if response.status_code >= 400:
+                yield self._parse_search_response(response)
+                return
+            try:
+                for item in iter_json_array(response.iter_content(chunk_size=self.STREAM_CHUNK_SIZE), "results", meta):
+                    yield normalize_batch((item,))[0]
+            except Exception as e:
+                logger.error(f"Busca em streaming interrompida: {str(e)}")
+                SEARCH_ERRORS.inc("stream_interrupted")
+                raise
+
+    def fetch_batch(self, query="notebook", offset=0, limit=50, etag=None):
+        """
+        Uma página de /products/search em formato colunar, para jobs em lote:
+        mantém a ordem da API, não passa pelo cache nem materializa dicts.
+        Com `etag`, a página é pedida com If-None-Match; se o ML responder 304,
+        volta SearchPage(None, None, etag). Erros voltam como dict.
+        """
+        url, params, _ = self._build_search(query, offset, limit)
+        headers = dict(self.headers, **{'If-None-Match': etag}) if etag else self.headers
+        try:
+            response = self.http.get(url, params=params, headers=headers, read_timeout=self.READ_TIMEOUT)
+        except UpstreamUnavailable as e:
+            return self._unavailable_error(e)
+        except Exception as e:
+            logger.error(f"Erro inesperado na busca: {str(e)}")
+            SEARCH_ERRORS.inc("exception")
+            return {"error": "connection_error", "message": str(e)}
+
+        if response.status_code == 304:
+            return SearchPage(None, None, etag)
+        if response.status_code >= 400:
+            return self._parse_search_response(response)
+        data = response.json()
+        with PROCESSING_SECONDS.time("normalize"):
+            batch = normalize_batch(data.get('results', []))
+        return SearchPage(batch, (data.get('paging') or {}).get('total'), response.headers.get('ETag'))
+
+    def _parse_search_response(self, response):
+        """Interpreta a resposta de /products/search (requests ou httpx)."""
+        if response.status_code == 401:
+            logger.error("Token expirado ou inválido (401)")
+            SEARCH_ERRORS.inc("auth_expired")
+            return {"error": "auth_expired"}
+
+        if response.status_code >= 400:
+            logger.error(f"Erro HTTP na API ML: {response.status_code}")
+            SEARCH_ERRORS.inc("api_error")
             try:
                 error_detail = response.json().get('message') or response.json().get('error')
             except:
                 error_detail = response.text
             return {"error": "api_error", "message": f"Erro na API ({response.status_code}): {error_detail}"}
-        except Exception as e:
-            logger.error(f"Erro inesperado na busca: {str(e)}")
-            return []
+
+        observe = PROCESSING_SECONDS.observe
+        start = time.perf_counter()
+        data = response.json()
+
+        # O endpoint /products/search pode retornar 'results' ou 'products' dependendo da versão
+        results = data.get('results', [])
+        parsed = time.perf_counter()
+        observe(parsed - start, "parse")
+
+        batch = normalize_batch(results)
+        normalized = time.perf_counter()
+        observe(normalized - parsed, "normalize")
+
+        if self.image_validator is not None:
+            # has_image passa a refletir as thumbnails já conferidas (só o cache; as novas vão para o segundo plano)
+            self.image_validator.apply(batch)
+            validated = time.perf_counter()
+            observe(validated - normalized, "images")
+            normalized = validated
+
+        # Requisito 4: Ordenação (Produtos com imagem primeiro)
+        order = batch.image_first_order()
+        sorted_at = time.perf_counter()
+        observe(sorted_at - normalized, "sort")
+
+        products = batch.to_records(order)
+        observe(time.perf_counter() - sorted_at, "materialize")
+        return products
 
     def _normalize_results(self, results):
         """Normaliza os dados seguindo os requisitos do desafio."""
-        normalized = []
-        for item in results:
-            # Captura atributos (exige pelo menos 3)
-            raw_attributes = item.get('attributes', [])
-            attrs_dict = {attr.get('id'): attr.get('value_name') for attr in raw_attributes if attr.get('value_name')}
-            
-            # Atributos específicos solicitados no desafio ou relevantes
-            display_attrs = []
-            
-            # Tenta pegar Marca, Cor e um terceiro (Capacidade ou Modelo)
-            brand = attrs_dict.get('BRAND', attrs_dict.get('MARCA', 'Não informado'))
-            color = attrs_dict.get('COLOR', attrs_dict.get('COR', 'Não informado'))
-            
-            # Terceiro atributo dinâmico (Capacidade, Modelo ou o primeiro disponível que não seja marca/cor)
-            model = attrs_dict.get('MODEL', attrs_dict.get('MODELO'))
-            capacity = attrs_dict.get('CAPACITY', attrs_dict.get('CAPACIDADE'))
-            third_attr = capacity or model or "Não informado"
-            
-            # Se ainda faltar, pega qualquer outro disponível
-            if third_attr == "Não informado":
-                for k, v in attrs_dict.items():
-                    if k not in ['BRAND', 'MARCA', 'COLOR', 'COR'] and v:
-                        third_attr = v
-                        break
-
-            # Imagem e Placeholder
-            thumbnail = item.get('thumbnail', '')
-            
-            # Se não tiver thumbnail, tenta pegar da lista 'pictures'
-            if not thumbnail and 'pictures' in item and len(item['pictures']) > 0:
-                thumbnail = item['pictures'][0].get('url', '')
-
-            # Força HTTPS para evitar Mixed Content Block
-            if thumbnail and thumbnail.startswith('http://'):
-                thumbnail = thumbnail.replace('http://', 'https://')
-                
-            has_image = bool(thumbnail and "placeholder" not in thumbnail.lower())
-            
-            # Melhorar qualidade da imagem se possível
-            if has_image and thumbnail.endswith('-I.jpg'):
-                thumbnail = thumbnail.replace('-I.jpg', '-V.jpg')
-            elif has_image and '-I.png' in thumbnail: # Suporte a PNG
-                thumbnail = thumbnail.replace('-I.png', '-V.png')
-
-            # Tratamento de Preço (API de Catálogo é diferente)
-            price = item.get('price')
-            if not price:
-                # Tenta pegar do buy_box_winner ou price_range que é comum no catalogo
-                buy_box = item.get('buy_box_winner', {})
-                price = buy_box.get('price')
-                
-            if not price:
-                 # Fallback para range de preço se não tiver preço fixo
-                 price_range = item.get('price_range', {})
-                 price = price_range.get('min_price', 0)
-
-            # Tratamento de Link (Permalink)
-            permalink = item.get('permalink')
-            if not permalink:
-                # Constrói o link manualmente se não vier
-                permalink = f"https://www.mercadolivre.com.br/p/{item.get('id')}"
-
-            normalized.append({
-                'id': item.get('id'),
-                'title': item.get('name', item.get('title', 'Sem título')), 
-                'status': 'Ativo' if item.get('status') == 'active' else item.get('status', 'Inativo'),
-                'price': price or 0,
-                'thumbnail': thumbnail if has_image else "https://via.placeholder.com/300x300?text=Sem+Imagem",
-                'has_image': has_image,
-                'permalink': permalink,
-                'brand': brand,
-                'color': color,
-                'additional_attr': third_attr,
-                'attributes': [
-                    {'label': 'Marca', 'value': brand},
-                    {'label': 'Cor', 'value': color},
-                    {'label': 'Capacidade/Modelo', 'value': third_attr}
-                ]
-            })
-        return normalized
+        with PROCESSING_SECONDS.time("normalize"):
+            return normalize_batch(results).to_records()
 
     def filter_by_brand(self, products, brand_query):
         if not brand_query:
             return products
         return [p for p in products if brand_query.lower() in p['brand'].lower()]
+
+
+class AsyncMercadoLivreService(MercadoLivreService):
+    """
+    Variante assíncrona (httpx) do serviço de busca, usada pelo modo ASGI.
+    Reaproveita a montagem da busca, a normalização e o cache do serviço síncrono.
+    Espera um AsyncHttpClient em http_client e um AsyncSingleFlight em single_flight.
+    """
+
+    async def search_products(self, query="notebook", offset=0, limit=10, site_id=None):
+        if not self.access_token:
+            logger.warning("Tentativa de busca sem access_token.")
+            return []
+
+        url, params, key = self._build_search(query, offset, limit, site_id)
+        loader = lambda: self._fetch_products_async(url, params)
+
+        if self.single_flight is not None:
+            fetch = loader
+            loader = lambda: self.single_flight.do(key, fetch)
+
+        if self.cache is None:
+            return await loader()
+        return await self.cache.get_or_load_async(key, loader)
+
+    async def _fetch_products_async(self, url, params):
+        try:
+            logger.info(f"Buscando no catálogo: {params['q']}")
+            response = await self.http.get(url, params=params, headers=self.headers, read_timeout=self.READ_TIMEOUT)
+            return self._parse_search_response(response)
+        except UpstreamUnavailable as e:
+            return self._unavailable_error(e)
+        except Exception as e:
+            logger.error(f"Erro inesperado na busca: {str(e)}")
+            SEARCH_ERRORS.inc("exception")
+            return {"error": "connection_error", "message": "Não foi possível falar com o Mercado Livre."}
+
+    async def search_all(self, query="notebook", offset=0, total=10, page_size=None):
+        """Fan-out assíncrono: páginas em paralelo (limitado por FANOUT_WORKERS), sem duplicatas."""
+        page_size = page_size or self.PAGE_SIZE
+        semaphore = asyncio.Semaphore(self.FANOUT_WORKERS)
+
+        async def fetch(start, size):
+            async with semaphore:
+                return await self.search_products(query, start, size)
+
+        pages = await asyncio.gather(*(fetch(start, size) for start, size in self._page_plan(offset, total, page_size)))
+        merged = []
+        seen = set()
+        for index, page in enumerate(pages):
+            if not isinstance(page, list):
+                if index == 0:
+                    return page
+                logger.warning(f"Página {index + 1} de '{query}' falhou; resultado parcial.")
+                break
+            for product in page:
+                if product['id'] not in seen:
+                    seen.add(product['id'])
+                    merged.append(product)
+        merged.sort(key=lambda x: x['has_image'], reverse=True)
+        return merged
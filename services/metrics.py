@@ -0,0 +1,221 @@
+import os
+import re
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Buckets em segundos (de 1 ms a 10 s): cobre normalização/render e chamadas ao ML
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """Contador monotônico por combinação de labels (valores posicionais, na ordem de labelnames)."""
+
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def expose(self):
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}_total{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Gauge:
+    """Valor instantâneo por combinação de labels (ex.: estado de um circuit breaker)."""
+
+    type = "gauge"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def expose(self):
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    """
+    Histograma com buckets fixos. observe() custa uma busca binária e um
+    incremento sob lock; os buckets cumulativos só são montados na exposição.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [contagem por bucket..., +Inf, soma]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def count(self, *labels):
+        series = self._series.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def expose(self):
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', bound))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+
+
+class MetricsRegistry:
+    """
+    Métricas do processo. Contadores e histogramas são atualizados no caminho
+    quente; estatísticas que já existem (cache, tokens, single-flight) são lidas
+    só no momento da exposição, por coletores registrados.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = {}  # prefix -> (stats, help, counters)
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Métrica {name} já registrada com outro tipo ou labels")
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._get_or_create(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+    def register_stats(self, prefix, stats, help, counters=()):
+        """
+        Expõe um dict de stats() como métricas: chaves em `counters` viram
+        <prefix>_<chave>_total (counter), as demais <prefix>_<chave> (gauge).
+        Registrar de novo o mesmo prefixo substitui o coletor anterior.
+        """
+        self._collectors[prefix] = (stats, help, frozenset(counters))
+
+    def expose(self):
+        """Texto no formato de exposição do Prometheus (0.0.4)."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.expose())
+        for prefix, (stats, help, counters) in list(self._collectors.items()):
+            try:
+                values = stats()
+            except Exception as e:
+                logging.getLogger(__name__).warning(f"Coletor de métricas {prefix} falhou: {e}")
+                continue
+            for key, value in values.items():
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    continue
+                kind = "counter" if key in counters else "gauge"
+                name = f"{prefix}_{key}"
+                lines.append(f"# HELP {name} {help} ({key})")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name}{'_total' if kind == 'counter' else ''} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Registro padrão do processo (cada worker do gunicorn expõe o seu)
+REGISTRY = MetricsRegistry()
+
+
+_trace_id = contextvars.ContextVar("trace_id", default="-")
+_VALID_TRACE_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+def new_trace_id(incoming=None):
+    """Define o trace id da requisição atual (reaproveita X-Request-ID válido) e o devolve."""
+    trace_id = incoming if incoming and _VALID_TRACE_ID.match(incoming) else os.urandom(8).hex()
+    _trace_id.set(trace_id)
+    return trace_id
+
+
+def current_trace_id():
+    return _trace_id.get()
+
+
+def install_log_trace_ids():
+    """
+    Inclui `trace_id` em todo LogRecord (use %(trace_id)s no formato do log).
+    Feito pela fábrica de records, vale para qualquer logger e handler.
+    """
+    factory = logging.getLogRecordFactory()
+    if getattr(factory, "_with_trace_id", False):
+        return
+
+    def record_factory(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        record.trace_id = _trace_id.get()
+        return record
+
+    record_factory._with_trace_id = True
+    logging.setLogRecordFactory(record_factory)
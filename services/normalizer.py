@@ -0,0 +1,265 @@
+import sys
+from functools import lru_cache
+from collections.abc import Mapping
+
+NAO_INFORMADO = "Não informado"
+
+# Tabela pré-computada: id do atributo -> posição no vetor de valores do item.
+# Pares (preferido, alternativo): BRAND/MARCA, COLOR/COR, CAPACITY/CAPACIDADE, MODEL/MODELO.
+ATTRIBUTE_SLOTS = {
+    'BRAND': 0, 'MARCA': 1,
+    'COLOR': 2, 'COR': 3,
+    'CAPACITY': 4, 'CAPACIDADE': 5,
+    'MODEL': 6, 'MODELO': 7,
+}
+# Atributos que não servem de fallback para o terceiro atributo
+_BRAND_COLOR_SLOTS = 4
+_UNSET = object()
+
+# Rótulos dos atributos exibidos no card (compartilhados por todos os produtos)
+LABEL_BRAND = "Marca"
+LABEL_COLOR = "Cor"
+LABEL_THIRD = "Capacidade/Modelo"
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+@lru_cache(maxsize=8192)
+def shared_attributes(brand, color, third_attr):
+    """Lista `attributes` de uma combinação marca/cor/terceiro atributo, única por processo (somente leitura)."""
+    return [
+        {'label': LABEL_BRAND, 'value': brand},
+        {'label': LABEL_COLOR, 'value': color},
+        {'label': LABEL_THIRD, 'value': third_attr},
+    ]
+
+
+class Product(Mapping):
+    """
+    Produto normalizado compacto: um objeto com __slots__ no lugar de um dict de
+    11 chaves. Marca, cor e terceiro atributo são internados e `attributes` vem
+    de shared_attributes, então produtos iguais nesses campos não duplicam nada.
+    Continua se comportando como o dict antigo para leitura (product['id'],
+    .get, igualdade com dicts) e vira dict com to_dict() (JSON).
+    """
+
+    __slots__ = ('id', 'title', 'status', 'price', 'thumbnail', 'has_image', 'permalink',
+                 'brand', 'color', 'additional_attr')
+    FIELDS = __slots__ + ('attributes',)
+    _FIELD_SET = frozenset(FIELDS)
+
+    def __init__(self, id, title, status, price, thumbnail, has_image, permalink, brand, color, additional_attr):
+        self.id = id
+        self.title = title
+        self.status = status
+        self.price = price
+        self.thumbnail = thumbnail
+        self.has_image = has_image
+        self.permalink = permalink
+        self.brand = _intern(brand)
+        self.color = _intern(color)
+        self.additional_attr = _intern(additional_attr)
+
+    @property
+    def attributes(self):
+        return shared_attributes(self.brand, self.color, self.additional_attr)
+
+    def __getitem__(self, key):
+        if key not in self._FIELD_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def __getstate__(self):
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def __setstate__(self, state):
+        for field, value in zip(self.__slots__, state):
+            setattr(self, field, value)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __repr__(self):
+        return f"Product({self.to_dict()!r})"
+
+
+def json_default(value):
+    """Para json.dumps(default=...): Products viram o dict equivalente."""
+    if isinstance(value, Product):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class NormalizedBatch:
+    """
+    Página de produtos normalizada em formato colunar (listas paralelas por campo).
+    Os produtos usados pelo template só são montados sob demanda (product/to_records).
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.titles = []
+        self.statuses = []
+        self.prices = []
+        self.thumbnails = []
+        self.has_image = []
+        self.permalinks = []
+        self.brands = []
+        self.colors = []
+        self.third_attrs = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def product(self, i):
+        """Materializa o produto i como Product (o registro compacto lido pelo index.html)."""
+        return Product(self.ids[i], self.titles[i], self.statuses[i], self.prices[i], self.thumbnails[i],
+                       self.has_image[i], self.permalinks[i], self.brands[i], self.colors[i], self.third_attrs[i])
+
+    __getitem__ = product
+
+    def __iter__(self):
+        for i in range(len(self.ids)):
+            yield self.product(i)
+
+    def image_first_order(self):
+        """Índices com imagem primeiro, mantendo a ordem original em cada grupo (sort estável)."""
+        has_image = self.has_image
+        with_image = [i for i in range(len(has_image)) if has_image[i]]
+        without_image = [i for i in range(len(has_image)) if not has_image[i]]
+        return with_image + without_image
+
+    def _rows(self, order=None):
+        rows = zip(self.ids, self.titles, self.statuses, self.prices, self.thumbnails, self.has_image,
+                   self.permalinks, self.brands, self.colors, self.third_attrs)
+        if order is not None:
+            rows = list(rows)
+            rows = [rows[i] for i in order]
+        return rows
+
+    def to_records(self, order=None):
+        """Todos os produtos como Product (opcionalmente na ordem de índices informada)."""
+        return [Product(*row) for row in self._rows(order)]
+
+    def to_dicts(self, order=None):
+        """
+        Materializa todos os produtos como dicts (formato antigo), opcionalmente
+        na ordem de índices informada.
+
+        Produtos com a mesma combinação marca/cor/terceiro atributo compartilham a
+        mesma lista `attributes` (somente leitura), o que corta a maior parte das
+        alocações em páginas grandes.
+        """
+        products = []
+        append = products.append
+        for item_id, title, status, price, thumbnail, has_image, permalink, brand, color, third_attr in self._rows(order):
+            append({
+                'id': item_id,
+                'title': title,
+                'status': status,
+                'price': price,
+                'thumbnail': thumbnail,
+                'has_image': has_image,
+                'permalink': permalink,
+                'brand': brand,
+                'color': color,
+                'additional_attr': third_attr,
+                'attributes': shared_attributes(brand, color, third_attr)
+            })
+        return products
+
+
+def normalize_batch(results):
+    """
+    Normaliza uma página inteira de /products/search em uma passada, gerando colunas.
+
+    Mesmas regras de MercadoLivreService._normalize_results: marca, cor e um terceiro
+    atributo (capacidade, modelo ou o primeiro outro disponível), thumbnail em HTTPS
+    com a variante -V (None sem imagem: o template escolhe o placeholder), preço com
+    fallback para buy_box_winner/price_range e permalink.
+    """
+    batch = NormalizedBatch()
+    ids_append = batch.ids.append
+    titles_append = batch.titles.append
+    statuses_append = batch.statuses.append
+    prices_append = batch.prices.append
+    thumbnails_append = batch.thumbnails.append
+    has_image_append = batch.has_image.append
+    permalinks_append = batch.permalinks.append
+    brands_append = batch.brands.append
+    colors_append = batch.colors.append
+    third_append = batch.third_attrs.append
+    slots = ATTRIBUTE_SLOTS
+
+    for item in results:
+        get = item.get
+        values = [None] * 8
+        fallback_key = _UNSET
+        fallback_value = None
+
+        for attr in get('attributes') or ():
+            value = attr.get('value_name')
+            if not value:
+                continue
+            attr_id = attr.get('id')
+            slot = slots.get(attr_id)
+            if slot is not None:
+                values[slot] = value
+            # Fallback = primeiro atributo (na ordem da API) fora de marca/cor, com o último valor visto
+            if slot is None or slot >= _BRAND_COLOR_SLOTS:
+                if fallback_key is _UNSET:
+                    fallback_key = attr_id
+                    fallback_value = value
+                elif attr_id == fallback_key:
+                    fallback_value = value
+
+        brand = values[0] or values[1] or NAO_INFORMADO
+        color = values[2] or values[3] or NAO_INFORMADO
+        third_attr = values[4] or values[5] or values[6] or values[7] or NAO_INFORMADO
+        if third_attr == NAO_INFORMADO and fallback_key is not _UNSET:
+            third_attr = fallback_value
+
+        thumbnail = get('thumbnail', '')
+        if not thumbnail:
+            pictures = get('pictures')
+            if pictures:
+                thumbnail = pictures[0].get('url', '')
+        if thumbnail and thumbnail.startswith('http://'):
+            thumbnail = thumbnail.replace('http://', 'https://')
+        has_image = bool(thumbnail and "placeholder" not in thumbnail.lower())
+        if has_image:
+            if thumbnail.endswith('-I.jpg'):
+                thumbnail = thumbnail.replace('-I.jpg', '-V.jpg')
+            elif '-I.png' in thumbnail:
+                thumbnail = thumbnail.replace('-I.png', '-V.png')
+        else:
+            thumbnail = None
+
+        price = get('price')
+        if not price:
+            price = (get('buy_box_winner') or {}).get('price')
+        if not price:
+            price = (get('price_range') or {}).get('min_price', 0)
+
+        item_id = get('id')
+        status = get('status')
+        ids_append(item_id)
+        titles_append(get('name', get('title', 'Sem título')))
+        statuses_append('Ativo' if status == 'active' else get('status', 'Inativo'))
+        prices_append(price or 0)
+        thumbnails_append(thumbnail)
+        has_image_append(has_image)
+        permalinks_append(get('permalink') or f"https://www.mercadolivre.com.br/p/{item_id}")
+        brands_append(brand)
+        colors_append(color)
+        third_append(third_attr)
+
+    return batch
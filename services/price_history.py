@@ -0,0 +1,625 @@
+"""
+Histórico de preços dos produtos vistos: série temporal local e compacta.
+
+Cada busca entrega pontos (id do produto, instante, preço, status). Eles ficam
+num buffer do worker e viram segmentos imutáveis no diretório do histórico,
+compartilhado pelos workers: nada é reescrito no lugar, só acrescentado.
+Observações repetidas (mesmo preço e status visto há menos de min_interval
+segundos) não geram ponto novo.
+
+Segmento = MAGIC, cabeçalho <I pontos> <I produtos> <q menor instante>
+<q maior instante> e um corpo comprimido com zlib, com os pontos ordenados por
+(produto, instante) em colunas de varints:
+
+    ids (tamanho + UTF-8, ordenados) | pontos por produto | instantes (delta a
+    partir do menor instante do segmento, depois delta do ponto anterior do
+    produto) | preços em centavos (zigzag do delta do ponto anterior do produto)
+    | status (dicionário + um byte por ponto)
+
+O nome do arquivo traz o intervalo de sequências que ele cobre
+(ts-<primeira>-<última>.seg). A compactação funde segmentos de tamanho parecido
+(como numa LSM, cada ponto é reescrito poucas vezes) e descarta pontos mais
+velhos que a retenção; o segmento fundido é gravado antes de os originais
+serem apagados, e um segmento coberto por outro é ignorado na leitura (e
+apagado na compactação seguinte), então uma queda no meio da compactação não
+duplica pontos.
+"""
+import os
+import time
+import zlib
+import bisect
+import struct
+import atexit
+import sqlite3
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows: compactação coordenada só entre as threads do worker
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"MLTS1\n"
+_HEADER = struct.Struct("<IIqq")
+_SUFFIX = ".seg"
+
+
+def _put_varints(out, values):
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+
+
+def _get_varints(data, pos, count):
+    values = []
+    append = values.append
+    for _ in range(count):
+        byte = data[pos]
+        pos += 1
+        value = byte & 0x7F
+        shift = 7
+        while byte & 0x80:
+            byte = data[pos]
+            pos += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+        append(value)
+    return values, pos
+
+
+def _zigzag(value):
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def _put_strings(out, strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    _put_varints(out, [len(data) for data in encoded])
+    for data in encoded:
+        out += data
+
+
+def _get_strings(data, pos, count):
+    lengths, pos = _get_varints(data, pos, count)
+    strings = []
+    for length in lengths:
+        strings.append(bytes(data[pos:pos + length]).decode("utf-8"))
+        pos += length
+    return strings, pos
+
+
+def encode_segment(ids, timestamps, cents, statuses):
+    """Bytes de um segmento com os pontos dados (colunas paralelas, em qualquer ordem)."""
+    order = sorted(range(len(ids)), key=lambda i: (ids[i], timestamps[i]))
+    distinct, counts = [], []
+    for i in order:
+        if distinct and distinct[-1] == ids[i]:
+            counts[-1] += 1
+        else:
+            distinct.append(ids[i])
+            counts.append(1)
+    min_ts = min(timestamps) if order else 0
+    max_ts = max(timestamps) if order else 0
+
+    time_deltas, price_deltas = [], []
+    status_codes = {}
+    codes = bytearray()
+    previous_id = None
+    for i in order:
+        if ids[i] != previous_id:
+            previous_id, previous_ts, previous_cents = ids[i], min_ts, 0
+        time_deltas.append(timestamps[i] - previous_ts)
+        price_deltas.append(_zigzag(cents[i] - previous_cents))
+        previous_ts, previous_cents = timestamps[i], cents[i]
+        codes.append(status_codes.setdefault(statuses[i], len(status_codes)))
+
+    body = bytearray()
+    _put_strings(body, distinct)
+    _put_varints(body, counts)
+    _put_varints(body, time_deltas)
+    _put_varints(body, price_deltas)
+    _put_varints(body, [len(status_codes)])
+    _put_strings(body, list(status_codes))
+    body += codes
+    return MAGIC + _HEADER.pack(len(order), len(distinct), min_ts, max_ts) + zlib.compress(bytes(body), 6)
+
+
+def read_header(data):
+    """(pontos, produtos, menor instante, maior instante) do segmento."""
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("não é um segmento do histórico de preços")
+    return _HEADER.unpack_from(data, len(MAGIC))
+
+
+class Segment:
+    """
+    Segmento decodificado: colunas em arrays, fatiadas por produto
+    (offsets[i]:offsets[i + 1] são os pontos de ids[i], em ordem de instante).
+    """
+
+    def __init__(self, data):
+        points, products, self.min_ts, self.max_ts = read_header(data)
+        body = memoryview(zlib.decompress(data[len(MAGIC) + _HEADER.size:]))
+        self.ids, pos = _get_strings(body, 0, products)
+        counts, pos = _get_varints(body, pos, products)
+        time_deltas, pos = _get_varints(body, pos, points)
+        price_deltas, pos = _get_varints(body, pos, points)
+        (status_count,), pos = _get_varints(body, pos, 1)
+        self.status_names, pos = _get_strings(body, pos, status_count)
+        self.status_codes = bytes(body[pos:pos + points])
+
+        self.offsets = array("I", [0])
+        self.timestamps = array("q", bytes(8 * points))
+        self.cents = array("q", bytes(8 * points))
+        j = 0
+        for count in counts:
+            ts, price = self.min_ts, 0
+            for _ in range(count):
+                ts += time_deltas[j]
+                price += _unzigzag(price_deltas[j])
+                self.timestamps[j] = ts
+                self.cents[j] = price
+                j += 1
+            self.offsets.append(j)
+        self._summary = None
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def find(self, product_id):
+        """(início, fim) dos pontos do produto, ou None."""
+        i = bisect.bisect_left(self.ids, product_id)
+        if i < len(self.ids) and self.ids[i] == product_id:
+            return self.offsets[i], self.offsets[i + 1]
+        return None
+
+    def points(self, start, end, since=None, until=None):
+        names, codes, timestamps, cents = self.status_names, self.status_codes, self.timestamps, self.cents
+        if since is not None:
+            start = bisect.bisect_left(timestamps, since, start, end)
+        if until is not None:
+            end = bisect.bisect_right(timestamps, until, start, end)
+        return [(timestamps[j], cents[j], names[codes[j]]) for j in range(start, end)]
+
+    def summary(self):
+        """{id: (menor preço, maior preço, instante do último ponto, último preço)}, calculado uma vez."""
+        if self._summary is None:
+            summary = {}
+            offsets, timestamps, cents = self.offsets, self.timestamps, self.cents
+            for i, product_id in enumerate(self.ids):
+                prices = cents[offsets[i]:offsets[i + 1]]
+                last = offsets[i + 1] - 1
+                summary[product_id] = (min(prices), max(prices), timestamps[last], cents[last])
+            self._summary = summary
+        return self._summary
+
+    def window_summary(self, since, until):
+        """Como summary(), mas só com os pontos em [since, until]: (id, menor, maior, instante do último, último)."""
+        offsets, timestamps, cents = self.offsets, self.timestamps, self.cents
+        left, right = bisect.bisect_left, bisect.bisect_right
+        for i, product_id in enumerate(self.ids):
+            start, end = offsets[i], offsets[i + 1]
+            if since > self.min_ts:
+                start = left(timestamps, since, start, end)
+            if until < self.max_ts:
+                end = right(timestamps, until, start, end)
+            if start < end:
+                prices = cents[start:end]
+                yield product_id, min(prices), max(prices), timestamps[end - 1], cents[end - 1]
+
+    def columns(self):
+        """Colunas paralelas (ids, instantes, centavos, status) de todos os pontos, para a compactação."""
+        ids = []
+        for i, product_id in enumerate(self.ids):
+            ids.extend([product_id] * (self.offsets[i + 1] - self.offsets[i]))
+        statuses = [self.status_names[code] for code in self.status_codes]
+        return ids, self.timestamps.tolist(), self.cents.tolist(), statuses
+
+
+def _segment_range(name):
+    # ts-<primeira>-<última>.seg
+    first, last = name[3:-len(_SUFFIX)].split("-")
+    return int(first), int(last)
+
+
+class PriceHistory:
+    """
+    Histórico de preços num diretório de segmentos, com buffer por worker.
+
+    record() é chamado a cada busca; o buffer vira segmento quando passa de
+    segment_points pontos ou de flush_interval segundos (numa thread, fora da
+    requisição), e em close()/saída do processo. As consultas juntam os
+    segmentos (com cache dos decodificados) e o buffer deste worker.
+    """
+
+    # Um segmento é fundido ao anterior quando este tem menos de MERGE_FACTOR vezes o seu tamanho
+    MERGE_FACTOR = 4
+
+    def __init__(self, directory, segment_points=65536, flush_interval=60, min_interval=3600,
+                 retention=90 * 86400, max_tracked=200000, cache_segments=16):
+        self.directory = directory
+        self.segment_points = segment_points
+        self.flush_interval = flush_interval
+        self.min_interval = min_interval
+        self.retention = retention
+        self.max_tracked = max_tracked
+        self.cache_segments = cache_segments
+        os.makedirs(directory, exist_ok=True)
+        self.recorded = 0
+        self.skipped = 0
+        self.flushes = 0
+        self.merges = 0
+        self.points_written = 0
+        self.bytes_written = 0
+        self._buffer = ([], [], [], [])
+        self._buffer_started = None
+        self._last = OrderedDict()  # id -> (instante, centavos, status) do último ponto aceito
+        self._cache = OrderedDict()  # nome do segmento -> Segment
+        self._headers = {}  # nome do segmento -> cabeçalho
+        self._flushing = False
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        atexit.register(self.close)
+
+    # -- escrita -----------------------------------------------------------
+
+    def record(self, products, now=None):
+        """Acrescenta um ponto por produto (id, price, status); devolve quantos foram aceitos."""
+        now = int(now if now is not None else time.time())
+        accepted = 0
+        with self._lock:
+            ids, timestamps, cents, statuses = self._buffer
+            last_seen = self._last
+            for product in products:
+                product_id = product.get('id')
+                if not product_id:
+                    continue
+                price = int(round(float(product.get('price') or 0) * 100))
+                status = product.get('status') or ""
+                last = last_seen.get(product_id)
+                if last is not None and last[1] == price and last[2] == status and now - last[0] < self.min_interval:
+                    self.skipped += 1
+                    continue
+                last_seen[product_id] = (now, price, status)
+                last_seen.move_to_end(product_id)
+                ids.append(product_id)
+                timestamps.append(now)
+                cents.append(price)
+                statuses.append(status)
+                accepted += 1
+            while len(last_seen) > self.max_tracked:
+                last_seen.popitem(last=False)
+            self.recorded += accepted
+            if ids and self._buffer_started is None:
+                self._buffer_started = now
+            due = len(ids) >= self.segment_points or (
+                ids and now - self._buffer_started >= self.flush_interval)
+            if due and not self._flushing:
+                self._flushing = True
+                threading.Thread(target=self._background_flush, name="price-history-flush", daemon=True).start()
+        return accepted
+
+    def _background_flush(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Falha ao gravar o histórico de preços: {e}")
+        finally:
+            self._flushing = False
+
+    def flush(self):
+        """Grava o buffer como um segmento novo e compacta; devolve o nome do segmento (ou None)."""
+        with self._lock:
+            columns = self._buffer
+            if not columns[0]:
+                return None
+            self._buffer = ([], [], [], [])
+            self._buffer_started = None
+        data = encode_segment(*columns)
+        with self._write_lock, self._directory_lock():
+            sequence = max((last for _, last in self._ranges()), default=0) + 1
+            name = self._write(sequence, sequence, data)
+            self.flushes += 1
+            self.points_written += len(columns[0])
+            self._compact()
+        return name
+
+    def _write(self, first, last, data):
+        name = f"ts-{first:010d}-{last:010d}{_SUFFIX}"
+        path = os.path.join(self.directory, name)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+        self.bytes_written += len(data)
+        return name
+
+    def _directory_lock(self):
+        return _DirectoryLock(os.path.join(self.directory, ".lock"))
+
+    def compact(self, full=False):
+        """Compacta agora; full=True funde todos os segmentos num só."""
+        with self._write_lock, self._directory_lock():
+            self._compact(full)
+
+    def _compact(self, full=False):
+        names = self._names(cleanup=True)
+        cutoff = int(time.time()) - self.retention
+        # Segmentos só com pontos vencidos saem sem ser lidos
+        for name in [name for name in names if self._header(name)[3] < cutoff]:
+            self._remove(name)
+            names.remove(name)
+        while len(names) > 1:
+            sizes = [self._header(name)[0] for name in names]
+            if full:
+                group = names
+            elif sizes[-2] < self.MERGE_FACTOR * sizes[-1]:
+                # Funde o sufixo de segmentos de tamanho parecido
+                start = len(names) - 2
+                total = sizes[-1] + sizes[-2]
+                while start > 0 and sizes[start - 1] < self.MERGE_FACTOR * total:
+                    start -= 1
+                    total += sizes[start]
+                group = names[start:]
+            else:
+                return
+            self._merge(group, cutoff)
+            names = self._names()
+            if full:
+                return
+
+    def _merge(self, names, cutoff):
+        ids, timestamps, cents, statuses = [], [], [], []
+        for name in names:
+            for target, values in zip((ids, timestamps, cents, statuses), self._segment(name).columns()):
+                target.extend(values)
+        keep = [i for i, ts in enumerate(timestamps) if ts >= cutoff]
+        if len(keep) < len(timestamps):
+            ids, timestamps = [ids[i] for i in keep], [timestamps[i] for i in keep]
+            cents, statuses = [cents[i] for i in keep], [statuses[i] for i in keep]
+        first, last = _segment_range(names[0])[0], _segment_range(names[-1])[1]
+        if ids:
+            self._write(first, last, encode_segment(ids, timestamps, cents, statuses))
+            self.points_written += len(ids)
+        for name in names:
+            self._remove(name)
+        self.merges += 1
+
+    def _remove(self, name):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+        self._cache.pop(name, None)
+        self._headers.pop(name, None)
+
+    # -- leitura -----------------------------------------------------------
+
+    def _ranges(self):
+        return [_segment_range(name) for name in os.listdir(self.directory)
+                if name.startswith("ts-") and name.endswith(_SUFFIX)]
+
+    def _names(self, cleanup=False):
+        """Segmentos válidos em ordem de sequência; os cobertos por um segmento fundido são ignorados."""
+        ranges = sorted(self._ranges(), key=lambda r: (r[0], -r[1]))
+        names, covered_until = [], 0
+        for first, last in ranges:
+            name = f"ts-{first:010d}-{last:010d}{_SUFFIX}"
+            if last <= covered_until:
+                # Sobra de uma compactação interrompida: os pontos já estão no segmento fundido
+                if cleanup:
+                    self._remove(name)
+                continue
+            names.append(name)
+            covered_until = last
+        return names
+
+    def _header(self, name):
+        header = self._headers.get(name)
+        if header is None:
+            with open(os.path.join(self.directory, name), "rb") as f:
+                header = self._headers[name] = read_header(f.read(len(MAGIC) + _HEADER.size))
+        return header
+
+    def _segment(self, name):
+        segment = self._cache.get(name)
+        if segment is None:
+            with open(os.path.join(self.directory, name), "rb") as f:
+                segment = Segment(f.read())
+            self._cache[name] = segment
+            while len(self._cache) > self.cache_segments:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(name)
+        return segment
+
+    def _overlapping(self, since, until):
+        for name in self._names():
+            try:
+                _, _, min_ts, max_ts = self._header(name)
+                if (since is None or max_ts >= since) and (until is None or min_ts <= until):
+                    yield name, min_ts, max_ts, self._segment(name)
+            except FileNotFoundError:
+                continue  # fundido por outro worker durante a leitura
+
+    def _buffered(self, product_id=None):
+        with self._lock:
+            ids, timestamps, cents, statuses = self._buffer
+            return [(ids[i], timestamps[i], cents[i], statuses[i]) for i in range(len(ids))
+                    if product_id is None or ids[i] == product_id]
+
+    def history(self, product_id, since=None, until=None):
+        """Pontos do produto [(instante, preço, status)] em ordem de instante."""
+        points = []
+        for _, _, _, segment in self._overlapping(since, until):
+            span = segment.find(product_id)
+            if span is not None:
+                points.extend(segment.points(*span, since, until))
+        points.extend((ts, price, status) for _, ts, price, status in self._buffered(product_id)
+                      if (since is None or ts >= since) and (until is None or ts <= until))
+        points.sort(key=lambda point: point[0])
+        return [(ts, price / 100, status) for ts, price, status in points]
+
+    def window(self, product_id, seconds, now=None):
+        """Menor, maior e último preço do produto nos últimos `seconds` segundos (None sem pontos)."""
+        now = int(now if now is not None else time.time())
+        points = self.history(product_id, since=now - seconds, until=now)
+        if not points:
+            return None
+        low = min(points, key=lambda point: point[1])
+        high = max(points, key=lambda point: point[1])
+        return {"id": product_id, "points": len(points), "min": low[1], "min_at": low[0],
+                "max": high[1], "max_at": high[0], "last": points[-1][1], "last_at": points[-1][0],
+                "status": points[-1][2]}
+
+    def price_drops(self, seconds, min_drop=0.05, limit=50, now=None):
+        """
+        Produtos cujo último preço está ao menos `min_drop` (fração) abaixo do maior
+        preço dos últimos `seconds` segundos, maiores quedas primeiro.
+        """
+        now = int(now if now is not None else time.time())
+        since = now - seconds
+        merged = {}  # id -> [menor, maior, instante do último, último]
+
+        def merge(product_id, low, high, last_ts, last):
+            entry = merged.get(product_id)
+            if entry is None:
+                merged[product_id] = [low, high, last_ts, last]
+                return
+            entry[0] = min(entry[0], low)
+            entry[1] = max(entry[1], high)
+            if last_ts >= entry[2]:
+                entry[2], entry[3] = last_ts, last
+
+        for _, min_ts, max_ts, segment in self._overlapping(since, now):
+            if min_ts >= since and max_ts <= now:
+                # Segmento inteiro na janela: resumo por produto pronto
+                for product_id, values in segment.summary().items():
+                    merge(product_id, *values)
+                continue
+            for product_id, *values in segment.window_summary(since, now):
+                merge(product_id, *values)
+        for product_id, ts, price, _ in self._buffered():
+            if since <= ts <= now:
+                merge(product_id, price, price, ts, price)
+
+        drops = []
+        for product_id, (low, high, last_ts, last) in merged.items():
+            if high > 0 and (high - last) / high >= min_drop:
+                drops.append({"id": product_id, "max": high / 100, "min": low / 100, "last": last / 100,
+                              "last_at": last_ts, "drop": round((high - last) / high, 4)})
+        drops.sort(key=lambda drop: (-drop["drop"], drop["id"]))
+        return drops[:limit]
+
+    def stats(self):
+        names = self._names()
+        return {
+            "recorded": self.recorded,
+            "skipped": self.skipped,
+            "buffered": len(self._buffer[0]),
+            "segments": len(names),
+            "points": sum(self._header(name)[0] for name in names),
+            "bytes": sum(os.path.getsize(os.path.join(self.directory, name)) for name in names),
+            "flushes": self.flushes,
+            "merges": self.merges,
+            "points_written": self.points_written,
+            "bytes_written": self.bytes_written,
+        }
+
+    def close(self):
+        """Grava o que estiver no buffer (chamado também na saída do processo)."""
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Falha ao gravar o histórico de preços: {e}")
+
+
+class _DirectoryLock:
+    """Lock exclusivo do diretório (flock), para gravação e compactação entre workers."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._file = open(self.path, "a")
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+class PriceAlerts:
+    """
+    Quedas de preço já alertadas, em SQLite (WAL) ao lado dos segmentos: o
+    estado é o mesmo para todos os workers e sobrevive a reinícios. Um produto
+    volta a ser alertado quando o preço cai abaixo do último alertado ou quando
+    o alerta anterior sai da janela consultada.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS price_alerts ("
+                         " id TEXT PRIMARY KEY, price REAL NOT NULL, alerted_at INTEGER NOT NULL)")
+
+    def _conn(self):
+        # Uma conexão por thread (e por processo, já que é criada sob demanda após o fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def claim(self, drops, seconds, now=None):
+        """
+        Marca como alertadas as quedas (de price_drops) ainda não alertadas na
+        janela e as devolve; numa transação, então dois workers nunca alertam a mesma.
+        """
+        now = int(now if now is not None else time.time())
+        conn = self._conn()
+        fresh = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for drop in drops:
+                row = conn.execute("SELECT price, alerted_at FROM price_alerts WHERE id = ?", (drop["id"],)).fetchone()
+                if row is None or drop["last"] < row[0] or row[1] < now - seconds:
+                    conn.execute("INSERT OR REPLACE INTO price_alerts (id, price, alerted_at) VALUES (?, ?, ?)",
+                                 (drop["id"], drop["last"], now))
+                    fresh.append(drop)
+            conn.execute("DELETE FROM price_alerts WHERE alerted_at < ?", (now - seconds,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return fresh
+
+
+def build_price_history():
+    """Histórico de preços a partir das variáveis de ambiente, ou None (ML_PRICE_HISTORY=0 desliga)."""
+    if os.getenv("ML_PRICE_HISTORY", "1") != "1":
+        return None
+    return PriceHistory(
+        os.getenv("ML_PRICE_HISTORY_DIR", "/tmp/ml_price_history"),
+        segment_points=int(os.getenv("ML_PRICE_HISTORY_SEGMENT_POINTS", 65536)),
+        flush_interval=float(os.getenv("ML_PRICE_HISTORY_FLUSH_INTERVAL", 60)),
+        min_interval=float(os.getenv("ML_PRICE_HISTORY_MIN_INTERVAL", 3600)),
+        retention=float(os.getenv("ML_PRICE_HISTORY_RETENTION_DAYS", 90)) * 86400,
+    )
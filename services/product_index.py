@@ -0,0 +1,219 @@
+import os
+import bisect
+import threading
+from collections import OrderedDict
+
+
+class ProductIndex:
+    """
+    Índice em memória dos produtos normalizados já vistos pelo worker.
+
+    Mantém índices invertidos por marca, cor, terceiro atributo, status e pela
+    busca que trouxe o produto, além de um array de preços ordenado para
+    consultas por faixa. Filtros e contagens de facetas saem daqui, sem nova
+    chamada ao Mercado Livre. Limitado a max_products (os mais antigos saem primeiro).
+    """
+
+    FACETS = ('brand', 'color', 'additional_attr', 'status')
+
+    def __init__(self, max_products=None):
+        self.max_products = max_products or int(os.getenv("ML_INDEX_MAX_PRODUCTS", 100000))
+        self._products = OrderedDict()   # id -> produto (ordem de inserção)
+        self._seq = {}                   # id -> sequência de inserção (ordem estável dos resultados)
+        self._next_seq = 0
+        self._postings = {facet: {} for facet in self.FACETS + ('query',)}  # valor normalizado -> set(ids)
+        self._labels = {facet: {} for facet in self.FACETS}                # valor normalizado -> grafia original
+        self._product_queries = {}       # id -> tuple(queries), tuplas compartilhadas via _query_sets
+        self._query_sets = {}            # tuple(queries) -> [tupla compartilhada, produtos que a usam]
+        self._prices = []                # [(preço, id)] ordenado
+        self._pending_prices = []        # inserções ainda fora de _prices
+        self._dropped_prices = {}        # (preço, id) -> remoções pendentes
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def normalize_query(query):
+        return " ".join(str(query or "").lower().split())
+
+    @staticmethod
+    def _key(value):
+        return str(value).casefold()
+
+    def __len__(self):
+        return len(self._products)
+
+    def has_query(self, query):
+        return bool(self._postings['query'].get(self.normalize_query(query)))
+
+    def add(self, products, query=None):
+        """Inserção incremental (ex.: a cada página que chega); produtos repetidos são atualizados."""
+        query_key = self.normalize_query(query) if query is not None else None
+        with self._lock:
+            for product in products:
+                if product.get('id') is None:
+                    continue
+                product_id = str(product['id'])
+                queries = self._product_queries.get(product_id, ())
+                if product_id in self._products:
+                    self._unlink(product_id)
+                self._products[product_id] = product
+                self._seq[product_id] = self._next_seq
+                self._next_seq += 1
+
+                for facet in self.FACETS:
+                    value = product.get(facet)
+                    if value is None:
+                        continue
+                    key = self._key(value)
+                    self._postings[facet].setdefault(key, set()).add(product_id)
+                    self._labels[facet].setdefault(key, value)
+
+                if query_key is not None and query_key not in queries:
+                    queries = queries + (query_key,)
+                for q in queries:
+                    self._postings['query'].setdefault(q, set()).add(product_id)
+                self._set_queries(product_id, queries)
+                self._pending_prices.append((product.get('price') or 0, product_id))
+
+            while len(self._products) > self.max_products:
+                oldest = next(iter(self._products))
+                self._unlink(oldest)
+                self._release_queries(oldest)
+
+    def remove(self, product_ids, query=None):
+        """
+        Tira produtos do índice. Com query, só desvincula da busca: o produto
+        continua indexado enquanto outra busca ainda o trouxer.
+        """
+        query_key = self.normalize_query(query) if query is not None else None
+        with self._lock:
+            for product_id in map(str, product_ids):
+                if product_id not in self._products:
+                    continue
+                queries = self._product_queries.get(product_id, ())
+                if query_key is not None:
+                    if query_key not in queries:
+                        continue
+                    if len(queries) > 1:
+                        ids = self._postings['query'].get(query_key)
+                        ids.discard(product_id)
+                        if not ids:
+                            del self._postings['query'][query_key]
+                        rest = tuple(q for q in queries if q != query_key)
+                        self._set_queries(product_id, rest)
+                        continue
+                self._unlink(product_id)
+                self._release_queries(product_id)
+
+    def _set_queries(self, product_id, queries):
+        """Associa as buscas ao produto, reaproveitando a tupla de outros produtos com as mesmas buscas."""
+        self._release_queries(product_id)
+        entry = self._query_sets.get(queries)
+        if entry is None:
+            entry = self._query_sets[queries] = [queries, 0]
+        entry[1] += 1
+        self._product_queries[product_id] = entry[0]
+
+    def _release_queries(self, product_id):
+        # A tupla sai de _query_sets com o último produto que a usa (memória limitada com o índice)
+        queries = self._product_queries.pop(product_id, None)
+        if queries is not None:
+            entry = self._query_sets[queries]
+            entry[1] -= 1
+            if not entry[1]:
+                del self._query_sets[queries]
+
+    def _unlink(self, product_id):
+        """Remove o produto de todos os índices (chamado com o lock)."""
+        product = self._products.pop(product_id)
+        self._seq.pop(product_id, None)
+        for facet in self.FACETS:
+            value = product.get(facet)
+            if value is None:
+                continue
+            key = self._key(value)
+            ids = self._postings[facet].get(key)
+            if ids is not None:
+                ids.discard(product_id)
+                if not ids:
+                    del self._postings[facet][key]
+                    self._labels[facet].pop(key, None)
+        for q in self._product_queries.get(product_id, ()):
+            ids = self._postings['query'].get(q)
+            if ids is not None:
+                ids.discard(product_id)
+                if not ids:
+                    del self._postings['query'][q]
+        entry = (product.get('price') or 0, product_id)
+        self._dropped_prices[entry] = self._dropped_prices.get(entry, 0) + 1
+
+    def _price_array(self):
+        """
+        Array de preços ordenado. Inserções e remoções são acumuladas e aplicadas
+        aqui, numa única ordenação (quase ordenada, barata) antes da próxima consulta
+        por faixa, em vez de deslocar o array a cada produto.
+        """
+        if self._pending_prices or self._dropped_prices:
+            entries = self._prices + self._pending_prices
+            if self._dropped_prices:
+                dropped = self._dropped_prices
+                kept = []
+                for entry in entries:
+                    count = dropped.get(entry)
+                    if count:
+                        dropped[entry] = count - 1
+                    else:
+                        kept.append(entry)
+                entries = kept
+            entries.sort()
+            self._prices = entries
+            self._pending_prices = []
+            self._dropped_prices = {}
+        return self._prices
+
+    def _match_ids(self, query=None, filters=None, min_price=None, max_price=None):
+        candidates = []
+        if query is not None:
+            candidates.append(self._postings['query'].get(self.normalize_query(query), set()))
+        for facet, value in (filters or {}).items():
+            if value:
+                candidates.append(self._postings[facet].get(self._key(value), set()))
+
+        if min_price is not None or max_price is not None:
+            prices = self._price_array()
+            lo = 0 if min_price is None else bisect.bisect_left(prices, (min_price, ""))
+            hi = len(prices) if max_price is None else bisect.bisect_right(prices, (max_price, "\uffff"))
+            candidates.append({product_id for _, product_id in prices[lo:hi]})
+
+        if not candidates:
+            return set(self._products)
+        # Interseção começando pelo menor conjunto
+        candidates.sort(key=len)
+        ids = set(candidates[0])
+        for other in candidates[1:]:
+            ids &= other
+            if not ids:
+                break
+        return ids
+
+    def search(self, query=None, filters=None, min_price=None, max_price=None):
+        """Produtos que atendem a todos os filtros, na ordem em que foram indexados."""
+        with self._lock:
+            ids = self._match_ids(query, filters, min_price, max_price)
+            seq = self._seq
+            return [self._products[i] for i in sorted(ids, key=seq.__getitem__)]
+
+    def facets(self, query=None, filters=None, min_price=None, max_price=None):
+        """Contagem por valor de cada faceta dentro do conjunto filtrado (maiores primeiro)."""
+        with self._lock:
+            ids = self._match_ids(query, filters, min_price, max_price)
+            result = {}
+            for facet in self.FACETS:
+                labels = self._labels[facet]
+                counts = [(labels[key], len(ids & postings)) for key, postings in self._postings[facet].items()]
+                result[facet] = sorted(((label, count) for label, count in counts if count),
+                                       key=lambda pair: (-pair[1], str(pair[0])))
+            return result
+
+    def clear(self):
+        with self._lock:
+            self.__init__(self.max_products)
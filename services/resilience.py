@@ -0,0 +1,308 @@
+import os
+import time
+import logging
+import threading
+from functools import lru_cache
+from urllib.parse import urlsplit
+from services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+BREAKER_STATE = REGISTRY.gauge(
+    "ml_circuit_breaker_state",
+    "Estado do circuit breaker por endpoint (0 = fechado, 1 = meio-aberto, 2 = aberto)",
+    ("endpoint",),
+)
+BREAKER_TRANSITIONS = REGISTRY.counter(
+    "ml_circuit_breaker_transitions",
+    "Mudanças de estado dos circuit breakers, por endpoint e novo estado",
+    ("endpoint", "state"),
+)
+UPSTREAM_REJECTED = REGISTRY.counter(
+    "ml_upstream_rejected",
+    "Chamadas ao ML recusadas localmente, sem sair do processo (circuit_open ou rate_limited)",
+    ("endpoint", "reason"),
+)
+RATE_LIMIT = REGISTRY.gauge(
+    "ml_rate_limit_per_second",
+    "Taxa atual do limitador por host (0 = sem limite)",
+    ("host",),
+)
+RATE_LIMIT_THROTTLES = REGISTRY.counter(
+    "ml_rate_limit_throttles",
+    "Respostas 429 recebidas do ML, por host",
+    ("host",),
+)
+
+
+@lru_cache(maxsize=1024)
+def endpoint_of(url):
+    """
+    Path da URL com segmentos que contêm dígitos trocados por ":id"
+    (/items/MLB123 -> /items/:id), para manter a cardinalidade baixa.
+    Os parâmetros vão em params=, então as URLs se repetem e o resultado fica em cache.
+    """
+    path = urlsplit(url).path or "/"
+    return "/".join(":id" if any(c.isdigit() for c in part) else part for part in path.split("/"))
+
+
+@lru_cache(maxsize=1024)
+def _host_of(url):
+    return urlsplit(url).netloc
+
+
+class UpstreamUnavailable(Exception):
+    """Chamada recusada antes de sair do processo; retry_after é a espera sugerida (segundos)."""
+
+    reason = "unavailable"
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    reason = "circuit_open"
+
+
+class RateLimitedError(UpstreamUnavailable):
+    reason = "rate_limited"
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    """O prazo da requisição (services.deadline) acabou antes de a chamada terminar."""
+
+    reason = "deadline"
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker de um endpoint do ML.
+
+    Fechado: as chamadas passam e falhas consecutivas (erro de conexão, timeout
+    ou 5xx) são contadas; ao atingir failure_threshold, abre. Aberto: as chamadas
+    falham na hora (CircuitOpenError) até recovery_timeout. Meio-aberto: até
+    half_open_max_calls chamadas de teste passam; um sucesso fecha o circuito e
+    uma falha o abre de novo.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, endpoint, failure_threshold=5, recovery_timeout=30, half_open_max_calls=1):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probes = 0
+        self._lock = threading.Lock()
+        BREAKER_STATE.set(0, endpoint)
+
+    def _transition(self, state, now):
+        self.state = state
+        if state == self.OPEN:
+            self.opened_at = now
+        self._probes = 0
+        BREAKER_STATE.set(self._STATE_VALUES[state], self.endpoint)
+        BREAKER_TRANSITIONS.inc(self.endpoint, state)
+        log = logger.warning if state == self.OPEN else logger.info
+        log(f"Circuit breaker de {self.endpoint}: {state}")
+
+    def acquire(self, now=None):
+        """Autoriza uma chamada ou levanta CircuitOpenError."""
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN:
+                remaining = self.opened_at + self.recovery_timeout - now
+                if remaining > 0:
+                    raise CircuitOpenError(f"Circuito aberto para {self.endpoint}", retry_after=remaining)
+                self._transition(self.HALF_OPEN, now)
+            if self._probes >= self.half_open_max_calls:
+                raise CircuitOpenError(f"Circuito meio-aberto para {self.endpoint}", retry_after=self.recovery_timeout)
+            self._probes += 1
+
+    def record_success(self, now=None):
+        with self._lock:
+            self.failures = 0
+            if self.state == self.HALF_OPEN:
+                self._transition(self.CLOSED, now if now is not None else time.monotonic())
+
+    def record_failure(self, now=None):
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self._transition(self.OPEN, now)
+
+    def cancel(self):
+        """Libera uma chamada autorizada que não chegou a ser feita."""
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._probes:
+                self._probes -= 1
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket de um host, ajustado pelas respostas 429 do ML.
+
+    Com rate=0 não há limite até o primeiro 429. Cada 429 bloqueia o host pelo
+    Retry-After e corta a taxa pela metade (a partir da taxa observada, se ainda
+    não havia limite); sem novos 429 ela volta linearmente ao teto em
+    recovery_time segundos, e sem teto configurado o limite é desligado de novo.
+    reserve() devolve quanto esperar antes de enviar, ou levanta RateLimitedError
+    se a espera passar de max_wait (falha rápida em vez de prender o worker).
+    """
+
+    def __init__(self, host, rate=0, burst=None, max_wait=2.0, min_rate=1.0, recovery_time=10.0):
+        self.host = host
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.max_wait = max_wait
+        self.min_rate = min_rate
+        self.recovery_time = recovery_time
+        self.throttles = 0
+        self._ceiling = rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._window_start = self._updated
+        self._window_count = 0
+        self._previous_count = 0
+        self._lock = threading.Lock()
+        RATE_LIMIT.set(rate, host)
+
+    def _observe_call(self, now):
+        # Chamadas por segundo (janelas de 1 s), base do corte quando ainda não há limite
+        if now - self._window_start >= 1.0:
+            self._previous_count = self._window_count if now - self._window_start < 2.0 else 0
+            self._window_start = now
+            self._window_count = 0
+        self._window_count += 1
+
+    def _advance(self, now):
+        if now <= self._updated:
+            return
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rate <= 0:
+            return
+        if self.rate < self._ceiling:
+            self.rate = min(self._ceiling, self.rate + self._ceiling / self.recovery_time * elapsed)
+            if self.rate >= self._ceiling and not self.max_rate:
+                self.rate = 0
+                self._tokens = self.burst
+                logger.info(f"Limitador de {self.host}: sem 429 recentes, limite desligado")
+            RATE_LIMIT.set(round(self.rate, 2), self.host)
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+
+    def reserve(self, now=None):
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            self._advance(now)
+            delay = max(0.0, self._blocked_until - now)
+            if self.rate > 0:
+                delay = max(delay, (1 - self._tokens) / self.rate)
+            if delay > self.max_wait:
+                raise RateLimitedError(f"Limite de requisições para {self.host}", retry_after=delay)
+            if self.rate > 0:
+                self._tokens -= 1
+            self._observe_call(now)
+            return delay
+
+    def throttle(self, retry_after=None, now=None):
+        """Registra um 429: bloqueia pelo Retry-After e reduz a taxa."""
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            self._advance(now)
+            self.throttles += 1
+            if self.rate <= 0:
+                observed = max(self._window_count, self._previous_count, self.min_rate)
+                self._ceiling = max(self.max_rate, observed)
+                self.rate = observed
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 1.0)
+            self._blocked_until = max(self._blocked_until, now + (retry_after or 0))
+            self._updated = max(now, self._blocked_until)
+            RATE_LIMIT.set(round(self.rate, 2), self.host)
+            RATE_LIMIT_THROTTLES.inc(self.host)
+        logger.warning(f"429 de {self.host}: limite reduzido para {self.rate:.1f} req/s (Retry-After {retry_after})")
+
+
+def retry_after_seconds(response):
+    """Retry-After em segundos (só a forma numérica; datas HTTP são ignoradas)."""
+    value = response.headers.get("Retry-After")
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+class UpstreamGuard:
+    """
+    Circuit breakers (um por endpoint) e limitadores (um por host) usados por um
+    cliente HTTP. Valores não informados vêm do ambiente.
+    """
+
+    def __init__(self, failure_threshold=None, recovery_timeout=None, half_open_max_calls=None,
+                 rate=None, burst=None, max_wait=None):
+        self.failure_threshold = failure_threshold or int(os.getenv("ML_BREAKER_FAILURE_THRESHOLD", 5))
+        self.recovery_timeout = recovery_timeout if recovery_timeout is not None else float(os.getenv("ML_BREAKER_RECOVERY_TIMEOUT", 30))
+        self.half_open_max_calls = half_open_max_calls or int(os.getenv("ML_BREAKER_HALF_OPEN_CALLS", 1))
+        self.rate = rate if rate is not None else float(os.getenv("ML_RATE_LIMIT", 0))
+        self.burst = burst if burst is not None else float(os.getenv("ML_RATE_LIMIT_BURST") or 0)
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv("ML_RATE_LIMIT_MAX_WAIT", 2))
+        self._breakers = {}
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, url):
+        endpoint = endpoint_of(url)
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(endpoint)
+                if breaker is None:
+                    breaker = self._breakers[endpoint] = CircuitBreaker(
+                        endpoint, self.failure_threshold, self.recovery_timeout, self.half_open_max_calls)
+        return breaker
+
+    def limiter(self, url):
+        host = _host_of(url)
+        limiter = self._limiters.get(host)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.get(host)
+                if limiter is None:
+                    limiter = self._limiters[host] = AdaptiveRateLimiter(host, self.rate, self.burst or None, self.max_wait)
+        return limiter
+
+    def admit(self, breaker, limiter):
+        """
+        Autoriza uma chamada no breaker e no limitador; devolve quanto esperar
+        antes de enviá-la ou levanta CircuitOpenError/RateLimitedError.
+        """
+        try:
+            breaker.acquire()
+            try:
+                return limiter.reserve()
+            except RateLimitedError:
+                breaker.cancel()
+                raise
+        except UpstreamUnavailable as e:
+            UPSTREAM_REJECTED.inc(breaker.endpoint, e.reason)
+            logger.info(f"Chamada a {breaker.endpoint} recusada ({e.reason}): {e}")
+            raise
+
+    @staticmethod
+    def record(breaker, status_code):
+        """5xx conta como falha do endpoint; qualquer outra resposta (inclusive 4xx) mostra que ele está de pé."""
+        if status_code // 100 == 5:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
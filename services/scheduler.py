@@ -0,0 +1,476 @@
+"""
+Fila de tarefas de segundo plano: prioridade, pool limitado e persistência.
+
+JobScheduler executa tarefas registradas por nome (refresh das buscas
+acompanhadas, alertas de queda de preço, ...) a partir de uma thread de
+despacho por worker: as tarefas vencidas saem do store em ordem de prioridade
+(menor primeiro) e de horário, só até o número de vagas livres do pool.
+Cada tipo de tarefa tem tentativas com backoff exponencial e, opcionalmente,
+um limite de execuções por segundo. As chamadas ao ML feitas pelas tarefas
+passam pelo mesmo HttpClient (limitador e circuit breaker) das buscas dos
+usuários: uma recusa dele (UpstreamUnavailable) adia a tarefa pelo
+retry_after, sem gastar tentativa.
+
+Com o store em SQLite, as tarefas pendentes sobrevivem a reinícios e os
+workers do gunicorn dividem a mesma fila: cada tarefa é reservada por um
+lease, e a de um worker que morreu volta para a fila quando o lease vence.
+"""
+import os
+import json
+import time
+import uuid
+import heapq
+import random
+import socket
+import sqlite3
+import logging
+import threading
+import contextvars
+import multiprocessing
+from itertools import count
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from services.metrics import REGISTRY, new_trace_id
+from services.resilience import AdaptiveRateLimiter, RateLimitedError, UpstreamUnavailable
+
+logger = logging.getLogger(__name__)
+
+JOB_RUNS = REGISTRY.counter(
+    "ml_job_runs",
+    "Execuções de tarefas de segundo plano, por tarefa e resultado (ok, retry, deferred, failed)",
+    ("job", "outcome"),
+)
+JOB_LAG = REGISTRY.histogram(
+    "ml_job_lag_seconds",
+    "Atraso entre o horário agendado e o início da tarefa",
+    ("job",),
+)
+JOB_DURATION = REGISTRY.histogram("ml_job_seconds", "Duração das tarefas de segundo plano", ("job",))
+
+# run_at em segundos desde a época (time.time()): o horário precisa valer depois de um reinício
+Job = namedtuple("Job", "id name args priority run_at attempts key")
+JobType = namedtuple("JobType", "fn max_attempts limiter process")
+
+
+def _run_traced(job_id, fn, args):
+    # Um trace id por execução: os logs da tarefa (e das chamadas ao ML) ficam agrupados
+    new_trace_id(f"job-{job_id[:12]}")
+    return fn(*args)
+
+
+class MemoryJobStore:
+    """Fila só deste processo (some num reinício)."""
+
+    def __init__(self):
+        self._jobs = {}      # id -> Job
+        self._keys = {}      # key -> id
+        self._versions = {}  # id -> versão válida nos heaps (None: reservada)
+        self._waiting = []   # (run_at, versão, id)
+        self._ready = []     # (prioridade, run_at, versão, id) das já vencidas
+        self._seq = count()
+        self._lock = threading.Lock()
+
+    def _push(self, job):
+        # Entradas antigas do mesmo id ficam nos heaps e são descartadas pela versão
+        version = self._versions[job.id] = next(self._seq)
+        heapq.heappush(self._waiting, (job.run_at, version, job.id))
+
+    def add(self, job):
+        with self._lock:
+            if job.key is not None and job.key in self._keys:
+                return False
+            self._jobs[job.id] = job
+            if job.key is not None:
+                self._keys[job.key] = job.id
+            self._push(job)
+            return True
+
+    def claim(self, now, limit, owner=None, lease=None):
+        with self._lock:
+            while self._waiting and self._waiting[0][0] <= now:
+                run_at, version, job_id = heapq.heappop(self._waiting)
+                if self._versions.get(job_id) == version:
+                    heapq.heappush(self._ready, (self._jobs[job_id].priority, run_at, version, job_id))
+            claimed = []
+            while self._ready and len(claimed) < limit:
+                _, _, version, job_id = heapq.heappop(self._ready)
+                if self._versions.get(job_id) == version:
+                    self._versions[job_id] = None
+                    claimed.append(self._jobs[job_id])
+            return claimed
+
+    def reschedule(self, job):
+        with self._lock:
+            if job.id in self._jobs:
+                self._jobs[job.id] = job
+                self._push(job)
+
+    def remove(self, job):
+        with self._lock:
+            if self._jobs.pop(job.id, None) is not None and job.key is not None:
+                self._keys.pop(job.key, None)
+            self._versions.pop(job.id, None)
+
+    def next_run_at(self):
+        with self._lock:
+            if self._ready:
+                return 0.0
+            return self._waiting[0][0] if self._waiting else None
+
+    def stats(self, now):
+        with self._lock:
+            due = [job.run_at for job in self._jobs.values()
+                   if self._versions.get(job.id) is not None and job.run_at <= now]
+            return {"pending": len(self._jobs), "due": len(due), "oldest_due": min(due, default=None)}
+
+
+class SQLiteJobStore:
+    """
+    Fila em SQLite (WAL): sobrevive a reinícios e é dividida entre os workers.
+    Uma tarefa reservada (owner/lease_until) só volta a ser entregue quando o
+    lease vence, então uma tarefa precisa terminar dentro do lease.
+    """
+
+    _COLUMNS = "id, name, args, priority, run_at, attempts, key"
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, name TEXT NOT NULL, args TEXT NOT NULL, priority INTEGER NOT NULL,"
+                " run_at REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, key TEXT UNIQUE,"
+                " owner TEXT, lease_until REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_run_at ON jobs (run_at)")
+
+    def _conn(self):
+        # Uma conexão por thread (e por processo, já que é criada sob demanda após o fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _job(row):
+        job_id, name, args, priority, run_at, attempts, key = row
+        return Job(job_id, name, json.loads(args), priority, run_at, attempts, key)
+
+    def add(self, job):
+        cursor = self._conn().execute(
+            f"INSERT OR IGNORE INTO jobs ({self._COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job.id, job.name, json.dumps(job.args, ensure_ascii=False), job.priority, job.run_at,
+             job.attempts, job.key),
+        )
+        return cursor.rowcount == 1
+
+    def claim(self, now, limit, owner=None, lease=300):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                f"SELECT {self._COLUMNS} FROM jobs WHERE run_at <= ? AND (lease_until IS NULL OR lease_until <= ?)"
+                " ORDER BY priority, run_at LIMIT ?", (now, now, limit)).fetchall()
+            conn.executemany("UPDATE jobs SET owner = ?, lease_until = ? WHERE id = ?",
+                             [(owner, now + lease, row[0]) for row in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [self._job(row) for row in rows]
+
+    def reschedule(self, job):
+        self._conn().execute(
+            "UPDATE jobs SET run_at = ?, attempts = ?, owner = NULL, lease_until = NULL WHERE id = ?",
+            (job.run_at, job.attempts, job.id))
+
+    def remove(self, job):
+        self._conn().execute("DELETE FROM jobs WHERE id = ?", (job.id,))
+
+    def next_run_at(self):
+        # Tarefas reservadas contam pelo fim do lease (quando voltam a ser entregues)
+        row = self._conn().execute(
+            "SELECT MIN(MAX(run_at, COALESCE(lease_until, 0))) FROM jobs").fetchone()
+        return row[0]
+
+    def stats(self, now):
+        pending, due, oldest = self._conn().execute(
+            "SELECT COUNT(*), SUM(run_at <= ?1 AND (lease_until IS NULL OR lease_until <= ?1)),"
+            " MIN(CASE WHEN run_at <= ?1 AND (lease_until IS NULL OR lease_until <= ?1) THEN run_at END)"
+            " FROM jobs", (now,)).fetchone()
+        return {"pending": pending, "due": due or 0, "oldest_due": oldest}
+
+
+class JobScheduler:
+    """
+    Executa as tarefas do store num pool limitado de threads (ou de processos,
+    para tarefas registradas com process=True e ML_JOBS_PROCESSES > 0).
+
+    Falha com exceção: nova tentativa após backoff * 2^tentativas (com jitter,
+    até max_backoff); esgotadas as max_attempts, a tarefa é descartada com log
+    de erro. Tarefas periódicas (every) voltam para a fila após cada execução,
+    com ou sem sucesso, e têm uma única instância pendente (pela key), mesmo
+    com vários workers.
+    """
+
+    OUTCOMES = ("ok", "retry", "deferred", "failed")
+    DEFAULT_PRIORITY = 5
+    THROUGHPUT_WINDOW = 60.0
+
+    def __init__(self, store=None, workers=4, processes=0, poll_interval=1.0, lease=300.0,
+                 backoff=5.0, max_backoff=600.0):
+        self.store = store if store is not None else MemoryJobStore()
+        self.workers = max(1, workers)
+        self.processes = max(0, processes)
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.outcomes = Counter()
+        self._types = {}     # nome -> JobType
+        self._periodic = {}  # key -> (nome, args, intervalo, prioridade)
+        self._by_job = Counter()  # (nome, resultado) -> execuções
+        self._finished = deque(maxlen=100000)  # instantes de término (vazão)
+        self._inflight = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = self._thread_pid = None
+        self._executor = self._executor_pid = None
+        self._process_executor = self._process_pid = None
+
+    def register(self, name, fn, max_attempts=5, rate=0, burst=None, process=False):
+        """
+        Registra o handler da tarefa `name` (fn(*args)). rate > 0 limita as
+        execuções por segundo deste tipo (token bucket, no mesmo formato do
+        limitador do ML); process=True roda fn no pool de processos, então fn
+        precisa ser uma função de módulo (picklable).
+        """
+        limiter = AdaptiveRateLimiter(f"job:{name}", rate, burst, max_wait=0) if rate else None
+        self._types[name] = JobType(fn, max(1, max_attempts), limiter, process)
+        return fn
+
+    def submit(self, name, *args, priority=DEFAULT_PRIORITY, delay=0, key=None):
+        """
+        Enfileira uma execução de `name` com args (JSON: o store persiste a
+        tarefa) e devolve o id; com key, não duplica uma tarefa ainda pendente
+        com a mesma key (devolve None).
+        """
+        if name not in self._types:
+            raise ValueError(f"Tarefa desconhecida: {name}")
+        job = Job(uuid.uuid4().hex, name, json.loads(json.dumps(list(args))), priority,
+                  time.time() + delay, 0, key)
+        if not self.store.add(job):
+            return None
+        self._wake.set()
+        return job.id
+
+    def every(self, name, interval, *args, priority=DEFAULT_PRIORITY, key=None):
+        """Agenda `name` a cada `interval` segundos (a primeira execução vale ao iniciar)."""
+        if name not in self._types:
+            raise ValueError(f"Tarefa desconhecida: {name}")
+        key = key or f"every:{name}:{json.dumps(list(args), ensure_ascii=False)}"
+        self._periodic[key] = (name, list(args), interval, priority)
+        if self._thread is not None:
+            self.submit(name, *args, priority=priority, key=key)
+        return key
+
+    def start(self):
+        """Inicia o despacho numa thread daemon deste processo (idempotente; refeito após o fork)."""
+        pid = os.getpid()
+        if self._thread is not None and self._thread_pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._thread_pid != pid or not self._thread.is_alive():
+                # Periódicas já persistidas mantêm o horário agendado antes do reinício
+                for key, (name, args, _, priority) in self._periodic.items():
+                    self.submit(name, *args, priority=priority, key=key)
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="ml-jobs", daemon=True)
+                self._thread_pid = pid
+                self._thread.start()
+
+    def stop(self, wait=False):
+        """Para o despacho; com wait, espera as tarefas em andamento terminarem."""
+        self._stop.set()
+        self._wake.set()
+        if wait:
+            if self._thread is not None and self._thread_pid == os.getpid():
+                self._thread.join()
+            for executor in (self._executor, self._process_executor):
+                if executor is not None:
+                    executor.shutdown(wait=True)
+            self._executor = self._process_executor = None
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ml-job")
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _process_pool(self):
+        with self._lock:
+            if self._process_executor is None or self._process_pid != os.getpid():
+                # forkserver: os processos não herdam as threads nem os sockets do worker
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else None
+                self._process_executor = ProcessPoolExecutor(max_workers=self.processes,
+                                                             mp_context=multiprocessing.get_context(method))
+                self._process_pid = os.getpid()
+            return self._process_executor
+
+    @staticmethod
+    def _owner():
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            timeout = self.poll_interval
+            try:
+                # Pool cheio: o término de uma tarefa acorda o despacho
+                if not self._dispatch():
+                    next_run_at = self.store.next_run_at()
+                    if next_run_at is not None:
+                        timeout = min(timeout, max(0.0, next_run_at - time.time()))
+            except Exception:
+                logger.exception("Erro inesperado no despacho das tarefas")
+            self._wake.wait(timeout)
+
+    def _dispatch(self):
+        """Inicia as tarefas vencidas que cabem no pool; devolve True se ele ficou cheio."""
+        with self._lock:
+            free = self.workers - self._inflight
+        if free <= 0:
+            return True
+        now = time.time()
+        jobs = self.store.claim(now, free, self._owner(), self.lease)
+        for job in jobs:
+            self._start(job, now)
+        return len(jobs) == free
+
+    def _start(self, job, now):
+        job_type = self._types.get(job.name)
+        if job_type is None:
+            # Tarefa persistida por uma versão anterior do app
+            logger.error(f"Tarefa {job.name} ({job.id}) sem handler registrado: descartada")
+            self.store.remove(job)
+            self._count(job, "failed")
+            return
+        if job_type.limiter is not None:
+            try:
+                job_type.limiter.reserve()
+            except RateLimitedError as e:
+                self.store.reschedule(job._replace(run_at=now + e.retry_after))
+                return
+        JOB_LAG.observe(max(0.0, now - job.run_at), job.name)
+        with self._lock:
+            self._inflight += 1
+        started = time.monotonic()
+        try:
+            if job_type.process and self.processes:
+                future = self._process_pool().submit(job_type.fn, *job.args)
+            else:
+                future = self._pool().submit(contextvars.copy_context().run, _run_traced, job.id, job_type.fn, job.args)
+        except RuntimeError:
+            # Pool encerrado (stop): a tarefa volta para a fila
+            with self._lock:
+                self._inflight -= 1
+            self.store.reschedule(job)
+            return
+        future.add_done_callback(lambda f: self._finish(job, job_type, f, started))
+
+    def _finish(self, job, job_type, future, started):
+        JOB_DURATION.observe(time.monotonic() - started, job.name)
+        error = future.exception()
+        outcome = "ok"
+        try:
+            if error is None:
+                self._done(job)
+            elif isinstance(error, UpstreamUnavailable):
+                # Cota ou circuito do ML: espera o que o HttpClient sugeriu, sem gastar tentativa
+                outcome = "deferred"
+                delay = error.retry_after if error.retry_after is not None else self.backoff
+                self.store.reschedule(job._replace(run_at=time.time() + delay))
+            elif job.attempts + 1 < job_type.max_attempts:
+                outcome = "retry"
+                delay = self.retry_delay(job.attempts)
+                logger.warning(f"Tarefa {job.name} ({job.id}) falhou ({error}); "
+                               f"tentativa {job.attempts + 2} em {delay:.1f} s")
+                self.store.reschedule(job._replace(run_at=time.time() + delay, attempts=job.attempts + 1))
+            else:
+                outcome = "failed"
+                logger.error(f"Tarefa {job.name} ({job.id}) falhou após {job.attempts + 1} tentativas: {error}")
+                self._done(job)
+        except Exception:
+            logger.exception(f"Erro ao atualizar a tarefa {job.name} ({job.id}) no store")
+        finally:
+            with self._lock:
+                self._inflight -= 1
+                self._finished.append(time.monotonic())
+            self._count(job, outcome)
+            self._wake.set()
+
+    def _count(self, job, outcome):
+        with self._lock:
+            self.outcomes[outcome] += 1
+            self._by_job[(job.name, outcome)] += 1
+        JOB_RUNS.inc(job.name, outcome)
+
+    def _done(self, job):
+        periodic = self._periodic.get(job.key)
+        if periodic is None:
+            self.store.remove(job)
+        else:
+            self.store.reschedule(job._replace(run_at=time.time() + periodic[2], attempts=0))
+
+    def retry_delay(self, attempts):
+        """Espera antes da próxima tentativa: exponencial, com jitter para não sincronizar os workers."""
+        return min(self.max_backoff, self.backoff * 2 ** attempts) * random.uniform(0.5, 1.0)
+
+    def stats(self):
+        now = time.time()
+        queue = self.store.stats(now)
+        with self._lock:
+            since = time.monotonic() - self.THROUGHPUT_WINDOW
+            recent = sum(1 for finished in self._finished if finished >= since)
+            inflight = self._inflight
+            outcomes = {outcome: self.outcomes[outcome] for outcome in self.OUTCOMES}
+        lag = now - queue["oldest_due"] if queue["oldest_due"] is not None else 0.0
+        return dict(outcomes, queued=queue["pending"], due=queue["due"], inflight=inflight,
+                    lag=round(max(0.0, lag), 3), throughput=round(recent / self.THROUGHPUT_WINDOW, 3),
+                    workers=self.workers, processes=self.processes)
+
+    def status(self):
+        """stats() mais as execuções por tarefa e os agendamentos periódicos (rota de status)."""
+        with self._lock:
+            jobs = {name: {"runs": {outcome: self._by_job[(name, outcome)] for outcome in self.OUTCOMES}}
+                    for name in self._types}
+        for name, args, interval, priority in self._periodic.values():
+            jobs[name].setdefault("every", []).append({"args": args, "interval": interval, "priority": priority})
+        return dict(self.stats(), jobs=jobs)
+
+
+def build_job_store():
+    """Cria o store da fila a partir das variáveis de ambiente (SQLite por padrão, para sobreviver a reinícios)."""
+    if os.getenv("ML_JOBS_STORE", "sqlite").lower() == "memory":
+        return MemoryJobStore()
+    return SQLiteJobStore(os.getenv("ML_JOBS_PATH", "/tmp/ml_jobs.sqlite3"))
+
+
+def build_scheduler():
+    """Cria a fila de tarefas a partir das variáveis de ambiente."""
+    return JobScheduler(
+        build_job_store(),
+        workers=int(os.getenv("ML_JOBS_WORKERS", 4)),
+        processes=int(os.getenv("ML_JOBS_PROCESSES", 0)),
+        poll_interval=float(os.getenv("ML_JOBS_POLL_INTERVAL", 1)),
+        lease=float(os.getenv("ML_JOBS_LEASE", 300)),
+        backoff=float(os.getenv("ML_JOBS_BACKOFF", 5)),
+        max_backoff=float(os.getenv("ML_JOBS_MAX_BACKOFF", 600)),
+    )
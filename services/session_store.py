@@ -0,0 +1,260 @@
+"""
+Sessões do Flask guardadas no servidor.
+
+O cookie leva só um id opaco (aleatório, 256 bits); os dados da sessão (token
+key, user id e uma cópia dos tokens) ficam num backend: SQLite (WAL, o padrão),
+compartilhado entre os workers do gunicorn e mantido entre reinícios, ou em
+memória (por worker, só para desenvolvimento com um único processo). Como o id
+não carrega dados, não há serialização nem HMAC do conteúdo a cada requisição,
+e um login feito num worker vale nos outros.
+
+Os tokens em si não têm a sessão como fonte da verdade: quem os renova e
+decide qual par é o mais novo é o TokenManager, com o store de tokens
+(services.token_manager.SQLiteTokenStore, no mesmo arquivo SQLite). A cópia na
+sessão só é trocada por um par que vence depois.
+"""
+import os
+import time
+import sqlite3
+import secrets
+import logging
+import threading
+from collections import OrderedDict
+from flask.sessions import SecureCookieSession, SessionInterface, session_json_serializer
+
+logger = logging.getLogger(__name__)
+
+
+class ServerSideSession(SecureCookieSession):
+    """Sessão com id opaco; `modified`/`accessed` vêm de SecureCookieSession."""
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        super().__init__(initial)
+        self.new = sid is None
+        self.sid = sid or secrets.token_urlsafe(32)
+        self.expires_at = expires_at
+        self.previous_sid = None
+
+    def rotate(self):
+        """Troca o id mantendo os dados (ex.: no login, contra fixação de sessão)."""
+        if not self.new:
+            self.previous_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.new = True
+        self.modified = True
+
+
+class MemorySessionBackend:
+    """Sessões em memória (por worker): somem ao reiniciar e não são vistas por outros workers."""
+
+    def __init__(self):
+        self._data = {}  # sid -> (dados, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, sid, now=None):
+        entry = self._data.get(sid)
+        if entry is None or entry[1] <= (now or time.time()):
+            return None
+        return dict(entry[0]), entry[1]
+
+    def set(self, sid, data, expires_at):
+        with self._lock:
+            self._data[sid] = (dict(data), expires_at)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def sweep(self, now=None):
+        """Remove as sessões vencidas e devolve quantas saíram."""
+        now = now or time.time()
+        with self._lock:
+            expired = [sid for sid, (_, expires_at) in self._data.items() if expires_at <= now]
+            for sid in expired:
+                del self._data[sid]
+        return len(expired)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteSessionBackend:
+    """
+    Sessões compartilhadas entre workers via arquivo SQLite (WAL).
+
+    Leituras passam por um cache local curto (cache_ttl segundos, LRU): uma
+    sequência de requisições da mesma sessão no mesmo worker não consulta o
+    SQLite a cada vez. Escritas deste worker atualizam o cache na hora; as de
+    outros workers aparecem em até cache_ttl.
+    """
+
+    def __init__(self, path, cache_ttl=1.0, cache_size=1024):
+        self.path = path
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.lookups = 0
+        self._cache = OrderedDict()  # sid -> (dados, expires_at, lido_em)
+        self._cache_lock = threading.Lock()
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)")
+
+    def _conn(self):
+        # Uma conexão por thread (e por processo, já que é criada sob demanda após o fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _remember(self, sid, data, expires_at, now):
+        with self._cache_lock:
+            self._cache[sid] = (data, expires_at, now)
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def get(self, sid, now=None):
+        now = now or time.time()
+        self.lookups += 1
+        cached = self._cache.get(sid)
+        if cached is not None and now - cached[2] <= self.cache_ttl:
+            self.cache_hits += 1
+            data, expires_at, _ = cached
+        else:
+            row = self._conn().execute("SELECT data, expires_at FROM sessions WHERE sid = ?", (sid,)).fetchone()
+            if row is None:
+                with self._cache_lock:
+                    self._cache.pop(sid, None)
+                return None
+            data, expires_at = session_json_serializer.loads(row[0]), row[1]
+            self._remember(sid, data, expires_at, now)
+        if expires_at <= now:
+            return None
+        return dict(data), expires_at
+
+    def set(self, sid, data, expires_at):
+        data = dict(data)
+        self._conn().execute(
+            "INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)",
+            (sid, session_json_serializer.dumps(data), expires_at),
+        )
+        self._remember(sid, data, expires_at, time.time())
+
+    def delete(self, sid):
+        self._conn().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+        with self._cache_lock:
+            self._cache.pop(sid, None)
+
+    def sweep(self, now=None):
+        now = now or time.time()
+        removed = self._conn().execute("DELETE FROM sessions WHERE expires_at <= ?", (now,)).rowcount
+        with self._cache_lock:
+            for sid in [sid for sid, (_, expires_at, _) in self._cache.items() if expires_at <= now]:
+                del self._cache[sid]
+        return removed
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    SessionInterface do Flask sobre um backend de sessões.
+
+    A validade é deslizante (ttl desde o último uso), mas a sessão só é regravada
+    sem mudanças quando já passou metade do ttl, para uma leitura não virar uma
+    escrita a cada requisição. Sessões vencidas são varridas a cada sweep_interval.
+    """
+
+    def __init__(self, backend=None, ttl=7 * 24 * 3600, sweep_interval=300):
+        self.backend = backend if backend is not None else MemorySessionBackend()
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.swept = 0
+        self._next_sweep = time.time() + sweep_interval
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        entry = self.backend.get(sid) if sid else None
+        if entry is None:
+            return ServerSideSession()
+        data, expires_at = entry
+        return ServerSideSession(data, sid=sid, expires_at=expires_at)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        now = time.time()
+        if session.accessed:
+            response.vary.add("Cookie")
+        if session.previous_sid:
+            self.backend.delete(session.previous_sid)
+
+        if not session:
+            if not session.new:
+                self.backend.delete(session.sid)
+            if not session.new or session.previous_sid:
+                response.delete_cookie(name, domain=domain, path=path, secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app), httponly=self.get_cookie_httponly(app))
+            self._maybe_sweep(now)
+            return
+
+        stale = session.expires_at is None or session.expires_at - now < self.ttl / 2
+        if session.modified or stale:
+            session.expires_at = now + self.ttl
+            self.backend.set(session.sid, session, session.expires_at)
+        if session.new or (session.permanent and stale):
+            response.set_cookie(
+                name, session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app),
+            )
+        self._maybe_sweep(now)
+
+    def _maybe_sweep(self, now):
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.sweep_interval
+        removed = self.backend.sweep(now)
+        self.swept += removed
+        if removed:
+            logger.info(f"{removed} sessões vencidas removidas")
+
+    def stats(self):
+        return {
+            "sessions": len(self.backend),
+            "swept": self.swept,
+            "lookups": getattr(self.backend, "lookups", 0),
+            "cache_hits": getattr(self.backend, "cache_hits", 0),
+        }
+
+
+def build_session_interface():
+    """
+    Cria o armazenamento de sessões a partir das variáveis de ambiente. SQLite
+    por padrão: com sessões em memória, um login feito num worker seria um id
+    desconhecido nos outros e todo reinício desconectaria os usuários.
+    """
+    if os.getenv("ML_SESSION_BACKEND", "sqlite").lower() == "memory":
+        backend = MemorySessionBackend()
+    else:
+        backend = SQLiteSessionBackend(
+            os.getenv("ML_SESSION_PATH", "/tmp/ml_sessions.sqlite3"),
+            cache_ttl=float(os.getenv("ML_SESSION_CACHE_TTL", 1)),
+        )
+    return ServerSideSessionInterface(
+        backend=backend,
+        ttl=float(os.getenv("ML_SESSION_TTL", 7 * 24 * 3600)),
+        sweep_interval=float(os.getenv("ML_SESSION_SWEEP_INTERVAL", 300)),
+    )
@@ -0,0 +1,129 @@
+import os
+import asyncio
+import hashlib
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: apenas coalescência entre threads
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalescência de chamadas idênticas (single-flight).
+
+    Para cada chave existe no máximo uma chamada ao upstream em andamento;
+    as demais threads aguardam e recebem o mesmo resultado (ou a mesma exceção).
+    Com lock_dir definido, a coalescência se estende aos outros workers do
+    gunicorn por meio de um arquivo de lock por chave: quem espera o lock
+    consulta `recheck` (ex.: o cache compartilhado) antes de repetir a chamada.
+    """
+
+    def __init__(self, lock_dir=None):
+        self.lock_dir = lock_dir if lock_dir is not None else os.getenv("ML_SINGLE_FLIGHT_LOCK_DIR")
+        if self.lock_dir and fcntl is None:
+            logger.warning("fcntl indisponível: single-flight restrito às threads do worker.")
+            self.lock_dir = None
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self.calls = 0
+        self.coalesced = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, recheck=None):
+        with self._lock:
+            call = self._inflight.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._inflight[key] = call
+                self.calls += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run(key, fn, recheck)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def _run(self, key, fn, recheck):
+        if not self.lock_dir:
+            return fn()
+
+        digest = hashlib.sha1(str(key).encode()).hexdigest()
+        path = os.path.join(self.lock_dir, f"{digest}.lock")
+        with open(path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # Outro worker pode ter concluído a mesma chamada enquanto esperávamos
+                if recheck is not None:
+                    value = recheck()
+                    if value is not None:
+                        return value
+                return fn()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def stats(self):
+        return {"calls": self.calls, "coalesced": self.coalesced, "inflight": len(self._inflight)}
+
+
+class AsyncSingleFlight:
+    """
+    Versão asyncio do SingleFlight para o modo ASGI: uma corrotina por chave,
+    as demais aguardam o mesmo Future. Vale apenas dentro do event loop do worker.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._inflight = {}
+
+    async def do(self, key, fn):
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # shield: o cancelamento de um chamador não cancela os demais
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self.calls += 1
+        try:
+            result = await fn()
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # evita o aviso de exceção não consumida sem waiters
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self):
+        return {"calls": self.calls, "coalesced": self.coalesced, "inflight": len(self._inflight)}
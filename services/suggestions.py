@@ -0,0 +1,222 @@
+"""
+Sugestões de busca (search-as-you-type) a partir de um índice de prefixos local.
+
+SuggestionIndex guarda as buscas feitas no worker e os títulos e marcas dos
+produtos normalizados já vistos, cada termo com uma pontuação de popularidade
+(buscas pesam mais que marcas, e marcas mais que títulos). A consulta por
+prefixo não chama o ML: uma busca binária acha o intervalo do prefixo num
+array ordenado e tabelas de top-k por bloco evitam percorrer o intervalo
+inteiro, então o custo não cresce com o número de termos que casam.
+
+Termos novos entram num conjunto pendente (sem ordem, varrido a cada consulta);
+quando ele enche, vira um segmento ordenado, e segmentos de tamanho parecido
+são fundidos (como numa LSM), o que amortiza a ordenação: poucos segmentos,
+cada um consultado à parte.
+"""
+import os
+import bisect
+import heapq
+import threading
+import unicodedata
+from itertools import chain
+
+# Peso somado à pontuação de um termo a cada ocorrência, por origem
+QUERY_WEIGHT = 5.0
+BRAND_WEIGHT = 1.0
+PRODUCT_WEIGHT = 0.2
+_KIND_RANK = {"product": 0, "brand": 1, "query": 2}
+# Marcas padrão do normalizador, que não viram sugestão
+_UNKNOWN_BRANDS = ("nao informado", "marca nao informada")
+
+# Maior código Unicode: prefixo + _MAX delimita o fim do intervalo do prefixo
+_MAX = chr(0x10FFFF)
+
+
+def suggestion_key(text):
+    """Chave de comparação: sem acentos, casefold e espaços normalizados."""
+    decomposed = unicodedata.normalize("NFKD", str(text or ""))
+    return " ".join("".join(c for c in decomposed if not unicodedata.combining(c)).casefold().split())
+
+
+class _Segment:
+    """
+    Termos ordenados com as pontuações do momento em que o segmento foi montado.
+    Cada nível de tabelas guarda, por bloco de BLOCK**nível posições, os
+    índices dos `k` termos de maior pontuação do bloco.
+    """
+
+    BLOCK = 64
+
+    def __init__(self, keys, scores, k):
+        self.keys = keys
+        self.scores = [scores[key] for key in keys]
+        self.levels = []  # [(tamanho do bloco, [top-k de cada bloco])], do menor para o maior
+        n = len(keys)
+        score = self.scores.__getitem__
+        size, tops = self.BLOCK, None
+        while size < n:
+            if tops is None:
+                tops = [heapq.nlargest(k, range(start, min(start + size, n)), key=score)
+                        for start in range(0, n, size)]
+            else:
+                tops = [heapq.nlargest(k, chain.from_iterable(tops[start:start + self.BLOCK]), key=score)
+                        for start in range(0, len(tops), self.BLOCK)]
+            self.levels.append((size, tops))
+            size *= self.BLOCK
+        self._descending = self.levels[::-1]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def top(self, prefix, k):
+        """Até k chaves com o prefixo, maiores pontuações (do segmento) primeiro."""
+        keys = self.keys
+        i = bisect.bisect_left(keys, prefix)
+        end = bisect.bisect_left(keys, prefix + _MAX, i)
+        candidates = []
+        while i < end:
+            # Maior bloco alinhado em i que cabe no intervalo; sem nenhum, a posição avulsa
+            for size, tops in self._descending:
+                if i % size == 0 and i + size <= end:
+                    candidates.extend(tops[i // size])
+                    i += size
+                    break
+            else:
+                candidates.append(i)
+                i += 1
+        return [keys[j] for j in heapq.nlargest(k, candidates, key=self.scores.__getitem__)]
+
+
+class SuggestionIndex:
+    """
+    Índice de prefixos das buscas, títulos e marcas vistos pelo worker.
+    Limitado a max_terms: quando passa disso, uma compactação completa
+    descarta os termos de menor pontuação. Termos já indexados que ganham
+    pontuação ficam num conjunto "quente", varrido a cada consulta até o
+    segmento deles ser refeito.
+    """
+
+    # Um segmento é fundido ao anterior quando este tem menos de MERGE_FACTOR vezes o seu tamanho
+    MERGE_FACTOR = 4
+
+    def __init__(self, max_terms=200000, k=10, pending_limit=512, max_title_length=80):
+        self.max_terms = max_terms
+        self.k = k
+        self.pending_limit = pending_limit
+        self.max_title_length = max_title_length
+        self._scores = {}     # chave -> pontuação atual
+        self._display = {}    # chave -> grafia exibida
+        self._kinds = {}      # chave -> origem (só as que não são títulos de produto)
+        self._segments = []   # segmentos ordenados, do maior (mais antigo) para o menor
+        self._pending = set()  # termos novos, ainda fora dos segmentos
+        self._hot = set()      # termos dos segmentos cuja pontuação mudou
+        self.merges = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._scores)
+
+    def add(self, text, weight=PRODUCT_WEIGHT, kind="product"):
+        """Soma `weight` à pontuação do termo (criando-o se preciso)."""
+        key = suggestion_key(text)[:self.max_title_length]
+        if key:
+            with self._lock:
+                self._add(key, text, weight, kind)
+
+    def _add(self, key, text, weight, kind):
+        score = self._scores.get(key)
+        display = " ".join(str(text).split())[:self.max_title_length]
+        if score is None:
+            self._scores[key] = weight
+            self._display[key] = display
+            self._pending.add(key)
+        else:
+            self._scores[key] = score + weight
+            if key not in self._pending:
+                self._hot.add(key)
+        # A origem mais relevante vence, com a sua grafia (uma busca que também é título aparece como busca)
+        if _KIND_RANK[kind] > _KIND_RANK[self._kinds.get(key, "product")]:
+            self._kinds[key] = kind
+            self._display[key] = display
+        if len(self._pending) >= self.pending_limit:
+            self._flush()
+
+    def add_query(self, query):
+        self.add(query, QUERY_WEIGHT, "query")
+
+    def add_products(self, products):
+        """Títulos novos e marcas de uma página de produtos normalizados (títulos repetidos não pontuam)."""
+        with self._lock:
+            for product in products:
+                title = product.get('title')
+                if title:
+                    key = suggestion_key(title)[:self.max_title_length]
+                    if key and key not in self._scores:
+                        self._add(key, title, PRODUCT_WEIGHT, "product")
+                brand = product.get('brand')
+                if brand:
+                    key = suggestion_key(brand)[:self.max_title_length]
+                    if key and key not in _UNKNOWN_BRANDS:
+                        self._add(key, brand, BRAND_WEIGHT, "brand")
+
+    def _flush(self):
+        """Pendentes viram um segmento novo; segmentos de tamanho parecido são fundidos (custo amortizado)."""
+        if len(self._scores) > self.max_terms or len(self._hot) > 4 * self.pending_limit:
+            self._compact()
+            return
+        keys = sorted(self._pending)
+        self._pending = set()
+        segments = self._segments
+        while segments and len(segments[-1]) < self.MERGE_FACTOR * len(keys):
+            # Duas sequências ordenadas: o timsort as funde em tempo linear
+            keys = sorted(segments.pop().keys + keys)
+            self.merges += 1
+        if self._hot:
+            self._hot.difference_update(keys)
+        segments.append(_Segment(keys, self._scores, self.k))
+
+    def _compact(self):
+        """Um único segmento com todos os termos, sem os de menor pontuação além de max_terms."""
+        if len(self._scores) > self.max_terms:
+            keep = set(heapq.nlargest(self.max_terms, self._scores, key=self._scores.__getitem__))
+            for key in [key for key in self._scores if key not in keep]:
+                del self._scores[key]
+                del self._display[key]
+                self._kinds.pop(key, None)
+        self._segments = [_Segment(sorted(self._scores), self._scores, self.k)]
+        self._pending = set()
+        self._hot = set()
+        self.merges += 1
+
+    def suggest(self, prefix, limit=None):
+        """Até `limit` sugestões [{"text", "kind"}] para o prefixo, mais populares primeiro."""
+        limit = min(limit or self.k, self.k)
+        key = suggestion_key(prefix)
+        if not key:
+            return []
+        with self._lock:
+            candidates = set()
+            for segment in self._segments:
+                candidates.update(segment.top(key, limit))
+            candidates.update(term for term in chain(self._pending, self._hot) if term.startswith(key))
+            scores = self._scores
+            ranked = sorted(candidates, key=lambda term: (-scores[term], term))[:limit]
+            return [{"text": self._display[term], "kind": self._kinds.get(term, "product")} for term in ranked]
+
+    def stats(self):
+        return {
+            "terms": len(self._scores),
+            "segments": len(self._segments),
+            "pending": len(self._pending),
+            "hot": len(self._hot),
+            "merges": self.merges,
+        }
+
+    def clear(self):
+        with self._lock:
+            self.__init__(self.max_terms, self.k, self.pending_limit, self.max_title_length)
+
+
+def build_suggestion_index():
+    """Índice de sugestões a partir das variáveis de ambiente."""
+    return SuggestionIndex(max_terms=int(os.getenv("ML_SUGGEST_MAX_TERMS", 200000)))
@@ -0,0 +1,371 @@
+import os
+import time
+import random
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+from services.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Estado imutável de um par de tokens: trocado inteiro a cada renovação,
+# por isso os handlers leem sem lock. refresh_at=None => expiração desconhecida.
+ManagedToken = namedtuple("ManagedToken", "access_token refresh_token expires_at refresh_at")
+# Par de tokens como gravado no store compartilhado
+StoredToken = namedtuple("StoredToken", "access_token refresh_token expires_at")
+
+
+def is_newer(token, than):
+    """`token` vence depois de `than` (vencimento desconhecido conta como o mais antigo)."""
+    return than is None or (token.expires_at or 0) > (than.expires_at or 0)
+
+
+class SQLiteTokenStore:
+    """
+    Tokens compartilhados entre os workers do gunicorn (SQLite/WAL, por padrão
+    no mesmo arquivo das sessões): a fonte da verdade dos pares de tokens.
+
+    Uma gravação só substitui o par guardado por um que vence depois
+    (expires_at maior), então um worker com uma cópia antiga nunca desfaz a
+    renovação feita por outro. lock_dir guarda um arquivo de lock por chave,
+    para que um único worker gaste o refresh_token (que é de uso único).
+    """
+
+    def __init__(self, path, lock_dir=None, ttl=7 * 24 * 3600):
+        self.path = path
+        self.lock_dir = lock_dir or f"{path}.locks"
+        # Chaves sem renovação há mais de ttl (sessões abandonadas) são varridas
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tokens ("
+                " key TEXT PRIMARY KEY, access_token TEXT NOT NULL, refresh_token TEXT, expires_at REAL,"
+                " seed TEXT, updated_at REAL NOT NULL)"
+            )
+
+    def _conn(self):
+        # Uma conexão por thread (e por processo, já que é criada sob demanda após o fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT access_token, refresh_token, expires_at FROM tokens WHERE key = ?", (key,)).fetchone()
+        return StoredToken(*row) if row else None
+
+    def put(self, key, token, now=None):
+        """Grava o par se ele vencer depois do guardado; devolve o par que ficou no store."""
+        self._conn().execute(
+            "INSERT INTO tokens (key, access_token, refresh_token, expires_at, updated_at) VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT (key) DO UPDATE SET access_token = excluded.access_token,"
+            " refresh_token = excluded.refresh_token, expires_at = excluded.expires_at,"
+            " updated_at = excluded.updated_at"
+            " WHERE COALESCE(excluded.expires_at, 0) > COALESCE(tokens.expires_at, 0)",
+            (key, token.access_token, token.refresh_token, token.expires_at, now or time.time()),
+        )
+        return self.get(key)
+
+    def seed(self, key, token, now=None):
+        """
+        Par inicial vindo da configuração (.env). Só entra se a chave ainda não
+        existe ou se a configuração mudou desde a última semente; senão vale o
+        par guardado, que já pode ter sido renovado (e o refresh_token do .env gasto).
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT seed FROM tokens WHERE key = ?", (key,)).fetchone()
+            if row is None or row[0] != token.access_token:
+                conn.execute(
+                    "INSERT OR REPLACE INTO tokens (key, access_token, refresh_token, expires_at, seed, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, token.access_token, token.refresh_token, token.expires_at, token.access_token,
+                     now or time.time()),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(key)
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM tokens WHERE key = ?", (key,))
+
+    def sweep(self, now=None, keep=()):
+        """Remove as chaves sem renovação há mais de ttl (exceto as de `keep`) e devolve quantas saíram."""
+        cutoff = (now or time.time()) - self.ttl
+        placeholders = ", ".join("?" * len(keep)) or "NULL"
+        return self._conn().execute(
+            f"DELETE FROM tokens WHERE updated_at < ? AND key NOT IN ({placeholders})", (cutoff, *keep)).rowcount
+
+
+class TokenManager:
+    """
+    Renovação proativa de tokens OAuth do Mercado Livre.
+
+    Guarda o par de tokens de cada sessão (ou do modo ML_ACCESS_TOKEN/ML_REFRESH_TOKEN)
+    junto com o vencimento informado em `expires_in`, e uma thread em segundo plano
+    renova cada um pouco antes de expirar (margem + jitter), para que a requisição
+    do usuário não descubra a expiração por um 401.
+
+    Com um store (SQLiteTokenStore), os workers dividem os tokens: cada um relê a
+    chave a cada sync_interval e adota o par guardado quando ele vence depois do
+    seu, e a renovação de uma chave passa por um lock entre workers. Quem
+    esperou o lock encontra o par novo no store em vez de gastar o refresh_token.
+    """
+
+    ENV_KEY = "env"
+
+    def __init__(self, auth_service, refresh_margin=None, jitter=None, retry_delay=None, max_entries=None,
+                 autostart=True, store=None, sync_interval=None, sweep_interval=3600):
+        self.auth_service = auth_service
+        # Sem autostart (app em preload), a thread só nasce em start(), já no worker
+        self.autostart = autostart
+        self.refresh_margin = refresh_margin if refresh_margin is not None else float(os.getenv("ML_TOKEN_REFRESH_MARGIN", 300))
+        self.jitter = jitter if jitter is not None else float(os.getenv("ML_TOKEN_REFRESH_JITTER", 60))
+        self.retry_delay = retry_delay if retry_delay is not None else float(os.getenv("ML_TOKEN_RETRY_DELAY", 30))
+        self.max_entries = max_entries or int(os.getenv("ML_TOKEN_MAX_ENTRIES", 10000))
+        self.store = store
+        self.sync_interval = sync_interval if sync_interval is not None else float(os.getenv("ML_TOKEN_SYNC_INTERVAL", 1))
+        self.sweep_interval = sweep_interval
+        self.refreshes = 0
+        self.failures = 0
+        self.unauthorized = 0
+        self.adopted = 0
+        self._tokens = OrderedDict()
+        self._synced = {}  # chave -> instante (monotonic) da última leitura do store
+        self._next_sweep = time.time() + sweep_interval
+        # Uma renovação por chave entre as threads e, com o store, entre os workers (lock em arquivo)
+        self._flight = SingleFlight(lock_dir=store.lock_dir) if store is not None else None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+
+    def _schedule(self, expires_at, now):
+        if expires_at is None:
+            return None
+        refresh_at = expires_at - self.refresh_margin - random.uniform(0, self.jitter)
+        return max(refresh_at, now)
+
+    def _token(self, access_token, refresh_token, expires_at, now):
+        return ManagedToken(access_token, refresh_token, expires_at,
+                            self._schedule(expires_at, now) if refresh_token else None)
+
+    def register(self, key, token_data, now=None, seed=False):
+        """
+        Registra (ou atualiza) os tokens de uma chave a partir da resposta do /oauth/token.
+        Aceita `expires_in` (segundos) ou `expires_at` (epoch) já calculado.
+        Com store, devolve o par que ficou guardado (pode ser um mais novo, de outro
+        worker); seed=True marca o par inicial do .env (SQLiteTokenStore.seed).
+        """
+        now = now or time.time()
+        expires_at = token_data.get('expires_at')
+        if expires_at is None and token_data.get('expires_in'):
+            expires_at = now + float(token_data['expires_in'])
+        token = self._token(token_data['access_token'], token_data.get('refresh_token'), expires_at, now)
+        if self.store is not None:
+            stored = (self.store.seed if seed else self.store.put)(key, token, now)
+            self._synced[key] = time.monotonic()
+            if stored != token[:3]:
+                self.adopted += 1
+                token = self._token(*stored, now)
+            self._maybe_sweep(now)
+        return self._set(key, token)
+
+    def _set(self, key, token):
+        with self._lock:
+            self._tokens[key] = token
+            self._tokens.move_to_end(key)
+            while len(self._tokens) > self.max_entries:
+                evicted, _ = self._tokens.popitem(last=False)
+                self._synced.pop(evicted, None)
+        if token.refresh_at is not None and self.autostart:
+            self._ensure_started()
+            self._wakeup.set()
+        return token
+
+    def get(self, key):
+        """Leitura lock-free do estado atual da chave (com store, relida a cada sync_interval)."""
+        if self._thread_pid is not None and self._thread_pid != os.getpid():
+            self._ensure_started()  # app carregado antes do fork (gunicorn --preload)
+        token = self._tokens.get(key)
+        if self.store is not None and key is not None:
+            checked = self._synced.get(key)
+            if checked is None or time.monotonic() - checked > self.sync_interval:
+                token = self._sync(key, token)
+        return token
+
+    def _sync(self, key, token):
+        """Confere a chave no store: adota um par mais novo e esquece a que outro worker descartou."""
+        stored = self.store.get(key)
+        if stored is None:
+            if token is None:
+                return None
+            if key != self.ENV_KEY:
+                self._forget(key)  # logout ou refresh_token rejeitado em outro worker
+                return None
+            stored = self.store.put(key, token)  # o modo .env nunca sai do store
+        self._synced[key] = time.monotonic()
+        if token is None:
+            return self._set(key, self._token(*stored, time.time()))  # chave registrada em outro worker
+        if not is_newer(stored, token):
+            return token
+        return self._adopt(key, stored)
+
+    def _adopt(self, key, stored):
+        self.adopted += 1
+        return self._set(key, self._token(*stored, time.time()))
+
+    def _stored_newer(self, key, token):
+        """O par do store, se outro worker já renovou a chave; None caso contrário."""
+        stored = self.store.get(key)
+        if stored is None or not is_newer(stored, token):
+            return None
+        self._synced[key] = time.monotonic()
+        return self._adopt(key, stored)
+
+    def _maybe_sweep(self, now):
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.sweep_interval
+        removed = self.store.sweep(now, keep=(self.ENV_KEY,))
+        if removed:
+            logger.info(f"{removed} tokens sem renovação removidos do store")
+
+    def start(self):
+        """Passa a renovar em segundo plano neste processo (chamado depois do fork no modo preload)."""
+        self.autostart = True
+        if self._next_due() is not None:
+            self._ensure_started()
+            self._wakeup.set()
+
+    def discard(self, key):
+        self._forget(key)
+        if self.store is not None:
+            self.store.delete(key)
+
+    def _forget(self, key):
+        with self._lock:
+            self._tokens.pop(key, None)
+            self._synced.pop(key, None)
+
+    def record_unauthorized(self, key):
+        """Conta requisições que ainda receberam 401 apesar da renovação proativa."""
+        self.unauthorized += 1
+
+    def refresh(self, key, now=None):
+        """Renova os tokens da chave agora. Retorna o novo ManagedToken ou None."""
+        local = self._tokens.get(key)
+        token = self.get(key)
+        if token is None or not token.refresh_token:
+            return None
+        if local is not None and token is not local and is_newer(token, local):
+            return token  # a leitura do store trouxe o par que outro worker acabou de renovar
+        if self._flight is None:
+            return self._refresh(key, token, now)
+        # Quem pega o lock depois de outro worker encontra o par novo no store e não chama o ML
+        return self._flight.do(f"token:{key}", lambda: self._refresh(key, token, now),
+                               recheck=lambda: self._stored_newer(key, token))
+
+    def _refresh(self, key, token, now):
+        new_tokens = self.auth_service.refresh_access_token(token.refresh_token)
+        now = now or time.time()
+        if 'access_token' not in new_tokens:
+            self.failures += 1
+            logger.error(f"Falha na renovação do token '{key}': {new_tokens.get('error')}")
+            # Erros de conexão são tentados de novo; um refresh_token rejeitado não volta a funcionar
+            if new_tokens.get('error') != 'invalid_grant':
+                self._postpone(key, now)
+                return None
+            if self.store is not None:
+                # Outro processo pode ter gasto o mesmo refresh_token e gravado o par novo
+                stored = self._stored_newer(key, token)
+                if stored is not None:
+                    return stored
+            if key == self.ENV_KEY:
+                # O modo .env não tem como logar de novo: o access_token vale até vencer, sem novas tentativas
+                logger.error("refresh_token do .env rejeitado: atualize ML_ACCESS_TOKEN/ML_REFRESH_TOKEN")
+                self._stop_refreshing(key)
+            else:
+                self.discard(key)
+            return None
+
+        self.refreshes += 1
+        new_tokens.setdefault('refresh_token', token.refresh_token)
+        return self.register(key, new_tokens, now=now)
+
+    def _postpone(self, key, now):
+        with self._lock:
+            token = self._tokens.get(key)
+            if token is not None and token.refresh_at is not None:
+                self._tokens[key] = token._replace(refresh_at=now + self.retry_delay)
+
+    def _stop_refreshing(self, key):
+        with self._lock:
+            token = self._tokens.get(key)
+            if token is not None:
+                self._tokens[key] = token._replace(refresh_at=None)
+
+    def due(self, now=None):
+        now = now or time.time()
+        return [key for key, token in list(self._tokens.items())
+                if token.refresh_at is not None and token.refresh_at <= now]
+
+    def _next_due(self):
+        times = [t.refresh_at for t in list(self._tokens.values()) if t.refresh_at is not None]
+        return min(times) if times else None
+
+    def _ensure_started(self):
+        # A thread não sobrevive ao fork do gunicorn: cada worker inicia a sua
+        pid = os.getpid()
+        if self._thread is not None and self._thread_pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._thread_pid != pid or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="token-refresh", daemon=True)
+                self._thread_pid = pid
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            next_due = self._next_due()
+            timeout = None if next_due is None else max(0.0, next_due - time.time())
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+            for key in self.due():
+                try:
+                    self.refresh(key)
+                except Exception as e:
+                    self.failures += 1
+                    self._postpone(key, time.time())
+                    logger.error(f"Erro inesperado ao renovar token '{key}': {str(e)}")
+
+    def stats(self):
+        return {
+            "tokens": len(self._tokens),
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "unauthorized": self.unauthorized,
+            "adopted": self.adopted,
+        }
+
+
+def build_token_store():
+    """
+    Store dos tokens no mesmo SQLite das sessões (ML_TOKEN_STORE_PATH usa outro
+    arquivo). Com sessões em memória, que pressupõem um único processo, não há
+    o que dividir entre workers.
+    """
+    if os.getenv("ML_SESSION_BACKEND", "sqlite").lower() == "memory":
+        return None
+    path = os.getenv("ML_TOKEN_STORE_PATH") or os.getenv("ML_SESSION_PATH", "/tmp/ml_sessions.sqlite3")
+    return SQLiteTokenStore(path, ttl=float(os.getenv("ML_SESSION_TTL", 7 * 24 * 3600)))
@@ -0,0 +1,193 @@
+"""
+Aquecimento do cache de buscas com as queries mais populares.
+
+QueryPopularity conta as buscas feitas na página inicial (busca + itens da
+primeira página, que é a chave de cache usada pela rota) e persiste um top-N
+em JSON, com decaimento por meia-vida: o arquivo é compartilhado pelos workers
+e sobrevive a deploys. WarmupService, numa thread por worker, pré-busca esse
+top-N ao subir e depois a cada `interval` segundos, num pool pequeno, pelas
+mesmas chamadas (limitador e circuit breaker) da busca normal.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class QueryPopularity:
+    """
+    Popularidade das buscas: contagens locais (por worker) somadas ao top-N
+    persistido a cada save(), que aplica o decaimento pelo tempo decorrido.
+    Dois workers salvando ao mesmo tempo podem perder as contagens de um deles;
+    a troca do arquivo é atômica, então ele nunca fica corrompido.
+    """
+
+    def __init__(self, path=None, top_n=20, half_life=24 * 3600, seeds=()):
+        self.path = path
+        self.top_n = top_n
+        self.half_life = half_life
+        self.seeds = [(self.normalize_query(query), limit) for query, limit in seeds]
+        self._counts = Counter()  # (busca, limite) -> acessos desde o último save
+        self._scores = {}         # top-N atual (sem arquivo, fica só em memória)
+        self._updated_at = time.time()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize_query(query):
+        return " ".join(str(query or "").lower().split())
+
+    def record(self, query, limit):
+        key = (self.normalize_query(query), limit)
+        with self._lock:
+            self._counts[key] += 1
+
+    def _load(self):
+        """(scores, updated_at) do arquivo; sem arquivo (ou ilegível), o estado em memória."""
+        if self.path:
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    state = json.load(f)
+                return ({(entry["q"], entry["limit"]): entry["score"] for entry in state["queries"]},
+                        state["updated_at"])
+            except FileNotFoundError:
+                pass
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Arquivo de popularidade {self.path} ignorado: {e}")
+        return dict(self._scores), self._updated_at
+
+    def _rank(self, scores):
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:self.top_n]
+        return dict(ranked)
+
+    def save(self, now=None):
+        """Soma as contagens locais ao top-N persistido (com decaimento) e devolve a lista a aquecer."""
+        now = now or time.time()
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        scores, updated_at = self._load()
+        if counts:
+            factor = 0.5 ** (max(0.0, now - updated_at) / self.half_life)
+            scores = {key: score * factor for key, score in scores.items()}
+            for key, count in counts.items():
+                scores[key] = scores.get(key, 0) + count
+            scores = self._rank(scores)
+            self._write(scores, now)
+        self._scores, self._updated_at = scores, (now if counts else updated_at)
+        return self.targets(scores)
+
+    def targets(self, scores=None):
+        """Seeds primeiro (ex.: a busca padrão da página inicial), depois o top-N por popularidade."""
+        ranked = list(self._rank(self._scores if scores is None else scores))
+        return list(dict.fromkeys(self.seeds + ranked))
+
+    def _write(self, scores, now):
+        if not self.path:
+            return
+        state = {"updated_at": now,
+                 "queries": [{"q": q, "limit": limit, "score": round(score, 3)} for (q, limit), score in scores.items()]}
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Não foi possível salvar a popularidade em {self.path}: {e}")
+
+
+class WarmupService:
+    """
+    Pré-busca periódica das buscas populares para o cache de resultados.
+
+    Entradas que ainda estarão frescas no próximo ciclo são puladas. Uma
+    recusa do limitador ou do circuit breaker encerra o ciclo: o aquecimento
+    nunca disputa a cota com as requisições dos usuários.
+    """
+
+    OUTCOMES = ("loaded", "fresh", "empty", "error", "skipped")
+
+    def __init__(self, service_factory, popularity, workers=2, interval=240):
+        self.service_factory = service_factory
+        self.popularity = popularity
+        self.workers = max(1, workers)
+        self.interval = interval
+        self.runs = 0
+        self.outcomes = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+
+    def warm(self):
+        """Um ciclo: persiste a popularidade e pré-busca o top-N. Devolve a contagem por resultado."""
+        targets = self.popularity.save()
+        service = self.service_factory()
+        if service is None or not targets:
+            return {}
+        cancelled = threading.Event()
+
+        def prefetch(target):
+            if cancelled.is_set():
+                return "skipped"
+            query, limit = target
+            outcome = service.prefetch(query, 0, limit, min_ttl=self.interval)
+            if isinstance(outcome, dict):
+                if outcome.get("error") == "upstream_unavailable":
+                    cancelled.set()
+                return "error"
+            return outcome
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(targets)), thread_name_prefix="ml-warmup") as executor:
+            outcomes = Counter(executor.map(prefetch, targets))
+        self.runs += 1
+        self.outcomes.update(outcomes)
+        logger.info(f"Aquecimento de {len(targets)} buscas em {time.perf_counter() - started:.2f} s: {dict(outcomes)}")
+        return dict(outcomes)
+
+    def start(self):
+        """Inicia o ciclo numa thread daemon deste processo (idempotente; refeito após o fork)."""
+        pid = os.getpid()
+        if self._thread is not None and self._thread_pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._thread_pid != pid or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="ml-warmup", daemon=True)
+                self._thread_pid = pid
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.warm()
+            except Exception:
+                logger.exception("Erro inesperado no aquecimento do cache")
+            self._stop.wait(self.interval)
+
+    def stats(self):
+        return dict({outcome: self.outcomes[outcome] for outcome in self.OUTCOMES}, runs=self.runs)
+
+
+def build_warmup(service_factory, default_query="notebook", default_limit=10):
+    """Cria o aquecimento a partir das variáveis de ambiente."""
+    seeds = [(query, default_limit) for query in
+             os.getenv("ML_WARMUP_QUERIES", default_query).split(",") if query.strip()]
+    popularity = QueryPopularity(
+        path=os.getenv("ML_WARMUP_PATH", "/tmp/ml_warmup.json") or None,
+        top_n=int(os.getenv("ML_WARMUP_TOP_N", 20)),
+        half_life=float(os.getenv("ML_WARMUP_HALF_LIFE", 24 * 3600)),
+        seeds=seeds,
+    )
+    return WarmupService(
+        service_factory, popularity,
+        workers=int(os.getenv("ML_WARMUP_WORKERS", 2)),
+        interval=float(os.getenv("ML_WARMUP_INTERVAL", 240)),
+    )
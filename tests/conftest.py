@@ -1,6 +1,22 @@
 import pytest
 import os
-from app import app as flask_app
+import json
+import atexit
+import shutil
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Arquivos do app (sessões, histórico de preços) num diretório da sessão de testes, nunca no
+# /tmp compartilhado; a fila de tarefas fica em memória e sem a thread de despacho
+_STATE_DIR = tempfile.mkdtemp(prefix="ml_tests_")
+atexit.register(shutil.rmtree, _STATE_DIR, ignore_errors=True)
+os.environ.setdefault("ML_SESSION_PATH", os.path.join(_STATE_DIR, "sessions.sqlite3"))
+os.environ.setdefault("ML_PRICE_HISTORY_DIR", os.path.join(_STATE_DIR, "price_history"))
+os.environ.setdefault("ML_JOBS_STORE", "memory")
+os.environ.setdefault("ML_JOBS_ENABLED", "0")
+
+from app import app as flask_app, page_cache  # noqa: E402
 
 @pytest.fixture
 def app():
@@ -9,6 +25,8 @@ def app():
         "TESTING": True,
         "SECRET_KEY": "test-secret-key",
     })
+    # Páginas renderizadas por um teste não podem responder pelo próximo
+    page_cache.clear()
     yield flask_app
 
 @pytest.fixture
@@ -18,3 +36,73 @@ def client(app):
 @pytest.fixture
 def runner(app):
     return app.test_cli_runner()
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    Servidor HTTP local que imita a API do ML.
+    Conta conexões TCP aceitas (handshakes) e requisições recebidas.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _StubHandler)
+        self.connections = 0
+        self.requests = []
+        self.responses = []  # fila de (status, body, headers); vazia => 200 padrão
+        self.default_body = {"results": []}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def next_response(self):
+        with self.lock:
+            if self.responses:
+                return self.responses.pop(0)
+        return 200, self.default_body, {}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode() if length else ""
+        with self.server.lock:
+            self.server.requests.append((self.command, self.path, body))
+        status, payload, headers = self.server.next_response()
+        if callable(payload):
+            payload = payload(self.command, self.path, body)
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    do_GET = _reply
+    do_POST = _reply
+    do_HEAD = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = StubServer()
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -1,3 +1,4 @@
+import json
 import pytest
 from unittest.mock import patch, MagicMock
 
@@ -63,3 +64,117 @@ def test_callback_no_code(client):
     response = client.get('/callback')
     assert response.status_code == 400
     assert b"Erro" in response.data
+
+def _products(n, start=0):
+    return [{'id': str(i), 'title': f'Produto {i}', 'price': 10, 'brand': 'X', 'thumbnail': '',
+             'permalink': '', 'has_image': True, 'status': 'Ativo', 'attributes': []}
+            for i in range(start, start + n)]
+
+@patch("services.mercado_livre.MercadoLivreService.search_products")
+def test_index_pagination_controls(mock_search, client):
+    with client.session_transaction() as sess:
+        sess['access_token'] = 'mock-token'
+    mock_search.return_value = _products(10)
+
+    response = client.get('/?q=notebook&page=2')
+
+    assert response.status_code == 200
+    assert b"Anterior" in response.data
+    assert "Próxima".encode() in response.data
+    mock_search.assert_called_once_with('notebook', 10, 10)
+
+@patch("services.mercado_livre.MercadoLivreService.search_products")
+def test_index_streams_multiple_pages(mock_search, client):
+    with client.session_transaction() as sess:
+        sess['access_token'] = 'mock-token'
+    mock_search.side_effect = lambda query, offset, limit: _products(limit, offset)
+
+    response = client.get('/?q=notebook&per_page=120')
+
+    assert response.is_streamed
+    assert response.data.count(b'class="product-card"') == 120
+    assert mock_search.call_count == 3
+
+@patch("services.mercado_livre.MercadoLivreService.search_products")
+def test_search_batch_json_and_ndjson(mock_search, client):
+    assert client.post('/api/search/batch', json={"queries": ["notebook"]}).status_code == 401
+    with client.session_transaction() as sess:
+        sess['access_token'] = 'mock-token'
+    mock_search.side_effect = lambda query, offset, limit, site_id: (
+        {"error": "api_error", "message": "falhou"} if query == "falha" else _products(limit, offset))
+
+    response = client.post('/api/search/batch', json={"queries": ["notebook", {"q": "falha", "site_id": "MLA"}]})
+    data = response.get_json()
+    assert [result['status'] for result in data['results']] == ["ok", "error"]
+    assert data['partial'] is True and len(data['results'][0]['products']) == 10
+
+    response = client.post('/api/search/batch?stream=1', json={"queries": [{"q": "celular", "limit": 3}]})
+    assert response.mimetype == "application/x-ndjson"
+    assert len(json.loads(response.data.splitlines()[0])['products']) == 3
+
+    response = client.post('/api/search/batch', json={"queries": [{"q": "x", "site_id": "ZZZ"}]})
+    assert response.status_code == 400
+
+def test_suggest_answers_from_local_index(client):
+    from app import suggestion_index
+    suggestion_index.clear()
+    suggestion_index.add_products(_products(3))
+    suggestion_index.add_query("produto 1")
+
+    data = client.get('/api/suggest?q=prod&limit=2').get_json()
+
+    assert data['suggestions'][0] == {"text": "produto 1", "kind": "query"}
+    assert len(data['suggestions']) == 2
+    assert client.get('/api/suggest?q=x&limit=a').status_code == 400
+
+def test_price_history_endpoints(client, tmp_path, monkeypatch):
+    import time
+    import app as app_module
+    from services.price_history import PriceHistory
+    history = PriceHistory(str(tmp_path / "prices"))
+    monkeypatch.setattr(app_module, "price_history", history)
+    now = int(time.time())
+    history.record([{"id": "MLB1", "price": 100.0, "status": "active"}], now=now - 3 * 86400)
+    history.flush()
+    history.record([{"id": "MLB1", "price": 80.0, "status": "active"}], now=now - 60)
+
+    data = client.get('/api/prices/MLB1?days=7').get_json()
+    assert [p['price'] for p in data['points']] == [100.0, 80.0]
+    assert (data['window']['min'], data['window']['max']) == (80.0, 100.0)
+
+    drops = client.get('/api/prices/drops?days=7&min_drop=0.1').get_json()['drops']
+    assert [(d['id'], d['drop']) for d in drops] == [("MLB1", 0.2)]
+    assert client.get('/api/prices/drops?days=abc').status_code == 400
+
+def test_jobs_status_and_price_alerts_job(client, tmp_path, monkeypatch):
+    import time
+    import app as app_module
+    from services.price_history import PriceAlerts, PriceHistory
+    from services.scheduler import JobScheduler
+    history = PriceHistory(str(tmp_path / "prices"))
+    monkeypatch.setattr(app_module, "price_history", history)
+    monkeypatch.setattr(app_module, "price_alerts", PriceAlerts(str(tmp_path / "alerts.sqlite3")))
+    monkeypatch.setenv("ML_PRICE_ALERTS_PATH", str(tmp_path / "alerts.jsonl"))
+    scheduler = JobScheduler(poll_interval=0.05)
+    scheduler.register("price_alerts", app_module._price_alerts_job)
+    monkeypatch.setattr(app_module, "scheduler", scheduler)
+    now = int(time.time())
+    history.record([{"id": "MLB1", "price": 100.0, "status": "active"}], now=now - 86400)
+    history.record([{"id": "MLB1", "price": 70.0, "status": "active"}], now=now - 60)
+
+    scheduler.submit("price_alerts", 7, 0.1)
+    scheduler.submit("price_alerts", 7, 0.1)  # mesma queda: alertada uma vez só
+    scheduler.start()
+    try:
+        deadline = time.monotonic() + 5
+        while scheduler.stats()["ok"] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        scheduler.stop(wait=True)
+
+    data = client.get('/api/jobs/status').get_json()
+    assert (data['ok'], data['queued'], data['inflight']) == (2, 0, 0)
+    assert data['jobs']['price_alerts']['runs']['ok'] == 2
+    assert {'lag', 'throughput', 'due', 'workers'} <= set(data)
+    alerts = (tmp_path / "alerts.jsonl").read_text().splitlines()
+    assert len(alerts) == 1 and '"MLB1"' in alerts[0]
@@ -0,0 +1,97 @@
+import asyncio
+import pytest
+import asgi
+from services.http_client import AsyncHttpClient
+from services.mercado_livre import MercadoLivreService, AsyncMercadoLivreService
+from services.auth import AuthService, AsyncAuthService
+from services.single_flight import AsyncSingleFlight
+
+SEARCH_BODY = {"results": [{"id": "MLB1", "name": "Produto Async", "price": 10.0, "thumbnail": "https://img/x-I.jpg"}]}
+
+@pytest.fixture
+def asgi_app(stub_server, monkeypatch):
+    monkeypatch.setattr(MercadoLivreService, "API_BASE_URL", stub_server.url)
+    monkeypatch.setattr(AuthService, "API_BASE_URL", stub_server.url)
+    asgi.app.config.update({"TESTING": True, "SECRET_KEY": "test-secret-key"})
+    asgi.search_cache.clear()
+    return asgi.app
+
+def _get(app, path, session=None):
+    async def run():
+        async with app.test_app() as test_app:
+            client = test_app.test_client()
+            if session:
+                async with client.session_transaction() as sess:
+                    sess.update(session)
+            response = await client.get(path)
+            return response, await response.get_data()
+    return asyncio.run(run())
+
+def test_async_index_no_auth(asgi_app, monkeypatch):
+    monkeypatch.delenv("ML_ACCESS_TOKEN", raising=False)
+    response, body = _get(asgi_app, "/")
+    assert response.status_code == 200
+    assert "Conecte sua conta".encode() in body
+
+def test_async_index_renders_products(asgi_app, stub_server):
+    stub_server.default_body = SEARCH_BODY
+    response, body = _get(asgi_app, "/?q=notebook", session={"access_token": "token"})
+    assert response.status_code == 200
+    assert b"Produto Async" in body
+    assert len(stub_server.requests) == 1
+
+def test_async_index_refreshes_expired_token(asgi_app, stub_server):
+    stub_server.responses = [
+        (401, {"message": "expired"}, {}),
+        (200, {"access_token": "novo", "refresh_token": "novo-refresh"}, {}),
+        (200, SEARCH_BODY, {}),
+    ]
+    response, body = _get(asgi_app, "/", session={"access_token": "velho", "refresh_token": "r"})
+    assert b"Produto Async" in body
+    assert [r[0] for r in stub_server.requests] == ["GET", "POST", "GET"]
+
+def test_async_callback_stores_tokens(asgi_app, stub_server):
+    stub_server.default_body = {"access_token": "real-token", "user_id": 42}
+    response, _ = _get(asgi_app, "/callback?code=valid-code")
+    assert response.status_code == 302
+
+def test_async_search_coalesces_concurrent_calls(stub_server, monkeypatch):
+    monkeypatch.setattr(MercadoLivreService, "API_BASE_URL", stub_server.url)
+    stub_server.default_body = SEARCH_BODY
+
+    async def run():
+        http = AsyncHttpClient(retries=0)
+        flight = AsyncSingleFlight()
+        services = [AsyncMercadoLivreService("token", http_client=http, single_flight=flight) for _ in range(20)]
+        results = await asyncio.gather(*(s.search_products("notebook") for s in services))
+        await http.aclose()
+        return results
+
+    results = asyncio.run(run())
+    assert all(r[0]["id"] == "MLB1" for r in results)
+    assert len(stub_server.requests) == 1
+
+def test_async_client_retries_5xx(stub_server):
+    stub_server.responses = [(503, {}, {}), (200, {"ok": True}, {})]
+
+    async def run():
+        http = AsyncHttpClient(retries=2, backoff_factor=0)
+        response = await http.get(f"{stub_server.url}/products/search")
+        await http.aclose()
+        return response
+
+    assert asyncio.run(run()).status_code == 200
+    assert len(stub_server.requests) == 2
+
+def test_async_refresh_token(stub_server, monkeypatch):
+    monkeypatch.setattr(AuthService, "API_BASE_URL", stub_server.url)
+    stub_server.default_body = {"access_token": "novo"}
+
+    async def run():
+        http = AsyncHttpClient()
+        result = await AsyncAuthService(http).refresh_access_token(" refresh ")
+        await http.aclose()
+        return result
+
+    assert asyncio.run(run())["access_token"] == "novo"
+    assert "refresh_token=refresh" in stub_server.requests[0][2]
@@ -20,7 +20,7 @@ def test_get_auth_url(auth_service):
     assert "redirect_uri=http://localhost:5000/callback" in url
     assert url.startswith("https://auth.mercadolivre.com.br/authorization")
 
-@patch("requests.post")
+@patch("requests.Session.post")
 def test_exchange_code_for_token_success(mock_post, auth_service):
     mock_response = MagicMock()
     mock_response.json.return_value = {"access_token": "mock-token", "refresh_token": "mock-refresh"}
@@ -32,7 +32,7 @@ def test_exchange_code_for_token_success(mock_post, auth_service):
     mock_post.assert_called_once()
     assert mock_post.call_args[1]['data']['code'] == "test-code"
 
-@patch("requests.post")
+@patch("requests.Session.post")
 def test_refresh_token_success(mock_post, auth_service):
     mock_response = MagicMock()
     mock_response.json.return_value = {"access_token": "new-token"}
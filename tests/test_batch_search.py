@@ -0,0 +1,100 @@
+import time
+import threading
+import pytest
+from services import deadline
+from services.batch_search import BatchSearch, BatchSearchError
+
+
+class FakeService:
+    """Stand-in de MercadoLivreService.search_products com atraso por busca."""
+
+    def __init__(self, delays=None, errors=None):
+        self.delays = delays or {}
+        self.errors = errors or {}
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def search_products(self, query, offset=0, limit=10, site_id=None):
+        with self.lock:
+            self.calls.append((site_id, query, offset, limit))
+        time.sleep(self.delays.get(query, 0))
+        if query in self.errors:
+            return self.errors[query]
+        return [{"id": f"{site_id}-{query}-{i}"} for i in range(limit)]
+
+
+def test_parse_validates_and_normalizes_queries():
+    batch = BatchSearch(max_queries=3, max_limit=50, max_deadline=10, site_ids=("MLA", "MLB"))
+    queries, deadline = batch.parse({"queries": ["  notebook  gamer ", {"q": "celular", "site_id": "mla", "limit": 5}],
+                                     "deadline": 30})
+
+    assert [(q.site_id, q.query, q.limit) for q in queries] == [("MLB", "notebook gamer", 10), ("MLA", "celular", 5)]
+    assert deadline == 10
+
+    for payload in (None, {"queries": []}, {"queries": ["a"] * 4}, {"queries": [{"q": ""}]},
+                    {"queries": [{"q": "a", "site_id": "XXX"}]}, {"queries": [{"q": "a", "limit": 500}]},
+                    {"queries": ["a"], "deadline": 0}):
+        with pytest.raises(BatchSearchError):
+            batch.parse(payload)
+
+
+def test_run_yields_in_completion_order_with_errors():
+    service = FakeService(delays={"lenta": 0.1}, errors={"falha": {"error": "api_error", "message": "Erro na API (500)"}})
+    batch = BatchSearch(max_workers=4)
+    queries, deadline = batch.parse({"queries": ["lenta", "rápida", {"q": "falha", "site_id": "MLA"}]})
+
+    results = list(batch.run(service, queries, deadline))
+
+    assert results[-1]["q"] == "lenta" and results[-1]["status"] == "ok"
+    assert len(results[-1]["products"]) == 10
+    failed = next(result for result in results if result["q"] == "falha")
+    assert failed["status"] == "error" and failed["error"] == "api_error" and failed["site_id"] == "MLA"
+    assert ("MLA", "falha", 0, 10) in service.calls
+
+
+def test_run_reports_timeouts_after_deadline():
+    service = FakeService(delays={"lenta": 0.5})
+    batch = BatchSearch(max_workers=4)
+    queries, _ = batch.parse({"queries": ["rápida", "lenta"]})
+
+    start = time.perf_counter()
+    results = list(batch.run(service, queries, 0.1))
+
+    assert time.perf_counter() - start < 0.4
+    assert [(result["q"], result["status"]) for result in results] == [("rápida", "ok"), ("lenta", "timeout")]
+
+
+def test_each_search_runs_under_the_batch_deadline():
+    seen = {}
+
+    class DeadlineService(FakeService):
+        def search_products(self, query, offset=0, limit=10, site_id=None):
+            seen[query] = deadline.remaining()
+            return super().search_products(query, offset, limit, site_id)
+
+    batch = BatchSearch(max_workers=2)
+    queries, _ = batch.parse({"queries": ["a", "b"]})
+    deadline.start_deadline(30)  # prazo da requisição, maior que o do lote
+    try:
+        assert [r["status"] for r in batch.run(DeadlineService(), queries, 0.5)] == ["ok", "ok"]
+        # O HttpClient encurta o timeout pelo prazo do lote; o da requisição continua o mesmo
+        assert all(0 < left <= 0.5 for left in seen.values())
+        assert deadline.remaining() > 29
+    finally:
+        deadline.clear_deadline()
+
+
+def test_network_failure_is_reported_per_query():
+    from services.mercado_livre import MercadoLivreService
+
+    class DownClient:
+        def get(self, url, **kwargs):
+            raise ConnectionError("connection refused")
+
+    batch = BatchSearch(max_workers=2)
+    queries, deadline = batch.parse({"queries": ["notebook"]})
+
+    [result] = batch.run(MercadoLivreService("token", http_client=DownClient()), queries, deadline)
+
+    assert result["status"] == "error" and result["error"] == "connection_error"
+    assert "products" not in result
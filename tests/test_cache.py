@@ -0,0 +1,216 @@
+import time
+import threading
+import pytest
+from unittest.mock import patch, MagicMock
+from services.cache import SearchCache, MemoryCacheBackend, SQLiteCacheBackend, RenderedPageCache
+from services.mercado_livre import MercadoLivreService
+
+PRODUCTS = [{"id": "MLB1", "title": "Produto"}]
+
+def test_make_key_normalizes_query():
+    assert SearchCache.make_key("MLB", "  Notebook   Dell ", 10, "active") == \
+        SearchCache.make_key("MLB", "notebook dell", 10, "active")
+    assert SearchCache.make_key("MLB", "notebook", 10, "active") != \
+        SearchCache.make_key("MLB", "notebook", 20, "active")
+
+def test_hit_and_miss_counters():
+    cache = SearchCache(ttl=60)
+    loader = MagicMock(return_value=PRODUCTS)
+
+    assert cache.get_or_load("k", loader) == PRODUCTS
+    assert cache.get_or_load("k", loader) == PRODUCTS
+
+    loader.assert_called_once()
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_errors_and_empty_results_are_not_cached():
+    cache = SearchCache(ttl=60)
+    loader = MagicMock(side_effect=[{"error": "auth_expired"}, [], PRODUCTS])
+
+    cache.get_or_load("k", loader)
+    cache.get_or_load("k", loader)
+    cache.get_or_load("k", loader)
+
+    assert loader.call_count == 3
+    assert cache.get("k") == PRODUCTS
+
+def test_lru_eviction_by_entries():
+    cache = SearchCache(backend=MemoryCacheBackend(max_entries=2), ttl=60)
+    cache.set("a", PRODUCTS)
+    cache.set("b", PRODUCTS)
+    cache.get_or_load("a", MagicMock())  # "a" passa a ser o mais recente
+    cache.set("c", PRODUCTS)
+
+    assert cache.get("a") == PRODUCTS
+    assert cache.get("b") is None
+    assert cache.stats()["evictions"] == 1
+
+def test_lru_eviction_by_bytes():
+    big = [{"id": "x" * 100}]
+    cache = SearchCache(backend=MemoryCacheBackend(max_entries=100, max_bytes=250), ttl=60)
+    cache.set("a", big)
+    cache.set("b", big)
+    cache.set("c", big)
+
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["bytes"] <= 250
+
+def test_stale_while_revalidate_serves_stale_and_refreshes():
+    cache = SearchCache(ttl=0.01, stale_ttl=60)
+    cache.set("k", PRODUCTS)
+    time.sleep(0.02)
+
+    refreshed = threading.Event()
+    fresh = [{"id": "MLB2", "title": "Novo"}]
+
+    def loader():
+        refreshed.set()
+        return fresh
+
+    # A chave expirada é devolvida sem esperar o upstream
+    assert cache.get_or_load("k", loader) == PRODUCTS
+    assert refreshed.wait(2)
+    for _ in range(100):
+        if cache.get("k") == fresh:
+            break
+        time.sleep(0.01)
+    assert cache.get("k") == fresh
+    assert cache.stats()["stale_hits"] == 1
+
+def test_sqlite_backend_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    writer = SearchCache(backend=SQLiteCacheBackend(path), ttl=60)
+    reader = SearchCache(backend=SQLiteCacheBackend(path), ttl=60)
+
+    writer.set("k", PRODUCTS)
+
+    assert reader.get_or_load("k", MagicMock()) == PRODUCTS
+    assert reader.stats()["hits"] == 1
+
+def test_sqlite_backend_lru_eviction(tmp_path):
+    cache = SearchCache(backend=SQLiteCacheBackend(str(tmp_path / "c.db"), max_entries=2), ttl=60)
+    cache.set("a", PRODUCTS)
+    time.sleep(0.01)
+    cache.set("b", PRODUCTS)
+    time.sleep(0.01)
+    cache.get("a")
+    time.sleep(0.01)
+    cache.set("c", PRODUCTS)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == PRODUCTS
+    assert cache.stats()["evictions"] == 1
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_backends_return_the_same_product_records(tmp_path, backend):
+    from services.normalizer import Product
+    product = Product("MLB1", "Notebook", "active", 3500.0, "", True, "", "Dell", "Prata", None)
+    cache = SearchCache(backend=SQLiteCacheBackend(str(tmp_path / "c.db")) if backend == "sqlite" else None)
+    cache.set("k", [product])
+
+    [cached] = cache.get("k")
+    assert isinstance(cached, Product)
+    assert cached.to_dict() == product.to_dict() and cached["attributes"] == product["attributes"]
+
+def test_sqlite_backend_reads_do_not_write(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "c.db"))
+    cache = SearchCache(backend=backend, ttl=60)
+    cache.set("k", PRODUCTS)
+    conn = backend._conn()
+    writes = conn.total_changes
+
+    cache.get("k")
+    cache.get("k")
+    assert conn.total_changes == writes
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_invalidate_query_drops_every_page_of_the_query(tmp_path, backend):
+    cache = SearchCache(backend=SQLiteCacheBackend(str(tmp_path / "c.db")) if backend == "sqlite" else None)
+    for query, offset in (("Notebook", 0), ("notebook ", 50), ("notebook dell", 0)):
+        cache.set(SearchCache.make_key("MLB", query, 50, "active", offset), PRODUCTS)
+
+    assert cache.invalidate_query("NOTEBOOK") == 2
+    assert cache.backend.keys() == ["MLB|notebook dell|50|active"]
+
+def test_page_cache_invalidate_query_uses_default_query():
+    cache = RenderedPageCache()
+    for args in ([("q", "Notebook"), ("page", "2")], [], [("q", "tablet")]):
+        cache.render(RenderedPageCache.make_key(False, args), "fp", lambda: "<html></html>")
+
+    assert cache.invalidate_query("notebook") == 2
+    assert cache.backend.keys() == ["anon?q=tablet"]
+
+@patch("requests.Session.get")
+def test_search_products_uses_cache(mock_get):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = {"results": [{"id": "MLB1", "name": "Produto"}]}
+    mock_get.return_value = mock_response
+    cache = SearchCache(ttl=60)
+
+    first = MercadoLivreService("token", cache=cache).search_products("Notebook")
+    second = MercadoLivreService("token", cache=cache).search_products("notebook ")
+
+    assert first == second
+    mock_get.assert_called_once()
+
+def test_page_cache_reuses_body_for_same_fingerprint():
+    cache = RenderedPageCache(ttl=0)
+    render = MagicMock(return_value="<html>1</html>")
+    key = RenderedPageCache.make_key(True, [("q", "notebook"), ("page", "2")])
+
+    etag, body = cache.render(key, "fp-1", render)
+    # Expirada (ttl=0), mas o contexto é o mesmo: corpo e ETag reaproveitados
+    assert cache.get(key) is None
+    assert cache.render(key, "fp-1", render) == (etag, body)
+    render.assert_called_once()
+
+    render.return_value = "<html>2</html>"
+    assert cache.render(key, "fp-2", render)[0] != etag
+    assert key != RenderedPageCache.make_key(False, [("page", "2"), ("q", "notebook")])
+    assert key == RenderedPageCache.make_key(True, [("page", "2"), ("q", "notebook")])
+
+def test_page_key_escapes_query_values():
+    # ?a=1%26b%3D2 (um parâmetro) e ?a=1&b=2 (dois) não podem dividir a página guardada
+    assert RenderedPageCache.make_key(False, [("a", "1&b=2")]) != \
+        RenderedPageCache.make_key(False, [("a", "1"), ("b", "2")])
+
+    cache = RenderedPageCache()
+    for q in ("tv & som", "tv"):
+        cache.render(RenderedPageCache.make_key(False, [("q", q), ("page", "2")]), "fp", lambda: "<html></html>")
+    assert cache.invalidate_query("TV  & som") == 1
+    assert len(cache.backend) == 1
+
+@patch("services.mercado_livre.MercadoLivreService.search_products")
+def test_index_conditional_request_returns_304(mock_search, client):
+    with client.session_transaction() as sess:
+        sess['access_token'] = 'mock-token'
+    mock_search.return_value = [{"id": "MLB1", "title": "Produto Cacheado", "price": 10, "thumbnail": "",
+                                 "permalink": "", "has_image": True, "status": "Ativo", "attributes": []}]
+
+    first = client.get('/?q=cache-etag')
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"] == "private, no-cache"
+    assert "Cookie" in first.headers["Vary"]
+    etag = first.headers["ETag"]
+
+    with patch("flask.templating._render") as render:
+        second = client.get('/?q=cache-etag', headers={"If-None-Match": etag})
+        third = client.get('/?q=cache-etag')
+
+    assert second.status_code == 304
+    assert second.data == b""
+    assert third.data == first.data
+    render.assert_not_called()
+    assert mock_search.call_count == 1
+
+def test_index_logged_out_variant_has_own_etag(client, monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module.token_manager, "get", lambda key: None)
+
+    response = client.get('/?q=cache-anon')
+
+    assert response.headers["Cache-Control"] == "public, no-cache"
+    assert b"Conectar" in response.data
+    assert client.get('/?q=cache-anon', headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
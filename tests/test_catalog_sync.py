@@ -0,0 +1,153 @@
+import json
+import hashlib
+import threading
+import pytest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from services.catalog_sync import CatalogSync, MemoryCatalogStore, SQLiteCatalogStore, SyncError
+from services.mercado_livre import MercadoLivreService
+from services.token_manager import TokenManager
+
+
+def _item(i, price=100):
+    return {"id": f"MLB{i}", "name": f"Notebook {i}", "status": "active", "price": price,
+            "thumbnail": f"http://img/{i}-I.jpg", "attributes": [{"id": "BRAND", "value_name": "Dell"}]}
+
+
+class MutableCatalogApi(ThreadingHTTPServer):
+    """/products/search sobre um catálogo que o teste altera entre os refreshes (ETag por página)."""
+    daemon_threads = True
+
+    def __init__(self, items):
+        super().__init__(("127.0.0.1", 0), _CatalogHandler)
+        self.items = items
+        self.etags = True
+        self.fail_offsets = set()
+        self.statuses = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _CatalogHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        params = parse_qs(urlparse(self.path).query)
+        offset, limit = int(params.get("offset", ["0"])[0]), int(params["limit"][0])
+        if offset in server.fail_offsets:
+            status, data = 503, b'{"message": "Service unavailable", "status": 503}'
+        else:
+            data = json.dumps({"paging": {"total": len(server.items)},
+                               "results": server.items[offset:offset + limit]}).encode()
+            status = 200
+        headers = {}
+        if status == 200 and server.etags:
+            headers["ETag"] = etag = '"' + hashlib.md5(data).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                status, data = 304, b""
+        with server.lock:
+            server.statuses.append(status)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def catalog_api(monkeypatch):
+    server = MutableCatalogApi([_item(i) for i in range(12)])
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    monkeypatch.setattr(MercadoLivreService, "API_BASE_URL", server.url)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _sync(store=None):
+    return CatalogSync(lambda: MercadoLivreService("token"), store=store or MemoryCatalogStore(),
+                       page_size=5, workers=2)
+
+
+def test_unchanged_catalog_is_answered_with_304s_and_no_delta(catalog_api):
+    sync = _sync()
+    deltas = []
+    sync.subscribe(deltas.append)
+
+    first = sync.refresh("Notebook")
+    assert [p["id"] for p in first.added] == [f"MLB{i}" for i in range(12)]
+    assert first.query == "notebook" and first.added[0]["brand"] == "Dell"
+
+    catalog_api.statuses.clear()
+    second = sync.refresh("notebook")
+    assert not second and second.unchanged == 12
+    assert catalog_api.statuses == [304, 304, 304]
+    assert deltas == [first]
+
+def test_delta_reports_added_changed_and_removed_products(catalog_api, tmp_path):
+    # Sem ETag: todas as páginas voltam inteiras e a diferença sai só dos hashes
+    catalog_api.etags = False
+    path = str(tmp_path / "catalog.sqlite3")
+    _sync(SQLiteCatalogStore(path)).refresh("notebook")
+
+    items = catalog_api.items
+    items[3] = _item(3, price=80)
+    items[7] = dict(_item(7), thumbnail="")
+    del items[10]
+    items.append(_item(20))
+
+    # Outro processo: o estado anterior vem do SQLite
+    delta = _sync(SQLiteCatalogStore(path)).refresh("notebook")
+    assert [p["id"] for p in delta.added] == ["MLB20"]
+    assert [(p["id"], fields) for p, fields in delta.changed] == \
+        [("MLB3", ["price"]), ("MLB7", ["thumbnail", "has_image"])]
+    assert delta.removed == ["MLB10"]
+    assert delta.unchanged == 9
+    assert not _sync(SQLiteCatalogStore(path)).refresh("notebook")
+
+def test_failed_page_aborts_without_touching_the_store(catalog_api):
+    sync = _sync()
+    sync.refresh("notebook")
+    del catalog_api.items[0:6]
+    catalog_api.fail_offsets = {5}
+
+    with pytest.raises(SyncError):
+        sync.refresh("notebook")
+    # Página parcial não vira remoção em massa: o próximo refresh completo vê a diferença inteira
+    catalog_api.fail_offsets = set()
+    assert len(sync.refresh("notebook").removed) == 6
+
+def test_sync_cli_writes_deltas_and_updates_consumers(runner, catalog_api, tmp_path):
+    import app as app_module
+    app_module.product_index.clear()
+    app_module.token_manager.register(TokenManager.ENV_KEY, {"access_token": "cli-token"})
+    queries = tmp_path / "queries.txt"
+    queries.write_text("notebook\n", encoding="utf-8")
+    args = ["sync", str(queries), "-o", str(tmp_path / "deltas.jsonl"), "--store", str(tmp_path / "c.sqlite3")]
+    try:
+        assert runner.invoke(args=args).exit_code == 0
+        catalog_api.items[0] = _item(0, price=50)
+        del catalog_api.items[1]
+        result = runner.invoke(args=args)
+    finally:
+        app_module.token_manager.discard(TokenManager.ENV_KEY)
+
+    assert result.exit_code == 0, result.output
+    assert "notebook: 0 novos, 1 alterados, 1 removidos, 10 iguais" in result.output
+    lines = [json.loads(line) for line in (tmp_path / "deltas.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert len(lines) == 14
+    assert lines[-2:] == [
+        dict(lines[-2], op="changed", id="MLB0", price=50, fields=["price"]),
+        {"op": "removed", "query": "notebook", "id": "MLB1"},
+    ]
+    assert app_module.product_index.search("notebook", max_price=60)[0]["id"] == "MLB0"
+    assert "MLB1" not in {p["id"] for p in app_module.product_index.search("notebook")}
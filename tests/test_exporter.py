@@ -0,0 +1,100 @@
+import json
+import pytest
+from services.normalizer import normalize_batch
+from services.columnar import iter_rows
+from services.exporter import CatalogExporter, ExportError, read_queries
+from services.mercado_livre import MercadoLivreService, SearchPage
+from services.token_manager import TokenManager
+
+TOTAL = 23
+
+def _item(query, i):
+    return {"id": f"{query[:3].upper()}{i}", "name": f"{query} {i}", "status": "active", "price": 10 + i,
+            "thumbnail": f"http://img/{i}-I.jpg" if i % 2 else "",
+            "attributes": [{"id": "BRAND", "value_name": "Dell" if i % 3 else "Lenovo"}]}
+
+
+class FakeService:
+    """Stand-in de MercadoLivreService.fetch_batch; falha a partir de fail_at chamadas."""
+
+    def __init__(self, fail_at=None):
+        self.calls = 0
+        self.fail_at = fail_at
+
+    def fetch_batch(self, query, offset=0, limit=50):
+        self.calls += 1
+        if self.fail_at is not None and self.calls > self.fail_at:
+            return {"error": "api_error", "message": "Erro na API (503)"}
+        items = [_item(query, i) for i in range(offset, min(offset + limit, TOTAL))]
+        return SearchPage(normalize_batch(items), TOTAL, None)
+
+
+def _export(tmp_path, fmt, service, name="out", **kwargs):
+    exporter = CatalogExporter(lambda: service, str(tmp_path / f"{name}.{fmt}"), fmt=fmt, page_size=5,
+                               workers=3, max_attempts=1, retry_delay=0, **kwargs)
+    return exporter, exporter.run(["notebook", "tablet"])
+
+
+def test_read_queries_skips_blank_comment_and_repeated_lines():
+    assert read_queries(["notebook\n", "\n", "# nada\n", "  Notebook ", "celular  dual chip\n"]) == \
+        ["notebook", "celular dual chip"]
+
+def test_columnar_export_matches_jsonl(tmp_path):
+    _, stats = _export(tmp_path, "jsonl", FakeService())
+    _, columnar_stats = _export(tmp_path, "columnar", FakeService())
+
+    with open(tmp_path / "out.jsonl", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    assert stats["items"] == columnar_stats["items"] == 2 * TOTAL
+    assert [r["id"] for r in rows[:3]] == ["NOT0", "NOT1", "NOT2"]
+    assert rows[-1]["query"] == "tablet"
+    assert list(iter_rows(tmp_path / "out.columnar")) == rows
+    assert columnar_stats["bytes"] < stats["bytes"]
+    # Concluída: o checkpoint é removido
+    assert not (tmp_path / "out.columnar.checkpoint.json").exists()
+
+@pytest.mark.parametrize("fmt", ["jsonl", "csv", "columnar"])
+def test_interrupted_export_resumes_where_it_stopped(tmp_path, fmt):
+    _export(tmp_path, fmt, FakeService(), name="full")
+
+    service = FakeService(fail_at=7)
+    with pytest.raises(ExportError):
+        _export(tmp_path, fmt, service)
+    checkpoint = json.loads((tmp_path / f"out.{fmt}.checkpoint.json").read_text())
+    assert checkpoint["queries"]["notebook"]["done"] is True
+    # Simula uma página escrita pela metade quando o processo morreu
+    with open(tmp_path / f"out.{fmt}", "ab") as f:
+        f.write(b"\x00lixo")
+
+    resumed_service = FakeService()
+    _, stats = _export(tmp_path, fmt, resumed_service)
+
+    assert stats["resumed"] is True
+    assert stats["items_this_run"] < TOTAL
+    assert resumed_service.calls < service.calls
+    assert (tmp_path / f"out.{fmt}").read_bytes() == (tmp_path / f"full.{fmt}").read_bytes()
+
+def test_checkpoint_from_other_configuration_is_rejected(tmp_path):
+    with pytest.raises(ExportError):
+        _export(tmp_path, "jsonl", FakeService(fail_at=2))
+    exporter = CatalogExporter(lambda: FakeService(), str(tmp_path / "out.jsonl"), page_size=10)
+    with pytest.raises(ExportError, match="--restart"):
+        exporter.run(["notebook"])
+    assert exporter.run(["notebook"], restart=True)["items"] == TOTAL
+
+def test_export_cli_against_stub_api(runner, stub_server, monkeypatch, tmp_path):
+    import app as app_module
+    monkeypatch.setattr(MercadoLivreService, "API_BASE_URL", stub_server.url)
+    stub_server.default_body = {"paging": {"total": 2}, "results": [_item("notebook", 0), _item("notebook", 1)]}
+    app_module.token_manager.register(TokenManager.ENV_KEY, {"access_token": "cli-token"})
+    queries = tmp_path / "queries.txt"
+    queries.write_text("notebook\n", encoding="utf-8")
+    try:
+        result = runner.invoke(args=["export", str(queries), "-o", str(tmp_path / "out.csv"), "-f", "csv"])
+    finally:
+        app_module.token_manager.discard(TokenManager.ENV_KEY)
+
+    assert result.exit_code == 0, result.output
+    assert "2 produtos de 1 buscas" in result.output
+    assert (tmp_path / "out.csv").read_text(encoding="utf-8").splitlines()[0].startswith("query,id,title")
+    assert len(stub_server.requests) == 1
@@ -0,0 +1,98 @@
+import time
+import itertools
+import pytest
+from services.deadline import start_deadline, clear_deadline
+from services.hedging import Hedger
+
+
+class FakeResponse:
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def slow_then_fast(slow_seconds=0.5):
+    """Primeira chamada lenta (réplica ruim), as seguintes imediatas."""
+    counter = itertools.count()
+    responses = []
+
+    def fn():
+        n = next(counter)
+        if n == 0:
+            time.sleep(slow_seconds)
+        response = FakeResponse("primary" if n == 0 else "hedge")
+        responses.append(response)
+        return response
+    return fn, responses
+
+
+def test_fast_call_is_not_hedged():
+    hedger = Hedger(max_delay=0.5)
+
+    assert hedger.call(lambda: "ok") == "ok"
+    assert hedger.stats()["hedged"] == 0
+
+
+def test_slow_call_fires_hedge_and_first_response_wins():
+    hedger = Hedger(max_delay=0.05)
+    fn, responses = slow_then_fast()
+
+    start = time.perf_counter()
+    response = hedger.call(fn)
+
+    assert response.name == "hedge"
+    assert time.perf_counter() - start < 0.4
+    assert hedger.stats()["hedged"] == 1
+    assert hedger.stats()["hedge_wins"] == 1
+    # A resposta que perdeu a corrida é descartada quando chega
+    time.sleep(0.6)
+    assert [r.closed for r in responses] == [False, True]
+
+
+def test_hedge_rate_is_capped():
+    hedger = Hedger(max_delay=0.01, max_ratio=0.0, burst=1.0)
+
+    for _ in range(3):
+        hedger.call(lambda: time.sleep(0.05) or "ok")
+
+    stats = hedger.stats()
+    assert stats["hedged"] == 1  # só o crédito inicial
+    assert stats["skipped"] == 2
+
+
+def test_no_hedge_once_the_deadline_is_gone():
+    hedger = Hedger(max_delay=0.02)
+    start_deadline(0.01)
+    try:
+        assert hedger.call(lambda: time.sleep(0.05) or "ok") == "ok"
+    finally:
+        clear_deadline()
+
+    assert hedger.stats()["hedged"] == 0
+    assert hedger.stats()["skipped"] == 1
+
+
+def test_both_failures_raise_the_primary_error():
+    hedger = Hedger(max_delay=0.01)
+    counter = itertools.count()
+
+    def fn():
+        n = next(counter)
+        time.sleep(0.05)
+        raise ConnectionError(f"falha {n}")
+
+    with pytest.raises(ConnectionError, match="falha 0"):
+        hedger.call(fn)
+
+
+def test_delay_follows_the_latency_percentile():
+    hedger = Hedger(percentile=0.9, min_delay=0.001, max_delay=1.0, min_samples=10)
+    assert hedger.delay() == 1.0  # sem amostras suficientes: espera máxima
+
+    for _ in range(20):
+        hedger.call(lambda: "ok")
+
+    assert hedger.delay() < 0.05
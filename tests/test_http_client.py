@@ -0,0 +1,138 @@
+import time
+import pytest
+from services.deadline import start_deadline, clear_deadline
+from services.resilience import DeadlineExceeded
+from services.http_client import HttpClient, get_http_client, reset_http_client
+from services.mercado_livre import MercadoLivreService
+from services.auth import AuthService
+
+@pytest.fixture
+def http_client():
+    client = HttpClient(retries=2, backoff_factor=0)
+    yield client
+    client.close()
+
+@pytest.fixture
+def budget():
+    yield start_deadline
+    clear_deadline()
+
+def test_keep_alive_reuses_single_connection(stub_server, http_client):
+    for _ in range(5):
+        response = http_client.get(f"{stub_server.url}/products/search")
+        assert response.status_code == 200
+
+    assert len(stub_server.requests) == 5
+    assert stub_server.connections == 1
+
+def test_services_share_pool_across_instances(stub_server, http_client, monkeypatch):
+    monkeypatch.setattr(MercadoLivreService, "API_BASE_URL", stub_server.url)
+    monkeypatch.setattr(AuthService, "API_BASE_URL", stub_server.url)
+    stub_server.default_body = {"results": [{"id": "MLB1", "name": "Produto"}], "access_token": "novo"}
+
+    # Uma instância nova por requisição, como em index(), não abre novas conexões
+    for _ in range(3):
+        products = MercadoLivreService("token", http_client=http_client).search_products("notebook")
+        assert products[0]["id"] == "MLB1"
+    AuthService(http_client=http_client).refresh_access_token("refresh")
+
+    assert len(stub_server.requests) == 4
+    assert stub_server.connections == 1
+
+def test_retry_on_5xx_then_success(stub_server, http_client):
+    stub_server.responses = [(503, {"error": "unavailable"}, {}), (200, {"ok": True}, {})]
+
+    response = http_client.get(f"{stub_server.url}/products/search")
+
+    assert response.status_code == 200
+    assert response.json() == {"ok": True}
+    assert len(stub_server.requests) == 2
+
+def test_retry_on_429_respects_retry_after(stub_server, http_client):
+    stub_server.responses = [(429, {"error": "too_many_requests"}, {"Retry-After": "0"})]
+
+    response = http_client.get(f"{stub_server.url}/products/search")
+
+    assert response.status_code == 200
+    assert len(stub_server.requests) == 2
+
+def test_post_is_not_retried_on_status(stub_server, http_client):
+    # refresh_token é de uso único: um 503 no POST não pode ser reenviado
+    stub_server.responses = [(503, {"error": "unavailable"}, {})]
+
+    response = http_client.post(f"{stub_server.url}/oauth/token", data={"grant_type": "refresh_token"})
+
+    assert response.status_code == 503
+    assert len(stub_server.requests) == 1
+
+def test_retries_exhausted_returns_last_response(stub_server, http_client):
+    stub_server.responses = [(500, {}, {})] * 3
+
+    response = http_client.get(f"{stub_server.url}/products/search")
+
+    assert response.status_code == 500
+    assert len(stub_server.requests) == 3
+
+def test_default_timeouts_from_env(monkeypatch):
+    monkeypatch.setenv("ML_HTTP_CONNECT_TIMEOUT", "1.5")
+    monkeypatch.setenv("ML_HTTP_READ_TIMEOUT", "7")
+    client = HttpClient()
+    assert client._timeout() == (1.5, 7.0)
+    assert client._timeout(read_timeout=15) == (1.5, 15)
+
+def test_process_wide_client_is_singleton():
+    reset_http_client()
+    assert get_http_client() is get_http_client()
+    reset_http_client()
+
+def test_services_resolve_the_pool_on_first_use():
+    reset_http_client()
+    auth = AuthService()
+    assert auth._http is None
+    # Criado só quando usado, no processo que vai usá-lo (após o fork, em preload)
+    assert auth.http is get_http_client()
+    reset_http_client()
+
+def test_deadline_caps_the_timeout(stub_server, http_client, budget):
+    timeouts = []
+    send = http_client.session.get
+    http_client.session.get = lambda url, **kwargs: timeouts.append(kwargs["timeout"]) or send(url, **kwargs)
+    budget(1.0)
+
+    http_client.get(f"{stub_server.url}/products/search", read_timeout=10)
+
+    connect, read = timeouts[0]
+    assert connect <= 1.0 and read <= 1.0
+
+def test_expired_deadline_fails_fast_without_calling_upstream(stub_server, http_client, budget, monkeypatch):
+    monkeypatch.setattr(MercadoLivreService, "API_BASE_URL", stub_server.url)
+    budget(0.001)
+    time.sleep(0.01)
+
+    with pytest.raises(DeadlineExceeded):
+        http_client.get(f"{stub_server.url}/products/search")
+    results = MercadoLivreService("token", http_client=http_client).search_products("notebook")
+
+    assert results["error"] == "upstream_unavailable"
+    assert results["reason"] == "deadline"
+    assert stub_server.requests == []
+    # Prazo da requisição não é falha do endpoint: o circuito continua fechado
+    assert http_client.guard.breaker(f"{stub_server.url}/products/search").failures == 0
+
+def test_token_refresh_runs_outside_the_deadline(stub_server, http_client, budget, monkeypatch):
+    # O refresh_token é de uso único: a renovação não pode ser cortada pelo prazo da busca
+    monkeypatch.setattr(AuthService, "API_BASE_URL", stub_server.url)
+    stub_server.default_body = {"access_token": "novo", "refresh_token": "novo-refresh"}
+    timeouts = []
+    send = http_client.session.post
+    http_client.session.post = lambda url, **kwargs: timeouts.append(kwargs["timeout"]) or send(url, **kwargs)
+    budget(0.001)
+    time.sleep(0.01)
+
+    tokens = AuthService(http_client=http_client).refresh_access_token("r")
+
+    assert tokens["access_token"] == "novo"
+    assert timeouts[0][1] == 15
+    # O prazo volta a valer para as chamadas seguintes
+    with pytest.raises(DeadlineExceeded):
+        http_client.get(f"{stub_server.url}/products/search")
@@ -0,0 +1,151 @@
+import os
+import time
+import threading
+from services.images import ImageValidator, ThumbnailCache, fallback_url
+from services.normalizer import normalize_batch
+
+CDN = "https://http2.mlstatic.com/D_NQ_NP_"
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, content_type="image/jpeg", body=b""):
+        self.status_code = status_code
+        self.headers = {"Content-Type": content_type}
+        self.body = body
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+
+class FakeHttp:
+    """Stand-in do HttpClient: respostas por URL e registro das chamadas."""
+
+    def __init__(self, responses=None, delay=0.0):
+        self.responses = responses or {}
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def _reply(self, method, url):
+        with self.lock:
+            self.calls.append((method, url))
+        time.sleep(self.delay)
+        response = self.responses.get(url, FakeResponse())
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def head(self, url, read_timeout=None, **kwargs):
+        return self._reply("HEAD", url)
+
+    def get(self, url, read_timeout=None, **kwargs):
+        return self._reply("GET", url)
+
+
+def _item(i, thumbnail):
+    return {"id": f"MLB{i}", "name": f"Produto {i}", "status": "active", "thumbnail": thumbnail}
+
+
+def test_fallback_url_points_to_original_variant():
+    assert fallback_url(CDN + "1-V.jpg") == CDN + "1-I.jpg"
+    assert fallback_url(CDN + "1-O.webp") is None
+
+
+def _drain(validator):
+    for _ in range(200):
+        if validator.stats()["pending"] == 0:
+            return
+        time.sleep(0.01)
+    raise AssertionError("validação em segundo plano não terminou")
+
+
+def test_apply_falls_back_and_sorts_by_verified_images():
+    http = FakeHttp({
+        CDN + "1-V.jpg": FakeResponse(404),
+        CDN + "2-V.jpg": FakeResponse(404),
+        CDN + "2-I.jpg": FakeResponse(404),
+        CDN + "3-V.jpg": FakeResponse(200, "text/html"),
+        CDN + "3-I.jpg": FakeResponse(200),
+    })
+    validator = ImageValidator(http_client=http)
+    items = [_item(i, CDN + f"{i}-I.jpg") for i in (1, 2, 3, 4)] + [_item(5, "")]
+
+    # Primeira busca: nada conferido ainda, as thumbnails saem como estão
+    first = validator.apply(normalize_batch(items))
+    assert first.thumbnails == [CDN + f"{i}-V.jpg" for i in (1, 2, 3, 4)] + [None]
+    _drain(validator)
+
+    batch = validator.apply(normalize_batch(items))
+
+    assert batch.thumbnails == [CDN + "1-I.jpg", None, CDN + "3-I.jpg", CDN + "4-V.jpg", None]
+    assert [p["id"] for p in batch.to_dicts(batch.image_first_order())] == ["MLB1", "MLB3", "MLB4", "MLB2", "MLB5"]
+    assert validator.stats()["broken"] == 1
+
+
+def test_apply_does_not_wait_for_the_network():
+    http = FakeHttp(delay=0.5)
+    validator = ImageValidator(http_client=http, max_workers=2)
+    start = time.perf_counter()
+    validator.apply(normalize_batch([_item(i, CDN + f"{i}-I.jpg") for i in range(8)]))
+    assert time.perf_counter() - start < 0.2
+    assert validator.stats()["pending"] == 8
+    # Repetir a busca com a fila cheia não agenda as mesmas URLs de novo
+    validator.apply(normalize_batch([_item(i, CDN + f"{i}-I.jpg") for i in range(8)]))
+    assert validator.stats()["pending"] == 8
+
+
+def test_pending_queue_is_bounded():
+    validator = ImageValidator(http_client=FakeHttp(delay=0.2), max_workers=1, max_pending=3)
+    validator.submit([CDN + f"{i}-V.jpg" for i in range(5)])
+    stats = validator.stats()
+    assert stats["pending"] == 3 and stats["dropped"] == 2
+
+
+def test_results_are_cached_but_unknown_urls_are_not():
+    http = FakeHttp({CDN + "2-V.jpg": ConnectionError("reset"), CDN + "3-V.jpg": FakeResponse(503)})
+    validator = ImageValidator(http_client=http)
+    items = [_item(i, CDN + f"{i}-I.jpg") for i in (1, 2, 3)]
+    urls = [CDN + f"{i}-V.jpg" for i in (1, 2, 3)]
+
+    for _ in range(2):
+        validator.apply(normalize_batch(items))
+        _drain(validator)
+
+    assert [url for _, url in http.calls].count(urls[0]) == 1
+    assert [url for _, url in http.calls].count(urls[1]) == 2
+    assert validator.stats()["cache_hits"] == 1
+    assert validator.stats()["unknown"] == 4
+
+
+def test_thumbnail_cache_serves_from_disk_and_evicts_lru(tmp_path):
+    urls = [CDN + f"{i}-V.jpg" for i in range(3)]
+    http = FakeHttp({url: FakeResponse(body=b"x" * 100) for url in urls})
+    cache = ThumbnailCache(str(tmp_path), http_client=http, max_bytes=250)
+
+    first = cache.fetch(urls[0])
+    cache.fetch(urls[1])
+    assert cache.fetch(urls[0]) == first
+    cache.fetch(urls[2])
+
+    assert len(http.calls) == 3
+    assert cache.stats()["evictions"] == 1
+    assert not os.path.exists(os.path.join(str(tmp_path), cache.filename(urls[1])))
+    assert open(first, "rb").read() == b"x" * 100
+
+    # Outro worker (ou o próximo deploy) reaproveita os arquivos do diretório
+    assert ThumbnailCache(str(tmp_path), http_client=http).stats()["files"] == 2
+
+
+def test_thumbnail_cache_rejects_other_hosts_and_large_files(tmp_path):
+    http = FakeHttp({CDN + "1-V.jpg": FakeResponse(body=b"x" * 2048)})
+    cache = ThumbnailCache(str(tmp_path), http_client=http, max_file_bytes=1024)
+
+    assert cache.fetch("https://example.com/1-V.jpg") is None
+    assert cache.fetch("https://mlstatic.com.example.com/1-V.jpg") is None
+    assert cache.fetch(CDN + "1-V.jpg") is None
+    assert http.calls == [("GET", CDN + "1-V.jpg")]
+    assert os.listdir(str(tmp_path)) == []
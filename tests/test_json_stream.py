@@ -0,0 +1,84 @@
+import json
+import pytest
+from unittest.mock import patch
+from services.json_stream import iter_json_array, JsonStreamError
+from services.http_client import HttpClient
+from services.mercado_livre import MercadoLivreService
+
+BODY = {
+    "keywords": "notebook \"results\"",
+    "paging": {"total": 1234, "offset": 0, "limit": 3},
+    "results": [
+        {"id": "MLB1", "name": "Notebook Ação", "price": 1999.9},
+        {"id": "MLB2", "name": "Cadeira", "attributes": [{"id": "BRAND", "value_name": "Ñandú"}]},
+        {"id": "MLB3", "name": "Mochila", "price": 12},
+    ],
+    "available_filters": [],
+}
+
+def _chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 100000])
+def test_items_across_any_chunk_boundary(size):
+    data = json.dumps(BODY, ensure_ascii=False, indent=1).encode("utf-8")
+    meta = {}
+
+    items = list(iter_json_array(_chunks(data, size), "results", meta))
+
+    assert items == BODY["results"]
+    assert meta["paging"]["total"] == 1234
+    assert meta["keywords"] == BODY["keywords"]
+
+def test_number_split_across_chunks_is_not_truncated():
+    items = list(iter_json_array([b'{"results": [12', b'34, 5]}'], "results"))
+    assert items == [1234, 5]
+
+def test_items_are_yielded_before_body_ends():
+    def chunks():
+        yield b'{"results": [{"id": 1}, '
+        raise AssertionError("leu além do necessário")
+
+    assert next(iter_json_array(chunks(), "results")) == {"id": 1}
+
+def test_truncated_body_raises():
+    with pytest.raises(JsonStreamError):
+        list(iter_json_array([b'{"results": [{"id": 1}, {"id"'], "results"))
+
+def test_missing_key_yields_nothing():
+    assert list(iter_json_array([b'{"paging": {}}'], "results")) == []
+
+def test_stream_products_yields_normalized_items(stub_server, monkeypatch):
+    monkeypatch.setattr(MercadoLivreService, "API_BASE_URL", stub_server.url)
+    stub_server.default_body = BODY
+    service = MercadoLivreService("token", http_client=HttpClient())
+    meta = {}
+
+    products = list(service.stream_products("notebook", limit=3, meta=meta))
+
+    assert [p["id"] for p in products] == ["MLB1", "MLB2", "MLB3"]
+    assert products[1]["brand"] == "Ñandú"
+    assert meta["paging"]["total"] == 1234
+
+def test_stream_products_yields_error_dict(stub_server, monkeypatch):
+    monkeypatch.setattr(MercadoLivreService, "API_BASE_URL", stub_server.url)
+    stub_server.responses = [(401, {"message": "expired"}, {})]
+    service = MercadoLivreService("token", http_client=HttpClient())
+
+    assert list(service.stream_products("notebook")) == [{"error": "auth_expired"}]
+
+@patch("services.mercado_livre.MercadoLivreService.stream_products")
+def test_search_stream_route_returns_ndjson(mock_stream, client):
+    with client.session_transaction() as sess:
+        sess['access_token'] = 'mock-token'
+    mock_stream.return_value = iter([{"id": "1"}, {"id": "2"}])
+
+    response = client.get('/api/search/stream?q=notebook&limit=2')
+
+    assert response.mimetype == "application/x-ndjson"
+    assert [json.loads(line) for line in response.data.splitlines()] == [{"id": "1"}, {"id": "2"}]
+
+def test_search_stream_route_requires_auth(client, monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module.token_manager, "get", lambda key: None)
+    assert client.get('/api/search/stream').status_code == 401
@@ -1,4 +1,5 @@
 import pytest
+from urllib.parse import urlparse, parse_qs
 from unittest.mock import patch, MagicMock
 from services.mercado_livre import MercadoLivreService
 
@@ -6,7 +7,7 @@ from services.mercado_livre import MercadoLivreService
 def ml_service():
     return MercadoLivreService(access_token="test-token")
 
-@patch("requests.get")
+@patch("requests.Session.get")
 def test_search_products_success(mock_get, ml_service):
     # Mock response data from ML API
     mock_response = MagicMock()
@@ -33,7 +34,7 @@ def test_search_products_success(mock_get, ml_service):
     assert products[0]["brand"] == "Marca X"
     assert "image-V.jpg" in products[0]["thumbnail"]  # Test quality replacement
 
-@patch("requests.get")
+@patch("requests.Session.get")
 def test_search_products_error_fallback_to_mock(mock_get, ml_service):
     # Test fallback to mock data on API error
     mock_get.side_effect = Exception("API Down")
@@ -44,7 +45,7 @@ def test_search_products_error_fallback_to_mock(mock_get, ml_service):
     assert len(products) > 0
     assert products[0]["id"] in ["1", "2", "3", "4"]
 
-@patch("requests.get")
+@patch("requests.Session.get")
 def test_search_products_401_fallback_to_mock(mock_get, ml_service):
     # Test fallback to mock data on 401 Unauthorized
     mock_response = MagicMock()
@@ -77,3 +78,51 @@ def test_normalize_results_missing_data(ml_service):
     assert normalized[0]["title"] == "Sem título"
     assert normalized[0]["brand"] == "Marca não informada"
     assert normalized[0]["price"] == 0
+
+def _paged_body(command, path, body):
+    # Cada página devolve ids a partir do offset; o último da página repete o primeiro da próxima
+    params = parse_qs(urlparse(path).query)
+    offset = int(params.get("offset", ["0"])[0])
+    limit = int(params["limit"][0])
+    ids = list(range(offset, offset + limit - 1)) + [offset + limit]
+    return {"results": [
+        {"id": f"MLB{i}", "name": f"P{i}", "thumbnail": f"https://img/{i}-I.jpg" if i % 2 else ""}
+        for i in ids
+    ]}
+
+@pytest.fixture
+def paged_service(stub_server, monkeypatch):
+    from services.http_client import HttpClient
+    monkeypatch.setattr(MercadoLivreService, "API_BASE_URL", stub_server.url)
+    stub_server.default_body = _paged_body
+    return MercadoLivreService(access_token="test-token", http_client=HttpClient())
+
+def test_page_plan_splits_window(ml_service):
+    assert ml_service._page_plan(0, 120, 50) == [(0, 50), (50, 50), (100, 20)]
+    assert ml_service._page_plan(10, 10, 50) == [(10, 10)]
+
+def test_iter_pages_fans_out_and_dedupes(paged_service, stub_server):
+    pages = list(paged_service.iter_pages("notebook", offset=0, total=30, page_size=10))
+
+    assert len(pages) == 3
+    ids = [p["id"] for page in pages for p in page]
+    assert len(ids) == len(set(ids))
+    offsets = sorted(int(parse_qs(urlparse(r[1]).query).get("offset", ["0"])[0]) for r in stub_server.requests)
+    assert offsets == [0, 10, 20]
+
+def test_iter_pages_keeps_image_first_within_page(paged_service):
+    first = next(paged_service.iter_pages("notebook", total=10, page_size=10))
+    flags = [p["has_image"] for p in first]
+    assert flags == sorted(flags, reverse=True)
+
+def test_search_all_merges_pages(paged_service):
+    products = paged_service.search_all("notebook", offset=0, total=20, page_size=10)
+    flags = [p["has_image"] for p in products]
+    assert flags == sorted(flags, reverse=True)
+    assert len({p["id"] for p in products}) == len(products)
+
+def test_iter_pages_returns_first_page_error(paged_service, stub_server):
+    stub_server.default_body = {"message": "expired"}
+    stub_server.responses = [(401, {}, {})] * 2
+    pages = list(paged_service.iter_pages("notebook", total=2, page_size=1))
+    assert pages == [{"error": "auth_expired"}]
@@ -0,0 +1,80 @@
+import logging
+import pytest
+from unittest.mock import patch
+from services.metrics import MetricsRegistry, install_log_trace_ids, new_trace_id, current_trace_id
+from services.http_client import HttpClient
+from services.mercado_livre import MercadoLivreService
+
+def test_histogram_exposition_is_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("demo_seconds", "Demo", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "parse")
+
+    text = registry.expose()
+
+    assert '# TYPE demo_seconds histogram' in text
+    assert 'demo_seconds_bucket{stage="parse",le="0.1"} 2' in text
+    assert 'demo_seconds_bucket{stage="parse",le="1.0"} 3' in text
+    assert 'demo_seconds_bucket{stage="parse",le="+Inf"} 4' in text
+    assert 'demo_seconds_count{stage="parse"} 4' in text
+    assert histogram.count("parse") == 4
+
+def test_counters_and_stats_collectors():
+    registry = MetricsRegistry()
+    registry.counter("demo_errors", "Erros", ("kind",)).inc("api_error", amount=2)
+    registry.register_stats("demo_cache", lambda: {"hits": 3, "entries": 7, "label": "x"}, "Cache", counters=("hits",))
+
+    text = registry.expose()
+
+    assert 'demo_errors_total{kind="api_error"} 2' in text
+    assert "# TYPE demo_cache_hits counter\ndemo_cache_hits_total 3" in text
+    assert "# TYPE demo_cache_entries gauge\ndemo_cache_entries 7" in text
+    assert "label" not in text
+    with pytest.raises(ValueError):
+        registry.histogram("demo_errors", "Outro tipo")
+
+def test_trace_id_reuses_valid_request_id():
+    assert new_trace_id("abc-123") == "abc-123"
+    generated = new_trace_id("não vale\n")
+    assert generated != "não vale\n" and len(generated) == 16
+    assert current_trace_id() == generated
+
+def test_fanout_threads_log_with_request_trace_id(stub_server, monkeypatch, caplog):
+    install_log_trace_ids()
+    monkeypatch.setattr(MercadoLivreService, "API_BASE_URL", stub_server.url)
+    service = MercadoLivreService("token", http_client=HttpClient())
+    new_trace_id("trace-fanout")
+
+    with caplog.at_level(logging.INFO, logger="services.mercado_livre"):
+        list(service.iter_pages("notebook", total=30, page_size=10))
+
+    records = [r for r in caplog.records if r.getMessage().startswith("Buscando no catálogo")]
+    assert len(records) == 3
+    assert {r.trace_id for r in records} == {"trace-fanout"}
+
+@patch("services.mercado_livre.MercadoLivreService.search_products")
+def test_metrics_endpoint_and_request_id_header(mock_search, client):
+    with client.session_transaction() as sess:
+        sess['access_token'] = 'mock-token'
+    mock_search.return_value = [{'id': '1', 'title': 'Produto', 'price': 10, 'thumbnail': '', 'permalink': '',
+                                 'has_image': True, 'status': 'Ativo', 'attributes': []}]
+
+    response = client.get('/?q=metricas', headers={"X-Request-ID": "req-42"})
+    assert response.headers["X-Request-ID"] == "req-42"
+
+    text = client.get('/metrics').get_data(as_text=True)
+
+    assert 'ml_request_seconds_count{route="/",method="GET",status="200"}' in text
+    assert 'ml_render_seconds_count{template="index.html"}' in text
+    assert "ml_page_cache_misses_total" in text
+    assert "ml_search_cache_hits_total" in text
+
+def test_upstream_latency_is_recorded_by_endpoint_and_status(stub_server):
+    from services.http_client import UPSTREAM_LATENCY
+    stub_server.responses = [(404, {"error": "not_found"}, {})]
+    before = UPSTREAM_LATENCY.count("GET", "/products/search", "404")
+
+    HttpClient(retries=0).get(f"{stub_server.url}/products/search", params={"q": "x"})
+
+    assert UPSTREAM_LATENCY.count("GET", "/products/search", "404") == before + 1
@@ -0,0 +1,105 @@
+import json
+import pickle
+from services.normalizer import normalize_batch, json_default, NAO_INFORMADO
+
+def test_attribute_precedence():
+    batch = normalize_batch([{
+        "id": "MLB1",
+        "attributes": [
+            {"id": "MARCA", "value_name": "Marca PT"},
+            {"id": "BRAND", "value_name": "Brand EN"},
+            {"id": "COR", "value_name": "Azul"},
+            {"id": "MODELO", "value_name": "M1"},
+            {"id": "CAPACITY", "value_name": "256 GB"},
+        ],
+    }])
+
+    assert batch.brands == ["Brand EN"]
+    assert batch.colors == ["Azul"]
+    assert batch.third_attrs == ["256 GB"]
+
+def test_third_attribute_falls_back_to_first_other():
+    batch = normalize_batch([{
+        "id": "MLB1",
+        "attributes": [
+            {"id": "BRAND", "value_name": "Dell"},
+            {"id": "VOLTAGE", "value_name": ""},
+            {"id": "WEIGHT", "value_name": "2 kg"},
+            {"id": "VOLTAGE", "value_name": "Bivolt"},
+            {"id": "WEIGHT", "value_name": "2,1 kg"},
+        ],
+    }])
+
+    # Primeiro atributo com valor fora de marca/cor, com o último valor visto
+    assert batch.third_attrs == ["2,1 kg"]
+    assert batch.colors == [NAO_INFORMADO]
+
+def test_thumbnail_rules():
+    batch = normalize_batch([
+        {"id": "1", "thumbnail": "http://img/a-I.jpg"},
+        {"id": "2", "pictures": [{"url": "http://img/b-I.png"}]},
+        {"id": "3", "thumbnail": "https://via.placeholder.com/x"},
+        {"id": "4"},
+    ])
+
+    assert batch.thumbnails[:2] == ["https://img/a-V.jpg", "https://img/b-V.png"]
+    assert batch.thumbnails[2:] == [None, None]
+    assert batch.has_image == [True, True, False, False]
+
+def test_price_and_defaults():
+    batch = normalize_batch([
+        {"id": "1", "buy_box_winner": {"price": 50}},
+        {"id": "2", "price_range": {"min_price": 30}},
+        {"id": "3", "status": "active", "title": "T"},
+    ])
+
+    assert batch.prices == [50, 30, 0]
+    assert batch.statuses == ["Inativo", "Inativo", "Ativo"]
+    assert batch.titles == ["Sem título", "Sem título", "T"]
+    assert batch.permalinks[0] == "https://www.mercadolivre.com.br/p/1"
+
+def test_image_first_order_is_stable():
+    batch = normalize_batch([
+        {"id": "a"},
+        {"id": "b", "thumbnail": "https://img/b.jpg"},
+        {"id": "c"},
+        {"id": "d", "thumbnail": "https://img/d.jpg"},
+    ])
+
+    products = batch.to_dicts(batch.image_first_order())
+
+    assert [p["id"] for p in products] == ["b", "d", "a", "c"]
+
+def test_to_dicts_matches_single_product():
+    batch = normalize_batch([
+        {"id": "1", "attributes": [{"id": "BRAND", "value_name": "X"}]},
+        {"id": "2", "attributes": [{"id": "BRAND", "value_name": "X"}]},
+    ])
+    products = batch.to_dicts()
+
+    assert products[0] == batch[0]
+    assert list(batch) == products
+    assert products[0]["attributes"] == [
+        {"label": "Marca", "value": "X"},
+        {"label": "Cor", "value": NAO_INFORMADO},
+        {"label": "Capacidade/Modelo", "value": NAO_INFORMADO},
+    ]
+    # Mesma combinação de atributos => mesma lista compartilhada
+    assert products[0]["attributes"] is products[1]["attributes"]
+
+def test_records_are_compact_and_read_like_dicts():
+    payload = json.loads(json.dumps([
+        {"id": str(i), "attributes": [{"id": "BRAND", "value_name": "Dell"}, {"id": "COLOR", "value_name": "Prata"}]}
+        for i in range(2)
+    ]))
+    batch = normalize_batch(payload)
+    first, second = batch.to_records()
+
+    assert not hasattr(first, "__dict__")
+    assert first == batch.to_dicts()[0] and first["brand"] == first.brand == "Dell"
+    assert first.get("missing") is None and "attributes" in first
+    # Strings internadas e attributes compartilhado entre páginas diferentes
+    assert first.brand is second.brand
+    assert first.attributes is normalize_batch(payload)[1].attributes
+    assert json.loads(json.dumps(first, default=json_default)) == first.to_dict()
+    assert pickle.loads(pickle.dumps(first)) == first
@@ -0,0 +1,132 @@
+import os
+import time
+import shutil
+import pytest
+from services.price_history import PriceAlerts, PriceHistory, Segment, encode_segment
+
+DAY = 86400
+# Recente: a retenção da compactação é contada a partir do relógio real
+T0 = (int(time.time()) // DAY - 10) * DAY
+
+
+@pytest.fixture
+def history(tmp_path):
+    store = PriceHistory(str(tmp_path / "prices"), segment_points=1000, flush_interval=10 ** 9, min_interval=3600,
+                         retention=30 * DAY)
+    yield store
+    store.close()
+
+
+def product(product_id, price, status="active"):
+    return {"id": product_id, "price": price, "status": status, "title": "Produto"}
+
+
+def test_segment_round_trip_with_price_rises_and_drops():
+    ids = ["MLB2", "MLB1", "MLB2", "MLB1", "MLB2"]
+    timestamps = [T0 + 5, T0, T0, T0 + 60, T0 + 10]
+    cents = [150000, 9990, 199900, 8990, 120000]
+    statuses = ["active", "active", "active", "paused", "active"]
+
+    segment = Segment(encode_segment(ids, timestamps, cents, statuses))
+
+    assert segment.ids == ["MLB1", "MLB2"]
+    assert segment.points(*segment.find("MLB1")) == [(T0, 9990, "active"), (T0 + 60, 8990, "paused")]
+    assert [p[1] for p in segment.points(*segment.find("MLB2"))] == [199900, 150000, 120000]
+    assert segment.find("MLB3") is None
+    assert segment.summary()["MLB2"] == (120000, 199900, T0 + 10, 120000)
+
+
+def test_repeated_observations_are_not_recorded(history):
+    assert history.record([product("MLB1", 100.0)], now=T0) == 1
+    # Mesma página renderizada de novo (cache): mesmo preço e status, nada novo
+    assert history.record([product("MLB1", 100.0)], now=T0 + 60) == 0
+    assert history.record([product("MLB1", 90.0)], now=T0 + 120) == 1
+    assert history.record([product("MLB1", 90.0, "paused")], now=T0 + 180) == 1
+    # Sem mudança, mas depois de min_interval: um ponto para mostrar que o preço se manteve
+    assert history.record([product("MLB1", 90.0, "paused")], now=T0 + 180 + 3600) == 1
+
+    assert history.stats()["skipped"] == 1
+
+
+def test_history_merges_segments_and_buffer(history):
+    history.record([product("MLB1", 100.0), product("MLB2", 50.0)], now=T0)
+    history.flush()
+    history.record([product("MLB1", 80.0)], now=T0 + DAY)
+    history.flush()
+    history.record([product("MLB1", 85.5)], now=T0 + 2 * DAY)
+
+    assert history.history("MLB1") == [(T0, 100.0, "active"), (T0 + DAY, 80.0, "active"),
+                                       (T0 + 2 * DAY, 85.5, "active")]
+    assert history.history("MLB1", since=T0 + 1) == [(T0 + DAY, 80.0, "active"), (T0 + 2 * DAY, 85.5, "active")]
+    assert history.history("MLB404") == []
+
+
+def test_window_min_max(history):
+    for day, price in enumerate((120.0, 99.9, 130.0, 110.0)):
+        history.record([product("MLB1", price)], now=T0 + day * DAY)
+    history.flush()
+
+    window = history.window("MLB1", 2 * DAY, now=T0 + 3 * DAY)
+
+    assert (window["min"], window["max"], window["last"], window["points"]) == (99.9, 130.0, 110.0, 3)
+    assert history.window("MLB1", DAY, now=T0 + 30 * DAY) is None
+
+
+def test_price_drops_over_window(history):
+    history.record([product("MLB1", 100.0), product("MLB2", 100.0), product("MLB3", 100.0)], now=T0)
+    history.flush()
+    history.record([product("MLB1", 70.0), product("MLB2", 97.0), product("MLB3", 120.0)], now=T0 + DAY)
+
+    drops = history.price_drops(7 * DAY, min_drop=0.05, now=T0 + DAY)
+
+    assert [(d["id"], d["max"], d["last"], d["drop"]) for d in drops] == [("MLB1", 100.0, 70.0, 0.3)]
+    # Janela que não alcança o preço antigo: sem queda
+    assert history.price_drops(3600, now=T0 + DAY) == []
+
+
+def test_compaction_merges_segments_and_drops_expired_points(history):
+    history.record([product("MLB1", 100.0)], now=T0 - 60 * DAY)
+    history.flush()
+    now = T0
+    for i in range(6):
+        history.record([product(f"MLB{i}", 10.0 + i)], now=now + i)
+        history.flush()
+
+    history.compact(full=True)
+
+    stats = history.stats()
+    assert stats["segments"] == 1
+    assert stats["merges"] >= 1
+    assert history.history("MLB1") == [(T0 + 1, 11.0, "active")]  # o ponto de 60 dias atrás venceu
+    assert history.history("MLB5") == [(T0 + 5, 15.0, "active")]
+
+
+def test_leftover_of_an_interrupted_compaction_is_ignored(history):
+    for i in range(3):
+        history.record([product("MLB1", 10.0 + i)], now=T0 + i * DAY)
+        history.flush()
+    history.compact(full=True)
+    [merged] = [name for name in os.listdir(history.directory) if name.endswith(".seg")]
+    assert merged == "ts-0000000001-0000000003.seg"
+    # Queda depois de gravar o segmento fundido e antes de apagar um dos originais
+    leftover = "ts-0000000002-0000000002.seg"
+    shutil.copy(os.path.join(history.directory, merged), os.path.join(history.directory, leftover))
+
+    assert len(history.history("MLB1")) == 3
+    history.compact()
+    assert leftover not in os.listdir(history.directory)
+
+
+def test_price_alerts_are_shared_between_workers_and_restarts(tmp_path):
+    path = str(tmp_path / "alerts.sqlite3")
+    drop = {"id": "MLB1", "max": 100.0, "last": 70.0, "drop": 0.3}
+    worker_a, worker_b = PriceAlerts(path), PriceAlerts(path)
+
+    assert worker_a.claim([drop], 7 * DAY, now=T0) == [drop]
+    assert worker_b.claim([drop], 7 * DAY, now=T0 + 3600) == []
+    # Reinício: o estado está no arquivo
+    assert PriceAlerts(path).claim([drop], 7 * DAY, now=T0 + 7200) == []
+    lower = dict(drop, last=60.0, drop=0.4)
+    assert worker_b.claim([lower], 7 * DAY, now=T0 + 7200) == [lower]
+    # O alerta anterior saiu da janela: a queda é alertada de novo
+    assert worker_a.claim([lower], 7 * DAY, now=T0 + 8 * DAY) == [lower]
@@ -0,0 +1,97 @@
+import pytest
+from unittest.mock import patch
+from services.product_index import ProductIndex
+
+def _product(i, brand="Dell", color="Preto", price=100, status="Ativo", attr="256 GB"):
+    return {'id': f'MLB{i}', 'title': f'Produto {i}', 'price': price, 'brand': brand, 'color': color,
+            'additional_attr': attr, 'status': status, 'thumbnail': '', 'permalink': '', 'has_image': True,
+            'attributes': []}
+
+@pytest.fixture
+def index():
+    idx = ProductIndex(max_products=100)
+    idx.add([
+        _product(1, "Dell", "Preto", 3000),
+        _product(2, "Lenovo", "Prata", 2500),
+        _product(3, "Dell", "Prata", 1500),
+        _product(4, "Apple", "Prata", 9000, status="Inativo"),
+    ], query="Notebook")
+    return idx
+
+def test_filters_intersect_and_keep_insertion_order(index):
+    assert [p['id'] for p in index.search("notebook", {'color': 'prata'})] == ['MLB2', 'MLB3', 'MLB4']
+    assert [p['id'] for p in index.search("notebook", {'brand': 'DELL', 'color': 'Prata'})] == ['MLB3']
+    assert index.search("cadeira", {'brand': 'Dell'}) == []
+
+def test_price_range_is_inclusive(index):
+    found = index.search("notebook", min_price=1500, max_price=3000)
+    assert [p['id'] for p in found] == ['MLB1', 'MLB2', 'MLB3']
+    assert [p['id'] for p in index.search(max_price=1499)] == []
+
+def test_facet_counts_follow_filters(index):
+    facets = index.facets("notebook")
+    assert facets['brand'] == [('Dell', 2), ('Apple', 1), ('Lenovo', 1)]
+    assert facets['status'] == [('Ativo', 3), ('Inativo', 1)]
+
+    facets = index.facets("notebook", {'color': 'Prata'}, max_price=5000)
+    assert facets['brand'] == [('Dell', 1), ('Lenovo', 1)]
+
+def test_reinsert_updates_postings(index):
+    index.add([_product(3, "Samsung", "Branco", 800)], query="monitor")
+
+    assert len(index) == 4
+    assert index.search("notebook", {'brand': 'Dell'})[0]['id'] == 'MLB1'
+    assert [p['id'] for p in index.search("monitor")] == ['MLB3']
+    # A busca anterior continua associada ao produto
+    assert [p['id'] for p in index.search("notebook", {'brand': 'Samsung'}, max_price=900)] == ['MLB3']
+
+def test_remove_from_query_keeps_products_of_other_queries(index):
+    index.add([_product(3)], query="monitor")
+    index.remove(['MLB2', 'MLB3'], query="notebook")
+
+    assert [p['id'] for p in index.search("notebook")] == ['MLB1', 'MLB4']
+    assert [p['id'] for p in index.search("monitor")] == ['MLB3']
+    assert len(index) == 3
+    assert [p['id'] for p in index.search(max_price=2600)] == ['MLB3']
+
+    index.remove(['MLB3', 'MLB9'])
+    assert not index.has_query("monitor")
+
+def test_bounded_size_evicts_oldest():
+    idx = ProductIndex(max_products=3)
+    idx.add([_product(i, price=i) for i in range(5)], query="x")
+
+    assert len(idx) == 3
+    assert [p['id'] for p in idx.search("x")] == ['MLB2', 'MLB3', 'MLB4']
+    assert [p['id'] for p in idx.search(max_price=2)] == ['MLB2']
+    assert idx.facets("x")['brand'] == [('Dell', 3)]
+
+def test_query_tuples_are_released_with_their_products():
+    idx = ProductIndex(max_products=2)
+    for i in range(10):
+        idx.add([_product(i)], query=f"busca {i}")
+    idx.add([_product(9)], query="outra")
+    idx.remove(['MLB8'])
+
+    assert len(idx._query_sets) == 1
+    assert idx._product_queries['MLB9'] == ("busca 9", "outra")
+
+@patch("services.mercado_livre.MercadoLivreService.search_products")
+def test_index_route_filters_from_local_index(mock_search, client):
+    import app as app_module
+    app_module.product_index.clear()
+    with client.session_transaction() as sess:
+        sess['access_token'] = 'mock-token'
+    mock_search.return_value = [_product(1, "Dell"), _product(2, "Lenovo"), _product(3, "Dell")]
+
+    response = client.get('/?q=notebook')
+    assert response.status_code == 200
+    assert b'class="facets"' in response.data
+    assert mock_search.call_count == 1
+
+    response = client.get('/?q=notebook&brand=Lenovo')
+
+    assert response.data.count(b'class="product-card"') == 1
+    assert b"Produto 2" in response.data
+    # Filtro servido do índice: nenhuma chamada nova ao ML
+    assert mock_search.call_count == 1
@@ -0,0 +1,122 @@
+import pytest
+from services.http_client import HttpClient
+from services.cache import SearchCache
+from services.mercado_livre import MercadoLivreService
+from services.metrics import REGISTRY
+from services.resilience import (CircuitBreaker, AdaptiveRateLimiter, UpstreamGuard, CircuitOpenError,
+                                 RateLimitedError, endpoint_of)
+
+SEARCH_BODY = {"results": [{"id": "MLB1", "name": "Notebook", "attributes": []}]}
+
+def test_breaker_opens_fails_fast_and_recovers_through_half_open():
+    breaker = CircuitBreaker("/products/search", failure_threshold=3, recovery_timeout=10)
+    for _ in range(3):
+        breaker.acquire(now=0)
+        breaker.record_failure(now=0)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.acquire(now=4)
+    assert error.value.retry_after == 6
+
+    # Depois do recovery_timeout só uma chamada de teste passa
+    breaker.acquire(now=11)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire(now=11)
+    breaker.record_success(now=12)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert 'ml_circuit_breaker_state{endpoint="/products/search"} 0' in REGISTRY.expose()
+
+def test_half_open_failure_reopens():
+    breaker = CircuitBreaker("/oauth/token", failure_threshold=1, recovery_timeout=5)
+    breaker.record_failure(now=0)
+    breaker.acquire(now=6)
+    breaker.record_failure(now=6)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire(now=10)
+
+def test_limiter_adapts_to_429_and_recovers():
+    limiter = AdaptiveRateLimiter("api.test", rate=10, max_wait=2, recovery_time=10)
+    assert limiter.reserve(now=100) == 0
+
+    limiter.throttle(retry_after=1, now=100)
+    assert limiter.rate == 5
+    # Bloqueado pelo Retry-After; uma espera acima de max_wait falha na hora
+    assert limiter.reserve(now=100) == pytest.approx(1)
+    limiter.throttle(retry_after=30, now=100)
+    with pytest.raises(RateLimitedError):
+        limiter.reserve(now=101)
+
+    # Sem novos 429 a taxa volta ao teto
+    limiter.reserve(now=140)
+    assert limiter.rate == 10
+
+def test_unlimited_limiter_switches_off_again_after_recovery():
+    limiter = AdaptiveRateLimiter("api.test", rate=0, recovery_time=1)
+    for _ in range(8):
+        assert limiter.reserve(now=50) == 0
+    limiter.throttle(now=50)
+    assert limiter.rate == 4
+
+    limiter.reserve(now=52)
+    assert limiter.rate == 0
+
+def test_open_circuit_short_circuits_http_calls(stub_server):
+    stub_server.responses = [(503, {}, {})] * 2
+    client = HttpClient(retries=0, guard=UpstreamGuard(failure_threshold=2, recovery_timeout=60))
+    url = f"{stub_server.url}/products/search"
+    assert [client.get(url).status_code for _ in range(2)] == [503, 503]
+
+    with pytest.raises(CircuitOpenError):
+        client.get(url)
+    assert len(stub_server.requests) == 2
+    # O circuito é por endpoint: o /oauth/token continua liberado
+    assert client.post(f"{stub_server.url}/oauth/token").status_code == 200
+
+def test_429_retry_after_is_honoured_by_the_limiter(stub_server):
+    stub_server.responses = [(429, {}, {"Retry-After": "0"})]
+    client = HttpClient(retries=1, guard=UpstreamGuard(rate=20))
+
+    response = client.get(f"{stub_server.url}/products/search")
+
+    assert response.status_code == 200
+    assert len(stub_server.requests) == 2
+    limiter = client.guard.limiter(stub_server.url)
+    assert limiter.throttles == 1 and limiter.rate < 20
+
+def test_search_serves_stale_cache_while_circuit_is_open(stub_server, monkeypatch):
+    monkeypatch.setattr(MercadoLivreService, "API_BASE_URL", stub_server.url)
+    stub_server.default_body = SEARCH_BODY
+    cache = SearchCache(ttl=0, stale_ttl=0)
+    client = HttpClient(retries=0, guard=UpstreamGuard(failure_threshold=1, recovery_timeout=60))
+    service = MercadoLivreService("token", http_client=client, cache=cache)
+    assert service.search_products("notebook")[0]["id"] == "MLB1"
+
+    stub_server.responses = [(500, {}, {})]
+    assert service.search_products("notebook")["error"] == "api_error"
+    # Circuito aberto: sem chamada ao ML, devolve o valor expirado guardado
+    assert service.search_products("notebook")[0]["id"] == "MLB1"
+    assert cache.stats()["stale_if_error"] == 1
+    assert len(stub_server.requests) == 2
+
+    error = service.search_products("tablet")
+    assert error["error"] == "upstream_unavailable"
+    assert "instável" in error["message"]
+
+def test_search_serves_stale_cache_when_the_connection_fails(stub_server, monkeypatch):
+    monkeypatch.setattr(MercadoLivreService, "API_BASE_URL", stub_server.url)
+    stub_server.default_body = SEARCH_BODY
+    cache = SearchCache(ttl=0, stale_ttl=0)
+    service = MercadoLivreService("token", http_client=HttpClient(retries=0), cache=cache)
+    assert service.search_products("notebook")[0]["id"] == "MLB1"
+
+    monkeypatch.setattr(service.http, "get", lambda *args, **kwargs: (_ for _ in ()).throw(ConnectionError("reset")))
+    assert service.search_products("notebook")[0]["id"] == "MLB1"
+    assert cache.stats()["stale_if_error"] == 1
+    assert service.search_products("tablet")["error"] == "connection_error"
+
+def test_endpoint_label_hides_ids():
+    assert endpoint_of("https://api.mercadolibre.com/items/MLB123/description?x=1") == "/items/:id/description"
+    assert endpoint_of("https://api.mercadolibre.com/products/search") == "/products/search"
@@ -0,0 +1,201 @@
+import math
+import time
+import threading
+import pytest
+from services.resilience import RateLimitedError
+from services.scheduler import Job, JobScheduler, MemoryJobStore, SQLiteJobStore
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condição não atingida a tempo")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def make_scheduler():
+    schedulers = []
+
+    def make(store=None, **options):
+        options.setdefault("poll_interval", 0.05)
+        options.setdefault("backoff", 0.01)
+        scheduler = JobScheduler(store, **options)
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.stop(wait=True)
+
+
+def job(job_id, priority=5, run_at=0.0, key=None):
+    return Job(job_id, "noop", [], priority, run_at, 0, key)
+
+
+@pytest.mark.parametrize("store_kind", ["memory", "sqlite"])
+def test_claim_orders_due_jobs_by_priority(tmp_path, store_kind):
+    store = MemoryJobStore() if store_kind == "memory" else SQLiteJobStore(str(tmp_path / "jobs.sqlite3"))
+    now = 1000.0
+    store.add(job("low", priority=9, run_at=now - 10))
+    store.add(job("high", priority=1, run_at=now - 1))
+    store.add(job("normal", priority=5, run_at=now - 5))
+    store.add(job("later", priority=0, run_at=now + 60))
+    assert store.add(job("periodic", priority=9, run_at=now, key="every:refresh"))
+    assert not store.add(job("periodic-again", run_at=now, key="every:refresh"))
+
+    assert [j.id for j in store.claim(now, 2, "w1", 300)] == ["high", "normal"]
+    assert [j.id for j in store.claim(now, 10, "w1", 300)] == ["low", "periodic"]
+    assert store.stats(now) == {"pending": 5, "due": 0, "oldest_due": None}
+    assert [j.id for j in store.claim(now + 60, 10, "w1", 300)] == ["later"]
+
+
+def test_failures_are_retried_with_backoff_then_dropped(make_scheduler):
+    calls = []
+
+    def flaky(value):
+        calls.append(value)
+        raise ValueError("falhou")
+
+    scheduler = make_scheduler()
+    scheduler.register("flaky", flaky, max_attempts=3)
+    scheduler.submit("flaky", 42)
+    scheduler.start()
+
+    wait_for(lambda: scheduler.stats()["failed"] == 1)
+    stats = scheduler.stats()
+    assert calls == [42, 42, 42]
+    assert (stats["retry"], stats["queued"], stats["inflight"]) == (2, 0, 0)
+
+
+def test_upstream_refusal_defers_without_spending_attempts(make_scheduler):
+    calls = []
+
+    def refresh():
+        calls.append(1)
+        if len(calls) < 3:
+            raise RateLimitedError("Limite de requisições para api.mercadolibre.com", retry_after=0.01)
+
+    scheduler = make_scheduler()
+    scheduler.register("refresh", refresh, max_attempts=1)
+    scheduler.submit("refresh")
+    scheduler.start()
+
+    wait_for(lambda: scheduler.stats()["ok"] == 1)
+    assert scheduler.stats()["deferred"] == 2
+    assert scheduler.stats()["failed"] == 0
+
+
+def test_pool_is_bounded_and_high_priority_runs_first(make_scheduler):
+    release = threading.Event()
+    order, running, peak = [], [0], [0]
+    lock = threading.Lock()
+
+    def work(name):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            order.append(name)
+        release.wait(5)
+        with lock:
+            running[0] -= 1
+
+    scheduler = make_scheduler(workers=2)
+    scheduler.register("work", work)
+    for i in range(4):
+        scheduler.submit("work", f"low{i}", priority=9)
+    scheduler.start()
+    wait_for(lambda: scheduler.stats()["inflight"] == 2)
+    scheduler.submit("work", "urgent", priority=0)
+    time.sleep(0.1)
+    assert scheduler.stats()["queued"] == 5  # as 2 em andamento continuam no store até terminar
+    release.set()
+
+    wait_for(lambda: scheduler.stats()["ok"] == 5)
+    assert peak[0] == 2
+    assert order[2] == "urgent"
+
+
+def test_per_job_rate_limit(make_scheduler):
+    ran = []
+    scheduler = make_scheduler()
+    scheduler.register("alert", ran.append, rate=2, burst=1)
+    for i in range(3):
+        scheduler.submit("alert", i)
+    started = time.monotonic()
+    scheduler.start()
+
+    wait_for(lambda: len(ran) == 3)
+    assert time.monotonic() - started >= 0.9  # 1 na hora, depois 2 por segundo
+
+
+def test_pending_jobs_survive_a_restart_and_workers_share_the_queue(tmp_path, make_scheduler):
+    path = str(tmp_path / "jobs.sqlite3")
+    ran = []
+    first = make_scheduler(SQLiteJobStore(path))
+    first.register("export", ran.append)
+    first.submit("export", "notebook")
+    # Periódica com a mesma key: uma única instância pendente
+    first.every("export", 3600, "celular")
+    first.start()
+    wait_for(lambda: first.stats()["ok"] == 2)
+    first.stop(wait=True)
+    first.submit("export", "tablet")  # fica no arquivo: o processo "caiu" antes de rodar
+
+    second = make_scheduler(SQLiteJobStore(path))
+    second.register("export", ran.append)
+    second.every("export", 3600, "celular")
+    second.start()
+
+    wait_for(lambda: second.stats()["ok"] == 1)
+    assert sorted(ran) == ["celular", "notebook", "tablet"]
+    stats = second.stats()
+    assert (stats["queued"], stats["due"]) == (1, 0)  # só a próxima execução da periódica
+
+
+def test_claimed_job_returns_to_the_queue_when_the_lease_expires(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    worker_a, worker_b = SQLiteJobStore(path), SQLiteJobStore(path)
+    worker_a.add(job("1"))
+
+    assert [j.id for j in worker_a.claim(100.0, 10, "a", lease=30)] == ["1"]
+    assert worker_b.claim(110.0, 10, "b", lease=30) == []
+    assert worker_b.next_run_at() == 130.0
+    # Worker "a" morreu sem terminar: depois do lease, "b" assume
+    assert [j.id for j in worker_b.claim(131.0, 10, "b", lease=30)] == ["1"]
+
+
+def test_process_pool_jobs(make_scheduler):
+    scheduler = make_scheduler(processes=1)
+    scheduler.register("factorial", math.factorial, process=True)
+    scheduler.submit("factorial", 20)
+    scheduler.start()
+
+    wait_for(lambda: scheduler.stats()["ok"] == 1, timeout=30)
+    status = scheduler.status()
+    assert status["jobs"]["factorial"]["runs"]["ok"] == 1
+    assert status["processes"] == 1
+
+
+def test_refresh_query_job_defers_while_the_upstream_refuses(make_scheduler, monkeypatch):
+    # Caminho real da tarefa: _refresh_query_job -> CatalogSync -> MercadoLivreService.fetch_batch -> HttpClient
+    import app as app_module
+    from services.resilience import CircuitOpenError
+    from services.token_manager import ManagedToken
+
+    class OpenCircuitClient:
+        def get(self, url, **kwargs):
+            raise CircuitOpenError("Circuito aberto para /products/search", retry_after=0.01)
+
+    monkeypatch.setattr("services.mercado_livre.get_http_client", OpenCircuitClient)
+    monkeypatch.setattr(app_module.token_manager, "get", lambda key: ManagedToken("token", None, None, None))
+
+    scheduler = make_scheduler()
+    scheduler.register("refresh_query", app_module._refresh_query_job, max_attempts=1)
+    scheduler.submit("refresh_query", "notebook")
+    scheduler.start()
+
+    wait_for(lambda: scheduler.stats()["deferred"] >= 2)
+    stats = scheduler.stats()
+    assert (stats["failed"], stats["retry"], stats["ok"]) == (0, 0, 0)
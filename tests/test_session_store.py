@@ -0,0 +1,106 @@
+import pytest
+from unittest.mock import patch
+from flask import Flask, session
+from services.session_store import (MemorySessionBackend, SQLiteSessionBackend, ServerSideSession,
+                                    ServerSideSessionInterface)
+
+
+def _app(interface):
+    app = Flask(__name__)
+    app.session_interface = interface
+
+    @app.route("/set/<value>")
+    def set_value(value):
+        session["token"] = value
+        return "ok"
+
+    @app.route("/get")
+    def get_value():
+        return session.get("token", "-")
+
+    @app.route("/clear")
+    def clear():
+        session.clear()
+        return "ok"
+
+    return app
+
+
+def _cookie(client):
+    cookie = client.get_cookie("session")
+    return cookie.value if cookie else None
+
+
+@patch("services.auth.AuthService.exchange_code_for_token")
+def test_cookie_carries_only_an_opaque_id(mock_exchange, client):
+    import app as app_module
+    mock_exchange.return_value = {"access_token": "real-token", "refresh_token": "ref-token", "user_id": 7}
+    with client.session_transaction() as sess:
+        sess["pre_login"] = True
+    before = _cookie(client)
+
+    client.get("/callback?code=valid-code")
+
+    sid = _cookie(client)
+    assert "real-token" not in sid and len(sid) == 43
+    # Login troca o id (fixação de sessão) e descarta o anterior
+    assert sid != before and app_module.app.session_interface.backend.get(before) is None
+    data, _ = app_module.app.session_interface.backend.get(sid)
+    assert data["access_token"] == "real-token" and data["ml_user_id"] == 7
+
+def test_reads_do_not_rewrite_a_fresh_session():
+    backend = MemorySessionBackend()
+    client = _app(ServerSideSessionInterface(backend, ttl=100)).test_client()
+    client.get("/set/a")
+
+    with patch.object(backend, "set", wraps=backend.set) as write:
+        assert client.get("/get").text == "a"
+        write.assert_not_called()
+
+    client.get("/clear")
+    assert len(backend) == 0 and _cookie(client) is None
+    assert client.get("/get").text == "-"
+
+def test_sqlite_sessions_are_shared_between_workers(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    writer = _app(ServerSideSessionInterface(SQLiteSessionBackend(path))).test_client()
+    reader_backend = SQLiteSessionBackend(path, cache_ttl=60)
+    reader = _app(ServerSideSessionInterface(reader_backend)).test_client()
+
+    writer.get("/set/velho")
+    reader.set_cookie("session", _cookie(writer))
+    assert reader.get("/get").text == "velho"
+    assert reader.get("/get").text == "velho"
+    assert reader_backend.cache_hits == 1
+
+    # Renovação em outro worker: aparece quando a entrada do cache local expira
+    writer.get("/set/novo")
+    reader_backend.cache_ttl = 0
+    assert reader.get("/get").text == "novo"
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_expired_sessions_are_ignored_and_swept(tmp_path, backend):
+    backend = SQLiteSessionBackend(str(tmp_path / "s.db")) if backend == "sqlite" else MemorySessionBackend()
+    interface = ServerSideSessionInterface(backend, ttl=100, sweep_interval=0)
+    backend.set("velha", {"token": "x"}, expires_at=1)
+    backend.set("atual", ServerSideSession({"token": "y"}), expires_at=2 ** 40)
+
+    assert backend.get("velha") is None
+    client = _app(interface).test_client()
+    client.get("/get")
+    assert len(backend) == 1 and interface.swept == 1
+
+def test_default_backend_is_shared_between_workers(tmp_path, monkeypatch):
+    from services.session_store import build_session_interface
+    monkeypatch.delenv("ML_SESSION_BACKEND", raising=False)
+    monkeypatch.setenv("ML_SESSION_PATH", str(tmp_path / "sessions.sqlite3"))
+    monkeypatch.setenv("ML_SESSION_CACHE_TTL", "0")
+    # Dois workers do gunicorn: cada um cria a sua interface com a configuração padrão
+    worker_a = _app(build_session_interface()).test_client()
+    worker_b = _app(build_session_interface()).test_client()
+
+    worker_a.get("/set/logado")
+    worker_b.set_cookie("session", _cookie(worker_a))
+    assert worker_b.get("/get").text == "logado"
+    worker_b.get("/clear")
+    assert worker_a.get("/get").text == "-"
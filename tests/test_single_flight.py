@@ -0,0 +1,93 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from services.single_flight import SingleFlight
+from services.http_client import HttpClient
+from services.cache import SearchCache
+from services.mercado_livre import MercadoLivreService
+from services.auth import AuthService
+
+def _slow_search(command, path, body):
+    time.sleep(0.2)
+    return {"results": [{"id": "MLB1", "name": "Produto"}], "access_token": "novo"}
+
+def _run_concurrently(n, fn):
+    barrier = threading.Barrier(n)
+
+    def call():
+        barrier.wait()
+        return fn()
+
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        return list(pool.map(lambda _: call(), range(n)))
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight(lock_dir="")
+    calls = []
+
+    def fn():
+        calls.append(1)
+        time.sleep(0.1)
+        return "resultado"
+
+    results = _run_concurrently(20, lambda: flight.do("k", fn))
+
+    assert results == ["resultado"] * 20
+    assert len(calls) == 1
+    assert flight.stats()["coalesced"] == 19
+
+def test_error_is_shared_by_all_waiters():
+    flight = SingleFlight(lock_dir="")
+
+    def fn():
+        time.sleep(0.1)
+        raise RuntimeError("upstream fora")
+
+    def call():
+        try:
+            flight.do("k", fn)
+        except RuntimeError as e:
+            return str(e)
+
+    assert _run_concurrently(10, call) == ["upstream fora"] * 10
+    assert flight.stats()["calls"] == 1
+
+def test_different_keys_are_not_coalesced():
+    flight = SingleFlight(lock_dir="")
+    assert flight.do("a", lambda: 1) == 1
+    assert flight.do("b", lambda: 2) == 2
+    assert flight.stats()["calls"] == 2
+
+def test_lock_file_rechecks_shared_result(tmp_path):
+    # Simula um segundo worker: o recheck encontra o valor gravado pelo primeiro
+    flight = SingleFlight(lock_dir=str(tmp_path))
+    assert flight.do("k", lambda: "upstream", recheck=lambda: "do cache") == "do cache"
+    assert flight.do("k", lambda: "upstream", recheck=lambda: None) == "upstream"
+
+def test_100_concurrent_searches_hit_upstream_once(stub_server, monkeypatch):
+    monkeypatch.setattr(MercadoLivreService, "API_BASE_URL", stub_server.url)
+    stub_server.default_body = _slow_search
+    http = HttpClient(pool_maxsize=100)
+    cache = SearchCache(ttl=60)
+    flight = SingleFlight(lock_dir="")
+
+    def search():
+        return MercadoLivreService("token", http_client=http, cache=cache, single_flight=flight).search_products("notebook")
+
+    results = _run_concurrently(100, search)
+
+    assert all(r[0]["id"] == "MLB1" for r in results)
+    assert len(stub_server.requests) == 1
+    http.close()
+
+def test_concurrent_refresh_of_same_token_posts_once(stub_server, monkeypatch):
+    monkeypatch.setattr(AuthService, "API_BASE_URL", stub_server.url)
+    stub_server.default_body = _slow_search
+    http = HttpClient(pool_maxsize=50)
+    auth = AuthService(http_client=http, single_flight=SingleFlight(lock_dir=""))
+
+    results = _run_concurrently(50, lambda: auth.refresh_access_token("refresh-unico"))
+
+    assert all(r["access_token"] == "novo" for r in results)
+    assert len(stub_server.requests) == 1
+    http.close()
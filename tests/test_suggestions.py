@@ -0,0 +1,55 @@
+import random
+from services.suggestions import SuggestionIndex, suggestion_key
+
+
+def _texts(suggestions):
+    return [suggestion["text"] for suggestion in suggestions]
+
+
+def test_prefix_is_accent_and_case_insensitive_and_ranked_by_popularity():
+    index = SuggestionIndex()
+    index.add_products([{"title": "Fogão 4 bocas", "brand": "Brastemp"},
+                        {"title": "Fone de ouvido", "brand": "Não informado"}])
+    index.add_query("fogao")
+    index.add_query("fogao")
+
+    suggestions = index.suggest("FOG")
+    assert _texts(suggestions) == ["fogao", "Fogão 4 bocas"]
+    assert suggestions[0]["kind"] == "query"
+    assert _texts(index.suggest("bras")) == ["Brastemp"]
+    assert index.suggest("nao") == [] and index.suggest("  ") == []
+
+
+def test_matches_linear_scan_across_segments_and_boosts():
+    rng = random.Random(7)
+    index = SuggestionIndex(pending_limit=16)
+    words = ["notebook", "note", "nokia", "mouse", "monitor", "mochila"]
+    for i in range(3000):
+        index.add(f"{rng.choice(words)} {rng.choice(words)} {i}")
+        if i % 7 == 0:
+            index.add(f"{rng.choice(words)} {rng.randrange(i + 1)}", weight=rng.choice([1.0, 5.0]))
+
+    assert index.stats()["segments"] > 1
+    scores = index._scores
+    for prefix in ["n", "no", "note", "mo", "mochila m", "x"]:
+        key = suggestion_key(prefix)
+        expected = sorted((t for t in scores if t.startswith(key)), key=lambda t: (-scores[t], t))[:5]
+        assert _texts(index.suggest(prefix, 5)) == [index._display[t] for t in expected]
+
+
+def test_memory_is_bounded_by_max_terms():
+    index = SuggestionIndex(max_terms=100, pending_limit=10)
+    index.add_query("notebook")
+    for i in range(500):
+        index.add(f"notebook {i}")
+
+    assert len(index) <= 110
+    assert _texts(index.suggest("note", 1)) == ["notebook"]
+
+
+def test_query_takes_over_the_display_text_of_a_title():
+    index = SuggestionIndex()
+    index.add_products([{"title": "Produto 1", "brand": "X"}])
+    index.add_query("produto 1")
+
+    assert index.suggest("prod") == [{"text": "produto 1", "kind": "query"}]
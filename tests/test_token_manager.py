@@ -0,0 +1,170 @@
+import time
+import pytest
+from unittest.mock import patch, MagicMock
+from services.token_manager import SQLiteTokenStore, StoredToken, TokenManager
+
+@pytest.fixture
+def auth():
+    auth = MagicMock()
+    auth.refresh_access_token.return_value = {"access_token": "novo", "refresh_token": "novo-refresh", "expires_in": 21600}
+    return auth
+
+def test_register_schedules_refresh_ahead_of_expiry(auth):
+    manager = TokenManager(auth, refresh_margin=300, jitter=60)
+    now = 1000.0
+
+    token = manager.register("k", {"access_token": "a", "refresh_token": "r", "expires_in": 3600}, now=now)
+
+    assert token.expires_at == now + 3600
+    assert now + 3600 - 360 <= token.refresh_at <= now + 3600 - 300
+
+def test_unknown_expiry_is_not_scheduled(auth):
+    manager = TokenManager(auth)
+    token = manager.register("k", {"access_token": "a", "refresh_token": "r"})
+    assert token.refresh_at is None
+    assert manager.due(now=time.time() + 10 ** 6) == []
+
+def test_refresh_replaces_state_and_counts(auth):
+    manager = TokenManager(auth)
+    manager.register("k", {"access_token": "a", "refresh_token": "r"})
+
+    token = manager.refresh("k")
+
+    assert token.access_token == "novo"
+    assert manager.get("k").refresh_token == "novo-refresh"
+    auth.refresh_access_token.assert_called_once_with("r")
+    assert manager.stats()["refreshes"] == 1
+
+def test_connection_failure_is_retried_later(auth):
+    auth.refresh_access_token.return_value = {"error": "connection_error"}
+    manager = TokenManager(auth, retry_delay=30)
+    manager.register("k", {"access_token": "a", "refresh_token": "r", "expires_in": 3600})
+    now = time.time()
+
+    assert manager.refresh("k", now=now) is None
+    assert manager.get("k").refresh_at == now + 30
+    assert manager.stats()["failures"] == 1
+
+def test_invalid_grant_drops_token(auth):
+    auth.refresh_access_token.return_value = {"error": "invalid_grant"}
+    manager = TokenManager(auth)
+    manager.register("k", {"access_token": "a", "refresh_token": "r"})
+
+    manager.refresh("k")
+
+    assert manager.get("k") is None
+
+def test_background_thread_refreshes_before_expiry(auth):
+    manager = TokenManager(auth, refresh_margin=0, jitter=0)
+    manager.register("k", {"access_token": "a", "refresh_token": "r", "expires_in": 0.05})
+
+    for _ in range(100):
+        if manager.get("k").access_token == "novo":
+            break
+        time.sleep(0.01)
+
+    assert manager.get("k").access_token == "novo"
+    assert manager.stats()["refreshes"] >= 1
+
+def test_bounded_entries(auth):
+    manager = TokenManager(auth, max_entries=2)
+    for key in ("a", "b", "c"):
+        manager.register(key, {"access_token": key})
+    assert manager.get("a") is None
+    assert manager.stats()["tokens"] == 2
+
+@patch("services.mercado_livre.MercadoLivreService.search_products")
+def test_index_uses_token_refreshed_in_background(mock_search, client):
+    import app as app_module
+    mock_search.return_value = []
+    with client.session_transaction() as sess:
+        sess['access_token'] = 'velho'
+        sess['refresh_token'] = 'r'
+        sess['token_key'] = 'sessao-1'
+    app_module.token_manager.register('sessao-1', {"access_token": "renovado", "refresh_token": "r2", "expires_in": 21600})
+
+    client.get('/')
+
+    with client.session_transaction() as sess:
+        assert sess['access_token'] == 'renovado'
+        assert sess['refresh_token'] == 'r2'
+    assert mock_search.call_count == 1
+    app_module.token_manager.discard('sessao-1')
+
+def test_without_autostart_thread_waits_for_start(auth):
+    # App em preload: nada de thread no master, só no worker depois do fork
+    manager = TokenManager(auth, autostart=False)
+    manager.register("k", {"access_token": "a", "refresh_token": "r", "expires_in": 3600})
+    assert manager._thread is None
+
+    manager.start()
+    assert manager._thread is not None and manager._thread.is_alive()
+
+def test_workers_sharing_a_store_spend_the_refresh_token_once(auth, tmp_path):
+    store_path = str(tmp_path / "tokens.sqlite3")
+    worker_a = TokenManager(auth, store=SQLiteTokenStore(store_path), sync_interval=3600)
+    worker_b = TokenManager(auth, store=SQLiteTokenStore(store_path), sync_interval=3600)
+    worker_a.register("k", {"access_token": "a", "refresh_token": "r", "expires_in": 600})
+    assert worker_b.get("k").access_token == "a"
+
+    assert worker_a.refresh("k").access_token == "novo"
+    # "b" ainda tem a cópia antiga: em vez de gastar "r" de novo, adota o par gravado por "a"
+    assert worker_b.refresh("k").access_token == "novo"
+    auth.refresh_access_token.assert_called_once_with("r")
+    assert worker_b.stats()["adopted"] == 1
+    # Uma cópia antiga gravada depois não desfaz a renovação
+    assert worker_b.register("k", {"access_token": "a", "refresh_token": "r", "expires_in": 600}).access_token == "novo"
+
+def test_invalid_grant_rereads_the_store_and_keeps_the_env_token(auth, tmp_path):
+    store = SQLiteTokenStore(str(tmp_path / "tokens.sqlite3"))
+    auth.refresh_access_token.return_value = {"error": "invalid_grant"}
+    worker = TokenManager(auth, store=store, sync_interval=3600)
+    worker.register("k", {"access_token": "a", "refresh_token": "r", "expires_in": 600})
+    # Outro processo renovou "k" (e gastou "r") sem passar pelo lock deste
+    store.put("k", StoredToken("novo", "r2", time.time() + 21600))
+    assert worker.refresh("k").access_token == "novo"
+
+    worker.register(TokenManager.ENV_KEY, {"access_token": "env", "refresh_token": "r", "expires_in": 600}, seed=True)
+    assert worker.refresh(TokenManager.ENV_KEY) is None
+    token = worker.get(TokenManager.ENV_KEY)
+    assert token.access_token == "env" and token.refresh_at is None
+    assert store.get(TokenManager.ENV_KEY) is not None
+
+def test_env_seed_keeps_the_refreshed_pair_across_restarts(auth, tmp_path):
+    store_path = str(tmp_path / "tokens.sqlite3")
+    env = {"access_token": "do-env", "refresh_token": "r"}
+    first = TokenManager(auth, store=SQLiteTokenStore(store_path))
+    first.register(TokenManager.ENV_KEY, env, seed=True)
+    first.refresh(TokenManager.ENV_KEY)
+
+    restarted = TokenManager(auth, store=SQLiteTokenStore(store_path))
+    assert restarted.register(TokenManager.ENV_KEY, env, seed=True).access_token == "novo"
+    # .env trocado pelo usuário: a nova semente vale
+    changed = restarted.register(TokenManager.ENV_KEY, {"access_token": "outro", "refresh_token": "r9"}, seed=True)
+    assert changed.access_token == "outro"
+
+def test_discard_reaches_the_other_workers(auth, tmp_path):
+    store_path = str(tmp_path / "tokens.sqlite3")
+    worker_a = TokenManager(auth, store=SQLiteTokenStore(store_path), sync_interval=0)
+    worker_b = TokenManager(auth, store=SQLiteTokenStore(store_path), sync_interval=0)
+    worker_a.register("k", {"access_token": "a", "refresh_token": "r", "expires_in": 600})
+    assert worker_b.get("k") is not None
+
+    worker_a.discard("k")
+    assert worker_b.get("k") is None
+
+def test_stale_worker_does_not_overwrite_a_newer_session_token(client):
+    import app as app_module
+    with client.session_transaction() as sess:
+        sess['access_token'] = 'renovado-em-outro-worker'
+        sess['refresh_token'] = 'r2'
+        sess['token_expires_at'] = time.time() + 21600
+        sess['token_key'] = 'sessao-2'
+    app_module.token_manager.register('sessao-2', {"access_token": "velho", "refresh_token": "r", "expires_in": 60})
+
+    with patch("services.mercado_livre.MercadoLivreService.search_products", return_value=[]):
+        client.get('/')
+
+    with client.session_transaction() as sess:
+        assert sess['access_token'] == 'renovado-em-outro-worker'
+    app_module.token_manager.discard('sessao-2')
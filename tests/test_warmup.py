@@ -0,0 +1,100 @@
+import time
+import threading
+from services.cache import SearchCache
+from services.mercado_livre import MercadoLivreService
+from services.warmup import QueryPopularity, WarmupService
+
+RESULTS = {"results": [{"id": "MLB1", "name": "Notebook"}]}
+
+
+class FakeService:
+    """Stand-in de MercadoLivreService.prefetch que mede a concorrência."""
+
+    def __init__(self, unavailable_at=None, delay=0.02):
+        self.calls = []
+        self.active = self.peak = 0
+        self.unavailable_at = unavailable_at
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def prefetch(self, query, offset=0, limit=10, min_ttl=0):
+        with self.lock:
+            self.calls.append((query, limit))
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            number = len(self.calls)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        if self.unavailable_at is not None and number >= self.unavailable_at:
+            return {"error": "upstream_unavailable", "reason": "rate_limited", "retry_after": 1}
+        return "loaded"
+
+
+def test_popularity_is_persisted_with_decay_and_seeds_first(tmp_path):
+    path = str(tmp_path / "warmup.json")
+    popularity = QueryPopularity(path, top_n=2, half_life=100, seeds=[("Notebook", 10)])
+    for query in ["celular"] * 3 + ["tablet"] * 2 + ["mouse"]:
+        popularity.record(query, 10)
+    assert popularity.save(now=1000) == [("notebook", 10), ("celular", 10), ("tablet", 10)]
+
+    # Outro worker (ou o próximo deploy) parte do arquivo; as contagens antigas valem metade
+    other = QueryPopularity(path, top_n=2, half_life=100)
+    assert other.save() == [("celular", 10), ("tablet", 10)]
+    for _ in range(2):
+        other.record(" Mouse ", 10)
+    assert other.save(now=1100) == [("mouse", 10), ("celular", 10)]
+
+def test_warm_is_bounded_and_stops_when_upstream_refuses():
+    popularity = QueryPopularity(top_n=10, seeds=[(f"busca {i}", 10) for i in range(8)])
+    service = FakeService(unavailable_at=3)
+    warmup = WarmupService(lambda: service, popularity, workers=2)
+
+    outcomes = warmup.warm()
+
+    assert service.peak == 2
+    assert outcomes["error"] >= 1 and outcomes["skipped"] >= 4
+    assert len(service.calls) < 8
+    assert WarmupService(lambda: None, popularity).warm() == {}
+
+def test_start_returns_before_the_first_cycle_finishes():
+    service = FakeService(delay=0.3)
+    warmup = WarmupService(lambda: service, QueryPopularity(seeds=[("notebook", 10)]), interval=60)
+    started = time.perf_counter()
+    warmup.start()
+    try:
+        assert time.perf_counter() - started < 0.1
+        for _ in range(100):
+            if warmup.runs:
+                break
+            time.sleep(0.01)
+        assert warmup.runs == 1 and service.calls == [("notebook", 10)]
+    finally:
+        warmup.stop()
+
+def test_prefetch_fills_the_cache_used_by_the_index_route(stub_server, monkeypatch, client):
+    import app as app_module
+    monkeypatch.setattr(MercadoLivreService, "API_BASE_URL", stub_server.url)
+    stub_server.default_body = RESULTS
+    cache = SearchCache(ttl=300)
+    monkeypatch.setattr(app_module, "search_cache", cache)
+    service = MercadoLivreService("token", cache=cache)
+
+    assert service.prefetch("Notebook", 0, 10) == "loaded"
+    assert service.prefetch("notebook", 0, 10, min_ttl=60) == "fresh"
+    # Vai expirar antes do próximo ciclo: busca de novo
+    assert service.prefetch("notebook", 0, 10, min_ttl=400) == "loaded"
+    assert len(stub_server.requests) == 2
+
+    with client.session_transaction() as sess:
+        sess['access_token'] = 'token'
+    response = client.get('/')
+    assert b"Notebook" in response.data
+    assert len(stub_server.requests) == 2
+
+    # A rota registra a chave de cache da primeira chamada (até PAGE_SIZE itens)
+    popularity = QueryPopularity(top_n=5)
+    monkeypatch.setattr(app_module.warmup, "popularity", popularity)
+    client.get('/?q=Celular&per_page=80')
+    client.get('/?q=celular&page=2')
+    assert popularity.save() == [("celular", MercadoLivreService.PAGE_SIZE)]